@@ -13,7 +13,7 @@ from datetime import datetime
 
 from fastapi import Body, FastAPI, HTTPException, Query, UploadFile, File, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.concurrency import run_in_threadpool
 
@@ -21,11 +21,28 @@ from core.settings import SETTINGS_PATH
 from core.nst import connect_profile, stop_profile, stop_all_browsers
 from core.browser import FBController
 from core import control as control_state
+from core import results_journal
+from core import results_index
+from core import profile_config
+from core import file_lock
+from core import post_queue
+from core import http_pool
+from core import rate_governor
+from core import pagination_checkpoint
+from core import page_prefetch
+from core import engagement_state
+from core import crawl_scheduler
+from core import storage
+from core import processed_index
+from core import post_claims
+from core.account_status import save_account_status, load_account_statuses, remove_account_statuses
+from core import payload_cache
+from core import post_details_cache
 from core.control import smart_sleep
 from core.scraper import SimpleBot
 from core.settings import get_settings
 from worker.get_all_info import get_all_info_from_post_ids_dir, get_info_for_profile_ids
-from core.paths import get_data_dir, get_settings_path, get_config_dir
+from core.paths import get_data_dir, get_settings_path
 app = FastAPI(title="NST Tool API", version="1.0.0")
 class InfoRunRequest(BaseModel):
     mode: str = "all"  # "all" hoặc "selected"
@@ -33,6 +50,14 @@ class InfoRunRequest(BaseModel):
     continuous: bool = False  # continuous mode
 
 
+class InfoRecheckRequest(BaseModel):
+    # Không truyền post_ids -> lấy các post có engagement state cập nhật trong since_hours giờ gần nhất
+    post_ids: list[str] | None = None
+    profile_ids: list[str] | None = None
+    since_hours: float = 24
+    limit: int = 1000
+
+
 # Cho phép frontend (file tĩnh) gọi API qua localhost
 app.add_middleware(
     CORSMiddleware,
@@ -45,7 +70,9 @@ app.add_middleware(
 # Bot processes (mỗi profile 1 process độc lập RUN/REST)
 _bot_lock = threading.Lock()
 _bot_processes: Dict[str, Process] = {}
-_settings_lock = threading.Lock()
+# Write lock của settings writer (RLock + lock file giữa các tiến trình): API, save_cookies
+# và get_payload cùng serialize read-modify-write settings.json qua lock này
+_settings_lock = profile_config.get_repository().write_lock
 _join_groups_lock = threading.Lock()
 _join_groups_processes: Dict[str, Process] = {}
 _feed_lock = threading.Lock()
@@ -135,9 +162,9 @@ def _hard_stop_everything(reason: str = "") -> dict:
 
     # 6) Stop group scan queue
     try:
-        global _group_scan_stop_requested, _group_scan_queue
+        global _group_scan_queue
         with _group_scan_lock:
-            _group_scan_stop_requested = True
+            _group_scan_stop_event.set()
             _group_scan_queue.clear()
         print("🛑 Đã dừng group scan queue")
     except Exception:
@@ -200,6 +227,7 @@ def _prune_bot_processes() -> None:
         _bot_processes.pop(pid, None)
 
 
+@profile_config.flush_on_exit
 def _run_bot_profile_loop(
     profile_id: str,
     run_minutes: float,  # Hỗ trợ số thập phân
@@ -461,6 +489,7 @@ def _run_bot_profile_loop(
         raise
 
 
+@profile_config.flush_on_exit
 def _run_join_groups_worker(profile_id: str, groups: list[str]) -> None:
     """Worker chạy join groups cho 1 profile (để chạy song song nhiều profile)."""
     try:
@@ -470,6 +499,7 @@ def _run_join_groups_worker(profile_id: str, groups: list[str]) -> None:
         print(f"❌ Join groups worker lỗi ({profile_id}): {exc}")
 
 
+@profile_config.flush_on_exit
 def _run_feed_worker(
     profile_id: str,
     mode: str,
@@ -844,27 +874,6 @@ def _validate_profiles_requirements(
         )
 
 
-def _atomic_write_json(path: Path, data: Dict[str, Any]) -> None:
-    """
-    Ghi JSON an toàn: write temp file cùng thư mục rồi replace.
-    """
-    directory = str(path.parent)
-    os.makedirs(directory, exist_ok=True)
-
-    fd, tmp_path = tempfile.mkstemp(prefix="settings_", suffix=".json", dir=directory)
-    try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            f.write("\n")
-        os.replace(tmp_path, str(path))
-    except Exception:
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
-        raise
-
-
 def _merge_group_ids(existing: Any, new_items: list[str]) -> list[str]:
     """Merge + de-dupe group ids, giữ thứ tự (existing trước)."""
     base: list[str] = []
@@ -886,7 +895,8 @@ def _merge_group_ids(existing: Any, new_items: list[str]) -> list[str]:
 
 def _write_settings_raw(raw: Dict[str, Any]) -> None:
     try:
-        _atomic_write_json(SETTINGS_PATH, raw)
+        # Ghi qua repository để cache cấu hình profile của worker cập nhật ngay (write-through)
+        profile_config.get_repository().write_raw(raw)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Không ghi được settings.json: {exc}") from exc
 
@@ -974,18 +984,7 @@ def report_account_status(payload: AccountStatusPayload) -> dict:
     if not pid:
         raise HTTPException(status_code=400, detail="profile_id rỗng")
 
-    status_file = get_data_dir() / "account_status.json"
-    status_file.parent.mkdir(parents=True, exist_ok=True)
-
-    data: Dict[str, Any] = {}
-    if status_file.exists():
-        try:
-            with status_file.open("r", encoding="utf-8") as f:
-                data = json.load(f) or {}
-        except Exception:
-            data = {}
-
-    data[pid] = {
+    save_account_status(pid, {
         "profile_id": pid,
         "status": payload.status,
         "banned": bool(payload.banned),
@@ -995,13 +994,7 @@ def report_account_status(payload: AccountStatusPayload) -> dict:
         "keyword": payload.keyword,
         "title": payload.title,
         "checked_at": payload.checked_at or datetime.utcnow().isoformat(),
-    }
-
-    try:
-        with status_file.open("w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"⚠️ Không ghi được account_status.json: {e}")
+    })
 
     print(f"🔔 [ACCOUNT_STATUS] {pid}: {payload.message}")
     return {"status": "ok", "profile_id": pid}
@@ -1017,17 +1010,7 @@ def get_account_status() -> dict:
     # Cleanup orphaned profiles trước khi đọc
     _cleanup_orphaned_profiles()
     
-    status_file = get_data_dir() / "account_status.json"
-    if not status_file.exists():
-        return {"accounts": {}}
-
-    try:
-        with status_file.open("r", encoding="utf-8") as f:
-            data = json.load(f) or {}
-        return {"accounts": data}
-    except Exception as e:
-        print(f"⚠️ Không đọc được account_status.json: {e}")
-        return {"accounts": {}}
+    return {"accounts": load_account_statuses()}
 
 
 @app.post("/settings/profiles")
@@ -1734,27 +1717,20 @@ def _check_data_exists(mode: str, profiles: Optional[list[str]] = None) -> bool:
     if mode == "selected":
         if not profiles:
             return False
-        # Kiểm tra xem có file nào cho các profile đã chọn không
+        # Kiểm tra xem có hàng đợi nào cho các profile đã chọn không
         for pid in profiles:
-            file_path = post_ids_dir / f"{pid}.json"
-            if file_path.exists():
-                try:
-                    with file_path.open("r", encoding="utf-8") as f:
-                        data = json.load(f)
-                        if isinstance(data, list) and len(data) > 0:
-                            return True
-                except Exception:
-                    pass
+            try:
+                if post_queue.pending_count(pid) > 0:
+                    return True
+            except Exception:
+                pass
         return False
     else:
-        # Mode "all": kiểm tra xem có file nào có dữ liệu không
-        json_files = list(post_ids_dir.glob("*.json"))
-        for file_path in json_files:
+        # Mode "all": kiểm tra xem có hàng đợi nào có dữ liệu không
+        for pid in post_queue.list_queue_profiles():
             try:
-                with file_path.open("r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    if isinstance(data, list) and len(data) > 0:
-                        return True
+                if post_queue.pending_count(pid) > 0:
+                    return True
             except Exception:
                 pass
         return False
@@ -1849,7 +1825,6 @@ def get_scan_stats() -> dict:
     Lấy số bài đã quét được cho từng profile_id từ các file JSON trong data/post_ids/
     """
     from pathlib import Path
-    import json
     import os
     
     POST_IDS_DIR = get_data_dir() / "post_ids"
@@ -1859,17 +1834,9 @@ def get_scan_stats() -> dict:
     if not POST_IDS_DIR.exists():
         return {"stats": stats}
     
-    json_files = list(POST_IDS_DIR.glob("*.json"))
-    for file_path in json_files:
-        profile_id = file_path.stem  # Lấy tên file không có extension
+    for profile_id in post_queue.list_queue_profiles():
         try:
-            with file_path.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    count = len(data)
-                else:
-                    count = 0
-                stats[profile_id] = count
+            stats[profile_id] = post_queue.pending_count(profile_id)
         except Exception:
             stats[profile_id] = 0
     
@@ -1900,9 +1867,165 @@ def get_info_progress() -> dict:
         "current": INFO_PROGRESS.get("current", 0),
         "total": INFO_PROGRESS.get("total", 0),
         "current_file": INFO_PROGRESS.get("current_file", ""),
+        "posts_per_minute": INFO_PROGRESS.get("posts_per_minute", 0.0),
     }
 
 
+@app.get("/info/http-stats")
+def get_info_http_stats() -> dict:
+    """
+    Thống kê session HTTP dùng chung cho GraphQL (số kết nối đã mở, số request đã gửi, request/kết nối)
+    """
+    return {"status": "ok", "stats": http_pool.get_pool_stats()}
+
+
+@app.get("/info/rate-governor")
+def get_info_rate_governor() -> dict:
+    """
+    Tốc độ hiện tại (request/phút, AIMD) của từng profile theo loại endpoint (graphql / html / graph_api),
+    số lần bị chặn (429 / 1357004 / Graph code 4, 17) và thời gian còn bị khoá
+    """
+    return {"status": "ok", "stats": rate_governor.get_stats()}
+
+
+@app.get("/info/pagination-checkpoints")
+def get_info_pagination_checkpoints() -> dict:
+    """
+    Checkpoint phân trang reactions/comments đang chờ tiếp tục (post dừng giữa chừng),
+    số lần đã tiếp tục và số trang không phải tải lại
+    """
+    return {"status": "ok", "stats": pagination_checkpoint.get_stats()}
+
+
+@app.get("/info/prefetch")
+def get_info_prefetch() -> dict:
+    """
+    Prefetch trang reactions/comments kế tiếp: số trang đã gửi trước, số trang dùng được,
+    số request bỏ phí (STOP / lỗi / hết trang) và số lần hết slot
+    """
+    return {"status": "ok", "stats": page_prefetch.get_stats()}
+
+
+@app.post("/info/recheck")
+def recheck_posts(payload: InfoRecheckRequest = Body(...)) -> dict:
+    """
+    Xếp lại các post đã crawl vào hàng đợi post_ids (của profile đã crawl) ở chế độ delta:
+    lần /info/run tiếp theo chỉ lấy reactions/comments mới, dừng khi gặp trang toàn user đã biết / tổng không đổi.
+    """
+    profile_filter = set(payload.profile_ids or [])
+    if payload.post_ids:
+        entries = []
+        for post_id in payload.post_ids:
+            state = engagement_state.load(post_id)
+            if state:
+                entries.append(state)
+    else:
+        entries = engagement_state.recent(payload.since_hours, limit=max(1, payload.limit))
+    by_profile: Dict[str, list] = {}
+    skipped = 0
+    for entry in entries:
+        profile_id = entry.get("profile_id")
+        if not profile_id or (profile_filter and profile_id not in profile_filter):
+            skipped += 1
+            continue
+        post = dict(entry.get("post") or {})
+        post.update({"id": entry.get("post_id"), "recheck": True})
+        by_profile.setdefault(profile_id, []).append(post)
+    try:
+        queued = {profile_id: post_queue.append_posts(profile_id, posts) for profile_id, posts in by_profile.items()}
+    except file_lock.FileLockTimeout as exc:
+        raise HTTPException(status_code=503, detail=f"Hàng đợi post_ids đang bị khoá, thử lại sau: {exc}") from exc
+    missing = len(payload.post_ids) - len(entries) if payload.post_ids else 0
+    print(f"🔁 [/info/recheck] Xếp lại {sum(queued.values())} post để lấy engagement mới (delta)")
+    return {"status": "ok", "queued": queued, "skipped": skipped, "missing_state": missing}
+
+
+@app.get("/info/engagement-state")
+def get_info_engagement_state() -> dict:
+    """
+    Thống kê delta re-crawl: số post có engagement state, số lần delta, số trang đã tải,
+    số lần dừng sớm (trang toàn user đã biết / tổng không đổi) và số reactions/comments mới
+    """
+    return {"status": "ok", "stats": engagement_state.get_stats()}
+
+
+@app.get("/info/scheduler")
+def get_info_scheduler() -> dict:
+    """
+    Crawl scheduler: budget request/phiên, budget trang/post, cửa sổ xếp hạng và phiên gần nhất của từng profile
+    (số post probe / crawl / hoãn, số request đã dùng)
+    """
+    return {"status": "ok", "stats": crawl_scheduler.get_stats()}
+
+
+@app.get("/info/payload-cache")
+def get_info_payload_cache() -> dict:
+    """
+    Thống kê payload cache (fb_dtsg/lsd theo profile): hits/misses, số lần refresh, tuổi và hạn dùng của từng profile
+    """
+    return {"status": "ok", "stats": payload_cache.get_stats()}
+
+
+@app.get("/info/post-details-cache")
+def get_info_post_details_cache() -> dict:
+    """
+    Thống kê cache get_id_from_url (URL share/bài -> post_id, owning_profile, post_text): hits/misses, số bài đang cache
+    """
+    return {"status": "ok", "stats": post_details_cache.get_stats()}
+
+
+@app.delete("/info/post-details-cache")
+def clear_info_post_details_cache() -> dict:
+    """Xoá cache get_id_from_url (vd: cần resolve lại nội dung bài đã sửa)"""
+    post_details_cache.clear()
+    return {"status": "ok"}
+
+
+@app.get("/storage/info")
+def get_storage_info() -> dict:
+    """
+    Backend lưu trữ đang dùng (STORAGE_BACKEND: json | sqlite) và số dòng từng bảng nếu là sqlite
+    """
+    return {"status": "ok", "storage": storage.get_stats()}
+
+
+@app.post("/storage/migrate")
+def migrate_storage_to_sqlite() -> dict:
+    """
+    Migrate 1 lần dữ liệu JSON (post_ids, results, groups.json, account_status.json) vào data/app_state.db.
+    Idempotent, không xóa file JSON. Đặt STORAGE_BACKEND = "sqlite" trong settings.json để bắt đầu dùng DB.
+    """
+    try:
+        summary = storage.migrate_from_json()
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Migrate sang SQLite thất bại: {exc}") from exc
+    return {"status": "ok", "migrated": summary, "backend": storage.backend_name()}
+
+
+@app.get("/info/profile-config")
+def get_info_profile_config() -> dict:
+    """
+    Thống kê repository cấu hình profile: số lần đọc từ cache (hits), số lần parse lại settings.json, số lần ghi
+    """
+    return {"status": "ok", "stats": profile_config.get_repository().get_stats()}
+
+
+@app.get("/info/processed-index")
+def get_info_processed_index() -> dict:
+    """
+    Thống kê processed index: số post đã crawl còn trong TTL, số lần bỏ qua được theo nguồn (browser/page_scan/info_queue)
+    """
+    return {"status": "ok", "stats": processed_index.get_stats()}
+
+
+@app.get("/info/post-claims")
+def get_info_post_claims() -> dict:
+    """
+    Thống kê claim registry: số post mỗi profile đang là chủ, số lần profile bỏ qua post đã có profile khác claim
+    """
+    return {"status": "ok", "stats": post_claims.get_stats()}
+
+
 # ==============================================================================
 # CONTROL API (STOP / PAUSE / RESUME) - theo spec Boss
 # ==============================================================================
@@ -1924,6 +2047,12 @@ def control_get_state() -> dict:
     return control_state.get_state()
 
 
+@app.get("/control/stop-latency")
+def control_stop_latency() -> dict:
+    """Độ trễ từ lúc bấm STOP tới lúc worker dừng, theo từng profile (ms)."""
+    return {"latency": control_state.get_stop_latency()}
+
+
 @app.post("/control/stop-all")
 def control_stop_all() -> dict:
     """
@@ -2050,18 +2179,11 @@ def _remove_profile_from_data_files(profile_id: str) -> None:
     
     try:
         # 1. Xóa khỏi account_status.json
-        status_file = get_data_dir() / "account_status.json"
-        if status_file.exists():
-            try:
-                with status_file.open("r", encoding="utf-8") as f:
-                    data = json.load(f) or {}
-                if isinstance(data, dict) and pid in data:
-                    del data[pid]
-                    with status_file.open("w", encoding="utf-8") as f:
-                        json.dump(data, f, ensure_ascii=False, indent=2)
-                    print(f"🗑️ Đã xóa profile_id {pid} khỏi account_status.json")
-            except Exception as e:
-                print(f"⚠️ Không thể xóa profile_id {pid} khỏi account_status.json: {e}")
+        try:
+            if remove_account_statuses([pid]):
+                print(f"🗑️ Đã xóa profile_id {pid} khỏi account_status")
+        except Exception as e:
+            print(f"⚠️ Không thể xóa profile_id {pid} khỏi account_status: {e}")
         
         # 2. Xóa khỏi groups.json
         try:
@@ -2088,15 +2210,10 @@ def _remove_profile_from_data_files(profile_id: str) -> None:
             except Exception as e:
                 print(f"⚠️ Không thể xóa profile_id {pid} khỏi frontend_state.json: {e}")
         
-        # 4. Xóa file post_ids/{profile_id}.json
-        post_ids_dir = get_data_dir() / "post_ids"
-        post_ids_file = post_ids_dir / f"{pid}.json"
-        if post_ids_file.exists():
-            try:
-                post_ids_file.unlink()
-                print(f"🗑️ Đã xóa file post_ids/{pid}.json")
-            except Exception as e:
-                print(f"⚠️ Không thể xóa file post_ids/{pid}.json: {e}")
+        # 4. Xóa hàng đợi post_ids/{profile_id} (.jsonl + .offset + .json cũ)
+        if pid in post_queue.list_queue_profiles():
+            post_queue.remove_queue(pid)
+            print(f"🗑️ Đã xóa hàng đợi post_ids/{pid}")
     except Exception as e:
         print(f"⚠️ Lỗi khi xóa profile_id {pid} khỏi data files: {e}")
 
@@ -2115,23 +2232,13 @@ def _cleanup_orphaned_profiles() -> None:
         valid_profile_ids = set(profiles.keys())
         
         # 1. Cleanup account_status.json
-        status_file = get_data_dir() / "account_status.json"
-        if status_file.exists():
-            try:
-                with status_file.open("r", encoding="utf-8") as f:
-                    data = json.load(f) or {}
-                if isinstance(data, dict):
-                    removed = []
-                    for pid in list(data.keys()):
-                        if pid not in valid_profile_ids:
-                            del data[pid]
-                            removed.append(pid)
-                    if removed:
-                        with status_file.open("w", encoding="utf-8") as f:
-                            json.dump(data, f, ensure_ascii=False, indent=2)
-                        print(f"🗑️ Đã cleanup {len(removed)} profile_id không hợp lệ khỏi account_status.json: {removed}")
-            except Exception as e:
-                print(f"⚠️ Không thể cleanup account_status.json: {e}")
+        try:
+            orphaned = [pid for pid in load_account_statuses() if pid not in valid_profile_ids]
+            removed = remove_account_statuses(orphaned) if orphaned else []
+            if removed:
+                print(f"🗑️ Đã cleanup {len(removed)} profile_id không hợp lệ khỏi account_status: {removed}")
+        except Exception as e:
+            print(f"⚠️ Không thể cleanup account_status: {e}")
         
         # 2. Cleanup frontend_state.json
         frontend_state_path = _get_frontend_state_path()
@@ -2214,6 +2321,9 @@ def _fetch_cookie_for_profile(profile_id: str) -> dict:
         
         print(f"✅ [{pid}] Đã lấy và lưu cookie thành công")
         return {"status": "ok", "profile_id": pid, "message": "Đã lấy và lưu cookie thành công"}
+    except profile_config.SettingsWriteError as exc:
+        print(f"❌ [{pid}] Lấy được cookie nhưng không ghi được settings.json: {exc}")
+        return {"status": "error", "profile_id": pid, "message": f"Không ghi được settings.json: {exc}", "write_failed": True}
     except Exception as exc:
         error_msg = str(exc)
         print(f"❌ [{pid}] Lỗi khi lấy cookie: {error_msg}")
@@ -2263,7 +2373,7 @@ def fetch_and_save_cookie(profile_id: str) -> dict:
     """
     result = _fetch_cookie_for_profile(profile_id)
     if result["status"] == "error":
-        raise HTTPException(status_code=400, detail=result["message"])
+        raise HTTPException(status_code=500 if result.get("write_failed") else 400, detail=result["message"])
     return {"status": "ok", "profile_id": result["profile_id"], "cookie": "đã lưu vào settings.json"}
 
 
@@ -2276,6 +2386,9 @@ def _get_latest_results_file_logic(filename_param: Optional[str] = None) -> dict
 
     RESULTS_DIR = get_data_dir() / "results"
 
+    # Materialize all_results_<ts>.json từ journal (.jsonl) nếu journal có dữ liệu mới
+    results_journal.compact_pending(RESULTS_DIR)
+
     # Nếu có filename, load file đó
     if filename_param:
         file_path = RESULTS_DIR / filename_param
@@ -2326,36 +2439,14 @@ def _get_latest_results_file_logic(filename_param: Optional[str] = None) -> dict
     if not RESULTS_DIR.exists():
         raise HTTPException(status_code=404, detail=f"Thư mục results không tồn tại: {RESULTS_DIR}")
 
-    # Pattern để parse timestamp từ tên file: all_results_YYYYMMDD_HHMMSS.json
-    pattern = re.compile(r'all_results_(\d{8})_(\d{6})\.json$')
-
-    # Tìm tất cả file JSON và parse timestamp
-    json_files = []
-    all_files = list(RESULTS_DIR.glob("*.json"))
-
-    for file_path in all_files:
-        match = pattern.match(file_path.name)
-        if match:
-            date_str, time_str = match.groups()
-            # Parse thành datetime để so sánh chính xác
-            try:
-                from datetime import datetime
-                # Parse YYYYMMDD HHMMSS
-                dt = datetime.strptime(f"{date_str} {time_str}", "%Y%m%d %H%M%S")
-                timestamp = dt.timestamp()  # Unix timestamp
-                json_files.append((file_path, timestamp, file_path.name))
-            except ValueError:
-                continue
-
-    if not json_files:
-        file_names = [f.name for f in all_files]
+    # Tra index (không glob + strptime + parse từng file)
+    entry = results_index.latest(RESULTS_DIR)
+    if entry is None:
+        file_names = [f.name for f in results_journal.result_runs(RESULTS_DIR)]
         raise HTTPException(status_code=404, detail=f"Không tìm thấy file JSON nào match pattern. Files found: {file_names}")
 
-    # Sắp xếp theo timestamp giảm dần (mới nhất trước)
-    json_files.sort(key=lambda x: x[1], reverse=True)
-
     # Lấy file gần nhất
-    latest_file, timestamp, filename = json_files[0]
+    latest_file, timestamp, filename = RESULTS_DIR / entry["filename"], entry["timestamp"], entry["filename"]
 
     try:
         with latest_file.open("r", encoding="utf-8") as f:
@@ -2394,13 +2485,148 @@ def get_latest_results_file_get(filename: Optional[str] = Query(None)) -> dict:
     return _get_latest_results_file_logic(filename)
 
 
+def _resolve_results_target(filename: Optional[str], from_timestamp: Optional[int], to_timestamp: Optional[int]):
+    """
+    Chọn file kết quả cho API phân trang/stream: theo filename, hoặc file mới nhất (trong khoảng nếu có).
+    Tính cả journal của lần chạy đang ghi (chưa compact) để không phải materialize file legacy.
+    Trả về (json_path, timestamp).
+    """
+    RESULTS_DIR = get_data_dir() / "results"
+
+    if filename:
+        if '..' in filename or '/' in filename or '\\' in filename or results_index.parse_timestamp(filename) is None:
+            raise HTTPException(status_code=400, detail=f"Tên file {filename} không hợp lệ")
+        json_path = RESULTS_DIR / filename
+        if not json_path.exists() and not results_journal.has_journal(json_path):
+            raise HTTPException(status_code=404, detail=f"File {filename} không tồn tại")
+        return json_path, int(results_index.parse_timestamp(filename).timestamp())
+
+    candidates = {entry["filename"]: entry["timestamp"] for entry in results_index.list_entries(RESULTS_DIR, from_timestamp, to_timestamp)}
+    for run_path in results_journal.journal_runs(RESULTS_DIR):
+        dt = results_index.parse_timestamp(run_path.name)
+        if dt is None:
+            continue
+        ts = int(dt.timestamp())
+        if (from_timestamp is None or ts >= from_timestamp) and (to_timestamp is None or ts <= to_timestamp):
+            candidates[run_path.name] = ts
+    if not candidates:
+        raise HTTPException(status_code=404, detail="Không tìm thấy file kết quả phù hợp")
+    filename = max(candidates, key=lambda name: candidates[name])
+    return RESULTS_DIR / filename, candidates[filename]
+
+
+def _results_summary(json_path: Path) -> dict:
+    """Tổng quan lấy từ sidecar của journal hoặc từ results index (không parse file kết quả)."""
+    if results_journal.has_journal(json_path):
+        return results_journal.read_counters(json_path)
+    entry = results_index.refresh(json_path.parent).get(json_path.name) or {}
+    return {k: entry.get(k, 0) for k in ("total_files", "total_posts_processed", "total_reactions", "total_comments")}
+
+
+def _parse_fields(fields: Optional[str]) -> list:
+    return [f.strip() for f in (fields or "").split(",") if f.strip()]
+
+
+def _project_result(result: dict, fields: list) -> dict:
+    """
+    Chỉ giữ các field được yêu cầu. Field đặc biệt "ids": post_id + danh sách id reactions/comments.
+    """
+    if not fields:
+        return result
+    projected = {}
+    for field in fields:
+        if field == "ids":
+            projected["post_id"] = result.get("post_id")
+            projected["reaction_ids"] = [u.get("id") for u in (result.get("reactions") or []) if isinstance(u, dict)]
+            projected["comment_ids"] = [c.get("id") for c in (result.get("comments") or []) if isinstance(c, dict)]
+        elif field in result:
+            projected[field] = result[field]
+    return projected
+
+
+def _iter_results_slice(json_path: Path, source_file: Optional[str], offset: int, limit: int, fields: list):
+    """Duyệt (file, result đã projection) từ vị trí offset, tối đa limit post (0 = hết)."""
+    index = 0
+    yielded = 0
+    for file_name, result in results_journal.iter_results(json_path):
+        if source_file and file_name != source_file:
+            continue
+        if index >= offset:
+            yield file_name, _project_result(result, fields)
+            yielded += 1
+            if limit and yielded >= limit:
+                return
+        index += 1
+
+
+@app.get("/data/results/page")
+def get_results_page(
+    filename: Optional[str] = Query(None),
+    from_timestamp: Optional[int] = Query(None),
+    to_timestamp: Optional[int] = Query(None),
+    source_file: Optional[str] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = Query(None),
+) -> dict:
+    """
+    Phân trang kết quả theo post (offset/limit, lọc theo source_file, projection qua fields=a,b hoặc fields=ids).
+    Bộ nhớ chỉ tỉ lệ với limit, không phụ thuộc kích thước file.
+    """
+    json_path, timestamp = _resolve_results_target(filename, from_timestamp, to_timestamp)
+    field_list = _parse_fields(fields)
+    items = [
+        {"file": file_name, "result": result}
+        for file_name, result in _iter_results_slice(json_path, source_file, offset, limit + 1, field_list)
+    ]
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {
+        "filename": json_path.name,
+        "timestamp": timestamp,
+        "summary": _results_summary(json_path),
+        "offset": offset,
+        "limit": limit,
+        "items": items,
+        "next_offset": offset + len(items) if has_more else None,
+    }
+
+
+@app.get("/data/results/stream")
+def stream_results(
+    filename: Optional[str] = Query(None),
+    from_timestamp: Optional[int] = Query(None),
+    to_timestamp: Optional[int] = Query(None),
+    source_file: Optional[str] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(0, ge=0),
+    fields: Optional[str] = Query(None),
+):
+    """
+    Stream kết quả dạng NDJSON (mỗi dòng 1 JSON) để UI render dần:
+    {"type": "meta", ...} -> {"type": "post", "file", "result"} x N -> {"type": "end", "count"}
+    """
+    json_path, timestamp = _resolve_results_target(filename, from_timestamp, to_timestamp)
+    field_list = _parse_fields(fields)
+
+    def _generate():
+        meta = {"type": "meta", "filename": json_path.name, "timestamp": timestamp, "summary": _results_summary(json_path)}
+        yield json.dumps(meta, ensure_ascii=False) + "\n"
+        count = 0
+        for file_name, result in _iter_results_slice(json_path, source_file, offset, limit, field_list):
+            count += 1
+            yield json.dumps({"type": "post", "file": file_name, "result": result}, ensure_ascii=False) + "\n"
+        yield json.dumps({"type": "end", "count": count}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(_generate(), media_type="application/x-ndjson")
+
+
 @app.get("/data/post-ids")
 def get_post_ids_list() -> dict:
     """
     Lấy danh sách tất cả file post_ids và nội dung của chúng.
     """
     from pathlib import Path
-    import json
 
     POST_IDS_DIR = get_data_dir() / "post_ids"
 
@@ -2408,29 +2634,17 @@ def get_post_ids_list() -> dict:
         return {"files": [], "total": 0}
 
     files_data = []
-    json_files = list(POST_IDS_DIR.glob("*.json"))
 
-    for file_path in json_files:
+    for profile_id in post_queue.list_queue_profiles():
         try:
-            with file_path.open("r", encoding="utf-8") as f:
-                content = f.read().strip()
-
-            # Parse JSON
-            data = json.loads(content)
-
-            # Xử lý cả trường hợp array hoặc object
-            if isinstance(data, list):
-                posts = data
-            elif isinstance(data, dict):
-                posts = [data]
-            else:
-                continue
+            # Chỉ các post chưa xử lý trong hàng đợi
+            posts = post_queue.pending_posts(profile_id)
 
             # Lấy thông tin từ posts
             for post in posts:
                 if isinstance(post, dict) and "id" in post:
                     files_data.append({
-                        "filename": file_path.name,
+                        "filename": f"{profile_id}.json",
                         "post_id": post.get("id"),
                         "flag": post.get("flag", ""),
                         "text": post.get("text", ""),
@@ -2465,8 +2679,8 @@ def cleanup_files_by_date(request: dict) -> dict:
         deleted_count = 0
         deleted_files = []
 
-        # Duyệt tất cả file .json
-        for file_path in results_dir.glob("*.json"):
+        # Duyệt mọi lần chạy (file .json, không tính sidecar .meta.json, + lần chạy chỉ có journal)
+        for file_path in results_journal.result_runs(results_dir):
             try:
                 # Extract date from filename (format: all_results_YYYYMMDD_HHMMSS.json)
                 filename = file_path.name
@@ -2476,7 +2690,8 @@ def cleanup_files_by_date(request: dict) -> dict:
 
                     # Nếu ngày file trùng với ngày được chọn thì xóa
                     if file_date == target_date:
-                        file_path.unlink()
+                        file_path.unlink(missing_ok=True)
+                        results_journal.remove_journal_files(file_path)
                         deleted_count += 1
                         deleted_files.append(filename)
             except (ValueError, IndexError):
@@ -2504,9 +2719,10 @@ def cleanup_all_files() -> dict:
     deleted_count = 0
     deleted_files = []
 
-    # Xóa tất cả file .json
-    for file_path in results_dir.glob("*.json"):
-        file_path.unlink()
+    # Xóa mọi lần chạy (file .json + journal + sidecar .meta.json đi kèm)
+    for file_path in results_journal.result_runs(results_dir):
+        file_path.unlink(missing_ok=True)
+        results_journal.remove_journal_files(file_path)
         deleted_count += 1
         deleted_files.append(file_path.name)
 
@@ -2539,11 +2755,8 @@ def cleanup_old_files(max_days: int = 3) -> dict:
     deleted_count = 0
     deleted_files = []
 
-    # Duyệt qua tất cả file trong thư mục
-    for file_path in RESULTS_DIR.glob("*.json"):
-        if not file_path.is_file():
-            continue
-
+    # Duyệt qua mọi lần chạy (file .json, không tính sidecar .meta.json, + lần chạy chỉ có journal)
+    for file_path in results_journal.result_runs(RESULTS_DIR):
         match = pattern.match(file_path.name)
         if not match:
             continue
@@ -2556,7 +2769,8 @@ def cleanup_old_files(max_days: int = 3) -> dict:
             # Kiểm tra tuổi file
             if current_time - file_datetime > max_age:
                 try:
-                    file_path.unlink()  # Xóa file
+                    file_path.unlink(missing_ok=True)  # Xóa file
+                    results_journal.remove_journal_files(file_path)
                     deleted_count += 1
                     deleted_files.append(file_path.name)
                     print(f"Đã xóa file cũ: {file_path.name}")
@@ -2591,7 +2805,6 @@ def get_results_by_date_range(request: dict) -> dict:
     Tìm và trả về file JSON có timestamp nằm trong khoảng thời gian được chỉ định
     """
     from pathlib import Path
-    import re
 
     RESULTS_DIR = get_data_dir() / "results"
 
@@ -2610,36 +2823,24 @@ def get_results_by_date_range(request: dict) -> dict:
     if not RESULTS_DIR.exists():
         raise HTTPException(status_code=404, detail=f"Thư mục results không tồn tại: {RESULTS_DIR}")
 
-    # Pattern để parse timestamp từ tên file
-    pattern = re.compile(r'all_results_(\d{8})_(\d{6})\.json$')
-
-    # Tìm tất cả file JSON và parse timestamp
-    matching_files = []
-    all_files = list(RESULTS_DIR.glob("*.json"))
-
-    for file_path in all_files:
-        match = pattern.match(file_path.name)
-        if match:
-            date_str, time_str = match.groups()
-            try:
-                from datetime import datetime
-                dt = datetime.strptime(f"{date_str} {time_str}", "%Y%m%d %H%M%S")
-                timestamp = dt.timestamp()
-
-                # Kiểm tra xem timestamp có nằm trong khoảng không
-                if from_timestamp <= timestamp <= to_timestamp:
-                    matching_files.append((file_path, timestamp, file_path.name))
-            except ValueError:
-                continue
+    # Materialize all_results_<ts>.json từ journal (.jsonl) nếu journal có dữ liệu mới
+    results_journal.compact_pending(RESULTS_DIR)
 
-    if not matching_files:
+    # Tra index: file mới nhất có timestamp trong khoảng
+    entry = results_index.latest(RESULTS_DIR, from_timestamp, to_timestamp)
+    if entry is None:
         raise HTTPException(status_code=404, detail=f"Không tìm thấy file JSON nào trong khoảng thời gian từ {from_timestamp} đến {to_timestamp}")
 
-    # Sắp xếp theo timestamp giảm dần (mới nhất trước)
-    matching_files.sort(key=lambda x: x[1], reverse=True)
-
     # Lấy file gần nhất trong khoảng
-    latest_file, timestamp, filename = matching_files[0]
+    latest_file, timestamp, filename = RESULTS_DIR / entry["filename"], entry["timestamp"], entry["filename"]
+
+    # Chỉ cần tổng quan -> trả từ index, không đọc file
+    if request.get("summary_only"):
+        return {
+            "filename": filename,
+            "timestamp": int(timestamp),
+            "summary": entry,
+        }
 
     try:
         with latest_file.open("r", encoding="utf-8") as f:
@@ -2664,6 +2865,7 @@ def get_results_by_date_range(request: dict) -> dict:
     return {
         "filename": filename,
         "timestamp": int(timestamp),
+        "summary": entry,
         "data": data
     }
 
@@ -2673,7 +2875,6 @@ def get_files_in_date_range(request: dict) -> dict:
     Trả về danh sách các file JSON có timestamp trong khoảng thời gian được chỉ định
     """
     from pathlib import Path
-    import re
 
     RESULTS_DIR = get_data_dir() / "results"
 
@@ -2692,35 +2893,23 @@ def get_files_in_date_range(request: dict) -> dict:
     if not RESULTS_DIR.exists():
         raise HTTPException(status_code=404, detail=f"Thư mục results không tồn tại: {RESULTS_DIR}")
 
-    # Pattern để parse timestamp từ tên file
-    pattern = re.compile(r'all_results_(\d{8})_(\d{6})\.json$')
-
-    # Tìm tất cả file JSON và parse timestamp
-    matching_files = []
-    all_files = list(RESULTS_DIR.glob("*.json"))
-
-    for file_path in all_files:
-        match = pattern.match(file_path.name)
-        if match:
-            date_str, time_str = match.groups()
-            try:
-                from datetime import datetime
-                dt = datetime.strptime(f"{date_str} {time_str}", "%Y%m%d %H%M%S")
-                timestamp = dt.timestamp()
-
-                # Kiểm tra xem timestamp có nằm trong khoảng không
-                if from_timestamp <= timestamp <= to_timestamp:
-                    matching_files.append({
-                        "filename": file_path.name,
-                        "timestamp": int(timestamp),
-                        "filepath": str(file_path),
-                        "date_formatted": dt.strftime("%d/%m/%Y %H:%M:%S")
-                    })
-            except ValueError:
-                continue
-
-    # Sắp xếp theo timestamp giảm dần (mới nhất trước)
-    matching_files.sort(key=lambda x: x["timestamp"], reverse=True)
+    # Materialize all_results_<ts>.json từ journal (.jsonl) nếu journal có dữ liệu mới
+    results_journal.compact_pending(RESULTS_DIR)
+
+    # Tra index (kèm size và số post/reactions/comments, không parse file)
+    matching_files = [
+        {
+            "filename": entry["filename"],
+            "timestamp": entry["timestamp"],
+            "filepath": str(RESULTS_DIR / entry["filename"]),
+            "date_formatted": entry["date_formatted"],
+            "size": entry["size"],
+            "total_posts_processed": entry["total_posts_processed"],
+            "total_reactions": entry["total_reactions"],
+            "total_comments": entry["total_comments"],
+        }
+        for entry in results_index.list_entries(RESULTS_DIR, from_timestamp, to_timestamp)
+    ]
 
     return {
         "files": matching_files,
@@ -2738,7 +2927,6 @@ def delete_data_files(request: dict) -> dict:
     Xóa các file JSON theo danh sách filenames được chỉ định
     """
     from pathlib import Path
-    import os
 
     RESULTS_DIR = get_data_dir() / "results"
 
@@ -2762,11 +2950,14 @@ def delete_data_files(request: dict) -> dict:
             failed_files.append({"filename": filename, "error": "Tên file không hợp lệ"})
             continue
 
-        file_path = RESULTS_DIR / filename
+        # Tên sidecar .meta.json -> xoá theo file gốc của lần chạy đó
+        file_path = results_journal.legacy_path_for(RESULTS_DIR / filename)
 
         try:
-            if file_path.exists():
-                os.remove(file_path)
+            if file_path.exists() or results_journal.has_journal(file_path):
+                file_path.unlink(missing_ok=True)
+                # Xóa luôn journal/sidecar để file không bị compact lại
+                results_journal.remove_journal_files(file_path)
                 deleted_files.append(filename)
                 print(f"🗑️ Đã xóa file: {filename}")
             else:
@@ -2787,141 +2978,71 @@ class ScanGroupsRequest(BaseModel):
     post_count: int
     start_date: str  # Format: YYYY-MM-DD
     end_date: str    # Format: YYYY-MM-DD
+    full_rescan: bool = False  # True = bỏ qua watermark, quét lại toàn bộ khoảng ngày
 
-# Queue để xử lý quét group lần lượt
+# Queue task quét group (mỗi task = 1 profile); các task trong queue được quét song song theo group
 _group_scan_queue = []
 _group_scan_lock = threading.Lock()
 _group_scan_processing = False
-_group_scan_stop_requested = False  # Flag để dừng group scan
+_group_scan_stop_event = threading.Event()  # Set để dừng group scan (đánh thức ngay, không cần poll)
+_group_scan_engine = None  # GroupScanEngine của lượt quét gần nhất (thống kê groups/phút, posts/phút)
 
 def _process_group_scan_queue():
-    """Xử lý queue quét group lần lượt"""
-    global _group_scan_processing, _group_scan_stop_requested
+    """
+    Xử lý queue quét group: lấy hết task đang chờ thành 1 lượt, GroupScanEngine quét song song
+    tối đa GROUP_SCAN_CONCURRENCY group (budget request riêng cho từng access token).
+    Task thêm vào trong lúc đang quét sẽ chạy ở lượt kế tiếp.
+    """
+    global _group_scan_processing, _group_scan_engine
     
     with _group_scan_lock:
-        if _group_scan_processing or len(_group_scan_queue) == 0 or _group_scan_stop_requested:
+        if _group_scan_processing or len(_group_scan_queue) == 0 or _group_scan_stop_event.is_set():
             return
         _group_scan_processing = True
-        _group_scan_stop_requested = False  # Reset flag khi bắt đầu
     
     try:
+        from core.group_scan import GroupScanEngine
+        from core.join_groups import load_groups
+        from worker.get_post_from_page import get_posts_from_page
+
+        settings = get_settings()
+        engine = GroupScanEngine(
+            concurrency=settings.group_scan_concurrency,
+            token_requests_per_minute=settings.group_scan_token_rpm,
+        )
+        _group_scan_engine = engine
+
         while True:
-            # Check stop flag trước khi xử lý task tiếp theo
+            # Check stop flag trước khi lấy lượt task tiếp theo
             with _group_scan_lock:
-                if _group_scan_stop_requested:
+                if _group_scan_stop_event.is_set():
                     print("🛑 Đã nhận yêu cầu dừng group scan")
                     break
                 if len(_group_scan_queue) == 0:
                     break
-                task = _group_scan_queue.pop(0)
-            
-            # Xử lý task
-            profile_id = task["profile_id"]
-            post_count = task["post_count"]
-            start_date = task["start_date"]
-            end_date = task["end_date"]
+                tasks = _group_scan_queue[:]
+                _group_scan_queue.clear()
             
             print(f"\n{'='*60}")
-            print(f"🚀 Bắt đầu quét group cho profile: {profile_id}")
-            print(f"   Số bài viết: {post_count}")
-            print(f"   Từ ngày: {start_date} đến {end_date}")
+            print(f"🚀 Bắt đầu quét group cho {len(tasks)} profile: {', '.join(t['profile_id'] for t in tasks)}")
+            for task in tasks:
+                print(f"   {task['profile_id']}: {task['post_count']} bài, từ {task['start_date']} đến {task['end_date']}")
             print(f"{'='*60}\n")
             
             try:
-                # Đọc groups.json
-                groups_file = get_config_dir() / "groups.json"
-                if not groups_file.exists():
-                    print(f"❌ File groups.json không tồn tại: {groups_file}")
-                    continue
-                
-                with groups_file.open("r", encoding="utf-8") as f:
-                    groups_data = json.load(f)
-                
-                # Lấy danh sách groups cho profile này
-                profile_groups = groups_data.get(profile_id, [])
-                if not profile_groups:
-                    print(f"⚠️ Không có group nào cho profile {profile_id}")
-                    continue
-                
-                print(f"📋 Tìm thấy {len(profile_groups)} group(s) cho profile {profile_id}")
-                
-                # Import function
-                from worker.get_post_from_page import get_posts_from_page
-                
-                # Quét từng group
-                total_posts_scanned = 0
-                for group_info in profile_groups:
-                    # Check stop flag trước mỗi group
-                    with _group_scan_lock:
-                        if _group_scan_stop_requested:
-                            print("🛑 Đã nhận yêu cầu dừng, dừng quét group")
-                            break
-                    
-                    page_id = group_info.get("page_id")
-                    url_page = group_info.get("url_page", "")
-                    
-                    if not page_id:
-                        print(f"⚠️ Bỏ qua group không có page_id: {group_info}")
-                        continue
-                    
-                    print(f"\n📌 Xử lý group: {page_id}")
-                    if url_page:
-                        print(f"   URL: {url_page}")
-                    
-                    # Check stop flag trước khi gọi get_posts_from_page
-                    with _group_scan_lock:
-                        if _group_scan_stop_requested:
-                            print("🛑 Đã nhận yêu cầu dừng, bỏ qua group còn lại")
-                            break
-                    
-                    try:
-                        # Gọi get_posts_from_page với limit = post_count
-                        # Hàm này sẽ tự động:
-                        # 1. Lấy posts từ Graph API
-                        # 2. Gọi get_id_from_url cho mỗi post để lấy chi tiết
-                        # 3. Lưu vào data/post_ids/{profile_id}.json
-                        posts = get_posts_from_page(
-                            page_id=page_id,
-                            profile_id=profile_id,
-                            start_date=start_date,
-                            end_date=end_date,
-                            limit=post_count
-                        )
-                        
-                        # Check stop flag sau khi quét xong group
-                        with _group_scan_lock:
-                            if _group_scan_stop_requested:
-                                print("🛑 Đã nhận yêu cầu dừng sau khi quét xong group")
-                                break
-                        
-                        if posts:
-                            total_posts_scanned += len(posts)
-                            print(f"   ✅ Đã quét {len(posts)} posts từ group {page_id}")
-                        else:
-                            print(f"   ⚠️ Không lấy được posts nào từ group {page_id}")
-                        
-                    except Exception as e:
-                        print(f"   ❌ Lỗi khi quét group {page_id}: {e}")
-                        import traceback
-                        traceback.print_exc()
-                        continue
-                
-                # Check stop flag sau khi quét xong profile
-                with _group_scan_lock:
-                    if _group_scan_stop_requested:
-                        print("🛑 Đã nhận yêu cầu dừng sau khi quét xong profile")
-                        break
-                
-                print(f"\n✅ Hoàn thành quét {len(profile_groups)} group(s), tổng cộng {total_posts_scanned} posts")
-                
-                print(f"\n✅ Hoàn thành quét group cho profile: {profile_id}\n")
-                
+                # get_posts_from_page sẽ tự động:
+                # 1. Lấy posts từ Graph API (kèm tác giả + nội dung nếu GROUP_SCAN_GRAPH_FIELDS), chờ budget token trước mỗi request
+                # 2. Post thiếu dữ liệu mới gọi get_id_from_url (song song có giới hạn, pipeline với trang kế tiếp)
+                # 3. Lưu vào data/post_ids/{profile_id}.json
+                engine.run(tasks, get_posts_from_page, load_groups, _group_scan_stop_event)
             except Exception as e:
-                print(f"❌ Lỗi khi xử lý profile {profile_id}: {e}")
+                print(f"❌ Lỗi khi quét group: {e}")
                 import traceback
                 traceback.print_exc()
     
     finally:
+        if _group_scan_engine is not None:
+            _group_scan_engine.finish()
         with _group_scan_lock:
             _group_scan_processing = False
             # Chỉ reset stop flag nếu không phải do stop request
@@ -2930,7 +3051,7 @@ def _process_group_scan_queue():
         # KHÔNG tự động tiếp tục xử lý queue khi hoàn thành
         # Chỉ tiếp tục nếu được gọi lại từ API
         with _group_scan_lock:
-            if _group_scan_stop_requested:
+            if _group_scan_stop_event.is_set():
                 print("🛑 Group scan đã dừng theo yêu cầu.")
             else:
                 print("✅ Group scan đã hoàn thành và tự động dừng. Gọi lại API để tiếp tục.")
@@ -2943,7 +3064,8 @@ def scan_groups(request: ScanGroupsRequest) -> dict:
     - Đọc groups.json để lấy danh sách groups cho mỗi profile
     - Với mỗi group, quét số lượng bài viết trong khoảng thời gian
     - Lưu kết quả vào data/post_ids/{profile_id}.json
-    - Xử lý lần lượt nếu có nhiều profile
+    - Nhiều profile / nhiều group được quét song song (GROUP_SCAN_CONCURRENCY, budget theo access token)
+    - Group đã quét trước đó chỉ lấy bài mới hơn watermark (full_rescan=true để quét lại toàn bộ)
     """
     profile_ids = request.profile_ids
     post_count = request.post_count
@@ -2970,13 +3092,14 @@ def scan_groups(request: ScanGroupsRequest) -> dict:
     # Thêm các task vào queue
     with _group_scan_lock:
         # Reset stop flag khi bắt đầu quét mới
-        _group_scan_stop_requested = False
+        _group_scan_stop_event.clear()
         for profile_id in profile_ids:
             task = {
                 "profile_id": profile_id,
                 "post_count": post_count,
                 "start_date": start_date,
-                "end_date": end_date
+                "end_date": end_date,
+                "full_rescan": bool(request.full_rescan),
             }
             _group_scan_queue.append(task)
     
@@ -2992,16 +3115,28 @@ def scan_groups(request: ScanGroupsRequest) -> dict:
 
 @app.get("/scan-groups/status")
 def get_scan_groups_status() -> dict:
-    """Lấy trạng thái queue quét group"""
+    """Lấy trạng thái queue quét group + thống kê lượt quét (groups/phút, posts/phút, budget từng token)"""
+    engine = _group_scan_engine
     with _group_scan_lock:
         return {
             "processing": _group_scan_processing,
             "queue_length": len(_group_scan_queue),
             "queue": _group_scan_queue.copy(),
-            "stop_requested": _group_scan_stop_requested
+            "stop_requested": _group_scan_stop_event.is_set(),
+            "engine": engine.get_stats() if engine is not None else None,
         }
 
 
+@app.get("/scan-groups/enrich-stats")
+def get_scan_groups_enrich_stats() -> dict:
+    """
+    Tỉ lệ làm giàu theo group (lần quét gần nhất): số post lấy thẳng tác giả/nội dung từ Graph API
+    và số post phải fallback tải HTML (get_id_from_url)
+    """
+    from worker.get_post_from_page import get_enrich_stats
+    return {"status": "ok", **get_enrich_stats()}
+
+
 @app.post("/scan-groups/stop")
 def stop_scan_groups() -> dict:
     """
@@ -3009,10 +3144,10 @@ def stop_scan_groups() -> dict:
     - Set flag stop để dừng xử lý queue
     - Clear queue nếu cần
     """
-    global _group_scan_stop_requested, _group_scan_queue
+    global _group_scan_queue
     
     with _group_scan_lock:
-        _group_scan_stop_requested = True
+        _group_scan_stop_event.set()
         queue_length = len(_group_scan_queue)
         # Clear queue để không xử lý các task còn lại
         _group_scan_queue.clear()
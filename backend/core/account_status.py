@@ -6,6 +6,7 @@ from core.browser import FBController
 
 
 from core.paths import get_data_dir
+from core import storage
 STATUS_FILE = get_data_dir() / "account_status.json"
 
 
@@ -172,30 +173,75 @@ def check_account_status_brutal(fb: FBController) -> Dict[str, Any]:
     }
 
 
+def _read_status_file() -> Dict[str, Any]:
+    if not STATUS_FILE.exists():
+        return {}
+    try:
+        with STATUS_FILE.open("r", encoding="utf-8") as f:
+            data = json.load(f) or {}
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _write_status_file(data: Dict[str, Any]) -> None:
+    STATUS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with STATUS_FILE.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
 def save_account_status(profile_id: str, result: Dict[str, Any]) -> None:
     """
-    Lưu trạng thái account vào file JSON để backend/frontend có thể đọc.
+    Lưu trạng thái account vào file JSON (hoặc bảng account_status nếu STORAGE_BACKEND = "sqlite")
+    để backend/frontend có thể đọc.
     Không raise lỗi để tránh ảnh hưởng luồng chính.
     """
     try:
-        STATUS_FILE.parent.mkdir(parents=True, exist_ok=True)
-        data: Dict[str, Any] = {}
-        if STATUS_FILE.exists():
-            try:
-                with STATUS_FILE.open("r", encoding="utf-8") as f:
-                    data = json.load(f) or {}
-            except Exception:
-                data = {}
-
+        store = storage.get_store()
+        if store is not None:
+            store.status_save(str(profile_id), result)
+            return
+        data = _read_status_file()
         data[str(profile_id)] = result
-
-        with STATUS_FILE.open("w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        _write_status_file(data)
     except Exception:
         # Không để bất kỳ lỗi ghi file nào làm vỡ luồng chính.
         pass
 
 
-
-
-
+def load_account_statuses() -> Dict[str, Any]:
+    """Snapshot trạng thái account: {profile_id: result}. Lỗi -> {}."""
+    try:
+        store = storage.get_store()
+        if store is not None:
+            return store.status_load()
+        return _read_status_file()
+    except Exception:
+        return {}
+
+
+def remove_account_statuses(profile_ids) -> list:
+    """Xóa trạng thái của các profile_id, trả về danh sách profile_id thực sự đã xóa."""
+    pids = [str(pid) for pid in profile_ids]
+    store = storage.get_store()
+    if store is not None:
+        return store.status_remove(pids)
+    data = _read_status_file()
+    removed = [pid for pid in pids if pid in data]
+    if removed:
+        for pid in removed:
+            del data[pid]
+        _write_status_file(data)
+    return removed
+
+
+def export_to_store(store) -> int:
+    """Migrator: chép account_status.json vào SqliteStore. Trả về số profile đã chép."""
+    copied = 0
+    for pid, result in _read_status_file().items():
+        try:
+            store.status_save(str(pid), result)
+            copied += 1
+        except Exception as e:
+            print(f"⚠️ Không thể migrate trạng thái account của {pid}: {e}")
+    return copied
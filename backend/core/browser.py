@@ -6,85 +6,15 @@ import re
 from urllib.parse import urlparse, parse_qs, unquote
 import os
 import sys
-import threading
 from core.settings import get_settings, SETTINGS_PATH
+from core.profile_config import get_repository as get_profile_config_repository, SettingsWriteError
 from core import control as control_state
 from core.control import smart_sleep
-from core.paths import get_data_dir
+from core import file_lock
+from core import post_queue
+from core import processed_index
+from core import post_claims
 
-# Lock để bảo vệ việc ghi settings.json (tránh race condition khi nhiều profile cùng lưu cookie)
-_settings_write_lock = threading.Lock()
-
-
-def _acquire_post_ids_lock_browser(lock_file, timeout_seconds: float = 10.0, poll: float = 0.1):
-    """Lock file đơn giản (cross-platform)"""
-    start = time.time()
-    while True:
-        try:
-            fd = os.open(str(lock_file), os.O_CREAT | os.O_EXCL | os.O_RDWR)
-            return fd
-        except FileExistsError:
-            if timeout_seconds and timeout_seconds > 0 and (time.time() - start >= timeout_seconds):
-                return None
-            time.sleep(poll)
-        except Exception:
-            return None
-
-
-def _release_post_ids_lock_browser(fd, lock_file):
-    """Release lock file"""
-    try:
-        if fd is not None:
-            try:
-                os.close(fd)
-            except Exception:
-                pass
-        try:
-            if lock_file.exists():
-                lock_file.unlink()
-        except Exception:
-            pass
-    except Exception:
-        pass
-
-
-def _save_post_ids_file_safe_browser(filepath, data):
-    """Lưu file post_ids JSON an toàn với lock"""
-    from pathlib import Path
-    lock_file = Path(str(filepath) + ".lock")
-    
-    fd = _acquire_post_ids_lock_browser(lock_file, timeout_seconds=10.0)
-    if fd is None:
-        print(f"⚠️ Không lấy được lock để lưu {filepath}, bỏ qua")
-        return
-    
-    try:
-        # Đọc lại file hiện có trong lock
-        existing_data = []
-        if filepath.exists():
-            try:
-                with filepath.open("r", encoding="utf8") as f:
-                    existing_data = json.load(f)
-            except Exception:
-                existing_data = []
-        
-        # Merge với dữ liệu mới (tránh trùng)
-        existing_ids = {item.get('id') or item.get('post_id') for item in existing_data if item.get('id') or item.get('post_id')}
-        new_items = [item for item in data if (item.get('id') or item.get('post_id')) not in existing_ids]
-        merged_data = existing_data + new_items
-        
-        # Atomic write
-        tmp_file = Path(str(filepath) + ".tmp")
-        with tmp_file.open("w", encoding="utf8") as f:
-            json.dump(merged_data, f, indent=2, ensure_ascii=False)
-            f.flush()
-            os.fsync(f.fileno())
-        
-        os.replace(str(tmp_file), str(filepath))
-    except Exception as e:
-        print(f"⚠️ Lỗi khi lưu file {filepath}: {e}")
-    finally:
-        _release_post_ids_lock_browser(fd, lock_file)
 # ==============================================================================
 # JS TOOLS & HELPER FUNCTIONS
 # ==============================================================================
@@ -450,26 +380,7 @@ class FBController:
                 print("⚠️ Không có post_id trong details")
                 return False
                 
-            folder = get_data_dir() / "post_ids"
-            folder.mkdir(parents=True, exist_ok=True)
-            filepath = folder / f"{self.profile_id}.json"
-
-            data = []
-            if filepath.exists():
-                try:
-                    with filepath.open("r", encoding="utf8") as f:
-                        data = json.load(f)
-                except:
-                    data = []
-
-            # 1. Tránh trùng ID (Check cả format cũ post_id và mới id)
-            for item in data:
-                existing_id = item.get("id") or item.get("post_id")
-                if existing_id == post_id:
-                    print(f"🔁 ID {post_id} đã tồn tại -> bỏ qua.")
-                    return False
-
-            # 2. Format dữ liệu JSON theo yêu cầu
+            # 1. Format dữ liệu JSON theo yêu cầu
             # Map flag: green -> xanh, yellow -> vàng
             flag_vn = "xanh" if post_type == "green" else "vàng" if post_type == "yellow" else post_type
             
@@ -484,10 +395,29 @@ class FBController:
                 "owning_profile": owning_profile
             }
 
-            data.append(record)
+            # 2. Post đã crawl trong TTL (processed index) -> không đưa lại vào hàng đợi
+            if processed_index.is_processed(post_id):
+                processed_index.record_saved("browser")
+                print(f"⏭️ ID {post_id} đã crawl gần đây -> bỏ qua.")
+                return False
 
-            # Lưu file với lock để tránh conflict khi nhiều luồng cùng ghi
-            _save_post_ids_file_safe_browser(filepath, data)
+            # 3. Profile khác đã claim bài này (claim registry) -> chỉ ghi nhận đã thấy, không crawl trùng
+            owner = post_claims.claim([post_id], self.profile_id).get(str(post_id), self.profile_id)
+            if owner != str(self.profile_id):
+                print(f"👥 ID {post_id} đã được profile {owner} claim -> bỏ qua.")
+                return False
+
+            # 4. Append vào hàng đợi post_ids (tự tránh trùng ID với các post chưa xử lý)
+            try:
+                added = post_queue.append_posts(self.profile_id, [record])
+            except file_lock.FileLockTimeout as e:
+                # Chưa ghi được vào hàng đợi: trả claim để lần gặp lại bài này còn lưu được
+                post_claims.release([post_id], self.profile_id)
+                print(f"❌ Không lưu được ID {post_id} vào hàng đợi: {e}")
+                return False
+            if not added:
+                print(f"🔁 ID {post_id} đã tồn tại -> bỏ qua.")
+                return False
 
             print(f"💾 Đã lưu Post {post_id} | Chủ bài: {owning_profile.get('name', 'N/A')}")
             
@@ -690,7 +620,7 @@ class FBController:
         """
         Lấy cookie từ browser context và lưu thẳng vào:
         backend/config/settings.json -> PROFILE_IDS[profile_id]["cookie"]
-        Trả về cookie_string.
+        Trả về cookie_string. Không ghi được xuống settings.json thì raise SettingsWriteError.
         """
         try:
             print("🍪 Đang trích xuất Cookie (Key=ID, Value=String)...")
@@ -733,51 +663,21 @@ class FBController:
                     print("⚠️ profile_id rỗng, không ghi vào settings.json")
                     return cookie_string
 
-                # 🔒 Dùng lock để tránh race condition khi nhiều profile cùng lưu cookie
-                with _settings_write_lock:
-                    # Đọc lại file trong lock để đảm bảo có dữ liệu mới nhất
-                    with SETTINGS_PATH.open("r", encoding="utf-8") as f:
-                        raw = json.load(f)
-
-                    if not isinstance(raw, dict):
-                        raw = {}
-
-                    profiles = raw.get("PROFILE_IDS")
-                    if profiles is None or isinstance(profiles, (list, str)):
-                        profiles = {}
-                    if not isinstance(profiles, dict):
-                        profiles = {}
-
-                    cfg = profiles.get(pid)
-                    if not isinstance(cfg, dict):
-                        cfg = {}
-                    cfg["cookie"] = cookie_string
-                    profiles[pid] = cfg
-                    raw["PROFILE_IDS"] = profiles
-
-                    # Ghi file (atomic write: temp file rồi replace)
-                    import tempfile
-                    directory = str(SETTINGS_PATH.parent)
-                    os.makedirs(directory, exist_ok=True)
-                    fd, tmp_path = tempfile.mkstemp(prefix="settings_", suffix=".json", dir=directory)
-                    try:
-                        with os.fdopen(fd, "w", encoding="utf-8") as f:
-                            json.dump(raw, f, ensure_ascii=False, indent=2)
-                            f.write("\n")
-                        os.replace(tmp_path, str(SETTINGS_PATH))
-                    except Exception:
-                        try:
-                            os.remove(tmp_path)
-                        except Exception:
-                            pass
-                        raise
+                # 🔒 Ghi qua settings writer: cookie của nhiều profile lưu cùng lúc được gom vào 1 lần ghi,
+                # có lock file giữa các tiến trình nên không mất update của nhau
+                get_profile_config_repository().update(pid, {"cookie": cookie_string})
 
                 print(f"✅ Đã cập nhật cookie vào settings.json cho profile_id={pid}")
+            except SettingsWriteError:
+                raise
             except Exception as e:
                 print(f"⚠️ Không ghi được cookie vào settings.json: {e}")
 
             return cookie_string
             
+        except SettingsWriteError as e:
+            print(f"❌ Không lưu được cookie vào settings.json: {e}")
+            raise
         except Exception as e:
             print(f"❌ Lỗi lưu cookies: {e}")
             return None
@@ -15,6 +15,29 @@ CONTROL_STATE_PATH = get_data_dir() / "runtime_control.json"
 
 _lock = threading.Lock()
 
+# Cache flags trong bộ nhớ (process-wide) để check_flags không phải open + json.load mỗi lần.
+# Invalidate theo chữ ký file (mtime_ns, size, inode); stat tối đa 1 lần mỗi _CACHE_STAT_INTERVAL giây.
+# Ghi trong cùng process (save_state) sẽ đẩy state mới vào cache ngay.
+_CACHE_STAT_INTERVAL = 0.05
+_cache_lock = threading.Lock()
+_cache: Dict[str, Any] = {"sig": None, "checked_at": 0.0, "flags": None}
+
+# Control bus: worker block trên Condition thay vì sleep-poll; mọi thay đổi state
+# (ghi trong process hoặc file bị process khác ghi) sẽ notify_all để đánh thức ngay.
+# Một watcher thread/process stat file (chỉ chạy khi có worker đang chờ).
+_BUS_SAFETY_TIMEOUT = 5.0
+_bus = threading.Condition()
+_bus_version = 0
+_bus_waiters = 0
+_async_waiters: set = set()
+_watcher_lock = threading.Lock()
+_watcher_thread: Optional[threading.Thread] = None
+
+# Độ trễ STOP (từ lúc bấm stop tới lúc worker thấy) theo profile
+STOP_LATENCY_PATH = get_data_dir() / "control_latency.json"
+_latency_lock = threading.Lock()
+_observed_stops: set = set()
+
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -36,6 +59,8 @@ def _default_state() -> Dict[str, Any]:
         "paused_profiles": [],
         "stopped_profiles": [],  # STOP theo profile (dừng ngay profile đó)
         "profile_states": {},  # {profile_id: RUNNING|PAUSED|STOPPED|ERROR}
+        "global_stop_requested_at": None,  # epoch seconds, để đo độ trễ STOP
+        "stop_requested_at": {},  # {profile_id: epoch seconds}
         "updated_at": _now_iso(),
     }
 
@@ -62,6 +87,8 @@ def load_state() -> Dict[str, Any]:
             base["stopped_profiles"] = []
         if not isinstance(base.get("profile_states"), dict):
             base["profile_states"] = {}
+        if not isinstance(base.get("stop_requested_at"), dict):
+            base["stop_requested_at"] = {}
         base["updated_at"] = _now_iso()
         return base
     except Exception:
@@ -75,6 +102,61 @@ def save_state(state: Dict[str, Any]) -> None:
     state.setdefault("profile_states", {})
     state["updated_at"] = _now_iso()
     _atomic_write_json(CONTROL_STATE_PATH, state)
+    # Đẩy state mới vào cache để các luồng trong process thấy ngay (không chờ stat)
+    _store_cache(state, _file_sig())
+
+
+def _file_sig() -> Optional[Tuple[int, int, int]]:
+    try:
+        st = CONTROL_STATE_PATH.stat()
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except Exception:
+        return None
+
+
+def _build_flags(st: Dict[str, Any]) -> Dict[str, Any]:
+    """Tính sẵn các set stopped/paused để check_flags chỉ còn là lookup."""
+    stop_at = st.get("stop_requested_at")
+    return {
+        "global_emergency_stop": bool(st.get("global_emergency_stop")),
+        "global_pause": bool(st.get("global_pause")),
+        "stopped": frozenset(str(x).strip() for x in (st.get("stopped_profiles") or []) if str(x).strip()),
+        "paused": frozenset(str(x).strip() for x in (st.get("paused_profiles") or []) if str(x).strip()),
+        "global_stop_requested_at": st.get("global_stop_requested_at"),
+        "stop_requested_at": dict(stop_at) if isinstance(stop_at, dict) else {},
+    }
+
+
+def _store_cache(st: Dict[str, Any], sig) -> Dict[str, Any]:
+    flags = _build_flags(st)
+    with _cache_lock:
+        previous = _cache["flags"]
+        _cache["sig"] = sig
+        _cache["flags"] = flags
+        _cache["checked_at"] = time.monotonic()
+    if previous is not None and previous != flags:
+        _notify_changed()
+    return flags
+
+
+def invalidate_cache() -> None:
+    """Buộc lần check_flags kế tiếp đọc lại runtime_control.json."""
+    with _cache_lock:
+        _cache["sig"] = None
+        _cache["flags"] = None
+        _cache["checked_at"] = 0.0
+
+
+def _get_flags() -> Dict[str, Any]:
+    flags = _cache["flags"]
+    now = time.monotonic()
+    if flags is not None and now - _cache["checked_at"] < _CACHE_STAT_INTERVAL:
+        return flags
+    sig = _file_sig()
+    if flags is not None and sig is not None and sig == _cache["sig"]:
+        _cache["checked_at"] = now
+        return flags
+    return _store_cache(load_state(), sig)
 
 
 def get_state() -> Dict[str, Any]:
@@ -105,6 +187,7 @@ def set_global_emergency_stop(value: bool) -> Dict[str, Any]:
     def _m(st: Dict[str, Any]) -> None:
         st["global_emergency_stop"] = bool(value)
         if value:
+            st["global_stop_requested_at"] = time.time()
             # Khi STOP ALL: clear pause + đưa tất cả profile_states về STOPPED để tránh "RUNNING" rác
             st["global_pause"] = False
             st["paused_profiles"] = []
@@ -204,8 +287,14 @@ def stop_profiles(profile_ids: list[str]) -> Dict[str, Any]:
         paused = [p for p in paused if p not in stopped]
         st["paused_profiles"] = paused
         st.setdefault("profile_states", {})
+        now = time.time()
+        stop_at = st.get("stop_requested_at")
+        if not isinstance(stop_at, dict):
+            stop_at = {}
         for pid in ids:
             st["profile_states"][pid] = "STOPPED"
+            stop_at[pid] = now
+        st["stop_requested_at"] = stop_at
 
     return _update(_m)
 
@@ -273,58 +362,228 @@ def set_profile_state(profile_id: str, state: str) -> Dict[str, Any]:
     return _update(_m)
 
 
-def check_flags(profile_id: Optional[str] = None) -> Tuple[bool, bool, str]:
+# ===================== CONTROL BUS =====================
+
+def bus_version() -> int:
+    """Version tăng mỗi khi control state thay đổi (dùng với wait_for_change)."""
+    return _bus_version
+
+
+def _notify_changed() -> None:
+    global _bus_version
+    with _bus:
+        _bus_version += 1
+        _bus.notify_all()
+        async_waiters = list(_async_waiters)
+    for loop, event in async_waiters:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            # event loop đã đóng
+            pass
+
+
+def _watch_loop() -> None:
+    while True:
+        with _bus:
+            while _bus_waiters == 0 and not _async_waiters:
+                _bus.wait()
+        try:
+            _get_flags()
+        except Exception:
+            pass
+        time.sleep(_CACHE_STAT_INTERVAL)
+
+
+def _ensure_watcher() -> None:
+    global _watcher_thread
+    with _watcher_lock:
+        if _watcher_thread is not None and _watcher_thread.is_alive():
+            return
+        _watcher_thread = threading.Thread(target=_watch_loop, name="control-watcher", daemon=True)
+        _watcher_thread.start()
+
+
+def wait_for_change(since_version: int, timeout: Optional[float] = None) -> bool:
     """
-    Return: (emergency_stop, paused, pause_reason)
-    Priority:
-      1) emergency_stop
-      2) global_pause
-      3) paused_profiles[pid]
+    Block (không tốn CPU) tới khi control state đổi so với since_version hoặc hết timeout.
+    Trả về True nếu có thay đổi.
     """
-    st = get_state()
-    if bool(st.get("global_emergency_stop")):
-        return True, False, "GLOBAL_EMERGENCY_STOP"
+    global _bus_waiters
+    _ensure_watcher()
+    with _bus:
+        if _bus_version != since_version:
+            return True
+        _bus_waiters += 1
+        _bus.notify_all()  # đánh thức watcher nếu đang ngủ
+        try:
+            return _bus.wait_for(lambda: _bus_version != since_version, timeout)
+        finally:
+            _bus_waiters -= 1
+
+
+async def async_wait_for_change(since_version: int, timeout: Optional[float] = None) -> bool:
+    """Bản asyncio của wait_for_change (không block event loop)."""
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    event = asyncio.Event()
+    entry = (loop, event)
+    _ensure_watcher()
+    with _bus:
+        if _bus_version != since_version:
+            return True
+        _async_waiters.add(entry)
+        _bus.notify_all()
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        with _bus:
+            _async_waiters.discard(entry)
+
+
+def _record_stop_latency(profile_id: Optional[str], reason: str, requested_at: Any) -> None:
+    """Ghi độ trễ STOP lần đầu process này thấy một yêu cầu stop (best-effort)."""
+    try:
+        requested_at = float(requested_at)
+    except (TypeError, ValueError):
+        return
+    key = str(profile_id or "").strip() or "GLOBAL"
+    marker = (key, requested_at)
+    if marker in _observed_stops:
+        return
+    _observed_stops.add(marker)
+    latency_ms = max(0.0, (time.time() - requested_at) * 1000.0)
+    try:
+        with _latency_lock:
+            data: Dict[str, Any] = {}
+            if STOP_LATENCY_PATH.exists():
+                with STOP_LATENCY_PATH.open("r", encoding="utf-8") as f:
+                    raw = json.load(f)
+                if isinstance(raw, dict):
+                    data = raw
+            item = data.get(key) if isinstance(data.get(key), dict) else {}
+            count = int(item.get("count", 0) or 0) + 1
+            total = float(item.get("total_ms", 0.0) or 0.0) + latency_ms
+            data[key] = {
+                "last_ms": round(latency_ms, 1),
+                "max_ms": round(max(float(item.get("max_ms", 0.0) or 0.0), latency_ms), 1),
+                "avg_ms": round(total / count, 1),
+                "total_ms": round(total, 1),
+                "count": count,
+                "reason": reason,
+                "observed_at": _now_iso(),
+            }
+            _atomic_write_json(STOP_LATENCY_PATH, data)
+        print(f"⏱️ [{key}] Độ trễ STOP: {latency_ms:.0f} ms ({reason})")
+    except Exception:
+        pass
+
+
+def get_stop_latency() -> Dict[str, Any]:
+    """Độ trễ STOP theo profile: {profile_id|GLOBAL: {last_ms, max_ms, avg_ms, count, ...}}"""
+    try:
+        with STOP_LATENCY_PATH.open("r", encoding="utf-8") as f:
+            raw = json.load(f)
+        return raw if isinstance(raw, dict) else {}
+    except Exception:
+        return {}
+
 
+def _flags_to_result(flags: Dict[str, Any], profile_id: Optional[str]) -> Tuple[bool, bool, str]:
     pid = str(profile_id or "").strip()
 
+    if flags["global_emergency_stop"]:
+        _record_stop_latency(pid, "GLOBAL_EMERGENCY_STOP", flags.get("global_stop_requested_at"))
+        return True, False, "GLOBAL_EMERGENCY_STOP"
+
     # STOP theo profile (ưu tiên hơn pause)
-    stopped_set = set([str(x).strip() for x in (st.get("stopped_profiles") or []) if str(x).strip()])
-    if pid and pid in stopped_set:
+    if pid and pid in flags["stopped"]:
+        _record_stop_latency(pid, "STOPPED_PROFILE", (flags.get("stop_requested_at") or {}).get(pid))
         return True, False, "STOPPED_PROFILE"
 
-    if bool(st.get("global_pause")):
+    if flags["global_pause"]:
         return False, True, "GLOBAL_PAUSE"
 
-    paused_set = set([str(x).strip() for x in (st.get("paused_profiles") or []) if str(x).strip()])
-    if pid and pid in paused_set:
+    if pid and pid in flags["paused"]:
         return False, True, "PAUSED_PROFILE"
 
     return False, False, ""
 
 
+def check_flags(profile_id: Optional[str] = None) -> Tuple[bool, bool, str]:
+    """
+    Return: (emergency_stop, paused, pause_reason)
+    Priority:
+      1) emergency_stop
+      2) global_pause
+      3) paused_profiles[pid]
+    Đọc từ cache trong bộ nhớ (invalidate theo mtime của runtime_control.json).
+    """
+    return _flags_to_result(_get_flags(), profile_id)
+
+
+def check_flags_uncached(profile_id: Optional[str] = None) -> Tuple[bool, bool, str]:
+    """Như check_flags nhưng luôn đọc lại file (cách cũ, dùng để so sánh benchmark)."""
+    return _flags_to_result(_build_flags(get_state()), profile_id)
+
+
+def benchmark_check_flags(iterations: int = 20000, profile_id: Optional[str] = None) -> Dict[str, float]:
+    """
+    Đo số lần check/giây: đọc file mỗi lần (trước) vs cache (sau).
+    Chạy: python -m core.control (từ thư mục backend)
+    """
+    n = max(1, int(iterations))
+    uncached_n = max(1, n // 20)  # đọc file chậm hơn nhiều -> chạy ít vòng hơn
+
+    t0 = time.perf_counter()
+    for _ in range(uncached_n):
+        check_flags_uncached(profile_id)
+    uncached_elapsed = time.perf_counter() - t0
+
+    invalidate_cache()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        check_flags(profile_id)
+    cached_elapsed = time.perf_counter() - t0
+
+    before = uncached_n / uncached_elapsed if uncached_elapsed > 0 else 0.0
+    after = n / cached_elapsed if cached_elapsed > 0 else 0.0
+    return {
+        "uncached_checks_per_sec": round(before, 1),
+        "cached_checks_per_sec": round(after, 1),
+        "speedup": round(after / before, 1) if before > 0 else 0.0,
+    }
+
+
 def wait_if_paused(profile_id: Optional[str], sleep_seconds: float = 0.5) -> None:
     """
-    Nếu PAUSE -> sleep + check flag liên tục.
+    Nếu PAUSE -> block trên control bus tới khi state đổi (resume/stop đánh thức ngay).
     Nếu emergency_stop -> raise RuntimeError để caller thoát ngay.
+    sleep_seconds giữ lại để tương thích (không còn dùng để poll).
     """
     pid = str(profile_id or "").strip()
     while True:
+        version = bus_version()
         stop, paused, _reason = check_flags(pid)
         if stop:
             raise RuntimeError("EMERGENCY_STOP")
         if not paused:
             return
-        time.sleep(max(0.2, float(sleep_seconds)))
+        wait_for_change(version, timeout=_BUS_SAFETY_TIMEOUT)
 
 
 def smart_sleep(seconds: float, profile_id: Optional[str] = None) -> None:
     """
     Sleep thông minh với khả năng STOP/PAUSE:
-    - Sleep theo chunk 0.5s
-    - Check STOP/PAUSE mỗi chunk
+    - Block trên control bus tối đa `seconds` giây (không sleep-poll theo chunk)
+    - STOP/PAUSE từ /control/* đánh thức ngay
     - Nếu STOP: raise RuntimeError("EMERGENCY_STOP") ngay lập tức
     - Nếu PAUSE: block trong wait_if_paused và KHÔNG giảm remaining time
-    - Nếu NORMAL: sleep chunk và giảm remaining time
+    - Nếu NORMAL: chờ và giảm remaining time theo thời gian thực tế đã chờ
     
     Args:
         seconds: Tổng số giây cần sleep
@@ -334,10 +593,10 @@ def smart_sleep(seconds: float, profile_id: Optional[str] = None) -> None:
         RuntimeError: Nếu bị STOP (message = "EMERGENCY_STOP")
     """
     remaining = float(seconds)
-    chunk = 0.5
     pid = str(profile_id or "").strip() if profile_id else None
     
     while remaining > 0:
+        version = bus_version()
         stop, paused, _reason = check_flags(pid)
         
         if stop:
@@ -345,12 +604,47 @@ def smart_sleep(seconds: float, profile_id: Optional[str] = None) -> None:
         
         if paused:
             # PAUSE: block trong wait_if_paused, KHÔNG giảm remaining time
-            wait_if_paused(pid, sleep_seconds=chunk)
+            wait_if_paused(pid)
             continue
         
-        # NORMAL: sleep chunk và giảm remaining time
-        sleep_time = min(chunk, remaining)
-        time.sleep(sleep_time)
-        remaining -= sleep_time
+        # NORMAL: chờ tới khi hết giờ hoặc state thay đổi
+        started = time.monotonic()
+        wait_for_change(version, timeout=remaining)
+        remaining -= time.monotonic() - started
+
+
+async def async_wait_if_paused(profile_id: Optional[str]) -> None:
+    """Bản asyncio của wait_if_paused."""
+    pid = str(profile_id or "").strip()
+    while True:
+        version = bus_version()
+        stop, paused, _reason = check_flags(pid)
+        if stop:
+            raise RuntimeError("EMERGENCY_STOP")
+        if not paused:
+            return
+        await async_wait_for_change(version, timeout=_BUS_SAFETY_TIMEOUT)
+
+
+async def async_smart_sleep(seconds: float, profile_id: Optional[str] = None) -> None:
+    """Bản asyncio của smart_sleep (không block event loop)."""
+    remaining = float(seconds)
+    pid = str(profile_id or "").strip() if profile_id else None
+    while remaining > 0:
+        version = bus_version()
+        stop, paused, _reason = check_flags(pid)
+        if stop:
+            raise RuntimeError("EMERGENCY_STOP")
+        if paused:
+            await async_wait_if_paused(pid)
+            continue
+        started = time.monotonic()
+        await async_wait_for_change(version, timeout=remaining)
+        remaining -= time.monotonic() - started
 
 
+if __name__ == "__main__":
+    result = benchmark_check_flags()
+    print(f"📊 check_flags (đọc file mỗi lần): {result['uncached_checks_per_sec']:.0f} checks/s")
+    print(f"📊 check_flags (cache):            {result['cached_checks_per_sec']:.0f} checks/s")
+    print(f"🚀 Nhanh hơn ~{result['speedup']}x")
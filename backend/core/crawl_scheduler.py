@@ -0,0 +1,198 @@
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from core import http_pool
+
+# Crawl scheduler đứng trước process_post_id (mỗi phiên = 1 lượt xử lý hàng đợi của 1 profile):
+# - Trước đây post được crawl theo thứ tự file, không giới hạn: 1 post viral (hàng chục nghìn reactions)
+#   có thể ăn hết cả phiên của profile trong khi các post quảng cáo phía sau chưa được động tới
+# - Hàng đợi được xếp hạng theo từng cửa sổ INFO_SCHEDULER_WINDOW post (crawl xong cửa sổ này mới probe cửa sổ sau,
+#   tới hết hàng đợi hoặc hết budget request của phiên; phần chưa xếp hạng lúc hết budget để nguyên cho phiên sau).
+#   Probe = đọc trang đầu reactions + comments (2 request/post) để biết tổng; kết quả probe được lưu vào record
+#   nên post bị hoãn không phải probe lại
+# - Trang đầu tải lúc probe được chuyển cho lúc crawl post (không tải lại trang 1) nếu chưa quá
+#   FIRST_PAGE_MAX_AGE_SECONDS, nên probe chỉ tốn thêm request với post bị hoãn
+# - Xếp hạng: post hoãn quá MAX_DEFERRALS lần (chống bỏ đói) -> flag xanh (quảng cáo) -> vàng -> engagement cao
+# - Budget: INFO_SESSION_REQUEST_BUDGET request GraphQL/phiên/profile (đo qua http_pool.requests_for),
+#   INFO_POST_PAGE_BUDGET trang mỗi loại (reactions/comments) cho 1 post; hết budget trang thì checkpoint
+#   phân trang giữ cursor, post được đưa lại cuối hàng đợi để phiên sau lấy tiếp (long tail)
+# - Post ước tính không còn vừa budget phiên thì hoãn: đưa lại cuối hàng đợi kèm probe + số lần hoãn
+# - Thống kê phiên gần nhất của từng profile: GET /info/scheduler
+FLAG_PRIORITY = {"xanh": 2, "green": 2, "vàng": 1, "yellow": 1}
+PROBE_TTL_SECONDS = 6 * 3600
+FIRST_PAGE_MAX_AGE_SECONDS = 15 * 60
+MAX_DEFERRALS = 3
+DEFAULT_SESSION_BUDGET = 1500
+DEFAULT_POST_PAGE_BUDGET = 40
+DEFAULT_WINDOW = 50
+
+_stats_lock = threading.Lock()
+_sessions: Dict[str, Dict[str, Any]] = {}
+
+
+def _settings() -> Tuple[bool, int, int, int]:
+    """(INFO_SCHEDULER_ENABLED, INFO_SESSION_REQUEST_BUDGET, INFO_POST_PAGE_BUDGET, INFO_SCHEDULER_WINDOW)."""
+    try:
+        from core.settings import get_settings
+        s = get_settings()
+        return (
+            bool(s.info_scheduler_enabled),
+            int(s.info_session_request_budget),
+            int(s.info_post_page_budget),
+            max(1, int(s.info_scheduler_window)),
+        )
+    except Exception:
+        return True, DEFAULT_SESSION_BUDGET, DEFAULT_POST_PAGE_BUDGET, DEFAULT_WINDOW
+
+
+def enabled() -> bool:
+    return _settings()[0]
+
+
+def cached_probe(post_data: Any) -> Optional[Dict[str, Any]]:
+    """Probe lưu trong record (post bị hoãn ở phiên trước), None nếu không có / quá PROBE_TTL_SECONDS."""
+    probe = post_data.get("probe") if isinstance(post_data, dict) else None
+    if not isinstance(probe, dict) or time.time() - float(probe.get("ts") or 0) > PROBE_TTL_SECONDS:
+        return None
+    return probe
+
+
+def _kind_pages(summary: Optional[Dict[str, Any]], page_budget: int) -> int:
+    """Ước tính số trang cần cho 1 loại (reactions/comments) từ trang đầu, đã chặn theo budget trang."""
+    if summary is None:
+        pages = page_budget or 1
+    elif not summary.get("has_next_page"):
+        pages = 1
+    elif summary.get("total") and summary.get("edges"):
+        pages = math.ceil(summary["total"] / summary["edges"])
+    else:
+        pages = page_budget or 10
+    return min(pages, page_budget) if page_budget else pages
+
+
+def engagement(probe: Optional[Dict[str, Any]]) -> int:
+    """Tổng reactions + comments theo probe (không có tổng thì dùng số mục ở trang đầu)."""
+    if not probe:
+        return 0
+    value = 0
+    for kind in ("reactions", "comments"):
+        summary = probe.get(kind) or {}
+        value += int(summary.get("total") or summary.get("edges") or 0)
+    return value
+
+
+class CrawlScheduler:
+    """Xếp hạng + budget request cho 1 phiên xử lý hàng đợi của 1 profile."""
+
+    def __init__(
+        self,
+        profile_id: str,
+        session_budget: Optional[int] = None,
+        post_page_budget: Optional[int] = None,
+        window: Optional[int] = None,
+    ):
+        _enabled, default_session, default_post, default_window = _settings()
+        self.profile_id = profile_id
+        self.session_budget = default_session if session_budget is None else int(session_budget)
+        self.post_page_budget = default_post if post_page_budget is None else int(post_page_budget)
+        self.window = default_window if window is None else max(1, int(window))
+        self._start_requests = http_pool.requests_for(profile_id)
+        self.stats: Dict[str, Any] = {
+            "started_at": time.time(),
+            "session_budget": self.session_budget,
+            "post_page_budget": self.post_page_budget,
+            "window": self.window,
+            "probed": 0,
+            "probe_cache_hits": 0,
+            "scheduled": 0,
+            "deferred": 0,
+            "budget_exhausted": False,
+        }
+        with _stats_lock:
+            _sessions[str(profile_id)] = self.stats
+
+    @property
+    def max_pages(self) -> Optional[int]:
+        """Budget trang mỗi loại cho 1 post (None = không giới hạn)."""
+        return self.post_page_budget or None
+
+    def used(self) -> int:
+        return http_pool.requests_for(self.profile_id) - self._start_requests
+
+    def remaining(self) -> Optional[int]:
+        """Số request còn lại của phiên (None = không giới hạn)."""
+        if not self.session_budget:
+            return None
+        return self.session_budget - self.used()
+
+    def exhausted(self) -> bool:
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self.stats["budget_exhausted"] = True
+            return True
+        return False
+
+    def estimate(self, probe: Optional[Dict[str, Any]]) -> int:
+        """Số request ước tính để crawl post (không tính probe; trang đầu sẽ được tải lại khi crawl)."""
+        probe = probe or {}
+        return sum(_kind_pages(probe.get(kind), self.post_page_budget) for kind in ("reactions", "comments"))
+
+    @staticmethod
+    def score(post_data: Any, probe: Optional[Dict[str, Any]]) -> Tuple[int, int, int]:
+        flag = str(post_data.get("flag") or "").strip().lower() if isinstance(post_data, dict) else ""
+        deferrals = int(post_data.get("deferred") or 0) if isinstance(post_data, dict) else 0
+        return (1 if deferrals >= MAX_DEFERRALS else 0, FLAG_PRIORITY.get(flag, 0), engagement(probe))
+
+    def plan(self, entries: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        entries: [{"idx", "post_data", "post_id", "probe"}] (probe đã có).
+        Trả về (scheduled theo thứ tự crawl, deferred): post không vừa budget phiên còn lại thì hoãn
+        (luôn giữ ít nhất 1 post để phiên không đứng yên).
+        """
+        ranked = sorted(entries, key=lambda e: self.score(e["post_data"], e["probe"]), reverse=True)
+        remaining = self.remaining()
+        scheduled, deferred = [], []
+        for entry in ranked:
+            entry["estimated_requests"] = self.estimate(entry["probe"])
+            if remaining is not None and scheduled and entry["estimated_requests"] > remaining:
+                deferred.append(entry)
+                continue
+            scheduled.append(entry)
+            if remaining is not None:
+                remaining -= entry["estimated_requests"]
+        self.stats["scheduled"] += len(scheduled)
+        self.stats["deferred"] += len(deferred)
+        return scheduled, deferred
+
+    @staticmethod
+    def deferred_record(post_data: Any, post_id: str, probe: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Record đưa lại cuối hàng đợi: giữ probe (kèm ts) + tăng số lần hoãn."""
+        record = dict(post_data) if isinstance(post_data, dict) else {"id": post_id}
+        record["deferred"] = int(record.get("deferred") or 0) + 1
+        if probe:
+            record["probe"] = {**probe, "ts": probe.get("ts") or time.time()}
+        return record
+
+    def record_probe(self, cached: bool) -> None:
+        self.stats["probe_cache_hits" if cached else "probed"] += 1
+
+    def finish(self) -> Dict[str, Any]:
+        self.stats["requests_used"] = self.used()
+        self.stats["finished_at"] = time.time()
+        return self.stats
+
+
+def get_stats() -> Dict[str, Any]:
+    """Phiên gần nhất của từng profile: budget, số post probe / crawl / hoãn, số request đã dùng."""
+    enabled_, session_budget, post_page_budget, window = _settings()
+    with _stats_lock:
+        sessions = {pid: dict(stats) for pid, stats in _sessions.items()}
+    return {
+        "enabled": enabled_,
+        "session_request_budget": session_budget,
+        "post_page_budget": post_page_budget,
+        "window": window,
+        "sessions": sessions,
+    }
@@ -0,0 +1,260 @@
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from core import storage
+from core.paths import get_data_dir
+
+# Trạng thái engagement theo post cho chế độ delta re-crawl:
+# - Trước đây xem lại 1 post để lấy engagement mới chỉ có cách crawl lại toàn bộ reactions/comments
+#   (post vài nghìn reactions = hàng trăm request) dù hôm qua đã có gần hết
+# - Sau mỗi lần crawl đủ, lưu lại id các user đã react, key các comment (user id + nội dung, giống
+#   extract_users_from_json) và tổng reactions/comments Facebook trả về
+# - Lần xem lại (post_data có "recheck" hoặc bật INFO_DELTA_RECRAWL): phân trang tới khi gặp 1 trang toàn user
+#   đã biết hoặc tổng không đổi thì dừng, kết quả chỉ chứa phần mới; phần mới được gộp vào state
+# - JSON: mỗi post 1 file data/engagement_state/<post_id>.json (ghi tmp + replace);
+#   STORAGE_BACKEND = "sqlite": bảng engagement_state
+# - Thống kê số lần delta / số trang đã tải / lý do dừng: GET /info/engagement-state
+STATE_DIR = get_data_dir() / "engagement_state"
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {
+    "full_saved": 0,
+    "delta_runs": 0,
+    "delta_pages": 0,
+    "stopped_known_page": 0,
+    "stopped_total_unchanged": 0,
+    "stopped_error": 0,
+    "stopped_budget": 0,
+    "reactions_added": 0,
+    "comments_added": 0,
+}
+
+
+def delta_by_default() -> bool:
+    """INFO_DELTA_RECRAWL: mọi post đã có state đều crawl kiểu delta (không cần cờ recheck)."""
+    try:
+        from core.settings import get_settings
+        return bool(get_settings().info_delta_recrawl)
+    except Exception:
+        return False
+
+
+def reaction_key(item: Dict[str, Any]) -> Optional[str]:
+    return item.get("id") if isinstance(item, dict) else None
+
+
+def comment_key(item: Dict[str, Any]) -> Optional[str]:
+    """Cùng key với seen_ids của extract_users_from_json: user id + nội dung (comment không có chữ -> user id)."""
+    if not isinstance(item, dict) or not item.get("id"):
+        return None
+    text = item.get("text")
+    return f"{item['id']}_{text}" if text else item["id"]
+
+
+def extract_total(container: Any) -> Optional[int]:
+    """Tổng số Facebook báo trong object reactors / comments ("count" hoặc "total_count"), None nếu không có."""
+    if not isinstance(container, dict):
+        return None
+    for key in ("count", "total_count"):
+        value = container.get(key)
+        if isinstance(value, (int, float)):
+            return int(value)
+    return None
+
+
+def _state_path(post_id: str) -> Path:
+    return STATE_DIR / f"{re.sub(r'[^0-9A-Za-z_-]', '_', str(post_id))}.json"
+
+
+def load(post_id: Any) -> Optional[Dict[str, Any]]:
+    """State của post (None nếu chưa crawl đủ lần nào)."""
+    post_id = str(post_id or "")
+    if not post_id:
+        return None
+    store = storage.get_store()
+    if store is not None:
+        return store.engagement_load(post_id)
+    try:
+        with _state_path(post_id).open("r", encoding="utf-8") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Không đọc được engagement state của post {post_id}: {e}")
+        return None
+
+
+def _save(state: Dict[str, Any]) -> None:
+    store = storage.get_store()
+    if store is not None:
+        store.engagement_save(state["post_id"], state)
+        return
+    path = _state_path(state["post_id"])
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"⚠️ Không ghi được engagement state của post {state.get('post_id')}: {e}")
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+
+def known_keys(state: Optional[Dict[str, Any]]) -> Tuple[Set[str], Set[str]]:
+    """(id user đã react, key comment đã có) của state."""
+    if not state:
+        return set(), set()
+    return set(state.get("reactor_ids") or []), set(state.get("comment_keys") or [])
+
+
+def _keys(items: Iterable[Dict[str, Any]], key_fn) -> List[str]:
+    return [key for key in (key_fn(item) for item in items or []) if key]
+
+
+def save_full(
+    post_id: str,
+    profile_id: Optional[str],
+    post: Dict[str, Any],
+    reactions: List[Dict[str, Any]],
+    comments: List[Dict[str, Any]],
+) -> None:
+    """Ghi state sau 1 lần crawl đủ (ghi đè state cũ). post: {"id","flag","text","owning_profile"} để recheck xếp lại hàng đợi."""
+    now = time.time()
+    previous = load(post_id) or {}
+    state = {
+        "post_id": str(post_id),
+        "profile_id": profile_id,
+        "post": post,
+        "reactor_ids": sorted(set(_keys(reactions, reaction_key))),
+        "comment_keys": sorted(set(_keys(comments, comment_key))),
+        # Tổng Facebook báo chỉ có khi đã chạy delta ít nhất 1 lần (phân trang đầy đủ không đọc field này)
+        "reactions_total": previous.get("reactions_total"),
+        "comments_total": previous.get("comments_total"),
+        "crawls": int(previous.get("crawls") or 0) + 1,
+        "created_at": previous.get("created_at") or now,
+        "updated_at": now,
+    }
+    _save(state)
+    with _stats_lock:
+        _stats["full_saved"] += 1
+
+
+def merge_delta(
+    state: Dict[str, Any],
+    new_reactions: List[Dict[str, Any]],
+    new_comments: List[Dict[str, Any]],
+    reactions_total: Optional[int],
+    comments_total: Optional[int],
+) -> None:
+    """
+    Gộp phần mới của 1 lần delta vào state + cập nhật tổng (chỉ khi Facebook có trả về).
+    Chỉ gọi khi cả 2 fetcher phân trang xong sạch (tới trang đã biết / tổng không đổi / hết trang):
+    lưu tổng của 1 lần dừng vì lỗi sẽ khiến lần sau dừng sớm ở "total_unchanged".
+    """
+    reactor_ids, comment_keys = known_keys(state)
+    reactor_ids.update(_keys(new_reactions, reaction_key))
+    comment_keys.update(_keys(new_comments, comment_key))
+    state = dict(state)
+    state.update({
+        "reactor_ids": sorted(reactor_ids),
+        "comment_keys": sorted(comment_keys),
+        "crawls": int(state.get("crawls") or 0) + 1,
+        "updated_at": time.time(),
+    })
+    if reactions_total is not None:
+        state["reactions_total"] = reactions_total
+    if comments_total is not None:
+        state["comments_total"] = comments_total
+    _save(state)
+    with _stats_lock:
+        _stats["delta_runs"] += 1
+        _stats["reactions_added"] += len(new_reactions or [])
+        _stats["comments_added"] += len(new_comments or [])
+
+
+def record_pages(pages: int, stop_reason: Optional[str] = None) -> None:
+    """Fetcher delta báo số trang đã tải + lý do dừng ("known_page" / "total_unchanged" / "error" / "budget")."""
+    with _stats_lock:
+        _stats["delta_pages"] += int(pages)
+        if stop_reason == "known_page":
+            _stats["stopped_known_page"] += 1
+        elif stop_reason == "total_unchanged":
+            _stats["stopped_total_unchanged"] += 1
+        elif stop_reason == "error":
+            _stats["stopped_error"] += 1
+        elif stop_reason == "budget":
+            _stats["stopped_budget"] += 1
+
+
+def recent(since_hours: float, profile_id: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+    """Post có state cập nhật trong since_hours giờ gần nhất: [{"post_id","profile_id","post","updated_at"}], mới nhất trước."""
+    since = time.time() - float(since_hours) * 3600.0
+    store = storage.get_store()
+    if store is not None:
+        return store.engagement_recent(since, profile_id, limit)
+    candidates = []
+    try:
+        for path in STATE_DIR.glob("*.json"):
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue
+            if mtime >= since:
+                candidates.append((mtime, path))
+    except Exception:
+        return []
+    out = []
+    for _mtime, path in sorted(candidates, reverse=True):
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                state = json.load(f)
+        except Exception:
+            continue
+        if profile_id and state.get("profile_id") != profile_id:
+            continue
+        out.append({k: state.get(k) for k in ("post_id", "profile_id", "post", "updated_at")})
+        if len(out) >= limit:
+            break
+    return out
+
+
+def export_to_store(store) -> int:
+    """Migrate data/engagement_state/*.json vào SQLite (upsert, chạy lại không trùng)."""
+    count = 0
+    for path in STATE_DIR.glob("*.json") if STATE_DIR.exists() else []:
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                state = json.load(f)
+            if isinstance(state, dict) and state.get("post_id"):
+                store.engagement_save(str(state["post_id"]), state)
+                count += 1
+        except Exception:
+            continue
+    return count
+
+
+def get_stats() -> Dict[str, Any]:
+    """Số post đang có state + thống kê delta trong tiến trình này (trang đã tải, lý do dừng, phần mới)."""
+    store = storage.get_store()
+    if store is not None:
+        posts = store.engagement_count()
+    else:
+        try:
+            posts = sum(1 for _ in STATE_DIR.glob("*.json"))
+        except Exception:
+            posts = 0
+    with _stats_lock:
+        stats = dict(_stats)
+    runs = stats["delta_runs"]
+    stats["pages_per_delta_run"] = round(stats["delta_pages"] / runs, 2) if runs else 0.0
+    return {**stats, "posts_with_state": posts, "delta_by_default": delta_by_default()}
@@ -0,0 +1,75 @@
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+# Lock file O_EXCL dùng chung giữa các tiến trình (post_claims, processed_index, post_details_cache,
+# payload_cache, settings writer, hàng đợi post_ids):
+# - acquire(): tạo file .lock bằng O_EXCL, lock cũ hơn stale_seconds coi như bị bỏ lại (tiến trình chết) thì phá
+# - Hết timeout mà chưa lấy được lock -> trả về None; release(None) KHÔNG xoá file lock
+#   (lock đó đang thuộc tiến trình khác, xoá đi là phá mutual exclusion của mọi tiến trình)
+# - locked(): context manager cho đoạn đọc-sửa-ghi bắt buộc có lock, hết timeout thì raise FileLockTimeout
+DEFAULT_TIMEOUT_SECONDS = 10.0
+DEFAULT_STALE_SECONDS = 60.0
+
+
+class FileLockTimeout(TimeoutError):
+    """Không lấy được lock file trong thời gian chờ (tiến trình khác đang giữ)."""
+
+
+def acquire(
+    lock_file: Path,
+    timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+    poll: float = 0.02,
+    stale_seconds: Optional[float] = DEFAULT_STALE_SECONDS,
+) -> Optional[int]:
+    """fd của lock file, hoặc None nếu hết timeout / lỗi (caller KHÔNG sở hữu lock)."""
+    lock_file = Path(lock_file)
+    start = time.time()
+    while True:
+        try:
+            return os.open(str(lock_file), os.O_CREAT | os.O_EXCL | os.O_RDWR)
+        except FileExistsError:
+            try:
+                if stale_seconds is not None and time.time() - lock_file.stat().st_mtime > stale_seconds:
+                    lock_file.unlink()
+                    continue
+            except OSError:
+                pass
+            if time.time() - start >= timeout_seconds:
+                return None
+            time.sleep(poll)
+        except Exception:
+            return None
+
+
+def release(fd: Optional[int], lock_file: Path) -> None:
+    """Trả lock: chỉ đóng + xoá file lock khi fd là của tiến trình này (acquire thành công)."""
+    if fd is None:
+        return
+    try:
+        os.close(fd)
+    except Exception:
+        pass
+    try:
+        Path(lock_file).unlink()
+    except Exception:
+        pass
+
+
+@contextmanager
+def locked(
+    lock_file: Path,
+    timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+    poll: float = 0.02,
+    stale_seconds: Optional[float] = DEFAULT_STALE_SECONDS,
+) -> Iterator[int]:
+    """Giữ lock file trong khối with; hết timeout thì raise FileLockTimeout (không đọc-sửa-ghi khi không có lock)."""
+    fd = acquire(lock_file, timeout_seconds, poll, stale_seconds)
+    if fd is None:
+        raise FileLockTimeout(f"Không lấy được lock {Path(lock_file).name} sau {timeout_seconds}s")
+    try:
+        yield fd
+    finally:
+        release(fd, lock_file)
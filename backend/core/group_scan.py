@@ -0,0 +1,235 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+# Engine quét group song song:
+# - Trước đây _process_group_scan_queue lấy từng task (pop(0)), quét lần lượt từng group của từng profile,
+#   group sau chỉ bắt đầu khi group trước phân trang + làm giàu xong
+# - Ở đây mọi (profile, group) được trải ra thành job, xếp xen kẽ giữa các profile (round-robin) rồi chạy
+#   tối đa GROUP_SCAN_CONCURRENCY job cùng lúc; trong mỗi group, get_posts_from_page làm giàu trang N
+#   trong khi tải trang N+1 (pipeline)
+# - Mỗi access token có budget request riêng (GROUP_SCAN_TOKEN_REQUESTS_PER_MINUTE): các group cùng
+#   profile chia nhau budget; Graph API trả code 4/17 (rate limit) thì token bị tạm khoá với backoff tăng dần
+# - Thống kê groups/phút, posts/phút qua GET /scan-groups/status
+BACKOFF_BASE_SECONDS = 60.0
+BACKOFF_MAX_SECONDS = 900.0
+
+
+def _token_key(access_token: str) -> str:
+    """Không giữ token thật trong thống kê: dùng vài ký tự hash."""
+    return hashlib.sha1(str(access_token or "").encode("utf-8")).hexdigest()[:10]
+
+
+class TokenBudget:
+    """
+    Budget request Graph API theo access token: tối đa requests_per_minute request/phút (0 = không giới hạn),
+    giãn đều (mỗi request cách nhau 60/rpm giây). Gặp code 4/17 thì khoá token theo backoff 60s, 120s, ... tối đa 15 phút.
+    """
+
+    def __init__(self, requests_per_minute: int = 0):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, Dict[str, Any]] = {}
+
+    def _state(self, access_token: str) -> Dict[str, Any]:
+        key = _token_key(access_token)
+        state = self._tokens.get(key)
+        if state is None:
+            state = {"next_at": 0.0, "blocked_until": 0.0, "strikes": 0, "requests": 0, "rate_limited": 0, "waited_seconds": 0.0}
+            self._tokens[key] = state
+        return state
+
+    def acquire(self, access_token: str, stop_event: Optional[threading.Event] = None) -> bool:
+        """Chờ tới lượt request của token. Trả về False nếu bị dừng (stop_event) trong lúc chờ."""
+        with self._lock:
+            state = self._state(access_token)
+            now = time.monotonic()
+            start_at = max(now, state["next_at"], state["blocked_until"])
+            state["next_at"] = start_at + self.interval
+            state["requests"] += 1
+            wait_seconds = start_at - now
+            state["waited_seconds"] += wait_seconds
+        if wait_seconds <= 0:
+            return True
+        if stop_event is not None:
+            return not stop_event.wait(wait_seconds)
+        time.sleep(wait_seconds)
+        return True
+
+    def on_rate_limited(self, access_token: str, code: Any = None) -> float:
+        """Token bị Graph API rate limit (code 4/17): khoá token, trả về số giây khoá."""
+        with self._lock:
+            state = self._state(access_token)
+            backoff = min(BACKOFF_BASE_SECONDS * (2 ** state["strikes"]), BACKOFF_MAX_SECONDS)
+            state["strikes"] += 1
+            state["rate_limited"] += 1
+            state["blocked_until"] = max(state["blocked_until"], time.monotonic() + backoff)
+            state["last_code"] = code
+        return backoff
+
+    def on_success(self, access_token: str) -> None:
+        with self._lock:
+            self._state(access_token)["strikes"] = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: {
+                    "requests": s["requests"],
+                    "rate_limited": s["rate_limited"],
+                    "waited_seconds": round(s["waited_seconds"], 1),
+                    "blocked_for_seconds": round(max(0.0, s["blocked_until"] - now), 1),
+                }
+                for key, s in self._tokens.items()
+            }
+
+
+class GroupScanEngine:
+    """Chạy các task quét group (mỗi task = 1 profile) song song theo group, có giới hạn concurrency."""
+
+    def __init__(self, concurrency: int = 4, token_requests_per_minute: int = 0):
+        self.concurrency = max(1, int(concurrency))
+        self.budget = TokenBudget(token_requests_per_minute)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Any] = {
+            "running": False,
+            "started_at": None,
+            "finished_at": None,
+            "groups_total": 0,
+            "groups_done": 0,
+            "groups_failed": 0,
+            "posts_found": 0,
+            "in_flight": 0,
+        }
+
+    @staticmethod
+    def _interleave(jobs_by_profile: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Xếp job xen kẽ giữa các profile để các luồng chạy trên nhiều token cùng lúc."""
+        ordered = []
+        depth = max((len(jobs) for jobs in jobs_by_profile), default=0)
+        for i in range(depth):
+            for jobs in jobs_by_profile:
+                if i < len(jobs):
+                    ordered.append(jobs[i])
+        return ordered
+
+    def _expand(self, tasks: List[Dict[str, Any]], load_groups: Callable[[str], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        jobs_by_profile = []
+        for task in tasks:
+            profile_id = task["profile_id"]
+            try:
+                groups = load_groups(profile_id) or []
+            except Exception as e:
+                print(f"❌ Không đọc được danh sách group của profile {profile_id}: {e}")
+                groups = []
+            if not groups:
+                print(f"⚠️ Không có group nào cho profile {profile_id}")
+                continue
+            print(f"📋 Tìm thấy {len(groups)} group(s) cho profile {profile_id}")
+            jobs = []
+            for group_info in groups:
+                page_id = group_info.get("page_id")
+                if not page_id:
+                    print(f"⚠️ Bỏ qua group không có page_id: {group_info}")
+                    continue
+                jobs.append({**task, "page_id": page_id, "url_page": group_info.get("url_page", "")})
+            jobs_by_profile.append(jobs)
+        return self._interleave(jobs_by_profile)
+
+    def run(
+        self,
+        tasks: List[Dict[str, Any]],
+        scan_fn: Callable[..., Any],
+        load_groups: Callable[[str], List[Dict[str, Any]]],
+        stop_event: threading.Event,
+    ) -> Dict[str, Any]:
+        """
+        tasks: [{"profile_id", "post_count", "start_date", "end_date", "full_rescan"?}]
+        scan_fn: get_posts_from_page (nhận thêm budget=TokenBudget)
+        """
+        jobs = self._expand(tasks, load_groups)
+        with self._lock:
+            if not self._stats["running"]:
+                self._stats.update({"started_at": time.time(), "finished_at": None})
+            self._stats["running"] = True
+            self._stats["groups_total"] += len(jobs)
+        print(f"🚀 Quét {len(jobs)} group của {len(tasks)} profile, tối đa {self.concurrency} group cùng lúc")
+
+        def _run_job(job):
+            with self._lock:
+                self._stats["in_flight"] += 1
+            try:
+                print(f"\n📌 Xử lý group: {job['page_id']} (profile {job['profile_id']})")
+                if job.get("url_page"):
+                    print(f"   URL: {job['url_page']}")
+                return scan_fn(
+                    page_id=job["page_id"],
+                    profile_id=job["profile_id"],
+                    start_date=job["start_date"],
+                    end_date=job["end_date"],
+                    limit=job["post_count"],
+                    stop_event=stop_event,
+                    budget=self.budget,
+                    incremental=False if job.get("full_rescan") else None,
+                )
+            finally:
+                with self._lock:
+                    self._stats["in_flight"] -= 1
+
+        pending = iter(jobs)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="group-scan") as executor:
+            in_flight = {}
+            while True:
+                while not stop_event.is_set() and len(in_flight) < self.concurrency:
+                    job = next(pending, None)
+                    if job is None:
+                        break
+                    in_flight[executor.submit(_run_job, job)] = job
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = in_flight.pop(future)
+                    try:
+                        posts = future.result() or []
+                        with self._lock:
+                            self._stats["groups_done"] += 1
+                            self._stats["posts_found"] += len(posts)
+                        if posts:
+                            print(f"   ✅ Đã quét {len(posts)} posts từ group {job['page_id']}")
+                        else:
+                            print(f"   ⚠️ Không lấy được posts nào từ group {job['page_id']}")
+                    except Exception as e:
+                        with self._lock:
+                            self._stats["groups_failed"] += 1
+                        print(f"   ❌ Lỗi khi quét group {job['page_id']}: {e}")
+
+        if stop_event.is_set():
+            print("🛑 Đã nhận yêu cầu dừng, bỏ qua các group còn lại")
+        stats = self.get_stats()
+        print(
+            f"\n✅ Xong lượt quét: {stats['groups_done']}/{stats['groups_total']} group, {stats['posts_found']} posts "
+            f"(~{stats['groups_per_minute']} group/phút, ~{stats['posts_per_minute']} post/phút)"
+        )
+        return stats
+
+    def finish(self) -> None:
+        with self._lock:
+            self._stats["running"] = False
+            self._stats["finished_at"] = time.time()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        started = stats["started_at"]
+        end = stats["finished_at"] or time.time()
+        elapsed = max(end - started, 1e-6) if started else 0.0
+        stats["elapsed_seconds"] = round(elapsed, 1)
+        stats["groups_per_minute"] = round(stats["groups_done"] * 60.0 / elapsed, 2) if elapsed else 0.0
+        stats["posts_per_minute"] = round(stats["posts_found"] * 60.0 / elapsed, 2) if elapsed else 0.0
+        stats["concurrency"] = self.concurrency
+        stats["tokens"] = self.budget.get_stats()
+        return stats
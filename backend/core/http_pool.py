@@ -0,0 +1,184 @@
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from core import rate_governor
+
+# Registry session HTTP theo profile: giữ kết nối keep-alive tới facebook.com
+# giữa các trang / post / file thay vì tạo Session + TLS handshake mới cho mỗi request.
+GRAPHQL_URL = "https://www.facebook.com/api/graphql/"
+POOL_MAXSIZE = 16  # đủ cho reactions + comments song song của nhiều post cùng profile
+
+# Header tĩnh (tính một lần), header động (cookie, lsd, friendly name) truyền theo từng request
+STATIC_GRAPHQL_HEADERS = {
+    "accept": "*/*",
+    "accept-encoding": "gzip, deflate",
+    "accept-language": "en,vi;q=0.9,en-US;q=0.8",
+    "content-type": "application/x-www-form-urlencoded",
+    "origin": "https://www.facebook.com",
+    "priority": "u=1, i",
+    "referer": "https://www.facebook.com/photo/?fbid=965661036626847&set=a.777896542069965",
+    "sec-ch-ua": '"Google Chrome";v="143", "Chromium";v="143", "Not A(Brand";v="24"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": '"Windows"',
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "same-origin",
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36",
+    "x-asbd-id": "359341",
+}
+
+_lock = threading.Lock()
+_sessions: Dict[Tuple[str, str], requests.Session] = {}
+_stats: Dict[str, int] = {"sessions_created": 0, "requests_sent": 0}
+# Số request GraphQL theo profile (crawl scheduler đo budget request của phiên)
+_profile_requests: Dict[str, int] = {}
+
+
+THROTTLE_RETRIES = 2  # số lần gửi lại khi 429 (chờ theo rate_governor thay vì backoff cố định của urllib3)
+
+
+def _build_retry() -> Retry:
+    # Retry chung (giống cấu hình cũ trong từng send_request); 429 do rate_governor xử lý trong post_graphql
+    status_forcelist = [500, 502, 503, 504]
+    if not rate_governor.enabled():
+        status_forcelist.insert(0, 429)
+    return Retry(
+        total=2,
+        backoff_factor=0.5,
+        status_forcelist=status_forcelist,
+        allowed_methods=["POST", "GET"],
+    )
+
+
+def _new_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=_build_retry(), pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.clear()
+    session.headers.update(STATIC_GRAPHQL_HEADERS)
+    # Cookie luôn truyền qua header theo profile -> không lưu Set-Cookie vào jar của session
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def get_session(profile_id: Optional[str], kind: str = "graphql") -> requests.Session:
+    """Lấy (hoặc tạo) session dùng chung cho profile_id + loại request."""
+    key = (str(profile_id or "").strip() or "_default", kind)
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _new_session()
+            _sessions[key] = session
+            _stats["sessions_created"] += 1
+        return session
+
+
+def graphql_headers(cookies: str, friendly_name: str, lsd: str = "") -> Dict[str, str]:
+    """Header động cho 1 request GraphQL (phần tĩnh đã nằm trong session)."""
+    return {
+        "cookie": cookies,
+        "x-fb-friendly-name": friendly_name,
+        "x-fb-lsd": lsd or "",
+    }
+
+
+def post_graphql(
+    profile_id: Optional[str], data: Any, headers: Dict[str, str], timeout: float = 20, governed: bool = True
+) -> requests.Response:
+    """
+    POST tới /api/graphql/ qua session pooled của profile.
+    governed=True: chờ lượt theo rate_governor (bucket "graphql" của profile), báo 429/1357004 cho governor
+    và gửi lại khi 429; STOP của profile trong lúc chờ -> raise RuntimeError("EMERGENCY_STOP").
+    Caller đã tự acquire (async client) thì truyền governed=False.
+    """
+    session = get_session(profile_id, "graphql")
+    attempt = 0
+    while True:
+        if governed and not rate_governor.acquire(profile_id, "graphql"):
+            raise RuntimeError("EMERGENCY_STOP")
+        count_request(profile_id)
+        response = session.post(GRAPHQL_URL, data=data, headers=headers, timeout=timeout)
+        if not governed:
+            return response
+        reason = rate_governor.throttle_reason(response)
+        if reason is None:
+            rate_governor.report_success(profile_id, "graphql")
+            return response
+        rate_governor.report_throttle(profile_id, "graphql", reason)
+        # 1357004 là lỗi payload/session: caller tự refresh payload rồi gửi lại
+        if reason != "429" or attempt >= THROTTLE_RETRIES:
+            return response
+        attempt += 1
+
+
+def count_request(profile_id: Optional[str]) -> None:
+    """Đếm 1 request GraphQL của profile (post_graphql tự gọi; client async gọi khi gửi qua httpx)."""
+    key = str(profile_id or "").strip()
+    with _lock:
+        _stats["requests_sent"] += 1
+        _profile_requests[key] = _profile_requests.get(key, 0) + 1
+
+
+def requests_for(profile_id: Optional[str]) -> int:
+    """Tổng số request GraphQL profile đã gửi trong tiến trình này."""
+    with _lock:
+        return _profile_requests.get(str(profile_id or "").strip(), 0)
+
+
+def _connections_opened(session: requests.Session) -> int:
+    total = 0
+    for adapter in session.adapters.values():
+        pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+        if pools is None:
+            continue
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            total += int(getattr(pool, "num_connections", 0) or 0)
+    return total
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Thống kê: số session, số kết nối TCP/TLS đã mở, số request đã gửi."""
+    with _lock:
+        sessions = dict(_sessions)
+        stats = dict(_stats)
+        profile_requests = dict(_profile_requests)
+    connections = 0
+    by_profile: Dict[str, Dict[str, int]] = {}
+    for (profile_id, kind), session in sessions.items():
+        opened = _connections_opened(session)
+        connections += opened
+        item = by_profile.setdefault(profile_id, {})
+        item[f"{kind}_connections_opened"] = opened
+    for profile_id, count in profile_requests.items():
+        by_profile.setdefault(profile_id, {})["graphql_requests"] = count
+    requests_sent = stats["requests_sent"]
+    return {
+        "sessions": len(sessions),
+        "sessions_created": stats["sessions_created"],
+        "connections_opened": connections,
+        "requests_sent": requests_sent,
+        "requests_per_connection": round(requests_sent / connections, 2) if connections else 0.0,
+        "by_profile": by_profile,
+    }
+
+
+def close_sessions(profile_id: Optional[str] = None) -> None:
+    """Đóng session (của 1 profile hoặc tất cả), best-effort."""
+    with _lock:
+        keys = [k for k in _sessions if profile_id is None or k[0] == str(profile_id).strip()]
+        sessions = [_sessions.pop(k) for k in keys]
+    for session in sessions:
+        try:
+            session.close()
+        except Exception:
+            pass
@@ -17,6 +17,7 @@ from core.browser import FBController
 from core import control as control_state
 from core.control import smart_sleep
 from core.paths import get_config_dir, get_data_dir
+from core import storage
 GROUPS_JSON_PATH = get_config_dir() / "groups.json"
 # Worker lấy page_id/post_id từ URL (dùng cookie theo profile_id trong settings.json)
 try:
@@ -94,6 +95,37 @@ def _read_groups_json() -> dict:
         return {}
 
 
+def load_groups(profile_id: str | None = None):
+    """
+    Đọc groups đã lưu: {profile_id: [{"page_id", "url_page"}]}, hoặc list của 1 profile nếu truyền profile_id.
+    STORAGE_BACKEND = "sqlite" -> đọc từ bảng groups (có index theo profile), ngược lại đọc groups.json.
+    """
+    store = storage.get_store()
+    if store is not None:
+        if profile_id is not None:
+            return store.groups_for_profile(str(profile_id).strip())
+        return store.groups_load()
+    data = _read_groups_json()
+    if profile_id is not None:
+        arr = data.get(str(profile_id).strip())
+        return arr if isinstance(arr, list) else []
+    return data
+
+
+def export_to_store(store) -> int:
+    """Migrator: chép groups.json vào SqliteStore (ghi đè theo profile). Trả về số group đã chép."""
+    copied = 0
+    for pid, groups in _read_groups_json().items():
+        if not isinstance(groups, list):
+            continue
+        try:
+            store.groups_replace(str(pid), groups)
+            copied += len(groups)
+        except Exception as e:
+            print(f"⚠️ Không thể migrate groups của {pid}: {e}")
+    return copied
+
+
 def _write_groups_json(data: dict) -> None:
     GROUPS_JSON_PATH.parent.mkdir(parents=True, exist_ok=True)
     tmp = Path(str(GROUPS_JSON_PATH) + ".tmp")
@@ -116,6 +148,15 @@ def save_group_page_id(profile_id: str, page_id: str, url_page: str) -> bool:
     if not pid or not pg or not urlp:
         return False
 
+    store = storage.get_store()
+    if store is not None:
+        try:
+            store.groups_upsert(pid, pg, urlp)
+            return True
+        except Exception as e:
+            print(f"⚠️ [groups] Không ghi được page_id vào DB (profile_id={pid}): {e}")
+            return False
+
     fd = _acquire_groups_lock()
     if fd is None:
         # Không có lock => không ghi để tránh race condition khi chạy đa process
@@ -163,6 +204,32 @@ def replace_all_groups_for_profile(profile_id: str, groups: list[dict]) -> bool:
     # Validate groups format
     if not isinstance(groups, list):
         return False
+
+    # Giữ watermark quét của các group vẫn còn trong danh sách mới
+    try:
+        old_marks = {
+            str(item.get("page_id") or "").strip(): item["watermark"]
+            for item in load_groups(pid)
+            if isinstance(item, dict) and isinstance(item.get("watermark"), dict)
+        }
+    except Exception:
+        old_marks = {}
+    if old_marks:
+        groups = [
+            {**item, "watermark": old_marks[str(item.get("page_id") or "").strip()]}
+            if isinstance(item, dict) and "watermark" not in item and str(item.get("page_id") or "").strip() in old_marks
+            else item
+            for item in groups
+        ]
+
+    store = storage.get_store()
+    if store is not None:
+        try:
+            store.groups_replace(pid, groups)
+            return True
+        except Exception as e:
+            print(f"❌ Lỗi khi ghi đè groups trong DB cho profile {pid}: {e}")
+            return False
     
     fd = _acquire_groups_lock()
     if fd is None:
@@ -195,6 +262,16 @@ def remove_profile_groups(profile_id: str) -> bool:
     pid = str(profile_id or "").strip()
     if not pid:
         return False
+
+    store = storage.get_store()
+    if store is not None:
+        try:
+            if store.groups_remove(pid):
+                print(f"✅ Đã xóa groups của profile {pid} khỏi DB")
+            return True
+        except Exception as e:
+            print(f"❌ Lỗi khi xóa groups của profile {pid} khỏi DB: {e}")
+            return False
     
     fd = _acquire_groups_lock()
     if fd is None:
@@ -217,6 +294,74 @@ def remove_profile_groups(profile_id: str) -> bool:
     finally:
         _release_groups_lock(fd)
 
+def get_group_watermark(profile_id: str, page_id: str) -> dict | None:
+    """
+    Watermark quét của group: {"timestamp", "created_time", "post_id", "post_ids", "covered_since", "updated_at"}
+    = bài mới nhất (created_time) đã đưa vào hàng đợi ở lần quét trước (post_ids: mọi bài cùng giây đó),
+    hoặc None nếu chưa quét.
+    """
+    pg = str(page_id or "").strip()
+    for item in load_groups(str(profile_id or "").strip()) or []:
+        if isinstance(item, dict) and str(item.get("page_id") or "").strip() == pg:
+            mark = item.get("watermark")
+            return mark if isinstance(mark, dict) else None
+    return None
+
+
+def update_group_watermark(profile_id: str, page_id: str, watermark: dict | None) -> bool:
+    """
+    Ghi watermark cho group (watermark chỉ tiến lên: bỏ qua nếu cũ hơn watermark đang lưu).
+    watermark=None -> xoá (lần quét sau quét lại toàn bộ khoảng ngày).
+    """
+    pid = str(profile_id or "").strip()
+    pg = str(page_id or "").strip()
+    if not pid or not pg:
+        return False
+
+    store = storage.get_store()
+    if store is not None:
+        try:
+            return store.groups_set_watermark(pid, pg, watermark)
+        except Exception as e:
+            print(f"⚠️ [groups] Không ghi được watermark vào DB (profile_id={pid}, page_id={pg}): {e}")
+            return False
+
+    fd = _acquire_groups_lock()
+    if fd is None:
+        print(f"⚠️ [groups.json] Không lấy được lock trong thời gian chờ -> bỏ qua ghi watermark (profile_id={pid})")
+        return False
+    try:
+        data = _read_groups_json()
+        for item in data.get(pid) or []:
+            if not isinstance(item, dict) or str(item.get("page_id") or "").strip() != pg:
+                continue
+            current = item.get("watermark") if isinstance(item.get("watermark"), dict) else None
+            if watermark is None:
+                item.pop("watermark", None)
+            elif current and int(current.get("timestamp") or 0) > int(watermark.get("timestamp") or 0):
+                return True
+            else:
+                item["watermark"] = watermark
+            _write_groups_json(data)
+            return True
+        return False
+    except Exception as e:
+        print(f"❌ Lỗi khi ghi watermark vào groups.json (profile_id={pid}, page_id={pg}): {e}")
+        return False
+    finally:
+        _release_groups_lock(fd)
+
+
+def reset_group_watermarks(profile_id: str) -> int:
+    """Xoá watermark mọi group của profile. Trả về số group đã xoá watermark."""
+    cleared = 0
+    for item in load_groups(str(profile_id or "").strip()) or []:
+        if isinstance(item, dict) and isinstance(item.get("watermark"), dict):
+            if update_group_watermark(profile_id, item.get("page_id"), None):
+                cleared += 1
+    return cleared
+
+
 class GroupJoiner(FBController):
     """
     Class chuyên dụng để đi xin vào nhóm
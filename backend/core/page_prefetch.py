@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Prefetch trang kế tiếp khi phân trang GraphQL reactions / comments (double buffer):
+# - Trước đây mỗi vòng lặp: gửi request -> chờ -> decode (Brotli) -> in preview -> parse -> xử lý edges
+#   rồi mới gửi trang sau, nên thời gian decode/parse/xử lý cộng thẳng vào độ trễ của từng trang
+# - Ngay khi parse xong JSON và biết cursor trang sau (page_info), gửi request trang sau trên thread nền
+#   trong lúc luồng phân trang xử lý edges / ghi checkpoint trang hiện tại; vòng lặp sau lấy response đã tải
+# - Mỗi luồng phân trang có tối đa 1 request prefetch đang bay (cursor trang sau chỉ có khi đã có trang này);
+#   tổng request prefetch đang bay của cả tiến trình giới hạn bởi GRAPHQL_PREFETCH_MAX_INFLIGHT (0 = tắt),
+#   hết slot thì trang sau được gửi đồng bộ như cũ
+# - Request vẫn đi qua send_request -> http_pool.post_graphql (governor + đếm request như bình thường)
+# - STOP / lỗi / hết budget trang: response prefetch bị bỏ (tối đa 1 request thừa mỗi luồng phân trang)
+# - Profile đang STOP / PAUSE thì không gửi prefetch; luồng phân trang thấy PAUSE thì close() bỏ prefetch
+#   đang bay (trang đó tải lại sau khi tiếp tục, không giữ response cũ qua thời gian tạm dừng)
+# - preload(): trang đã tải sẵn ở chỗ khác (trang đầu do crawl scheduler probe) -> fetch dùng luôn, không gửi lại
+# - last_sent_at: thời điểm gửi request của response fetch() vừa trả (prefetch thì là lúc thread nền gửi),
+#   dùng làm stale_since khi refresh payload (payload_cache single-flight)
+# - Thống kê: GET /info/prefetch
+DEFAULT_MAX_INFLIGHT = 8
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_slots: Optional[threading.BoundedSemaphore] = None
+_max_inflight: Optional[int] = None
+_stats: Dict[str, int] = {"prefetched": 0, "hits": 0, "wasted": 0, "no_slot": 0, "preloaded": 0, "skipped_paused": 0}
+
+
+def _load_max_inflight() -> int:
+    try:
+        from core.settings import get_settings
+        return int(get_settings().graphql_prefetch_max_inflight)
+    except Exception:
+        return DEFAULT_MAX_INFLIGHT
+
+
+def _get_executor():
+    """(executor, semaphore) dùng chung, tạo lần đầu theo GRAPHQL_PREFETCH_MAX_INFLIGHT; (None, None) nếu tắt."""
+    global _executor, _slots, _max_inflight
+    with _lock:
+        if _max_inflight is None:
+            _max_inflight = max(0, _load_max_inflight())
+            if _max_inflight:
+                _executor = ThreadPoolExecutor(max_workers=_max_inflight, thread_name_prefix="graphql-prefetch")
+                _slots = threading.BoundedSemaphore(_max_inflight)
+        return _executor, _slots
+
+
+def _stopped_or_paused(profile_id: Optional[str]) -> bool:
+    try:
+        from core.control import check_flags
+        stop, paused, _reason = check_flags(profile_id)
+        return bool(stop or paused)
+    except Exception:
+        return False
+
+
+def _count(key: str) -> None:
+    with _lock:
+        _stats[key] += 1
+
+
+class PagePrefetcher:
+    """
+    Double buffer cho 1 lần phân trang. send(cursor) -> response (hàm gửi request của module).
+    Dùng: response = pf.fetch(cursor) thay cho send(cursor); parse xong trang thì pf.prefetch(cursor_trang_sau);
+    kết thúc (hết trang / lỗi / STOP) hoặc gặp PAUSE thì pf.close().
+    profile_id: check STOP/PAUSE (của profile hoặc toàn cục) trước khi gửi prefetch.
+    """
+
+    def __init__(self, send: Callable[[Optional[str]], Any], profile_id: Optional[str] = None):
+        self._send = send
+        self._profile_id = profile_id
+        self._cursor: Optional[str] = None
+        self._future = None
+        self.last_sent_at: Optional[float] = None  # None = không rõ (response preload)
+
+    def _timed_send(self, cursor: Optional[str]):
+        sent_at = time.time()
+        return sent_at, self._send(cursor)
+
+    def prefetch(self, cursor: Optional[str]) -> None:
+        """Gửi trước request của trang có cursor này (bỏ qua nếu tắt / đã có request đang bay / hết slot / STOP, PAUSE)."""
+        if not cursor or self._future is not None:
+            return
+        if _stopped_or_paused(self._profile_id):
+            _count("skipped_paused")
+            return
+        executor, slots = _get_executor()
+        if executor is None:
+            return
+        if not slots.acquire(blocking=False):
+            _count("no_slot")
+            return
+        try:
+            future = executor.submit(self._timed_send, cursor)
+        except RuntimeError:
+            # Executor đã shutdown (tiến trình đang tắt) -> gửi đồng bộ ở fetch
+            slots.release()
+            return
+        future.add_done_callback(lambda _f: slots.release())
+        self._cursor, self._future = cursor, future
+        _count("prefetched")
+
+    def preload(self, cursor: Optional[str], response: Any) -> None:
+        """Response đã có sẵn của trang cursor (vd. trang đầu tải lúc probe): fetch(cursor) trả về luôn."""
+        if response is None:
+            return
+        self.close()
+        future: Future = Future()
+        future.set_result((None, response))
+        self._cursor, self._future = cursor, future
+        _count("preloaded")
+
+    def fetch(self, cursor: Optional[str]) -> Any:
+        """Response của trang cursor: lấy từ prefetch nếu khớp, không thì gửi đồng bộ (lỗi gửi raise như send)."""
+        if self._future is not None and self._cursor == cursor:
+            future, self._future, self._cursor = self._future, None, None
+            _count("hits")
+            self.last_sent_at, response = future.result()
+            return response
+        self.close()
+        self.last_sent_at, response = self._timed_send(cursor)
+        return response
+
+    def close(self) -> None:
+        """Bỏ request prefetch chưa dùng (chưa chạy thì huỷ, đang chạy thì để thread nền tự xong)."""
+        future, self._future, self._cursor = self._future, None, None
+        if future is not None:
+            future.cancel()
+            _count("wasted")
+
+
+def get_stats() -> Dict[str, Any]:
+    """Số trang đã prefetch / preload / đã dùng / bỏ phí / không có slot / bỏ qua do STOP, PAUSE (trong tiến trình này)."""
+    with _lock:
+        stats = dict(_stats)
+        max_inflight = _max_inflight if _max_inflight is not None else max(0, _load_max_inflight())
+    return {**stats, "enabled": max_inflight > 0, "max_inflight": max_inflight}
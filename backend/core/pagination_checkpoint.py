@@ -0,0 +1,182 @@
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.paths import get_data_dir
+
+# Checkpoint phân trang reactions / comments theo post:
+# - Trước đây cursor chỉ nằm trong biến local của get_all_users_by_fid / get_all_comments_by_post_id:
+#   crash, STOP hay 1357004 giữa chừng ở post hàng chục nghìn reactions là mất hết các trang đã tải
+# - Sau mỗi PAGINATION_CHECKPOINT_PAGES trang, ghi thêm 1 dòng vào data/pagination_checkpoints/<kind>_<post_id>.jsonl:
+#   {"cursor", "page_number", "extra", "items": [chỉ phần items mới từ dòng trước], "ts"} (append, không ghi lại cả file)
+# - Dừng bất thường (exception / STOP / lỗi giữa chừng) thì ghi nốt phần chưa lưu; lấy xong hết trang thì xoá file
+# - Lần chạy sau gặp lại post: nạp items + cursor cuối, tiếp tục từ trang đó thay vì trang 1
+# - Checkpoint cũ hơn MAX_AGE_HOURS bị bỏ (cursor Facebook hết hạn)
+CHECKPOINT_DIR = get_data_dir() / "pagination_checkpoints"
+DEFAULT_EVERY_PAGES = 5
+MAX_AGE_HOURS = 24
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {"resumed": 0, "pages_skipped": 0, "checkpoints_written": 0, "completed": 0}
+
+
+def _every_pages() -> int:
+    try:
+        from core.settings import get_settings
+        return int(get_settings().pagination_checkpoint_pages)
+    except Exception:
+        return DEFAULT_EVERY_PAGES
+
+
+def checkpoint_path(kind: str, post_id: Any) -> Path:
+    safe_id = re.sub(r"[^0-9A-Za-z_-]", "_", str(post_id or ""))
+    return CHECKPOINT_DIR / f"{kind}_{safe_id}.jsonl"
+
+
+def exists(kind: str, post_id: Any) -> bool:
+    return checkpoint_path(kind, post_id).exists()
+
+
+def clear(kind: str, post_id: Any) -> None:
+    try:
+        checkpoint_path(kind, post_id).unlink()
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Không xoá được checkpoint {kind} {post_id}: {e}")
+
+
+def pages_fetched(kind: str, post_id: Any) -> int:
+    """Số trang đã lấy theo dòng checkpoint cuối cùng (0 nếu không có / hỏng)."""
+    pages = 0
+    try:
+        with checkpoint_path(kind, post_id).open("rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    pages = max(int(json.loads(line.decode("utf-8")).get("page_number") or 1) - 1, 0)
+                except Exception:
+                    break
+    except OSError:
+        return 0
+    return pages
+
+
+class PaginationCheckpoint:
+    """
+    Checkpoint của 1 lần phân trang (kind = "reactions" | "comments").
+    Dùng: state = cp.load() -> (nếu có) tiếp tục từ state; sau mỗi trang cp.update(items, cursor, page_number);
+    kết thúc cp.close(finished) (finished=True: đã lấy hết -> xoá, False: ghi nốt để lần sau tiếp tục).
+    """
+
+    def __init__(self, kind: str, post_id: Any, every_pages: Optional[int] = None):
+        self.kind = kind
+        self.post_id = str(post_id)
+        self.path = checkpoint_path(kind, post_id)
+        self.every_pages = _every_pages() if every_pages is None else int(every_pages)
+        self.enabled = self.every_pages > 0
+        self._saved_items = 0
+        self._pages_since_save = 0
+        self._state: Optional[Dict[str, Any]] = None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """{"cursor", "page_number", "items", "extra"} của lần chạy trước, hoặc None (không có / hết hạn / hỏng)."""
+        if not self.enabled or not self.path.exists():
+            return None
+        try:
+            if time.time() - self.path.stat().st_mtime > MAX_AGE_HOURS * 3600:
+                print(f"⚠️ Checkpoint {self.kind} của post {self.post_id} đã quá {MAX_AGE_HOURS} giờ, bắt đầu lại từ trang 1")
+                clear(self.kind, self.post_id)
+                return None
+            items: List[Any] = []
+            last: Optional[Dict[str, Any]] = None
+            valid_size = 0
+            with self.path.open("rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # dòng ghi dở (crash giữa lúc ghi)
+                    try:
+                        record = json.loads(line.decode("utf-8"))
+                    except Exception:
+                        break
+                    items.extend(record.get("items") or [])
+                    last = record
+                    valid_size += len(line)
+            if not last or not last.get("cursor"):
+                clear(self.kind, self.post_id)
+                return None
+            # Cắt phần ghi dở để các dòng append sau không dính vào dòng hỏng
+            if valid_size < self.path.stat().st_size:
+                os.truncate(str(self.path), valid_size)
+        except Exception as e:
+            print(f"⚠️ Không đọc được checkpoint {self.kind} của post {self.post_id}: {e}")
+            clear(self.kind, self.post_id)
+            return None
+        self._saved_items = len(items)
+        page_number = int(last.get("page_number") or 1)
+        with _stats_lock:
+            _stats["resumed"] += 1
+            _stats["pages_skipped"] += max(page_number - 1, 0)
+        print(f"♻️ Tiếp tục {self.kind} của post {self.post_id} từ trang {page_number} (đã có {len(items)} mục từ lần chạy trước)")
+        return {"cursor": last["cursor"], "page_number": page_number, "items": items, "extra": last.get("extra") or {}}
+
+    def update(self, items: List[Any], cursor: Optional[str], page_number: int, **extra: Any) -> None:
+        """Gọi sau mỗi trang thành công: items = toàn bộ list đã thu thập, cursor = cursor của trang kế tiếp."""
+        if not self.enabled or not cursor:
+            return
+        self._state = {"items": items, "cursor": cursor, "page_number": page_number, "extra": extra}
+        self._pages_since_save += 1
+        if self._pages_since_save >= self.every_pages:
+            self.flush()
+
+    def flush(self) -> None:
+        """Ghi phần items mới + cursor hiện tại (append 1 dòng)."""
+        state = self._state
+        if not self.enabled or state is None or not self._pages_since_save:
+            return
+        items = state["items"]
+        record = {
+            "cursor": state["cursor"],
+            "page_number": state["page_number"],
+            "extra": state["extra"],
+            "items": items[self._saved_items:],
+            "ts": time.time(),
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._saved_items = len(items)
+            self._pages_since_save = 0
+            with _stats_lock:
+                _stats["checkpoints_written"] += 1
+        except Exception as e:
+            print(f"⚠️ Không ghi được checkpoint {self.kind} của post {self.post_id}: {e}")
+
+    def close(self, finished: bool) -> None:
+        if not self.enabled:
+            return
+        if finished:
+            clear(self.kind, self.post_id)
+            with _stats_lock:
+                _stats["completed"] += 1
+        else:
+            self.flush()
+
+
+def get_stats() -> Dict[str, Any]:
+    """Số checkpoint đang chờ tiếp tục + số lần đã tiếp tục / số trang khỏi tải lại (trong tiến trình này)."""
+    try:
+        pending = sorted(p.name for p in CHECKPOINT_DIR.glob("*.jsonl"))
+    except Exception:
+        pending = []
+    with _stats_lock:
+        stats = dict(_stats)
+    return {**stats, "every_pages": _every_pages(), "max_age_hours": MAX_AGE_HOURS, "pending": len(pending), "pending_files": pending[:50]}
@@ -0,0 +1,182 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from core import file_lock
+from core.paths import get_data_dir
+
+# Cache giá trị payload động theo profile (fb_dtsg, lsd, jazoest, __spin_r, __spin_t, ...):
+# - Có hạn dùng rõ ràng (expires_at), hết hạn thì refresh thay vì dùng mãi giá trị trong settings.json
+# - Lưu ra data/payload_cache.json để các worker/tiến trình khác dùng chung
+# - Refresh single-flight: nhiều worker gặp 1357004 cùng lúc chỉ có 1 lần capture cho mỗi profile
+CACHE_PATH = get_data_dir() / "payload_cache.json"
+DEFAULT_TTL_SECONDS = 3600
+_STAT_INTERVAL = 0.5  # tối đa 2 lần stat file/giây khi đọc cache
+
+_lock = threading.Lock()
+_profile_locks: Dict[str, threading.Lock] = {}
+_cache: Dict[str, Any] = {"sig": None, "checked_at": 0.0, "entries": {}}
+_stats: Dict[str, int] = {"hits": 0, "misses": 0, "refreshes": 0, "refresh_joined": 0, "refresh_failed": 0}
+
+
+def _file_sig() -> Optional[tuple]:
+    try:
+        st = CACHE_PATH.stat()
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def _load_entries() -> Dict[str, Any]:
+    """Đọc entries (cache trong bộ nhớ, chỉ đọc lại file khi chữ ký file thay đổi)."""
+    now = time.monotonic()
+    with _lock:
+        if now - _cache["checked_at"] < _STAT_INTERVAL:
+            return _cache["entries"]
+        _cache["checked_at"] = now
+        sig = _file_sig()
+        if sig == _cache["sig"]:
+            return _cache["entries"]
+        entries: Dict[str, Any] = {}
+        if sig is not None:
+            try:
+                with CACHE_PATH.open("r", encoding="utf-8") as f:
+                    raw = json.load(f)
+                if isinstance(raw, dict):
+                    entries = raw
+            except Exception:
+                entries = {}
+        _cache["sig"] = sig
+        _cache["entries"] = entries
+        return entries
+
+
+def _save_entries(entries: Dict[str, Any]) -> None:
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CACHE_PATH.with_name(f"{CACHE_PATH.name}.{os.getpid()}.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp.replace(CACHE_PATH)
+    with _lock:
+        _cache["sig"] = _file_sig()
+        _cache["checked_at"] = time.monotonic()
+        _cache["entries"] = entries
+
+
+def _count(key: str) -> None:
+    with _lock:
+        _stats[key] += 1
+
+
+def _get_profile_lock(profile_id: str) -> threading.Lock:
+    with _lock:
+        lock = _profile_locks.get(profile_id)
+        if lock is None:
+            lock = threading.Lock()
+            _profile_locks[profile_id] = lock
+        return lock
+
+
+def _entry(profile_id: str) -> Optional[Dict[str, Any]]:
+    entry = _load_entries().get(str(profile_id))
+    return entry if isinstance(entry, dict) and isinstance(entry.get("values"), dict) else None
+
+
+def get(profile_id: str) -> Optional[Dict[str, Any]]:
+    """Giá trị payload còn hạn của profile, hoặc None (hết hạn / chưa có)."""
+    entry = _entry(profile_id)
+    if entry and float(entry.get("expires_at", 0) or 0) > time.time():
+        _count("hits")
+        return dict(entry["values"])
+    _count("misses")
+    return None
+
+
+def put(profile_id: str, values: Dict[str, Any], ttl_seconds: Optional[int] = None, source: str = "") -> Dict[str, Any]:
+    """Ghi giá trị payload mới cho profile với hạn dùng ttl_seconds (mặc định DEFAULT_TTL_SECONDS)."""
+    ttl = int(ttl_seconds) if ttl_seconds else DEFAULT_TTL_SECONDS
+    now = time.time()
+    clean = {k: v for k, v in (values or {}).items() if v}
+    entries = dict(_load_entries())
+    entries[str(profile_id)] = {
+        "values": clean,
+        "fetched_at": now,
+        "expires_at": now + ttl,
+        "source": source,
+    }
+    _save_entries(entries)
+    return clean
+
+
+def invalidate(profile_id: str) -> None:
+    """Đánh dấu hết hạn (giữ lại values để tham khảo, lần get sau sẽ miss)."""
+    entries = dict(_load_entries())
+    entry = entries.get(str(profile_id))
+    if isinstance(entry, dict):
+        entry = dict(entry)
+        entry["expires_at"] = 0
+        entries[str(profile_id)] = entry
+        _save_entries(entries)
+
+
+def refresh(
+    profile_id: str,
+    refresher: Callable[[], Optional[Dict[str, Any]]],
+    stale_since: Optional[float] = None,
+    ttl_seconds: Optional[int] = None,
+    lock_timeout: float = 120.0,
+) -> Optional[Dict[str, Any]]:
+    """
+    Refresh single-flight cho 1 profile.
+    - stale_since: thời điểm caller thấy payload lỗi; nếu trong lúc chờ lock đã có worker khác
+      refresh sau thời điểm đó thì dùng luôn kết quả, không capture lại.
+    - refresher(): trả về dict values (hoặc None nếu thất bại), kèm key "_source" tuỳ chọn.
+    """
+    pid = str(profile_id)
+    if stale_since is None:
+        stale_since = time.time()
+    lock_file = CACHE_PATH.with_name(f"{CACHE_PATH.name}.{pid}.lock")
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with _get_profile_lock(pid):
+        # Hết lock_timeout vẫn refresh (single-flight best-effort) nhưng không đụng vào lock của tiến trình khác
+        fd = file_lock.acquire(lock_file, lock_timeout, poll=0.1, stale_seconds=lock_timeout)
+        try:
+            with _lock:
+                _cache["checked_at"] = 0.0  # buộc đọc lại file (tiến trình khác có thể vừa ghi)
+            entry = _entry(pid)
+            if entry and float(entry.get("fetched_at", 0) or 0) >= stale_since and float(entry.get("expires_at", 0) or 0) > time.time():
+                _count("refresh_joined")
+                print(f"♻️ Payload của {pid} vừa được refresh bởi worker khác, dùng lại (không capture)")
+                return dict(entry["values"])
+            values = refresher()
+            if not values:
+                _count("refresh_failed")
+                return None
+            values = dict(values)
+            source = str(values.pop("_source", "") or "")
+            _count("refreshes")
+            return put(pid, values, ttl_seconds=ttl_seconds, source=source)
+        finally:
+            file_lock.release(fd, lock_file)
+
+
+def get_stats() -> Dict[str, Any]:
+    """Thống kê cache: hits/misses, số lần refresh thật, số lần dùng lại refresh của worker khác."""
+    entries = _load_entries()
+    now = time.time()
+    profiles = {}
+    for pid, entry in entries.items():
+        if not isinstance(entry, dict):
+            continue
+        profiles[pid] = {
+            "source": entry.get("source", ""),
+            "age_seconds": round(now - float(entry.get("fetched_at", 0) or 0), 1),
+            "expires_in_seconds": round(float(entry.get("expires_at", 0) or 0) - now, 1),
+        }
+    with _lock:
+        stats = dict(_stats)
+    return {**stats, "profiles": profiles}
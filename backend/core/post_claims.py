@@ -0,0 +1,187 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Set
+
+from core import file_lock
+from core import storage
+from core.paths import get_data_dir
+from core.utils import normalize_ids
+
+# Claim registry dùng chung giữa các profile / tiến trình worker:
+# - Nhiều profile hay gặp cùng 1 bài quảng cáo; trước đây profile nào cũng share, get_id_from_url
+#   rồi crawl reactions/comments trong post_ids/<profile>.jsonl của mình -> request GraphQL trùng lặp
+# - claim(): profile claim trước là chủ bài (resolve + crawl), profile sau chỉ được ghi vào seen_by
+# - Claim hết hạn sau POST_CLAIM_TTL_HOURS (chủ bài chết giữa chừng thì profile khác được claim lại);
+#   release() trả claim khi chủ không resolve được bài
+# - JSON: data/post_claims.json, mỗi lần claim đọc-sửa-ghi trong lock file O_EXCL (atomic giữa tiến trình)
+# - STORAGE_BACKEND = "sqlite": bảng post_claims, claim trong 1 transaction BEGIN IMMEDIATE
+CLAIMS_PATH = get_data_dir() / "post_claims.json"
+LOCK_PATH = get_data_dir() / "post_claims.lock"
+DEFAULT_TTL_HOURS = 24
+_COUNTER_PREFIX = "claims_avoided:"
+
+_lock = threading.Lock()
+
+
+def _ttl_seconds() -> float:
+    """POST_CLAIM_TTL_HOURS trong settings.json (0 = tắt registry, profile nào cũng tự xử lý như cũ)."""
+    try:
+        from core.settings import get_settings
+        hours = get_settings().post_claim_ttl_hours
+    except Exception:
+        hours = DEFAULT_TTL_HOURS
+    return float(hours) * 3600.0
+
+
+def enabled() -> bool:
+    return _ttl_seconds() > 0
+
+
+def _read_file() -> Dict[str, Any]:
+    try:
+        with CLAIMS_PATH.open("r", encoding="utf-8") as f:
+            raw = json.load(f)
+    except Exception:
+        raw = {}
+    if not isinstance(raw, dict):
+        raw = {}
+    if not isinstance(raw.get("claims"), dict):
+        raw["claims"] = {}
+    if not isinstance(raw.get("duplicates_avoided"), dict):
+        raw["duplicates_avoided"] = {}
+    return raw
+
+
+def _write_file(raw: Dict[str, Any]) -> None:
+    CLAIMS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CLAIMS_PATH.with_name(f"{CLAIMS_PATH.name}.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(raw, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp.replace(CLAIMS_PATH)
+
+
+def claim(post_ids: Iterable[Any], profile_id: Any) -> Dict[str, str]:
+    """
+    Claim các post cho profile. Trả về {post_id: profile chủ}; owner == profile_id nghĩa là profile này
+    được resolve/crawl bài, owner khác -> chỉ ghi nhận đã thấy, caller bỏ qua.
+    Registry tắt / lỗi đọc ghi -> coi như profile này là chủ (giữ hành vi cũ).
+    """
+    ids = normalize_ids(post_ids)
+    profile_id = str(profile_id or "").strip()
+    ttl = _ttl_seconds()
+    if not ids or not profile_id or ttl <= 0:
+        return {pid: profile_id for pid in ids}
+    now = time.time()
+    expire_before = now - ttl
+    try:
+        store = storage.get_store()
+        if store is not None:
+            owners = store.claims_claim(ids, profile_id, now, expire_before)
+            avoided = sum(1 for owner in owners.values() if owner != profile_id)
+            if avoided:
+                store.bump_counter(f"{_COUNTER_PREFIX}{profile_id}", avoided)
+            return owners
+        owners = {}
+        with _lock:
+            with file_lock.locked(LOCK_PATH):
+                raw = _read_file()
+                claims = raw["claims"]
+                # Dọn claim hết hạn luôn trong lần ghi này để file không phình
+                for pid in [pid for pid, c in claims.items() if float((c or {}).get("claimed_at", 0) or 0) < expire_before]:
+                    claims.pop(pid, None)
+                avoided = 0
+                for pid in ids:
+                    entry = claims.get(pid)
+                    if not isinstance(entry, dict) or entry.get("owner") == profile_id:
+                        claims[pid] = {"owner": profile_id, "claimed_at": now, "seen_by": (entry or {}).get("seen_by") or {}}
+                        owners[pid] = profile_id
+                        continue
+                    entry.setdefault("seen_by", {})[profile_id] = now
+                    owners[pid] = entry["owner"]
+                    avoided += 1
+                if avoided:
+                    raw["duplicates_avoided"][profile_id] = int(raw["duplicates_avoided"].get(profile_id, 0) or 0) + avoided
+                _write_file(raw)
+        return owners
+    except Exception as e:
+        print(f"⚠️ Không claim được post (xử lý như chưa có chủ): {e}")
+        return {pid: profile_id for pid in ids}
+
+
+def claimed_elsewhere(post_ids: Iterable[Any], profile_id: Any) -> Set[str]:
+    """Claim rồi trả về các post_id đang thuộc profile khác (caller bỏ qua các post này)."""
+    profile_id = str(profile_id or "").strip()
+    return {pid for pid, owner in claim(post_ids, profile_id).items() if owner != profile_id}
+
+
+def release(post_ids: Iterable[Any], profile_id: Any) -> None:
+    """Trả claim (vd: chủ bài không resolve được post) để profile khác có thể claim lại."""
+    ids = normalize_ids(post_ids)
+    profile_id = str(profile_id or "").strip()
+    if not ids or not profile_id or not enabled():
+        return
+    try:
+        store = storage.get_store()
+        if store is not None:
+            store.claims_release(ids, profile_id)
+            return
+        with _lock:
+            with file_lock.locked(LOCK_PATH):
+                raw = _read_file()
+                changed = False
+                for pid in ids:
+                    entry = raw["claims"].get(pid)
+                    if isinstance(entry, dict) and entry.get("owner") == profile_id:
+                        raw["claims"].pop(pid, None)
+                        changed = True
+                if changed:
+                    _write_file(raw)
+    except Exception as e:
+        print(f"⚠️ Không trả được claim: {e}")
+
+
+def export_to_store(store) -> int:
+    """Migrate post_claims.json (claim còn hiệu lực) + bộ đếm vào SQLite (chạy lại không trùng)."""
+    raw = _read_file()
+    expire_before = time.time() - _ttl_seconds()
+    live = {
+        pid: c for pid, c in raw["claims"].items()
+        if isinstance(c, dict) and float(c.get("claimed_at", 0) or 0) >= expire_before
+    }
+    if live:
+        store.claims_import(live)
+    if store.get_meta("claims_avoided_migrated") is None:
+        for pid, count in raw["duplicates_avoided"].items():
+            store.bump_counter(f"{_COUNTER_PREFIX}{pid}", int(count or 0))
+        store.set_meta("claims_avoided_migrated", True)
+    return len(live)
+
+
+def get_stats() -> Dict[str, Any]:
+    """Số claim còn hiệu lực theo profile chủ + số lần profile bỏ qua được post đã có chủ."""
+    ttl = _ttl_seconds()
+    since = time.time() - ttl
+    store = storage.get_store()
+    if store is not None:
+        owned = store.claims_count(since)
+        avoided = store.get_counters(_COUNTER_PREFIX)
+    else:
+        with _lock:
+            raw = _read_file()
+        owned: Dict[str, int] = {}
+        for c in raw["claims"].values():
+            if isinstance(c, dict) and float(c.get("claimed_at", 0) or 0) >= since:
+                owned[c.get("owner")] = owned.get(c.get("owner"), 0) + 1
+        avoided = {k: int(v) for k, v in raw["duplicates_avoided"].items()}
+    return {
+        "enabled": ttl > 0,
+        "ttl_hours": round(ttl / 3600.0, 2),
+        "active_claims": sum(owned.values()),
+        "claims_by_profile": owned,
+        "duplicates_avoided": avoided,
+        "duplicates_avoided_total": sum(avoided.values()),
+    }
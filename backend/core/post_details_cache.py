@@ -0,0 +1,247 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+from core import file_lock
+from core.paths import get_data_dir
+
+# Cache kết quả get_id_from_url (share URL / URL bài -> post_id, owning_profile, post_text):
+# - share_center_ad và vòng retry trong process_post gọi get_id_from_url cho mỗi URL /share/p/... bắt được,
+#   mỗi lần tải + regex cả trang HTML facebook.com dù URL/bài đó vừa được profile khác resolve vài phút trước
+# - LRU trong bộ nhớ (tối đa POST_DETAILS_CACHE_SIZE bài), key theo URL đã chuẩn hoá và theo post_id
+# - Trên đĩa: log append-only data/post_details_cache.jsonl, các tiến trình đọc phần mới theo offset
+#   (resolve ở tiến trình này thì tiến trình khác cũng hit); compact khi log dài gấp đôi số entry còn sống
+# - Entry hết hạn sau POST_DETAILS_CACHE_TTL_HOURS (0 = tắt cache)
+CACHE_PATH = get_data_dir() / "post_details_cache.jsonl"
+LOCK_PATH = get_data_dir() / "post_details_cache.lock"
+DEFAULT_TTL_HOURS = 24
+DEFAULT_MAX_ENTRIES = 5000
+_COMPACT_MIN_LINES = 2000
+_STAT_INTERVAL = 0.5  # tối đa 2 lần stat file/giây khi đọc
+# Query param giữ lại khi chuẩn hoá URL (các param khác là tracking: mibextid, rdid, __cft__, ...)
+_KEEP_QUERY = {"story_fbid", "fbid", "id", "v", "set"}
+
+_lock = threading.Lock()
+# post_id -> {"post_id", "owning_profile", "post_text", "ts"}; url -> post_id
+_posts: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_urls: "OrderedDict[str, str]" = OrderedDict()
+_log: Dict[str, Any] = {"ino": None, "offset": 0, "lines": 0, "checked_at": 0.0}
+_stats: Dict[str, int] = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0, "expired": 0, "log_lines_read": 0, "compactions": 0}
+
+
+def _settings():
+    """(ttl giây, số entry tối đa) từ settings.json."""
+    try:
+        from core.settings import get_settings
+        s = get_settings()
+        return float(s.post_details_cache_ttl_hours) * 3600.0, max(int(s.post_details_cache_size), 1)
+    except Exception:
+        return DEFAULT_TTL_HOURS * 3600.0, DEFAULT_MAX_ENTRIES
+
+
+def normalize_url(url: Any) -> str:
+    """
+    Chuẩn hoá URL Facebook: bỏ tracking query/fragment, m./web./mbasic. -> www., bỏ "/" cuối.
+    Path giữ nguyên chữ hoa/thường (mã share /share/p/<code> phân biệt hoa thường).
+    """
+    url = str(url or "").strip()
+    if not url:
+        return ""
+    try:
+        parsed = urlparse(url if "://" in url else f"https://{url}")
+    except Exception:
+        return url
+    host = (parsed.hostname or "").lower()
+    for prefix in ("m.", "web.", "mbasic.", "mobile."):
+        if host.startswith(prefix):
+            host = "www." + host[len(prefix):]
+            break
+    if host == "facebook.com":
+        host = "www.facebook.com"
+    path = parsed.path.rstrip("/") or "/"
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parsed.query) if k in _KEEP_QUERY))
+    return f"https://{host}{path}" + (f"?{query}" if query else "")
+
+
+def _remember_locked(entry: Dict[str, Any], url_key: str, max_entries: int) -> None:
+    post_id = entry["post_id"]
+    _posts[post_id] = entry
+    _posts.move_to_end(post_id)
+    if url_key:
+        _urls[url_key] = post_id
+        _urls.move_to_end(url_key)
+    while len(_posts) > max_entries:
+        _posts.popitem(last=False)
+        _stats["evictions"] += 1
+    # URL trỏ tới bài đã bị đẩy khỏi LRU thì cũng bỏ (giữ _urls có giới hạn)
+    while len(_urls) > 2 * max_entries:
+        _urls.popitem(last=False)
+
+
+def _refresh_locked(force: bool = False) -> None:
+    """Đọc phần log mới (tiến trình khác vừa ghi); log bị compact (inode đổi / ngắn lại) thì đọc lại từ đầu."""
+    now = time.monotonic()
+    if not force and now - _log["checked_at"] < _STAT_INTERVAL:
+        return
+    _log["checked_at"] = now
+    try:
+        st = CACHE_PATH.stat()
+    except OSError:
+        return
+    if st.st_ino != _log["ino"] or st.st_size < _log["offset"]:
+        _log.update({"ino": st.st_ino, "offset": 0, "lines": 0})
+    if st.st_size == _log["offset"]:
+        return
+    _, max_entries = _settings()
+    with CACHE_PATH.open("rb") as f:
+        f.seek(_log["offset"])
+        pos = _log["offset"]
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            pos += len(line)
+            _log["lines"] += 1
+            try:
+                record = json.loads(line.decode("utf-8"))
+                entry = {
+                    "post_id": str(record["post_id"]),
+                    "owning_profile": record.get("owning_profile"),
+                    "post_text": record.get("post_text"),
+                    "ts": float(record.get("ts", 0) or 0),
+                }
+            except Exception:
+                continue
+            _remember_locked(entry, str(record.get("url") or ""), max_entries)
+            _stats["log_lines_read"] += 1
+    _log["offset"] = pos
+
+
+def _lookup(url_key: str = "", post_id: str = "") -> Optional[Dict[str, Any]]:
+    ttl, _ = _settings()
+    if ttl <= 0:
+        return None
+    with _lock:
+        _refresh_locked()
+        pid = _urls.get(url_key) if url_key else post_id
+        entry = _posts.get(pid) if pid else None
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        if time.time() - entry["ts"] > ttl:
+            _stats["expired"] += 1
+            _stats["misses"] += 1
+            return None
+        _posts.move_to_end(pid)
+        _stats["hits"] += 1
+        return {k: entry[k] for k in ("post_id", "owning_profile", "post_text")}
+
+
+def get_by_url(url: Any) -> Optional[Dict[str, Any]]:
+    """{post_id, owning_profile, post_text} đã resolve cho URL (còn hạn), hoặc None."""
+    url_key = normalize_url(url)
+    return _lookup(url_key=url_key) if url_key else None
+
+
+def get_by_post_id(post_id: Any) -> Optional[Dict[str, Any]]:
+    post_id = str(post_id or "").strip()
+    return _lookup(post_id=post_id) if post_id else None
+
+
+def put(url: Any, post_id: Any, owning_profile: Any = None, post_text: Any = None) -> None:
+    """Lưu kết quả resolve (chỉ khi có post_id) vào LRU + log trên đĩa. Best-effort, lỗi chỉ log."""
+    post_id = str(post_id or "").strip()
+    ttl, max_entries = _settings()
+    if not post_id or ttl <= 0:
+        return
+    url_key = normalize_url(url)
+    entry = {"post_id": post_id, "owning_profile": owning_profile, "post_text": post_text, "ts": time.time()}
+    with _lock:
+        _remember_locked(entry, url_key, max_entries)
+        _stats["puts"] += 1
+    try:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps({"url": url_key, **entry}, ensure_ascii=False) + "\n"
+        with file_lock.locked(LOCK_PATH):
+            with CACHE_PATH.open("a", encoding="utf-8") as f:
+                f.write(line)
+        _maybe_compact(max_entries)
+    except Exception as e:
+        print(f"⚠️ Không ghi được post details cache: {e}")
+
+
+def _maybe_compact(max_entries: int) -> None:
+    with _lock:
+        _refresh_locked(force=True)
+        lines = _log["lines"]
+    if lines < max(_COMPACT_MIN_LINES, 2 * max_entries):
+        return
+    compact()
+
+
+def compact() -> int:
+    """Ghi lại log chỉ còn các entry còn hạn đang có trong LRU (atomic). Trả về số entry còn lại."""
+    ttl, _ = _settings()
+    fd = file_lock.acquire(LOCK_PATH)
+    if fd is None:
+        return -1
+    try:
+        with _lock:
+            _refresh_locked(force=True)
+            cutoff = time.time() - ttl
+            urls_by_post: Dict[str, list] = {}
+            for url_key, pid in _urls.items():
+                urls_by_post.setdefault(pid, []).append(url_key)
+            tmp = CACHE_PATH.with_name(f"{CACHE_PATH.name}.tmp")
+            kept = 0
+            with tmp.open("w", encoding="utf-8") as f:
+                for pid, entry in _posts.items():
+                    if entry["ts"] < cutoff:
+                        continue
+                    kept += 1
+                    for url_key in urls_by_post.get(pid) or [""]:
+                        f.write(json.dumps({"url": url_key, **entry}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            tmp.replace(CACHE_PATH)
+            st = CACHE_PATH.stat()
+            _log.update({"ino": st.st_ino, "offset": st.st_size, "lines": kept, "checked_at": time.monotonic()})
+            _stats["compactions"] += 1
+        return kept
+    finally:
+        file_lock.release(fd, LOCK_PATH)
+
+
+def clear() -> None:
+    """Xoá cache (bộ nhớ + file)."""
+    with _lock:
+        _posts.clear()
+        _urls.clear()
+        _log.update({"ino": None, "offset": 0, "lines": 0, "checked_at": 0.0})
+        try:
+            CACHE_PATH.unlink()
+        except Exception:
+            pass
+
+
+def get_stats() -> Dict[str, Any]:
+    """hits/misses (tính trong tiến trình này), số bài đang cache, TTL, giới hạn LRU."""
+    ttl, max_entries = _settings()
+    with _lock:
+        _refresh_locked()
+        size = len(_posts)
+        url_keys = len(_urls)
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        **stats,
+        "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+        "enabled": ttl > 0,
+        "ttl_hours": round(ttl / 3600.0, 2),
+        "max_entries": max_entries,
+        "cached_posts": size,
+        "cached_urls": url_keys,
+    }
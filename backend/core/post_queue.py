@@ -0,0 +1,429 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core import file_lock, storage
+from core.paths import get_data_dir
+
+# Hàng đợi post_ids theo profile (thay cho pop-and-rewrite file <profile>.json):
+# - <profile>.jsonl  : log append-only, mỗi dòng 1 post {"id","flag","text","owning_profile"}
+# - <profile>.offset : byte offset đã commit (consumer đã xử lý xong tới đâu) + generation
+# Producer chỉ append 1 dòng, consumer chỉ ghi lại file offset (vài chục byte) sau mỗi post.
+# Crash giữa chừng -> lần chạy sau tiếp tục từ offset đã commit.
+# Compact ghi dòng header {"_generation": N} ở đầu log mới: crash sau khi thay log mà trước khi ghi lại
+# file offset thì generation trong log > generation trong file offset -> offset coi như 0 (không áp offset cũ lên log mới).
+# Không lấy được lock hàng đợi (tiến trình khác giữ quá lâu) -> append_posts raise FileLockTimeout, không âm thầm bỏ post.
+# STORAGE_BACKEND = "sqlite": cùng interface nhưng lưu trong bảng post_queue của data/app_state.db
+# (offset = seq của dòng đã xử lý).
+POST_IDS_DIR = get_data_dir() / "post_ids"
+QUEUE_SUFFIX = ".jsonl"
+OFFSET_SUFFIX = ".offset"
+LEGACY_SUFFIX = ".json"
+GENERATION_KEY = "_generation"
+# Meta trong SqliteStore: {profile_id: migrated_at} các hàng đợi JSON đã chép sang DB
+MIGRATED_META_KEY = "post_queue_migrated"
+
+# Id các post trong log (id -> end_offset lớn nhất) theo profile, đọc tăng dần theo phần log mới
+# (tiến trình khác append) thay vì quét lại toàn bộ phần chưa xử lý mỗi lần append
+_ids_lock = threading.Lock()
+_ids_cache: Dict[str, Dict[str, Any]] = {}
+
+
+def queue_path(profile_id: str) -> Path:
+    return POST_IDS_DIR / f"{profile_id}{QUEUE_SUFFIX}"
+
+
+def _offset_path(profile_id: str) -> Path:
+    return POST_IDS_DIR / f"{profile_id}{OFFSET_SUFFIX}"
+
+
+def _legacy_path(profile_id: str) -> Path:
+    return POST_IDS_DIR / f"{profile_id}{LEGACY_SUFFIX}"
+
+
+def _lock_path(profile_id: str) -> Path:
+    return POST_IDS_DIR / f"{profile_id}{QUEUE_SUFFIX}.lock"
+
+
+def _item_id(item: Any) -> Optional[str]:
+    """Hỗ trợ cả format cũ (string / post_id) và mới (id)."""
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        return item.get("id") or item.get("post_id")
+    return None
+
+
+def _log_generation(profile_id: str) -> Optional[int]:
+    """Generation ghi ở dòng header của log (log chưa từng compact / không có header -> None)."""
+    try:
+        with queue_path(profile_id).open("rb") as f:
+            first = f.readline()
+        if not first.endswith(b"\n"):
+            return None
+        header = json.loads(first.decode("utf-8"))
+        if isinstance(header, dict) and GENERATION_KEY in header:
+            return int(header[GENERATION_KEY])
+    except Exception:
+        pass
+    return None
+
+
+def _read_offset(profile_id: str) -> Tuple[int, int]:
+    """
+    Trả về (offset, generation). Best-effort: lỗi -> (0, 0).
+    Log đã được compact sang generation mới nhưng file offset chưa kịp ghi lại (crash giữa 2 bước) -> (0, generation mới).
+    """
+    try:
+        with _offset_path(profile_id).open("r", encoding="utf-8") as f:
+            raw = json.load(f)
+        offset, generation = int(raw.get("offset", 0) or 0), int(raw.get("generation", 0) or 0)
+    except Exception:
+        offset, generation = 0, 0
+    log_generation = _log_generation(profile_id)
+    if log_generation is not None and log_generation > generation:
+        return 0, log_generation
+    return offset, generation
+
+
+def _write_offset(profile_id: str, offset: int, generation: int) -> None:
+    path = _offset_path(profile_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump({"offset": int(offset), "generation": int(generation)}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp.replace(path)
+
+
+def _scan(profile_id: str, offset: int) -> List[Tuple[Any, int]]:
+    """
+    Đọc log từ offset: trả về [(record, end_offset)].
+    Dòng cuối chưa có '\\n' (producer đang ghi dở) sẽ không được đọc.
+    """
+    path = queue_path(profile_id)
+    out: List[Tuple[Any, int]] = []
+    if not path.exists():
+        return out
+    with path.open("rb") as f:
+        f.seek(offset)
+        pos = offset
+        while True:
+            line = f.readline()
+            if not line or not line.endswith(b"\n"):
+                break
+            pos += len(line)
+            text = line.strip()
+            if not text:
+                continue
+            try:
+                record = json.loads(text.decode("utf-8"))
+            except Exception:
+                # Dòng hỏng thì bỏ qua nhưng vẫn tiến offset
+                continue
+            if isinstance(record, dict) and GENERATION_KEY in record:
+                continue
+            out.append((record, pos))
+    return out
+
+
+def _log_ids_locked(profile_id: str, generation: int) -> Dict[str, int]:
+    """
+    (Đã giữ lock hàng đợi) id -> end_offset lớn nhất của các post trong log. Chỉ đọc phần log mới từ lần trước;
+    log bị compact / thay (generation / inode đổi, ngắn lại) thì đọc lại từ đầu.
+    """
+    path = queue_path(profile_id)
+    try:
+        st = path.stat()
+    except OSError:
+        st = None
+    with _ids_lock:
+        cache = _ids_cache.get(profile_id)
+        if st is None:
+            cache = {"ino": None, "generation": generation, "end": 0, "ids": {}}
+        elif (
+            cache is None
+            or cache["ino"] != st.st_ino
+            or cache["generation"] != generation
+            or st.st_size < cache["end"]
+        ):
+            cache = {"ino": st.st_ino, "generation": generation, "end": 0, "ids": {}}
+        _ids_cache[profile_id] = cache
+        if st is not None and st.st_size > cache["end"]:
+            new_records = _scan(profile_id, cache["end"])
+            for record, end_offset in new_records:
+                rid = _item_id(record)
+                if rid:
+                    cache["ids"][rid] = end_offset
+            if new_records:
+                cache["end"] = new_records[-1][1]
+        return cache["ids"]
+
+
+def _remember_appended_locked(profile_id: str, start: int, lines: List[str], ids: List[str]) -> None:
+    """Ghi nhận các dòng vừa append (bắt đầu từ byte start) vào cache id."""
+    with _ids_lock:
+        cache = _ids_cache.get(profile_id)
+        if cache is None or cache["end"] != start:
+            # Cache lệch (log bị ghi từ chỗ khác) -> lần sau đọc lại từ phần chưa biết
+            return
+        pos = start
+        for line, rid in zip(lines, ids):
+            pos += len(line.encode("utf-8"))
+            cache["ids"][rid] = pos
+        cache["end"] = pos
+        try:
+            cache["ino"] = queue_path(profile_id).stat().st_ino
+        except OSError:
+            pass
+
+
+def _append_locked(profile_id: str, records: Iterable[Any], after_offset: int = 0) -> int:
+    """
+    Append records (đã giữ lock), bỏ qua id đã có trong phần chưa xử lý.
+    after_offset: chỉ so trùng với phần log sau offset này (requeue post đang xử lý dở, chưa commit offset).
+    """
+    offset, generation = _read_offset(profile_id)
+    since = max(offset, after_offset)
+    log_ids = _log_ids_locked(profile_id, generation)
+    seen = set()
+    lines, ids = [], []
+    for record in records:
+        rid = _item_id(record)
+        if not rid or rid in seen or log_ids.get(rid, -1) > since:
+            continue
+        seen.add(rid)
+        ids.append(rid)
+        lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+    if not lines:
+        return 0
+    path = queue_path(profile_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as f:
+        start = f.tell()
+        f.write("".join(lines))
+        f.flush()
+        os.fsync(f.fileno())
+    _remember_appended_locked(profile_id, start, lines, ids)
+    return len(lines)
+
+
+def _migrate_legacy_locked(profile_id: str) -> None:
+    """Chuyển file cũ <profile>.json (mảng) vào log rồi xóa file cũ."""
+    legacy = _legacy_path(profile_id)
+    if not legacy.exists():
+        return
+    try:
+        with legacy.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = [data]
+        if isinstance(data, list) and data:
+            added = _append_locked(profile_id, data)
+            print(f"📦 Đã chuyển {added} post từ {legacy.name} sang hàng đợi {queue_path(profile_id).name}")
+        legacy.unlink()
+    except Exception as e:
+        print(f"⚠️ Không thể chuyển file post_ids cũ {legacy.name}: {e}")
+
+
+def _with_lock(profile_id: str, fn, default=None, raise_on_timeout: bool = False):
+    """Chạy fn khi giữ lock hàng đợi; hết timeout -> raise FileLockTimeout (raise_on_timeout) hoặc log lỗi + default."""
+    POST_IDS_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        with file_lock.locked(_lock_path(profile_id), poll=0.05):
+            return fn()
+    except file_lock.FileLockTimeout as e:
+        print(f"❌ Không lấy được lock hàng đợi post_ids cho {profile_id}: {e}")
+        if raise_on_timeout:
+            raise
+        return default
+
+
+def append_posts(profile_id: str, records: List[Dict[str, Any]]) -> int:
+    """
+    Producer: append các post mới vào hàng đợi (không ghi lại file).
+    Trả về số post thực sự được thêm (đã loại trùng với phần chưa xử lý).
+    Raise file_lock.FileLockTimeout nếu không lấy được lock hàng đợi (post CHƯA được ghi).
+    """
+    store = storage.get_store()
+    if store is not None:
+        return store.queue_append(profile_id, records)
+    def _do():
+        _migrate_legacy_locked(profile_id)
+        return _append_locked(profile_id, records)
+    return _with_lock(profile_id, _do, raise_on_timeout=True) or 0
+
+
+def requeue_post(profile_id: str, record: Dict[str, Any], end_offset: int, generation: int) -> bool:
+    """
+    Consumer: đưa post đang xử lý (chưa commit offset, end_offset = vị trí dòng của nó) lại cuối hàng đợi.
+    Gọi TRƯỚC khi commit offset qua post: crash giữa 2 bước thì post có 2 bản (không mất).
+    True nếu bản requeue đã nằm trên đĩa (vừa ghi hoặc đã có sẵn phía sau), False nếu không ghi được.
+    """
+    store = storage.get_store()
+    if store is not None:
+        try:
+            store.queue_append(profile_id, [record], after_seq=end_offset)
+            return True
+        except Exception as e:
+            print(f"⚠️ Không thể requeue post vào hàng đợi {profile_id}: {e}")
+            return False
+    def _do():
+        _offset, current_gen = _read_offset(profile_id)
+        # Log đã bị compact (generation khác) -> end_offset không còn đúng vị trí, so trùng với cả phần chưa xử lý
+        return _append_locked(profile_id, [record], after_offset=end_offset if current_gen == generation else 0)
+    return _with_lock(profile_id, _do) is not None
+
+
+def read_pending(profile_id: str) -> Tuple[List[Tuple[Any, int]], int]:
+    """
+    Consumer: trả về ([(post_data, end_offset)], generation) cho các post chưa xử lý.
+    Sau khi xử lý xong 1 post, gọi commit_offset(profile_id, end_offset, generation).
+    """
+    store = storage.get_store()
+    if store is not None:
+        return store.queue_read_pending(profile_id)
+    if _legacy_path(profile_id).exists():
+        _with_lock(profile_id, lambda: _migrate_legacy_locked(profile_id))
+    offset, generation = _read_offset(profile_id)
+    return _scan(profile_id, offset), generation
+
+
+def pending_posts(profile_id: str) -> List[Any]:
+    """Danh sách post chưa xử lý (chỉ đọc)."""
+    store = storage.get_store()
+    if store is not None:
+        return [r for r, _ in store.queue_read_pending(profile_id)[0]]
+    return _pending_posts_json(profile_id)
+
+
+def _pending_posts_json(profile_id: str) -> List[Any]:
+    offset, _gen = _read_offset(profile_id)
+    items = [r for r, _ in _scan(profile_id, offset)]
+    legacy = _legacy_path(profile_id)
+    if legacy.exists():
+        # File cũ chưa được migrate (chỉ đọc, không ghi)
+        try:
+            with legacy.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                data = [data]
+            if isinstance(data, list):
+                seen = {_item_id(r) for r in items}
+                items.extend(r for r in data if _item_id(r) not in seen)
+        except Exception:
+            pass
+    return items
+
+
+def pending_count(profile_id: str) -> int:
+    store = storage.get_store()
+    if store is not None:
+        return store.queue_pending_count(profile_id)
+    return len(pending_posts(profile_id))
+
+
+def commit_offset(profile_id: str, offset: int, generation: int) -> bool:
+    """
+    Ghi lại offset đã xử lý (O(1), atomic). Bỏ qua nếu log đã bị compact
+    (generation khác) hoặc offset lùi lại so với giá trị đã commit.
+    """
+    store = storage.get_store()
+    if store is not None:
+        return store.queue_commit(profile_id, offset, generation)
+    def _do():
+        current, current_gen = _read_offset(profile_id)
+        if current_gen != generation or offset <= current:
+            return False
+        _write_offset(profile_id, offset, generation)
+        return True
+    return bool(_with_lock(profile_id, _do, default=False))
+
+
+def compact_queue(profile_id: str) -> None:
+    """
+    Thu gọn log: bỏ phần đã xử lý (trước offset) và tăng generation.
+    Gọi sau khi consumer xử lý xong 1 lượt, không gọi sau mỗi post.
+    """
+    store = storage.get_store()
+    if store is not None:
+        store.queue_compact(profile_id)
+        return
+    def _do():
+        offset, generation = _read_offset(profile_id)
+        path = queue_path(profile_id)
+        if offset <= 0 or not path.exists():
+            return
+        # Log mới mang generation trong header: crash trước khi ghi lại file offset thì _read_offset tự nhận ra
+        tmp = path.with_name(f"{path.name}.tmp")
+        with path.open("rb") as src, tmp.open("wb") as dst:
+            dst.write((json.dumps({GENERATION_KEY: generation + 1}) + "\n").encode("utf-8"))
+            src.seek(offset)
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                dst.write(chunk)
+            dst.flush()
+            os.fsync(dst.fileno())
+        tmp.replace(path)
+        _write_offset(profile_id, 0, generation + 1)
+    _with_lock(profile_id, _do)
+
+
+def list_queue_profiles() -> List[str]:
+    """Danh sách profile_id có hàng đợi (log mới hoặc file .json cũ)."""
+    store = storage.get_store()
+    if store is not None:
+        return store.queue_profiles()
+    return _queue_profiles_json()
+
+
+def _queue_profiles_json() -> List[str]:
+    if not POST_IDS_DIR.exists():
+        return []
+    ids = set()
+    for p in POST_IDS_DIR.glob(f"*{QUEUE_SUFFIX}"):
+        ids.add(p.name[: -len(QUEUE_SUFFIX)])
+    for p in POST_IDS_DIR.glob(f"*{LEGACY_SUFFIX}"):
+        ids.add(p.name[: -len(LEGACY_SUFFIX)])
+    return sorted(ids)
+
+
+def remove_queue(profile_id: str) -> None:
+    """Xóa toàn bộ hàng đợi của profile (log, offset, file cũ)."""
+    store = storage.get_store()
+    if store is not None:
+        store.queue_remove(profile_id)
+    with _ids_lock:
+        _ids_cache.pop(profile_id, None)
+    for p in (queue_path(profile_id), _offset_path(profile_id), _legacy_path(profile_id)):
+        try:
+            if p.exists():
+                p.unlink()
+        except Exception as e:
+            print(f"⚠️ Không thể xóa {p.name}: {e}")
+
+
+def export_to_store(store) -> int:
+    """
+    Migrator: chép phần chưa xử lý của mọi hàng đợi JSON vào SqliteStore. Trả về số post đã thêm.
+    Profile đã migrate (meta MIGRATED_META_KEY) thì bỏ qua: chạy lại không đưa lại các post
+    đã xử lý xong bên SQLite (queue_append chỉ dedupe với phần chưa xử lý).
+    """
+    migrated = store.get_meta(MIGRATED_META_KEY) or {}
+    added = 0
+    for profile_id in _queue_profiles_json():
+        if profile_id in migrated:
+            continue
+        try:
+            added += store.queue_append(profile_id, _pending_posts_json(profile_id))
+            migrated[profile_id] = time.time()
+            store.set_meta(MIGRATED_META_KEY, migrated)
+        except Exception as e:
+            print(f"⚠️ Không thể migrate hàng đợi post_ids của {profile_id}: {e}")
+    return added
@@ -0,0 +1,232 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+from core import file_lock
+from core import storage
+from core.paths import get_data_dir
+from core.utils import normalize_ids
+
+# Index các post đã crawl xong (reactions/comments), sống qua nhiều lần chạy:
+# - Hàng đợi post_ids bỏ post sau khi xử lý nên producer (share ads, quét page/group) không còn thấy nó
+#   -> mai gặp lại cùng bài là share + get_id_from_url + crawl lại từ đầu
+# - Producer/consumer gọi filter_processed() trước khi làm việc mạng, post còn trong TTL thì bỏ qua
+# - JSON: log append-only processed_posts.jsonl ({"id","ts"}/dòng), mỗi tiến trình đọc phần mới theo offset;
+#   compact (bỏ dòng hết hạn/trùng) khi log dài gấp đôi số entry còn sống
+# - STORAGE_BACKEND = "sqlite": bảng processed_posts (post_id PK, processed_at có index)
+# Số lần bỏ qua được (saved hits) đếm theo nguồn, xem qua GET /info/processed-index.
+LOG_PATH = get_data_dir() / "processed_posts.jsonl"
+STATS_PATH = get_data_dir() / "processed_posts.stats.json"
+LOCK_PATH = get_data_dir() / "processed_posts.lock"
+DEFAULT_TTL_DAYS = 7
+_COMPACT_MIN_LINES = 5000
+_COUNTER_PREFIX = "processed_saved:"
+
+_lock = threading.Lock()
+_memory: Dict[str, Any] = {"ino": None, "offset": 0, "lines": 0, "entries": {}}
+
+
+def _ttl_seconds() -> float:
+    """PROCESSED_POST_TTL_DAYS trong settings.json (0 = tắt index)."""
+    try:
+        from core.settings import get_settings
+        days = get_settings().processed_post_ttl_days
+    except Exception:
+        days = DEFAULT_TTL_DAYS
+    return float(days) * 86400.0
+
+
+def enabled() -> bool:
+    return _ttl_seconds() > 0
+
+
+def _refresh_locked() -> Dict[str, float]:
+    """Đọc phần log mới (từ offset lần trước); file bị compact (inode đổi / ngắn lại) thì đọc lại từ đầu."""
+    try:
+        st = LOG_PATH.stat()
+    except OSError:
+        _memory.update({"ino": None, "offset": 0, "lines": 0, "entries": {}})
+        return _memory["entries"]
+    if st.st_ino != _memory["ino"] or st.st_size < _memory["offset"]:
+        _memory.update({"ino": st.st_ino, "offset": 0, "lines": 0, "entries": {}})
+    if st.st_size == _memory["offset"]:
+        return _memory["entries"]
+    entries = _memory["entries"]
+    with LOG_PATH.open("rb") as f:
+        f.seek(_memory["offset"])
+        pos = _memory["offset"]
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            pos += len(line)
+            _memory["lines"] += 1
+            try:
+                record = json.loads(line.decode("utf-8"))
+                entries[str(record["id"])] = float(record.get("ts", 0) or 0)
+            except Exception:
+                continue
+    _memory["offset"] = pos
+    return entries
+
+
+def filter_processed(post_ids: Iterable[Any]) -> Set[str]:
+    """Các post_id (trong danh sách) đã được crawl trong thời hạn TTL."""
+    ids = normalize_ids(post_ids)
+    ttl = _ttl_seconds()
+    if not ids or ttl <= 0:
+        return set()
+    since = time.time() - ttl
+    try:
+        store = storage.get_store()
+        if store is not None:
+            return store.processed_lookup(ids, since)
+        with _lock:
+            entries = _refresh_locked()
+            return {pid for pid in ids if entries.get(pid, 0) >= since}
+    except Exception as e:
+        print(f"⚠️ Không đọc được processed index: {e}")
+        return set()
+
+
+def is_processed(post_id: Any) -> bool:
+    return bool(filter_processed([post_id]))
+
+
+def mark_processed(post_ids: Iterable[Any]) -> None:
+    """Ghi nhận post đã crawl xong (best-effort, lỗi chỉ log)."""
+    ids = normalize_ids(post_ids)
+    if not ids or not enabled():
+        return
+    now = time.time()
+    try:
+        store = storage.get_store()
+        if store is not None:
+            store.processed_add(ids, now)
+            return
+        lines = "".join(json.dumps({"id": pid, "ts": round(now, 3)}) + "\n" for pid in ids)
+        LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock.locked(LOCK_PATH):
+            with LOG_PATH.open("a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        _maybe_compact()
+    except Exception as e:
+        print(f"⚠️ Không ghi được processed index: {e}")
+
+
+def _maybe_compact() -> None:
+    with _lock:
+        entries = _refresh_locked()
+        lines = _memory["lines"]
+    if lines < _COMPACT_MIN_LINES or lines < 2 * max(len(entries), 1):
+        return
+    compact()
+
+
+def compact() -> int:
+    """Bỏ entry hết hạn / dòng trùng: ghi lại log chỉ còn entry sống (atomic). Trả về số entry còn lại."""
+    since = time.time() - _ttl_seconds()
+    store = storage.get_store()
+    if store is not None:
+        store.processed_compact(since)
+        return store.processed_count()
+    fd = file_lock.acquire(LOCK_PATH)
+    if fd is None:
+        return -1
+    try:
+        with _lock:
+            entries = _refresh_locked()
+            live = {pid: ts for pid, ts in entries.items() if ts >= since}
+            tmp = LOG_PATH.with_name(f"{LOG_PATH.name}.tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                for pid, ts in live.items():
+                    f.write(json.dumps({"id": pid, "ts": round(ts, 3)}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            tmp.replace(LOG_PATH)
+            # Đọc lại từ đầu lần sau (inode mới)
+            _memory.update({"ino": None, "offset": 0, "lines": 0, "entries": {}})
+        print(f"🗜️ Đã compact processed index: {len(entries)} -> {len(live)} post")
+        return len(live)
+    finally:
+        file_lock.release(fd, LOCK_PATH)
+
+
+def export_to_store(store) -> int:
+    """Migrate processed_posts.jsonl (entry còn trong TTL) + saved hits vào SQLite (upsert, chạy lại không trùng)."""
+    since = time.time() - _ttl_seconds()
+    with _lock:
+        live = {pid: ts for pid, ts in _refresh_locked().items() if ts >= since}
+    if live:
+        store.processed_import(live)
+    if store.get_meta("processed_saved_migrated") is None:
+        try:
+            with STATS_PATH.open("r", encoding="utf-8") as f:
+                stats = json.load(f)
+        except Exception:
+            stats = {}
+        for source, count in (stats.items() if isinstance(stats, dict) else []):
+            store.bump_counter(f"{_COUNTER_PREFIX}{source}", int(count or 0))
+        store.set_meta("processed_saved_migrated", True)
+    return len(live)
+
+
+def record_saved(source: str, count: int = 1) -> None:
+    """Đếm số lần producer bỏ qua được việc mạng nhờ index (theo nguồn: browser, page_scan, info_queue)."""
+    if count <= 0:
+        return
+    try:
+        store = storage.get_store()
+        if store is not None:
+            store.bump_counter(f"{_COUNTER_PREFIX}{source}", count)
+            return
+        with file_lock.locked(LOCK_PATH):
+            try:
+                with STATS_PATH.open("r", encoding="utf-8") as f:
+                    stats = json.load(f)
+                if not isinstance(stats, dict):
+                    stats = {}
+            except Exception:
+                stats = {}
+            stats[source] = int(stats.get(source, 0) or 0) + int(count)
+            tmp = STATS_PATH.with_name(f"{STATS_PATH.name}.tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(stats, f, ensure_ascii=False)
+            tmp.replace(STATS_PATH)
+    except Exception:
+        pass
+
+
+def _saved_counts() -> Dict[str, int]:
+    store = storage.get_store()
+    if store is not None:
+        return store.get_counters(_COUNTER_PREFIX)
+    try:
+        with STATS_PATH.open("r", encoding="utf-8") as f:
+            stats = json.load(f)
+        return {k: int(v) for k, v in stats.items()} if isinstance(stats, dict) else {}
+    except Exception:
+        return {}
+
+
+def get_stats() -> Dict[str, Any]:
+    """Số post đang được nhớ, TTL và số lần đã bỏ qua được theo nguồn."""
+    saved = _saved_counts()
+    ttl = _ttl_seconds()
+    store = storage.get_store()
+    if store is not None:
+        tracked: Optional[int] = store.processed_count()
+    else:
+        with _lock:
+            since = time.time() - ttl
+            tracked = sum(1 for ts in _refresh_locked().values() if ts >= since)
+    return {
+        "enabled": ttl > 0,
+        "ttl_days": round(ttl / 86400.0, 2),
+        "tracked_posts": tracked,
+        "saved_hits": saved,
+        "saved_hits_total": sum(saved.values()),
+    }
@@ -0,0 +1,365 @@
+import atexit
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from core import file_lock
+from core.paths import get_settings_path
+
+# Repository cấu hình profile (PROFILE_IDS trong settings.json) dùng chung cả tiến trình:
+# - Giữ bản đã parse trong bộ nhớ, chỉ đọc lại khi chữ ký file (mtime_ns, size) thay đổi
+# - Là nơi duy nhất ghi settings.json: mọi writer (API, save_cookies, get_payload) đi qua write lock
+#   (RLock trong tiến trình + lock file O_EXCL giữa các tiến trình), đọc lại file trong lock rồi ghi atomic
+# - update() theo profile được gom lại (coalesce) trong FLUSH_DELAY giây rồi flush 1 lần cho nhiều profile
+# Nhờ vậy get_cookies/get_access_token (gọi mỗi URL/post) không phải parse lại settings.json,
+# và hàng chục profile refresh cùng lúc chỉ tạo vài lần ghi file, không mất update của nhau.
+_STAT_INTERVAL = 0.5  # tối đa 2 lần stat file/giây khi đọc
+FLUSH_DELAY = 0.2  # cửa sổ gom update trước khi flush
+LOCK_TIMEOUT = 30.0  # lock file cũ hơn thời gian này coi như bị bỏ lại (tiến trình chết)
+
+
+class SettingsReadError(RuntimeError):
+    """settings.json tồn tại nhưng không đọc / parse được."""
+
+
+class SettingsWriteError(RuntimeError):
+    """update(wait=True) không ghi được xuống settings.json (lỗi đọc/ghi hoặc quá timeout)."""
+
+
+def _normalize_profile_id(profile_id: Any) -> str:
+    return str(profile_id or "").strip()
+
+
+class SettingsWriteLock:
+    """
+    Lock ghi settings.json, reentrant: RLock cho các thread trong tiến trình + lock file O_EXCL
+    cho các tiến trình khác. Không lấy được lock file sau LOCK_TIMEOUT thì vẫn ghi (best-effort, có log).
+    """
+
+    def __init__(self, lock_file: Path, timeout: float = LOCK_TIMEOUT):
+        self.lock_file = lock_file
+        self.timeout = timeout
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def _acquire_file_lock(self, poll: float = 0.05):
+        fd = file_lock.acquire(self.lock_file, self.timeout, poll=poll, stale_seconds=self.timeout)
+        if fd is None:
+            print(f"⚠️ Không lấy được lock {self.lock_file.name} sau {self.timeout}s, vẫn ghi settings.json")
+        return fd
+
+    def __enter__(self):
+        self._rlock.acquire()
+        if self._depth == 0:
+            try:
+                self.lock_file.parent.mkdir(parents=True, exist_ok=True)
+            except Exception:
+                pass
+            self._fd = self._acquire_file_lock()
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth == 0:
+            file_lock.release(self._fd, self.lock_file)
+            self._fd = None
+        self._rlock.release()
+        return False
+
+
+class ProfileConfigRepository:
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else get_settings_path()
+        self._lock = threading.RLock()
+        self.write_lock = SettingsWriteLock(self.path.with_name(f"{self.path.name}.lock"))
+        self._raw: Dict[str, Any] = {}
+        self._sig: Optional[tuple] = None
+        self._checked_at = 0.0
+        self._loaded = False
+        self.version = 0
+        # Update đang chờ flush: {profile_id: {field: value}}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._pending_cond = threading.Condition()
+        self._pending_seq = 0
+        self._flushed_seq = 0
+        self._flush_scheduled = False
+        self._failed_seq = 0
+        self._last_error = ""
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "reloads": 0,
+            "writes": 0,
+            "queued_updates": 0,
+            "flushes": 0,
+            "flushed_profiles": 0,
+            "flush_errors": 0,
+        }
+
+    def _file_sig(self) -> Optional[tuple]:
+        try:
+            st = self.path.stat()
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _read_file(self) -> Dict[str, Any]:
+        """
+        Nội dung settings.json ({} nếu file chưa có). File có nhưng không đọc / parse được thì raise
+        SettingsReadError: writer không được ghi đè lên 1 lần đọc hỏng (sẽ xoá hết setting khác).
+        """
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            raise SettingsReadError(f"Không đọc được {self.path.name}: {e}") from e
+        if not isinstance(raw, dict):
+            raise SettingsReadError(f"{self.path.name} không phải JSON object")
+        return raw
+
+    def _ensure_fresh(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            if self._loaded and now - self._checked_at < _STAT_INTERVAL:
+                self._stats["hits"] += 1
+                return self._raw
+            self._checked_at = now
+            sig = self._file_sig()
+            if self._loaded and sig == self._sig:
+                self._stats["hits"] += 1
+                return self._raw
+            try:
+                self._raw = self._read_file() if sig is not None else {}
+            except SettingsReadError as e:
+                # Đọc hỏng (file đang bị sửa tay / ghi dở từ ngoài): giữ bản cache cũ, lần sau đọc lại
+                print(f"⚠️ {e}, dùng cấu hình đã cache")
+                self._loaded = True
+                return self._raw
+            self._sig = sig
+            self._loaded = True
+            self.version += 1
+            self._stats["reloads"] += 1
+            return self._raw
+
+    def invalidate(self) -> None:
+        """Buộc lần đọc sau stat lại file (dùng khi biết file vừa bị ghi từ nơi khác)."""
+        with self._lock:
+            self._checked_at = 0.0
+            self._sig = None
+
+    def get_raw(self) -> Dict[str, Any]:
+        """Bản sao nội dung settings.json (đọc từ cache)."""
+        return json.loads(json.dumps(self._ensure_fresh()))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Snapshot có version: {"version", "data"}; version tăng mỗi lần cache đổi (đọc lại hoặc ghi).
+        Reader so version để biết cấu hình đã đổi mà không cần so nội dung.
+        """
+        with self._lock:
+            raw = self._ensure_fresh()
+            return {"version": self.version, "data": json.loads(json.dumps(raw))}
+
+    def get_setting(self, key: str, default: Any = None) -> Any:
+        """Giá trị 1 key cấp cao nhất của settings.json (không copy toàn bộ file)."""
+        value = self._ensure_fresh().get(key, default)
+        return json.loads(json.dumps(value)) if isinstance(value, (dict, list)) else value
+
+    def get(self, profile_id: Any) -> Optional[Dict[str, Any]]:
+        """Bản sao PROFILE_IDS[profile_id] (kèm update đang chờ flush) hoặc None nếu không có."""
+        pid = _normalize_profile_id(profile_id)
+        profiles = self._ensure_fresh().get("PROFILE_IDS")
+        cfg = profiles.get(pid) if isinstance(profiles, dict) else None
+        with self._pending_cond:
+            pending = dict(self._pending.get(pid) or {})
+        if not isinstance(cfg, dict):
+            return pending or None
+        return {**cfg, **pending}
+
+    def get_value(self, profile_id: Any, key: str) -> str:
+        """Giá trị chuỗi (đã strip) của 1 field trong config profile, "" nếu không có."""
+        cfg = self.get(profile_id) or {}
+        return str(cfg.get(key) or "").strip()
+
+    def _write_file(self, raw: Dict[str, Any]) -> None:
+        directory = str(self.path.parent)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix="settings_", suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(raw, f, ensure_ascii=False, indent=2)
+                f.write("\n")
+            os.replace(tmp_path, str(self.path))
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except Exception:
+                pass
+            raise
+
+    def _apply_pending(self, raw: Dict[str, Any], pending: Dict[str, Dict[str, Any]]) -> None:
+        profiles = raw.get("PROFILE_IDS")
+        if not isinstance(profiles, dict):
+            profiles = {}
+        for pid, values in pending.items():
+            cfg = profiles.get(pid)
+            if not isinstance(cfg, dict):
+                cfg = {}
+            cfg.update(values)
+            profiles[pid] = cfg
+        raw["PROFILE_IDS"] = profiles
+
+    def _take_pending(self):
+        with self._pending_cond:
+            pending = self._pending
+            self._pending = {}
+            self._flush_scheduled = False
+            return pending, self._pending_seq
+
+    def _mark_flushed(self, seq: int) -> None:
+        with self._pending_cond:
+            self._flushed_seq = max(self._flushed_seq, seq)
+            self._pending_cond.notify_all()
+
+    def _restore_pending(self, pending: Dict[str, Dict[str, Any]], seq: int, error: Exception) -> None:
+        """Flush lỗi: trả update về hàng đợi (update mới hơn đè lên), báo lỗi cho các update đang chờ tới seq."""
+        with self._pending_cond:
+            for pid, values in pending.items():
+                self._pending[pid] = {**values, **self._pending.get(pid, {})}
+            self._failed_seq = max(self._failed_seq, seq)
+            self._last_error = str(error)
+            self._stats["flush_errors"] += 1
+            self._pending_cond.notify_all()
+
+    def _store(self, raw: Dict[str, Any]) -> None:
+        self._write_file(raw)
+        with self._lock:
+            self._raw = json.loads(json.dumps(raw))
+            self._sig = self._file_sig()
+            self._checked_at = time.monotonic()
+            self._loaded = True
+            self.version += 1
+            self._stats["writes"] += 1
+
+    def write_raw(self, raw: Dict[str, Any]) -> None:
+        """
+        Ghi toàn bộ settings.json (atomic) và cập nhật cache ngay.
+        Các update profile đang chờ flush được áp lên raw trước khi ghi để không bị mất.
+        """
+        with self.write_lock:
+            pending, seq = self._take_pending()
+            try:
+                if pending:
+                    self._apply_pending(raw, pending)
+                self._store(raw)
+            except Exception as e:
+                if pending:
+                    self._restore_pending(pending, seq, e)
+                raise
+            self._stats["flushed_profiles"] += len(pending)
+        self._mark_flushed(seq)
+
+    def flush(self) -> bool:
+        """
+        Ghi tất cả update đang chờ trong 1 lần: đọc file mới nhất trong write lock, merge, ghi atomic.
+        Đọc / ghi lỗi thì không ghi gì, update được giữ lại trong hàng đợi (lần flush sau thử lại). Trả về False nếu lỗi.
+        """
+        with self.write_lock:
+            pending, seq = self._take_pending()
+            if pending:
+                try:
+                    raw = self._read_file()
+                    self._apply_pending(raw, pending)
+                    self._store(raw)
+                    self._stats["flushes"] += 1
+                    self._stats["flushed_profiles"] += len(pending)
+                except Exception as e:
+                    self._restore_pending(pending, seq, e)
+                    print(f"⚠️ Không ghi được settings.json ({len(pending)} profile, giữ lại để ghi sau): {e}")
+                    return False
+        self._mark_flushed(seq)
+        return True
+
+    def update(self, profile_id: Any, values: Dict[str, Any], wait: bool = True, timeout: float = 10.0) -> Dict[str, Any]:
+        """
+        Đưa values vào hàng đợi ghi của PROFILE_IDS[profile_id] (gom với update của profile khác).
+        wait=True: chờ tới khi đã flush xuống file (tối đa timeout giây); flush lỗi / quá timeout thì raise
+        SettingsWriteError (update vẫn nằm trong hàng đợi, lần flush sau thử lại).
+        Trả về config profile đã merge (theo cache + các giá trị vừa update).
+        """
+        pid = _normalize_profile_id(profile_id)
+        if not pid:
+            raise ValueError("profile_id rỗng")
+        values = dict(values or {})
+        with self._pending_cond:
+            self._pending.setdefault(pid, {}).update(values)
+            self._pending_seq += 1
+            ticket = self._pending_seq
+            self._stats["queued_updates"] += 1
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                timer = threading.Timer(FLUSH_DELAY, self.flush)
+                timer.daemon = True
+                timer.start()
+            if wait:
+                done = self._pending_cond.wait_for(
+                    lambda: self._flushed_seq >= ticket or self._failed_seq >= ticket, timeout
+                )
+                if not done:
+                    raise SettingsWriteError(f"Quá {timeout}s chưa ghi được settings.json cho profile {pid}")
+                if self._flushed_seq < ticket:
+                    raise SettingsWriteError(f"Không ghi được settings.json cho profile {pid}: {self._last_error}")
+        cfg = self.get(pid) or {}
+        cfg.update(values)
+        return cfg
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {**self._stats, "version": self.version, "path": str(self.path)}
+        with self._pending_cond:
+            stats["pending_profiles"] = len(self._pending)
+            stats["last_error"] = self._last_error
+        return stats
+
+
+_repository: Optional[ProfileConfigRepository] = None
+_repository_lock = threading.Lock()
+
+
+def get_repository() -> ProfileConfigRepository:
+    """Repository dùng chung cả tiến trình (tạo lần đầu khi gọi)."""
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                _repository = ProfileConfigRepository()
+                # Flush nốt update đang chờ khi tiến trình thoát
+                atexit.register(_repository.flush)
+    return _repository
+
+
+def flush_pending() -> bool:
+    """Flush update đang chờ của repository (nếu đã tạo). Trả về False nếu ghi lỗi."""
+    return _repository.flush() if _repository is not None else True
+
+
+def flush_on_exit(func):
+    """
+    Decorator cho entrypoint của Process con: multiprocessing thoát tiến trình con bằng os._exit nên atexit
+    không chạy -> flush nốt update wait=False (payload/cookie từ get_payload) khi entrypoint kết thúc.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            flush_pending()
+    return wrapper
@@ -0,0 +1,197 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from core.control import async_smart_sleep, smart_sleep
+
+# Governor tốc độ request tới Facebook dùng chung cho mọi luồng trong tiến trình:
+# - Trước đây chỉ có Retry(total=2, backoff_factor=0.5) của urllib3 + các time.sleep cố định,
+#   reactions / comments / get_id / Graph API không biết nhau đang bắn bao nhiêu request cho cùng 1 tài khoản
+# - Mỗi (profile, loại endpoint) có 1 token bucket; tốc độ tự điều chỉnh kiểu AIMD:
+#   thành công -> tăng cộng (~increase_rpm mỗi phút chạy đều), bị chặn (429 / 1357004 / Graph code 4, 17)
+#   -> giảm nhân (x decrease_factor) + tạm khoá profile ở endpoint đó một lúc (cooldown tăng dần)
+# - Chờ lượt / cooldown (tới COOLDOWN_MAX_SECONDS) không phải sleep cứng: chờ trên stop_event của caller,
+#   không có thì chờ trên control bus của profile (STOP đánh thức ngay, PAUSE giữ lại như smart_sleep)
+# - Graph API: quét group song song có TokenBudget (core.group_scan) theo access token thì budget đó lo
+#   code 4/17, bucket "graph_api" chỉ dùng khi quét lẻ không có budget (không throttle 2 lần)
+# - Tắt bằng RATE_GOVERNOR_ENABLED=false (acquire trả về ngay, không đo đạc gì)
+# - Tốc độ hiện tại của từng bucket: GET /info/rate-governor
+ENDPOINT_CLASSES: Dict[str, Dict[str, float]] = {
+    # GraphQL /api/graphql/ (reactions, comments - sync + async)
+    "graphql": {"initial_rpm": 120, "min_rpm": 6, "max_rpm": 1200, "increase_rpm": 12},
+    # Tải HTML trang bài / group (get_id)
+    "html": {"initial_rpm": 60, "min_rpm": 3, "max_rpm": 600, "increase_rpm": 6},
+    # Graph API graph.facebook.com (quét group lẻ, không có TokenBudget)
+    "graph_api": {"initial_rpm": 60, "min_rpm": 2, "max_rpm": 600, "increase_rpm": 6},
+}
+DECREASE_FACTOR = 0.5
+BURST = 5  # số request được bắn liền khi bucket đầy
+COOLDOWN_BASE_SECONDS = 5.0
+COOLDOWN_MAX_SECONDS = 300.0
+
+_lock = threading.Lock()
+_buckets: Dict[tuple, "AimdBucket"] = {}
+
+
+def enabled() -> bool:
+    """RATE_GOVERNOR_ENABLED trong settings (lỗi đọc settings -> coi như bật)."""
+    try:
+        from core.settings import get_settings
+        return bool(get_settings().rate_governor_enabled)
+    except Exception:
+        return True
+
+
+class AimdBucket:
+    """Token bucket có tốc độ (request/phút) điều chỉnh AIMD. Thread-safe."""
+
+    def __init__(self, initial_rpm: float, min_rpm: float, max_rpm: float, increase_rpm: float):
+        self.rate_rpm = float(initial_rpm)
+        self.min_rpm = float(min_rpm)
+        self.max_rpm = float(max_rpm)
+        self.increase_rpm = float(increase_rpm)
+        self.tokens = float(BURST)
+        self._lock = threading.Lock()
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._strikes = 0
+        self.stats: Dict[str, Any] = {"requests": 0, "successes": 0, "throttled": 0, "decreases": 0, "waited_seconds": 0.0, "last_reason": None}
+
+    def _refill_locked(self, now: float) -> None:
+        self.tokens = min(float(BURST), self.tokens + (now - self._updated_at) * self.rate_rpm / 60.0)
+        self._updated_at = now
+
+    def reserve(self) -> float:
+        """Giữ chỗ 1 request, trả về số giây phải chờ trước khi gửi (token âm = đang xếp hàng)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill_locked(now)
+            self.tokens -= 1.0
+            wait = -self.tokens * 60.0 / self.rate_rpm if self.tokens < 0 else 0.0
+            wait = max(wait, self._blocked_until - now)
+            self.stats["requests"] += 1
+            self.stats["waited_seconds"] += wait
+            return wait
+
+    def on_success(self) -> None:
+        with self._lock:
+            # Cộng: chạy đều 1 phút ở tốc độ r (r request thành công) thì tăng ~increase_rpm
+            self.rate_rpm = min(self.max_rpm, self.rate_rpm + self.increase_rpm / self.rate_rpm)
+            self._strikes = 0
+            self.stats["successes"] += 1
+
+    def on_throttle(self, reason: str) -> float:
+        """Bị chặn: giảm tốc độ + khoá cooldown. Trả về số giây cooldown."""
+        with self._lock:
+            now = time.monotonic()
+            self.stats["throttled"] += 1
+            self.stats["last_reason"] = reason
+            # Nhiều request đang bay cùng bị chặn thì chỉ tính là 1 lần giảm
+            if now - self._last_decrease < max(1.0, 60.0 / self.rate_rpm):
+                return max(0.0, self._blocked_until - now)
+            self._last_decrease = now
+            self.rate_rpm = max(self.min_rpm, self.rate_rpm * DECREASE_FACTOR)
+            self.tokens = min(self.tokens, 0.0)
+            cooldown = min(COOLDOWN_MAX_SECONDS, COOLDOWN_BASE_SECONDS * (2 ** self._strikes))
+            self._strikes += 1
+            self._blocked_until = max(self._blocked_until, now + cooldown)
+            self.stats["decreases"] += 1
+            return cooldown
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._refill_locked(now)
+            return {
+                "rate_rpm": round(self.rate_rpm, 2),
+                "tokens": round(self.tokens, 2),
+                "blocked_for_seconds": round(max(0.0, self._blocked_until - now), 1),
+                **{k: (round(v, 1) if isinstance(v, float) else v) for k, v in self.stats.items()},
+            }
+
+
+def get_bucket(profile_id: Optional[str], endpoint: str) -> AimdBucket:
+    key = (str(profile_id or "").strip() or "_default", endpoint)
+    bucket = _buckets.get(key)
+    if bucket is not None:
+        return bucket
+    with _lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = AimdBucket(**ENDPOINT_CLASSES.get(endpoint, ENDPOINT_CLASSES["graphql"]))
+            _buckets[key] = bucket
+        return bucket
+
+
+def _wait(seconds: float, profile_id: Optional[str], stop_event: Optional[threading.Event]) -> bool:
+    """Chờ seconds giây trên stop_event, không có thì trên control bus của profile. False nếu bị STOP."""
+    if stop_event is not None:
+        return not stop_event.wait(seconds)
+    try:
+        smart_sleep(seconds, profile_id)
+    except RuntimeError as e:
+        if "EMERGENCY_STOP" in str(e):
+            return False
+        raise
+    return True
+
+
+def acquire(profile_id: Optional[str], endpoint: str, stop_event: Optional[threading.Event] = None) -> bool:
+    """Chờ tới lượt gửi request. False nếu bị dừng trong lúc chờ (stop_event set / STOP của profile)."""
+    if not enabled():
+        return True
+    wait = get_bucket(profile_id, endpoint).reserve()
+    if wait <= 0:
+        return True
+    return _wait(wait, profile_id, stop_event)
+
+
+async def acquire_async(profile_id: Optional[str], endpoint: str) -> None:
+    """Bản async của acquire: chờ trên control bus, STOP thì raise RuntimeError("EMERGENCY_STOP") như async_smart_sleep."""
+    if not enabled():
+        return
+    wait = get_bucket(profile_id, endpoint).reserve()
+    if wait > 0:
+        await async_smart_sleep(wait, profile_id)
+
+
+def report_success(profile_id: Optional[str], endpoint: str) -> None:
+    if enabled():
+        get_bucket(profile_id, endpoint).on_success()
+
+
+def report_throttle(profile_id: Optional[str], endpoint: str, reason: str) -> float:
+    """Báo request bị chặn (429 / 1357004 / graph_4 / graph_17). Trả về số giây cooldown của bucket."""
+    if not enabled():
+        return 0.0
+    bucket = get_bucket(profile_id, endpoint)
+    decreases = bucket.stats["decreases"]
+    cooldown = bucket.on_throttle(reason)
+    if bucket.stats["decreases"] != decreases:
+        print(f"🚦 [{profile_id}] {endpoint} bị chặn ({reason}) -> giảm còn {bucket.rate_rpm:.1f} req/phút, nghỉ {cooldown:.1f}s")
+    return cooldown
+
+
+def throttle_reason(response: Any) -> Optional[str]:
+    """Lý do bị chặn của response GraphQL (429 hoặc lỗi 1357004 trong body), None nếu không bị chặn. Không dùng cho response stream."""
+    status = getattr(response, "status_code", None)
+    if status == 429:
+        return "429"
+    if status == 200:
+        try:
+            if b"1357004" in (response.content or b"")[:512]:
+                return "1357004"
+        except Exception:
+            pass
+    return None
+
+
+def get_stats() -> Dict[str, Any]:
+    """Tốc độ hiện tại (request/phút) + số lần bị chặn của từng (profile, endpoint)."""
+    with _lock:
+        items = list(_buckets.items())
+    by_profile: Dict[str, Dict[str, Any]] = {}
+    for (profile_id, endpoint), bucket in items:
+        by_profile.setdefault(profile_id, {})[endpoint] = bucket.snapshot()
+    return {"enabled": enabled(), "endpoint_classes": ENDPOINT_CLASSES, "profiles": by_profile}
@@ -0,0 +1,169 @@
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.paths import get_data_dir
+
+# Index (manifest) các file all_results_<ts>.json trong data/results:
+# {filename: {timestamp, date_formatted, size, mtime_ns, total_files, total_posts_processed, total_reactions, total_comments}}
+# - Writer (results_journal.compact) cập nhật entry ngay khi ghi file
+# - API gọi refresh(): chỉ os.scandir + so (size, mtime_ns), file nào đổi/mới mới parse 1 lần
+# Nằm ngoài data/results để các endpoint cleanup (glob *.json) không xóa nhầm.
+INDEX_PATH = get_data_dir() / "results_index.json"
+RESULTS_FILE_PATTERN = re.compile(r'all_results_(\d{8})_(\d{6})\.json$')
+
+_lock = threading.Lock()
+_memory: Dict[str, Any] = {"loaded": False, "entries": {}}
+
+
+def parse_timestamp(filename: str) -> Optional[datetime]:
+    """all_results_YYYYMMDD_HHMMSS.json -> datetime (None nếu tên không hợp lệ)."""
+    match = RESULTS_FILE_PATTERN.match(filename)
+    if not match:
+        return None
+    date_str, time_str = match.groups()
+    try:
+        return datetime.strptime(f"{date_str} {time_str}", "%Y%m%d %H%M%S")
+    except ValueError:
+        return None
+
+
+def _load() -> Dict[str, Any]:
+    if not _memory["loaded"]:
+        entries: Dict[str, Any] = {}
+        try:
+            with INDEX_PATH.open("r", encoding="utf-8") as f:
+                raw = json.load(f)
+            if isinstance(raw, dict):
+                entries = raw
+        except Exception:
+            entries = {}
+        _memory["entries"] = entries
+        _memory["loaded"] = True
+    return _memory["entries"]
+
+
+def _save(entries: Dict[str, Any]) -> None:
+    INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = INDEX_PATH.with_name(f"{INDEX_PATH.name}.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp.replace(INDEX_PATH)
+    _memory["entries"] = entries
+
+
+def _read_summary(path: Path) -> Dict[str, int]:
+    """Parse file 1 lần để lấy counters (chỉ dùng khi file chưa có trong index / đã thay đổi)."""
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            content = f.read().strip()
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError:
+            # Giống API: bỏ dữ liệu thừa sau closing brace cuối
+            data = json.loads(content[: content.rfind("}") + 1])
+    except Exception:
+        data = {}
+    return _summary_from_data(data if isinstance(data, dict) else {})
+
+
+def _summary_from_data(data: Dict[str, Any]) -> Dict[str, int]:
+    results_by_file = data.get("results_by_file") or {}
+    if not isinstance(results_by_file, dict):
+        results_by_file = {}
+    return {
+        "total_files": int(data.get("total_files", len(results_by_file)) or 0),
+        "total_posts_processed": int(data.get("total_posts_processed", sum(len(v or []) for v in results_by_file.values())) or 0),
+        "total_reactions": int(data.get("total_reactions", 0) or 0),
+        "total_comments": int(data.get("total_comments", 0) or 0),
+    }
+
+
+def _make_entry(path: Path, st: os.stat_result, dt: datetime, summary: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        "filename": path.name,
+        "timestamp": int(dt.timestamp()),
+        "date_formatted": dt.strftime("%d/%m/%Y %H:%M:%S"),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        **summary,
+    }
+
+
+def upsert(json_path: Path, data: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Writer gọi sau khi ghi file all_results_<ts>.json (data = nội dung vừa ghi, để khỏi parse lại).
+    Best-effort: lỗi chỉ log, refresh() sẽ tự sửa lần sau.
+    """
+    dt = parse_timestamp(json_path.name)
+    if dt is None:
+        return
+    try:
+        st = json_path.stat()
+        summary = _summary_from_data(data) if isinstance(data, dict) else _read_summary(json_path)
+        with _lock:
+            entries = dict(_load())
+            entries[json_path.name] = _make_entry(json_path, st, dt, summary)
+            _save(entries)
+    except Exception as e:
+        print(f"⚠️ Không thể cập nhật results index cho {json_path.name}: {e}")
+
+
+def refresh(results_dir: Path) -> Dict[str, Any]:
+    """
+    Đồng bộ index với thư mục results (thêm file mới/đã đổi, bỏ file đã xóa).
+    Chỉ stat file, không parse file đã có trong index với cùng size + mtime.
+    """
+    with _lock:
+        entries = _load()
+        current: Dict[str, Any] = {}
+        changed = False
+        try:
+            scanned = list(os.scandir(results_dir)) if results_dir.exists() else []
+        except OSError:
+            scanned = []
+        for item in scanned:
+            dt = parse_timestamp(item.name)
+            if dt is None or not item.is_file():
+                continue
+            try:
+                st = item.stat()
+            except OSError:
+                continue
+            entry = entries.get(item.name)
+            if isinstance(entry, dict) and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+                current[item.name] = entry
+                continue
+            current[item.name] = _make_entry(Path(item.path), st, dt, _read_summary(Path(item.path)))
+            changed = True
+        if changed or set(current) != set(entries):
+            try:
+                _save(current)
+            except Exception as e:
+                print(f"⚠️ Không thể ghi results index: {e}")
+                _memory["entries"] = current
+        return dict(current)
+
+
+def list_entries(results_dir: Path, from_timestamp: Optional[int] = None, to_timestamp: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Các entry (mới nhất trước), lọc theo khoảng timestamp nếu có."""
+    entries = refresh(results_dir).values()
+    out = [
+        dict(e) for e in entries
+        if (from_timestamp is None or e["timestamp"] >= from_timestamp)
+        and (to_timestamp is None or e["timestamp"] <= to_timestamp)
+    ]
+    out.sort(key=lambda e: e["timestamp"], reverse=True)
+    return out
+
+
+def latest(results_dir: Path, from_timestamp: Optional[int] = None, to_timestamp: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Entry mới nhất (trong khoảng nếu có) hoặc None."""
+    entries = list_entries(results_dir, from_timestamp, to_timestamp)
+    return entries[0] if entries else None
@@ -0,0 +1,324 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core import results_index
+from core import storage
+from core.paths import get_data_dir
+
+# Journal kết quả dạng JSON Lines (append-only):
+# - all_results_<ts>.jsonl      : mỗi post đã xử lý là 1 dòng {"file": ..., "result": {...}}
+# - all_results_<ts>.meta.json  : sidecar nhỏ chứa counters (ghi lại mỗi lần append, vài trăm byte)
+# - all_results_<ts>.json       : file legacy (shape results_by_file) được compact từ journal khi cần
+# STORAGE_BACKEND = "sqlite": journal + sidecar nằm trong bảng results/result_runs của data/app_state.db
+# (run = tên file legacy), file legacy vẫn được compact từ DB như cũ để các API đọc file không đổi.
+JOURNAL_SUFFIX = ".jsonl"
+META_SUFFIX = ".meta.json"
+
+_lock = threading.Lock()
+
+
+def _atomic_write_json(path: Path, data: Dict[str, Any], indent: Optional[int] = None) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp.replace(path)
+
+
+def journal_path_for(json_path: Path) -> Path:
+    """all_results_<ts>.json -> all_results_<ts>.jsonl"""
+    return json_path.with_name(f"{json_path.stem}{JOURNAL_SUFFIX}")
+
+
+def meta_path_for(json_path: Path) -> Path:
+    """all_results_<ts>.json -> all_results_<ts>.meta.json"""
+    return json_path.with_name(f"{json_path.stem}{META_SUFFIX}")
+
+
+def is_meta_file(path: Path) -> bool:
+    return Path(path).name.endswith(META_SUFFIX)
+
+
+def legacy_path_for(path: Path) -> Path:
+    """all_results_<ts>.meta.json / .jsonl / .json -> all_results_<ts>.json (file gốc của lần chạy)."""
+    path = Path(path)
+    for suffix in (META_SUFFIX, JOURNAL_SUFFIX):
+        if path.name.endswith(suffix):
+            return path.with_name(f"{path.name[: -len(suffix)]}.json")
+    return path
+
+
+def result_runs(results_dir: Path) -> List[Path]:
+    """
+    File legacy của mọi lần chạy trong results_dir: file .json (bỏ sidecar .meta.json) + lần chạy chỉ có journal.
+    Dùng cho các API dọn dẹp thay cho glob("*.json") (glob đó khớp cả sidecar .meta.json).
+    """
+    runs = {p.name for p in results_dir.glob("*.json") if not is_meta_file(p)} if results_dir.exists() else set()
+    runs.update(p.name for p in journal_runs(results_dir))
+    return [results_dir / name for name in sorted(runs)]
+
+
+def has_journal(json_path: Path) -> bool:
+    """True nếu lần chạy có dữ liệu journal (file .jsonl hoặc run trong DB sqlite)."""
+    store = storage.get_store()
+    if store is not None and store.results_updated_at(json_path.name) is not None:
+        return True
+    return journal_path_for(json_path).exists()
+
+
+def journal_runs(results_dir: Path) -> List[Path]:
+    """Đường dẫn file legacy của mọi lần chạy có journal (file .jsonl trong results_dir + run trong DB)."""
+    runs = set()
+    if results_dir.exists():
+        for journal in results_dir.glob(f"all_results_*{JOURNAL_SUFFIX}"):
+            runs.add(f"{journal.stem}.json")
+    store = storage.get_store()
+    if store is not None:
+        runs.update(store.results_runs().keys())
+    return [results_dir / name for name in sorted(runs)]
+
+
+def _empty_counters() -> Dict[str, Any]:
+    return {
+        "total_files": 0,
+        "posts_by_file": {},
+        "total_posts_processed": 0,
+        "total_reactions": 0,
+        "total_comments": 0,
+    }
+
+
+def read_counters(json_path: Path) -> Dict[str, Any]:
+    """
+    Đọc counters từ sidecar (không cần parse journal).
+    Best-effort: lỗi/không tồn tại -> counters rỗng.
+    """
+    store = storage.get_store()
+    if store is not None:
+        try:
+            counters = store.results_counters(json_path.name)
+            if counters is not None:
+                return counters
+        except Exception:
+            pass
+    try:
+        with meta_path_for(json_path).open("r", encoding="utf-8") as f:
+            raw = json.load(f)
+        if isinstance(raw, dict):
+            base = _empty_counters()
+            base.update(raw)
+            return base
+    except Exception:
+        pass
+    return _empty_counters()
+
+
+def append_result(json_path: Path, file_name: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Append 1 kết quả post vào journal (O(kích thước post), không ghi lại toàn bộ file)
+    và cập nhật counters trong sidecar. Trả về counters mới.
+    """
+    store = storage.get_store()
+    if store is not None:
+        return store.results_append(json_path.name, file_name, result)
+    line = json.dumps({"file": file_name, "result": result}, ensure_ascii=False)
+    with _lock:
+        journal = journal_path_for(json_path)
+        journal.parent.mkdir(parents=True, exist_ok=True)
+        with journal.open("a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        counters = read_counters(json_path)
+        posts_by_file = counters.get("posts_by_file") or {}
+        posts_by_file[file_name] = int(posts_by_file.get(file_name, 0) or 0) + 1
+        counters["posts_by_file"] = posts_by_file
+        counters["total_files"] = len(posts_by_file)
+        counters["total_posts_processed"] = int(counters.get("total_posts_processed", 0) or 0) + 1
+        counters["total_reactions"] = int(counters.get("total_reactions", 0) or 0) + int(result.get("reactions_count", 0) or 0)
+        counters["total_comments"] = int(counters.get("total_comments", 0) or 0) + int(result.get("comments_count", 0) or 0)
+        _atomic_write_json(meta_path_for(json_path), counters)
+        return counters
+
+
+def iter_journal(json_path: Path):
+    """
+    Duyệt từng record trong journal: yield (file_name, result).
+    Dòng cuối bị ghi dở (crash giữa chừng) sẽ bị bỏ qua.
+    """
+    store = storage.get_store()
+    if store is not None and store.results_updated_at(json_path.name) is not None:
+        yield from store.results_iter(json_path.name)
+        return
+    yield from _iter_journal_file(json_path)
+
+
+def _iter_journal_file(json_path: Path):
+    journal = journal_path_for(json_path)
+    if not journal.exists():
+        return
+    with journal.open("r", encoding="utf-8") as f:
+        for raw_line in f:
+            raw_line = raw_line.strip()
+            if not raw_line:
+                continue
+            try:
+                record = json.loads(raw_line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(record, dict) or not isinstance(record.get("result"), dict):
+                continue
+            yield record.get("file") or "", record["result"]
+
+
+def _iter_legacy_file(json_path: Path):
+    if not json_path.exists():
+        return
+    with json_path.open("r", encoding="utf-8") as f:
+        content = f.read().strip()
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        data = json.loads(content[: content.rfind("}") + 1])
+    for file_name, results in ((data or {}).get("results_by_file") or {}).items():
+        for result in results or []:
+            if isinstance(result, dict):
+                yield file_name, result
+
+
+def iter_results(json_path: Path):
+    """
+    Duyệt kết quả của 1 lần chạy: yield (file_name, result) theo thứ tự ghi.
+    Ưu tiên journal (đọc từng dòng, bộ nhớ không phụ thuộc kích thước file);
+    file cũ không có journal thì mới phải parse toàn bộ file legacy.
+    """
+    if has_journal(json_path):
+        yield from iter_journal(json_path)
+        return
+    yield from _iter_legacy_file(json_path)
+
+
+def build_legacy_data(json_path: Path) -> Dict[str, Any]:
+    """
+    Dựng lại cấu trúc legacy của all_results_<ts>.json từ journal:
+    {total_files, results_by_file, total_posts_processed, total_reactions, total_comments}
+    """
+    results_by_file: Dict[str, list] = {}
+    total_reactions = 0
+    total_comments = 0
+    for file_name, result in iter_journal(json_path):
+        results_by_file.setdefault(file_name, []).append(result)
+        total_reactions += int(result.get("reactions_count", 0) or 0)
+        total_comments += int(result.get("comments_count", 0) or 0)
+    return {
+        "total_files": len(results_by_file),
+        "results_by_file": results_by_file,
+        "total_posts_processed": sum(len(v) for v in results_by_file.values()),
+        "total_reactions": total_reactions,
+        "total_comments": total_comments,
+    }
+
+
+def needs_compaction(json_path: Path) -> bool:
+    """True nếu journal mới hơn file legacy (hoặc file legacy chưa có)."""
+    store = storage.get_store()
+    if store is not None:
+        updated_at = store.results_updated_at(json_path.name)
+        if updated_at is not None:
+            try:
+                return not json_path.exists() or updated_at > json_path.stat().st_mtime
+            except Exception:
+                return True
+    journal = journal_path_for(json_path)
+    if not journal.exists():
+        return False
+    try:
+        if not json_path.exists():
+            return True
+        return journal.stat().st_mtime > json_path.stat().st_mtime
+    except Exception:
+        return True
+
+
+def compact(json_path: Path, force: bool = False) -> bool:
+    """
+    Materialize file legacy all_results_<ts>.json từ journal (atomic write).
+    Chỉ ghi khi journal có thay đổi so với lần compact trước (trừ khi force=True).
+    Trả về True nếu đã ghi file.
+    """
+    with _lock:
+        if not force and not needs_compaction(json_path):
+            return False
+        data = build_legacy_data(json_path)
+        _atomic_write_json(json_path, data, indent=2)
+        # Cập nhật index (counters lấy luôn từ data vừa ghi, API không cần parse lại file)
+        results_index.upsert(json_path, data)
+        return True
+
+
+def compact_pending(results_dir: Path) -> int:
+    """
+    Compact mọi journal trong results_dir có dữ liệu mới hơn file legacy.
+    Dùng trước khi API liệt kê/đọc all_results_*.json. Trả về số file đã compact.
+    """
+    count = 0
+    for json_path in journal_runs(results_dir):
+        try:
+            if compact(json_path):
+                count += 1
+        except Exception as e:
+            print(f"⚠️ Lỗi khi compact journal {journal_path_for(json_path).name}: {e}")
+    return count
+
+
+def remove_journal_files(json_path: Path) -> None:
+    """Xóa journal + sidecar đi kèm file legacy (best-effort) để file không bị materialize lại."""
+    json_path = legacy_path_for(json_path)
+    store = storage.get_store()
+    if store is not None:
+        try:
+            store.results_remove(json_path.name)
+        except Exception as e:
+            print(f"⚠️ Không thể xóa kết quả {json_path.name} khỏi DB: {e}")
+    for p in (journal_path_for(json_path), meta_path_for(json_path)):
+        try:
+            if p.exists():
+                p.unlink()
+        except Exception as e:
+            print(f"⚠️ Không thể xóa {p.name}: {e}")
+
+
+def export_to_store(store) -> int:
+    """
+    Migrator: chép kết quả của mọi lần chạy trong data/results (journal nếu có, không thì file legacy)
+    vào SqliteStore. Run đã có trong DB thì bỏ qua. Trả về số dòng kết quả đã chép.
+    """
+    results_dir = get_data_dir() / "results"
+    existing = store.results_runs()
+    names = set()
+    if results_dir.exists():
+        for path in results_dir.glob("all_results_*.json"):
+            if results_index.parse_timestamp(path.name) is not None:
+                names.add(path.name)
+        for journal in results_dir.glob(f"all_results_*{JOURNAL_SUFFIX}"):
+            names.add(f"{journal.stem}.json")
+    copied = 0
+    for name in sorted(names - set(existing)):
+        json_path = results_dir / name
+        try:
+            source = journal_path_for(json_path)
+            if source.exists():
+                rows = _iter_journal_file(json_path)
+            else:
+                source = json_path
+                rows = _iter_legacy_file(json_path)
+            copied += store.results_import(name, rows, updated_at=source.stat().st_mtime)
+        except Exception as e:
+            print(f"⚠️ Không thể migrate kết quả {name}: {e}")
+    return copied
@@ -9,6 +9,7 @@ from core.scraper import SimpleBot
 from core.settings import get_settings
 from core.utils import clean_profile_list
 from core import control as control_state
+from core import profile_config
 
 
 class AppRunner:
@@ -63,6 +64,7 @@ class AppRunner:
                 continue
         return default
 
+    @profile_config.flush_on_exit
     def worker(self, profile_id):
         """Hàm xử lý cho từng profile (Process con)"""
         # trạng thái profile
@@ -28,6 +28,14 @@ def _coerce_positive_int(value: Any, default: int) -> int:
         return default
 
 
+def _coerce_non_negative_int(value: Any, default: int) -> int:
+    try:
+        num = int(value)
+        return num if num >= 0 else default
+    except (TypeError, ValueError):
+        return default
+
+
 def _parse_profile_ids(value: Any) -> List[str]:
     """
     Trả về danh sách profile_id.
@@ -67,6 +75,52 @@ class Settings:
     profile_configs: Dict[str, Any] = field(default_factory=dict)
     run_minutes: int = 30
     rest_minutes: int = 120
+    # Lấy thông tin (get_all_info): số post xử lý song song / profile,
+    # lấy reactions + comments song song trong 1 post, giới hạn post/phút / profile (0 = không giới hạn)
+    info_post_concurrency: int = 1
+    info_parallel_fetch: bool = False
+    info_posts_per_minute: int = 0
+    # Engine asyncio: 1 event loop chạy phân trang reactions/comments cho nhiều profile cùng lúc,
+    # mỗi profile tối đa info_async_requests_per_profile request đồng thời
+    info_async_graphql: bool = False
+    info_async_requests_per_profile: int = 4
+    # Backend lưu trữ hàng đợi post_ids / kết quả / groups / trạng thái account: "json" (file) hoặc "sqlite" (WAL)
+    storage_backend: str = "json"
+    # Số ngày giữ post đã xử lý trong processed index (producer bỏ qua post đã crawl), 0 = tắt
+    processed_post_ttl_days: int = 7
+    # Claim registry giữa các profile: profile claim post trước mới resolve/crawl, claim hết hạn sau N giờ, 0 = tắt
+    post_claim_ttl_hours: int = 24
+    # Cache kết quả get_id_from_url (URL share/bài -> post_id, owning_profile, post_text): hạn dùng (giờ, 0 = tắt) + số bài tối đa
+    post_details_cache_ttl_hours: int = 24
+    post_details_cache_size: int = 5000
+    # Quét group: lấy tác giả + nội dung từ Graph API (feed{message,from}); bài thiếu dữ liệu mới tải HTML,
+    # chạy song song tối đa group_scan_enrich_workers luồng
+    group_scan_graph_fields: bool = True
+    group_scan_enrich_workers: int = 4
+    # Quét nhiều group song song (tối đa group_scan_concurrency group cùng lúc) + budget request Graph API
+    # theo access token (request/phút, 0 = không giới hạn; gặp code 4/17 thì token bị tạm khoá)
+    group_scan_concurrency: int = 4
+    group_scan_token_rpm: int = 60
+    # Quét group tăng dần: mỗi group lưu watermark (bài mới nhất đã lấy) trong groups.json, lần sau chỉ lấy bài mới hơn
+    group_scan_incremental: bool = True
+    # Governor tốc độ request (token bucket AIMD theo profile + loại endpoint, dùng chung mọi luồng)
+    rate_governor_enabled: bool = True
+    # Checkpoint cursor + kết quả từng phần của reactions/comments mỗi N trang (0 = tắt)
+    pagination_checkpoint_pages: int = 5
+    # Post phân trang dở (còn checkpoint) được đưa lại cuối hàng đợi tối đa N lần; quá N lần thì lưu
+    # kết quả từng phần (status "partial", không đánh dấu đã crawl) và xoá checkpoint
+    info_max_resume_attempts: int = 3
+    # Post đã crawl đủ 1 lần thì mọi lần crawl lại đều kiểu delta (chỉ lấy reactions/comments mới);
+    # tắt thì chỉ post được xếp lại qua POST /info/recheck mới chạy delta
+    info_delta_recrawl: bool = False
+    # Crawl scheduler: probe trang đầu để xếp hạng post (flag -> engagement), budget request GraphQL mỗi phiên
+    # của profile (0 = không giới hạn) + budget trang mỗi loại cho 1 post (0 = không giới hạn), xếp hạng theo cửa sổ N post
+    info_scheduler_enabled: bool = True
+    info_session_request_budget: int = 1500
+    info_post_page_budget: int = 40
+    info_scheduler_window: int = 50
+    # Prefetch trang reactions/comments kế tiếp trong lúc xử lý trang hiện tại: tối đa N request đang bay (0 = tắt)
+    graphql_prefetch_max_inflight: int = 8
 
 
 @lru_cache(maxsize=1)
@@ -92,6 +146,30 @@ def get_settings() -> Settings:
         profile_configs=_parse_profile_configs(raw.get("PROFILE_IDS", {})),
         run_minutes=_coerce_positive_int(raw.get("RUN_MINUTES", 30), 30),
         rest_minutes=_coerce_positive_int(raw.get("REST_MINUTES", 120), 120),
+        info_post_concurrency=_coerce_positive_int(raw.get("INFO_POST_CONCURRENCY", 1), 1),
+        info_parallel_fetch=_parse_bool(raw.get("INFO_PARALLEL_FETCH", False)),
+        info_posts_per_minute=_coerce_non_negative_int(raw.get("INFO_POSTS_PER_MINUTE", 0), 0),
+        info_async_graphql=_parse_bool(raw.get("INFO_ASYNC_GRAPHQL", False)),
+        info_async_requests_per_profile=_coerce_positive_int(raw.get("INFO_ASYNC_REQUESTS_PER_PROFILE", 4), 4),
+        storage_backend=str(raw.get("STORAGE_BACKEND", "json") or "json").strip().lower(),
+        processed_post_ttl_days=_coerce_non_negative_int(raw.get("PROCESSED_POST_TTL_DAYS", 7), 7),
+        post_claim_ttl_hours=_coerce_non_negative_int(raw.get("POST_CLAIM_TTL_HOURS", 24), 24),
+        post_details_cache_ttl_hours=_coerce_non_negative_int(raw.get("POST_DETAILS_CACHE_TTL_HOURS", 24), 24),
+        post_details_cache_size=_coerce_positive_int(raw.get("POST_DETAILS_CACHE_SIZE", 5000), 5000),
+        group_scan_graph_fields=_parse_bool(raw.get("GROUP_SCAN_GRAPH_FIELDS", True)),
+        group_scan_enrich_workers=_coerce_positive_int(raw.get("GROUP_SCAN_ENRICH_WORKERS", 4), 4),
+        group_scan_concurrency=_coerce_positive_int(raw.get("GROUP_SCAN_CONCURRENCY", 4), 4),
+        group_scan_token_rpm=_coerce_non_negative_int(raw.get("GROUP_SCAN_TOKEN_REQUESTS_PER_MINUTE", 60), 60),
+        group_scan_incremental=_parse_bool(raw.get("GROUP_SCAN_INCREMENTAL", True)),
+        rate_governor_enabled=_parse_bool(raw.get("RATE_GOVERNOR_ENABLED", True)),
+        pagination_checkpoint_pages=_coerce_non_negative_int(raw.get("PAGINATION_CHECKPOINT_PAGES", 5), 5),
+        info_max_resume_attempts=_coerce_non_negative_int(raw.get("INFO_MAX_RESUME_ATTEMPTS", 3), 3),
+        info_delta_recrawl=_parse_bool(raw.get("INFO_DELTA_RECRAWL", False)),
+        info_scheduler_enabled=_parse_bool(raw.get("INFO_SCHEDULER_ENABLED", True)),
+        info_session_request_budget=_coerce_non_negative_int(raw.get("INFO_SESSION_REQUEST_BUDGET", 1500), 1500),
+        info_post_page_budget=_coerce_non_negative_int(raw.get("INFO_POST_PAGE_BUDGET", 40), 40),
+        info_scheduler_window=_coerce_positive_int(raw.get("INFO_SCHEDULER_WINDOW", 50), 50),
+        graphql_prefetch_max_inflight=_coerce_non_negative_int(raw.get("GRAPHQL_PREFETCH_MAX_INFLIGHT", 8), 8),
     )
 
 
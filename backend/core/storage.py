@@ -0,0 +1,722 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from core.paths import get_data_dir
+
+# Backend lưu trữ tuỳ chọn: SQLite (WAL) cho hàng đợi post_ids, kết quả, groups và trạng thái account.
+# - Bật bằng STORAGE_BACKEND = "sqlite" trong settings.json (mặc định "json": giữ nguyên layout file cũ)
+# - Các module post_queue / results_journal / join_groups / account_status vẫn là interface cho caller,
+#   bên trong gọi get_store(): None -> dùng file JSON như cũ, SqliteStore -> ghi vào data/app_state.db
+# - WAL + busy_timeout: nhiều tiến trình ghi cùng lúc, mỗi thay đổi chỉ là 1 transaction nhỏ
+#   (không ghi lại cả file), truy vấn theo profile/run đều có index
+# - migrate_from_json(): chuyển 1 lần dữ liệu JSON hiện có vào DB (idempotent, không xoá file cũ)
+# runtime_control.json vẫn là file: control bus theo dõi thay đổi qua chữ ký file (stat) nên giữ nguyên.
+DB_PATH = get_data_dir() / "app_state.db"
+BACKEND_JSON = "json"
+BACKEND_SQLITE = "sqlite"
+BUSY_TIMEOUT_SECONDS = 30.0
+_PAGE_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS post_queue (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    profile_id TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_post_queue_profile_seq ON post_queue(profile_id, seq);
+CREATE INDEX IF NOT EXISTS idx_post_queue_profile_post ON post_queue(profile_id, post_id);
+CREATE TABLE IF NOT EXISTS queue_offsets (
+    profile_id TEXT PRIMARY KEY,
+    committed_seq INTEGER NOT NULL DEFAULT 0,
+    generation INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    post_id TEXT,
+    result TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_run_id ON results(run, id);
+CREATE INDEX IF NOT EXISTS idx_results_post ON results(post_id);
+CREATE TABLE IF NOT EXISTS result_runs (
+    run TEXT PRIMARY KEY,
+    posts_by_file TEXT NOT NULL DEFAULT '{}',
+    total_posts_processed INTEGER NOT NULL DEFAULT 0,
+    total_reactions INTEGER NOT NULL DEFAULT 0,
+    total_comments INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS groups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    profile_id TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_groups_profile ON groups(profile_id, id);
+CREATE INDEX IF NOT EXISTS idx_groups_profile_page ON groups(profile_id, page_id);
+CREATE TABLE IF NOT EXISTS account_status (
+    profile_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS processed_posts (
+    post_id TEXT PRIMARY KEY,
+    processed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_processed_posts_at ON processed_posts(processed_at);
+CREATE TABLE IF NOT EXISTS post_claims (
+    post_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    claimed_at REAL NOT NULL,
+    seen_by TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_post_claims_at ON post_claims(claimed_at);
+CREATE TABLE IF NOT EXISTS engagement_state (
+    post_id TEXT PRIMARY KEY,
+    profile_id TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_engagement_state_at ON engagement_state(updated_at);
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _record_id(item: Any) -> Optional[str]:
+    """Giống post_queue: hỗ trợ string / {"id"} / {"post_id"}."""
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        return item.get("id") or item.get("post_id")
+    return None
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+class SqliteStore:
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = Path(db_path) if db_path else DB_PATH
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    # ------------------------------------------------------------------
+    # Kết nối / transaction
+    # ------------------------------------------------------------------
+    def _conn(self) -> sqlite3.Connection:
+        """Mỗi thread 1 connection (sqlite3 không chia sẻ connection giữa thread)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT_SECONDS * 1000)}")
+        with self._init_lock:
+            if not self._initialized:
+                conn.executescript(_SCHEMA)
+                self._initialized = True
+        self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        """Transaction ghi: BEGIN IMMEDIATE để lấy write lock ngay (tiến trình khác chờ theo busy_timeout)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            self._local.conn = None
+
+    # ------------------------------------------------------------------
+    # Hàng đợi post_ids (offset = seq của dòng đã xử lý)
+    # ------------------------------------------------------------------
+    def _queue_state(self, conn: sqlite3.Connection, profile_id: str) -> Tuple[int, int]:
+        row = conn.execute(
+            "SELECT committed_seq, generation FROM queue_offsets WHERE profile_id = ?", (profile_id,)
+        ).fetchone()
+        return (int(row[0]), int(row[1])) if row else (0, 0)
+
+    def queue_append(self, profile_id: str, records: List[Any], after_seq: int = 0) -> int:
+        added = 0
+        with self._tx() as conn:
+            committed, _gen = self._queue_state(conn, profile_id)
+            committed = max(committed, int(after_seq or 0))
+            seen = set()
+            for record in records:
+                rid = _record_id(record)
+                if not rid or rid in seen:
+                    continue
+                seen.add(rid)
+                exists = conn.execute(
+                    "SELECT 1 FROM post_queue WHERE profile_id = ? AND post_id = ? AND seq > ? LIMIT 1",
+                    (profile_id, rid, committed),
+                ).fetchone()
+                if exists:
+                    continue
+                conn.execute(
+                    "INSERT INTO post_queue(profile_id, post_id, record) VALUES (?, ?, ?)",
+                    (profile_id, rid, _dumps(record)),
+                )
+                added += 1
+        return added
+
+    def queue_read_pending(self, profile_id: str) -> Tuple[List[Tuple[Any, int]], int]:
+        conn = self._conn()
+        committed, generation = self._queue_state(conn, profile_id)
+        rows = conn.execute(
+            "SELECT record, seq FROM post_queue WHERE profile_id = ? AND seq > ? ORDER BY seq",
+            (profile_id, committed),
+        ).fetchall()
+        out = []
+        for record, seq in rows:
+            try:
+                out.append((json.loads(record), int(seq)))
+            except Exception:
+                continue
+        return out, generation
+
+    def queue_pending_count(self, profile_id: str) -> int:
+        conn = self._conn()
+        committed, _gen = self._queue_state(conn, profile_id)
+        row = conn.execute(
+            "SELECT COUNT(*) FROM post_queue WHERE profile_id = ? AND seq > ?", (profile_id, committed)
+        ).fetchone()
+        return int(row[0] if row else 0)
+
+    def queue_commit(self, profile_id: str, seq: int, generation: int) -> bool:
+        with self._tx() as conn:
+            committed, current_gen = self._queue_state(conn, profile_id)
+            if current_gen != generation or seq <= committed:
+                return False
+            conn.execute(
+                "INSERT INTO queue_offsets(profile_id, committed_seq, generation) VALUES (?, ?, ?) "
+                "ON CONFLICT(profile_id) DO UPDATE SET committed_seq = excluded.committed_seq",
+                (profile_id, int(seq), int(generation)),
+            )
+            return True
+
+    def queue_compact(self, profile_id: str) -> None:
+        with self._tx() as conn:
+            committed, generation = self._queue_state(conn, profile_id)
+            if committed <= 0:
+                return
+            conn.execute("DELETE FROM post_queue WHERE profile_id = ? AND seq <= ?", (profile_id, committed))
+            conn.execute(
+                "INSERT INTO queue_offsets(profile_id, committed_seq, generation) VALUES (?, ?, ?) "
+                "ON CONFLICT(profile_id) DO UPDATE SET generation = excluded.generation",
+                (profile_id, committed, generation + 1),
+            )
+
+    def queue_profiles(self) -> List[str]:
+        rows = self._conn().execute("SELECT DISTINCT profile_id FROM post_queue ORDER BY profile_id").fetchall()
+        return [r[0] for r in rows]
+
+    def queue_remove(self, profile_id: str) -> None:
+        with self._tx() as conn:
+            conn.execute("DELETE FROM post_queue WHERE profile_id = ?", (profile_id,))
+            conn.execute("DELETE FROM queue_offsets WHERE profile_id = ?", (profile_id,))
+
+    # ------------------------------------------------------------------
+    # Kết quả (run = tên file all_results_<ts>.json)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _counters_from_row(row) -> Dict[str, Any]:
+        try:
+            posts_by_file = json.loads(row[0] or "{}")
+        except Exception:
+            posts_by_file = {}
+        return {
+            "total_files": len(posts_by_file),
+            "posts_by_file": posts_by_file,
+            "total_posts_processed": int(row[1] or 0),
+            "total_reactions": int(row[2] or 0),
+            "total_comments": int(row[3] or 0),
+        }
+
+    def results_append(self, run: str, file_name: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT INTO results(run, file_name, post_id, result) VALUES (?, ?, ?, ?)",
+                (run, file_name, str(result.get("post_id") or "") or None, _dumps(result)),
+            )
+            row = conn.execute(
+                "SELECT posts_by_file, total_posts_processed, total_reactions, total_comments FROM result_runs WHERE run = ?",
+                (run,),
+            ).fetchone()
+            counters = self._counters_from_row(row) if row else self._counters_from_row(("{}", 0, 0, 0))
+            posts_by_file = counters["posts_by_file"]
+            posts_by_file[file_name] = int(posts_by_file.get(file_name, 0) or 0) + 1
+            counters["total_files"] = len(posts_by_file)
+            counters["total_posts_processed"] += 1
+            counters["total_reactions"] += int(result.get("reactions_count", 0) or 0)
+            counters["total_comments"] += int(result.get("comments_count", 0) or 0)
+            conn.execute(
+                "INSERT INTO result_runs(run, posts_by_file, total_posts_processed, total_reactions, total_comments, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(run) DO UPDATE SET posts_by_file = excluded.posts_by_file, "
+                "total_posts_processed = excluded.total_posts_processed, total_reactions = excluded.total_reactions, "
+                "total_comments = excluded.total_comments, updated_at = excluded.updated_at",
+                (
+                    run,
+                    _dumps(posts_by_file),
+                    counters["total_posts_processed"],
+                    counters["total_reactions"],
+                    counters["total_comments"],
+                    time.time(),
+                ),
+            )
+            return counters
+
+    def results_import(self, run: str, rows, updated_at: Optional[float] = None) -> int:
+        """
+        Migrator: chép cả run trong 1 transaction (rows = iterable (file_name, result)). Trả về số dòng.
+        updated_at: mtime của file nguồn (giữ nguyên để compact_pending không ghi lại file legacy vừa migrate).
+        """
+        posts_by_file: Dict[str, int] = {}
+        total_reactions = 0
+        total_comments = 0
+        count = 0
+        with self._tx() as conn:
+            for file_name, result in rows:
+                conn.execute(
+                    "INSERT INTO results(run, file_name, post_id, result) VALUES (?, ?, ?, ?)",
+                    (run, file_name, str(result.get("post_id") or "") or None, _dumps(result)),
+                )
+                posts_by_file[file_name] = posts_by_file.get(file_name, 0) + 1
+                total_reactions += int(result.get("reactions_count", 0) or 0)
+                total_comments += int(result.get("comments_count", 0) or 0)
+                count += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO result_runs(run, posts_by_file, total_posts_processed, total_reactions, total_comments, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (run, _dumps(posts_by_file), count, total_reactions, total_comments, updated_at or time.time()),
+            )
+        return count
+
+    def results_counters(self, run: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT posts_by_file, total_posts_processed, total_reactions, total_comments FROM result_runs WHERE run = ?",
+            (run,),
+        ).fetchone()
+        return self._counters_from_row(row) if row else None
+
+    def results_iter(self, run: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Duyệt (file_name, result) theo thứ tự ghi, đọc theo trang để bộ nhớ không phụ thuộc kích thước run."""
+        last_id = 0
+        while True:
+            rows = self._conn().execute(
+                "SELECT id, file_name, result FROM results WHERE run = ? AND id > ? ORDER BY id LIMIT ?",
+                (run, last_id, _PAGE_SIZE),
+            ).fetchall()
+            if not rows:
+                return
+            for row_id, file_name, result in rows:
+                last_id = row_id
+                try:
+                    yield file_name or "", json.loads(result)
+                except Exception:
+                    continue
+
+    def results_runs(self) -> Dict[str, float]:
+        """{run: updated_at} của các run có trong DB."""
+        rows = self._conn().execute("SELECT run, updated_at FROM result_runs").fetchall()
+        return {r[0]: float(r[1] or 0) for r in rows}
+
+    def results_updated_at(self, run: str) -> Optional[float]:
+        row = self._conn().execute("SELECT updated_at FROM result_runs WHERE run = ?", (run,)).fetchone()
+        return float(row[0] or 0) if row else None
+
+    def results_remove(self, run: str) -> None:
+        with self._tx() as conn:
+            conn.execute("DELETE FROM results WHERE run = ?", (run,))
+            conn.execute("DELETE FROM result_runs WHERE run = ?", (run,))
+
+    # ------------------------------------------------------------------
+    # Groups (cùng format groups.json: {profile_id: [{"page_id", "url_page", ...}]})
+    # ------------------------------------------------------------------
+    def groups_load(self) -> Dict[str, List[Dict[str, Any]]]:
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        for profile_id, data in self._conn().execute("SELECT profile_id, data FROM groups ORDER BY profile_id, id"):
+            try:
+                out.setdefault(profile_id, []).append(json.loads(data))
+            except Exception:
+                continue
+        return out
+
+    def groups_for_profile(self, profile_id: str) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT data FROM groups WHERE profile_id = ? ORDER BY id", (profile_id,)).fetchall()
+        out = []
+        for (data,) in rows:
+            try:
+                out.append(json.loads(data))
+            except Exception:
+                continue
+        return out
+
+    def groups_upsert(self, profile_id: str, page_id: str, url_page: str) -> None:
+        with self._tx() as conn:
+            row = conn.execute(
+                "SELECT id, data FROM groups WHERE profile_id = ? AND page_id = ? ORDER BY id LIMIT 1",
+                (profile_id, page_id),
+            ).fetchone()
+            if row:
+                try:
+                    item = json.loads(row[1])
+                except Exception:
+                    item = {"page_id": page_id}
+                item["url_page"] = url_page
+                conn.execute("UPDATE groups SET data = ? WHERE id = ?", (_dumps(item), row[0]))
+            else:
+                conn.execute(
+                    "INSERT INTO groups(profile_id, page_id, data) VALUES (?, ?, ?)",
+                    (profile_id, page_id, _dumps({"page_id": page_id, "url_page": url_page})),
+                )
+
+    def groups_replace(self, profile_id: str, groups: List[Any]) -> None:
+        with self._tx() as conn:
+            conn.execute("DELETE FROM groups WHERE profile_id = ?", (profile_id,))
+            for item in groups:
+                page_id = str(item.get("page_id") or "").strip() if isinstance(item, dict) else ""
+                conn.execute(
+                    "INSERT INTO groups(profile_id, page_id, data) VALUES (?, ?, ?)",
+                    (profile_id, page_id, _dumps(item)),
+                )
+
+    def groups_remove(self, profile_id: str) -> bool:
+        with self._tx() as conn:
+            cur = conn.execute("DELETE FROM groups WHERE profile_id = ?", (profile_id,))
+            return cur.rowcount > 0
+
+    def groups_set_watermark(self, profile_id: str, page_id: str, watermark: Optional[Dict[str, Any]]) -> bool:
+        """Ghi watermark vào group (chỉ tiến lên, trừ khi watermark=None để xoá). False nếu group không tồn tại."""
+        with self._tx() as conn:
+            row = conn.execute(
+                "SELECT id, data FROM groups WHERE profile_id = ? AND page_id = ? ORDER BY id LIMIT 1",
+                (profile_id, page_id),
+            ).fetchone()
+            if not row:
+                return False
+            try:
+                item = json.loads(row[1])
+            except Exception:
+                item = {"page_id": page_id}
+            current = item.get("watermark") if isinstance(item.get("watermark"), dict) else None
+            if watermark is None:
+                item.pop("watermark", None)
+            elif current and int(current.get("timestamp") or 0) > int(watermark.get("timestamp") or 0):
+                return True
+            else:
+                item["watermark"] = watermark
+            conn.execute("UPDATE groups SET data = ? WHERE id = ?", (_dumps(item), row[0]))
+            return True
+
+    # ------------------------------------------------------------------
+    # Trạng thái account
+    # ------------------------------------------------------------------
+    def status_save(self, profile_id: str, result: Dict[str, Any]) -> None:
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT INTO account_status(profile_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(profile_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (profile_id, _dumps(result), time.time()),
+            )
+
+    def status_load(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for profile_id, data in self._conn().execute("SELECT profile_id, data FROM account_status ORDER BY profile_id"):
+            try:
+                out[profile_id] = json.loads(data)
+            except Exception:
+                continue
+        return out
+
+    def status_remove(self, profile_ids: List[str]) -> List[str]:
+        removed = []
+        with self._tx() as conn:
+            for pid in profile_ids:
+                cur = conn.execute("DELETE FROM account_status WHERE profile_id = ?", (pid,))
+                if cur.rowcount > 0:
+                    removed.append(pid)
+        return removed
+
+    # ------------------------------------------------------------------
+    # Processed index (post đã crawl) + counters
+    # ------------------------------------------------------------------
+    def processed_add(self, post_ids: List[str], processed_at: float) -> None:
+        with self._tx() as conn:
+            conn.executemany(
+                "INSERT INTO processed_posts(post_id, processed_at) VALUES (?, ?) "
+                "ON CONFLICT(post_id) DO UPDATE SET processed_at = excluded.processed_at",
+                [(pid, processed_at) for pid in post_ids],
+            )
+
+    def processed_import(self, entries: Dict[str, float]) -> None:
+        """Upsert {post_id: processed_at} trong 1 transaction (dùng cho migrate)."""
+        with self._tx() as conn:
+            conn.executemany(
+                "INSERT INTO processed_posts(post_id, processed_at) VALUES (?, ?) "
+                "ON CONFLICT(post_id) DO UPDATE SET processed_at = MAX(processed_at, excluded.processed_at)",
+                list(entries.items()),
+            )
+
+    def processed_lookup(self, post_ids: List[str], since: float) -> set:
+        """Các post_id trong danh sách đã xử lý sau thời điểm since."""
+        found = set()
+        conn = self._conn()
+        for pid in post_ids:
+            row = conn.execute(
+                "SELECT 1 FROM processed_posts WHERE post_id = ? AND processed_at >= ?", (pid, since)
+            ).fetchone()
+            if row:
+                found.add(pid)
+        return found
+
+    def processed_compact(self, before: float) -> int:
+        with self._tx() as conn:
+            return conn.execute("DELETE FROM processed_posts WHERE processed_at < ?", (before,)).rowcount
+
+    def processed_count(self) -> int:
+        return int(self._conn().execute("SELECT COUNT(*) FROM processed_posts").fetchone()[0])
+
+    # ------------------------------------------------------------------
+    # Claim registry (profile nào crawl post nào)
+    # ------------------------------------------------------------------
+    def claims_claim(self, post_ids: List[str], profile_id: str, now: float, expire_before: float) -> Dict[str, str]:
+        """
+        Claim các post cho profile trong 1 transaction: post chưa có chủ (hoặc claim đã hết hạn) -> profile này;
+        post đã có chủ khác -> chỉ ghi nhận profile đã thấy. Trả về {post_id: owner}.
+        """
+        owners: Dict[str, str] = {}
+        with self._tx() as conn:
+            for pid in post_ids:
+                row = conn.execute("SELECT owner, claimed_at, seen_by FROM post_claims WHERE post_id = ?", (pid,)).fetchone()
+                if row is None or row[1] < expire_before or row[0] == profile_id:
+                    conn.execute(
+                        "INSERT INTO post_claims(post_id, owner, claimed_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(post_id) DO UPDATE SET owner = excluded.owner, claimed_at = excluded.claimed_at, "
+                        "seen_by = CASE WHEN post_claims.owner = excluded.owner THEN post_claims.seen_by ELSE '{}' END",
+                        (pid, profile_id, now),
+                    )
+                    owners[pid] = profile_id
+                    continue
+                seen = json.loads(row[2] or "{}")
+                seen[profile_id] = now
+                conn.execute("UPDATE post_claims SET seen_by = ? WHERE post_id = ?", (json.dumps(seen), pid))
+                owners[pid] = row[0]
+        return owners
+
+    def claims_release(self, post_ids: List[str], profile_id: str) -> int:
+        with self._tx() as conn:
+            return sum(
+                conn.execute("DELETE FROM post_claims WHERE post_id = ? AND owner = ?", (pid, profile_id)).rowcount
+                for pid in post_ids
+            )
+
+    def claims_import(self, claims: Dict[str, Dict[str, Any]]) -> None:
+        """Upsert claim từ file JSON (dùng cho migrate)."""
+        with self._tx() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO post_claims(post_id, owner, claimed_at, seen_by) VALUES (?, ?, ?, ?)",
+                [
+                    (pid, str(c.get("owner")), float(c.get("claimed_at", 0) or 0), json.dumps(c.get("seen_by") or {}))
+                    for pid, c in claims.items()
+                    if isinstance(c, dict) and c.get("owner")
+                ],
+            )
+
+    def claims_compact(self, before: float) -> int:
+        with self._tx() as conn:
+            return conn.execute("DELETE FROM post_claims WHERE claimed_at < ?", (before,)).rowcount
+
+    def claims_count(self, since: float) -> Dict[str, int]:
+        """Số claim còn hiệu lực theo profile chủ."""
+        rows = self._conn().execute(
+            "SELECT owner, COUNT(*) FROM post_claims WHERE claimed_at >= ? GROUP BY owner", (since,)
+        ).fetchall()
+        return {owner: int(n) for owner, n in rows}
+
+    # ------------------------------------------------------------------
+    # Engagement state (delta re-crawl reactions/comments)
+    # ------------------------------------------------------------------
+    def engagement_load(self, post_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM engagement_state WHERE post_id = ?", (post_id,)).fetchone()
+        if not row:
+            return None
+        try:
+            return json.loads(row[0])
+        except Exception:
+            return None
+
+    def engagement_save(self, post_id: str, state: Dict[str, Any]) -> None:
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT INTO engagement_state(post_id, profile_id, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(post_id) DO UPDATE SET profile_id = excluded.profile_id, data = excluded.data, "
+                "updated_at = excluded.updated_at",
+                (post_id, state.get("profile_id"), _dumps(state), float(state.get("updated_at") or time.time())),
+            )
+
+    def engagement_recent(self, since: float, profile_id: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """[{"post_id", "profile_id", "post", "updated_at"}] của post có state cập nhật từ since (mới nhất trước)."""
+        sql = "SELECT data FROM engagement_state WHERE updated_at >= ?"
+        params: List[Any] = [since]
+        if profile_id:
+            sql += " AND profile_id = ?"
+            params.append(profile_id)
+        sql += " ORDER BY updated_at DESC LIMIT ?"
+        params.append(int(limit))
+        out = []
+        for (data,) in self._conn().execute(sql, params):
+            try:
+                state = json.loads(data)
+            except Exception:
+                continue
+            out.append({k: state.get(k) for k in ("post_id", "profile_id", "post", "updated_at")})
+        return out
+
+    def engagement_count(self) -> int:
+        return int(self._conn().execute("SELECT COUNT(*) FROM engagement_state").fetchone()[0])
+
+    def bump_counter(self, key: str, amount: int = 1) -> None:
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT INTO counters(key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                (key, int(amount)),
+            )
+
+    def get_counters(self, prefix: str = "") -> Dict[str, int]:
+        rows = self._conn().execute("SELECT key, value FROM counters WHERE key LIKE ?", (f"{prefix}%",)).fetchall()
+        return {k[len(prefix):]: int(v) for k, v in rows}
+
+    # ------------------------------------------------------------------
+    # Meta / thống kê
+    # ------------------------------------------------------------------
+    def set_meta(self, key: str, value: Any) -> None:
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT INTO meta(key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, _dumps(value)),
+            )
+
+    def get_meta(self, key: str) -> Any:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        try:
+            return json.loads(row[0])
+        except Exception:
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        counts = {}
+        for table in ("post_queue", "results", "result_runs", "groups", "account_status", "processed_posts", "post_claims", "engagement_state"):
+            counts[table] = int(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+        return {
+            "backend": BACKEND_SQLITE,
+            "db_path": str(self.db_path),
+            "journal_mode": conn.execute("PRAGMA journal_mode").fetchone()[0],
+            "rows": counts,
+            "migrated": self.get_meta("migrated_from_json"),
+        }
+
+
+_store: Optional[SqliteStore] = None
+_store_lock = threading.Lock()
+
+
+def backend_name() -> str:
+    """STORAGE_BACKEND trong settings.json ("json" nếu không đọc được / không hợp lệ)."""
+    try:
+        from core.settings import get_settings
+        name = get_settings().storage_backend
+    except Exception:
+        return BACKEND_JSON
+    return name if name in (BACKEND_JSON, BACKEND_SQLITE) else BACKEND_JSON
+
+
+def open_store(db_path: Optional[Path] = None) -> SqliteStore:
+    """SqliteStore dùng chung cả tiến trình (tạo lần đầu khi gọi), không phụ thuộc STORAGE_BACKEND."""
+    global _store
+    if _store is None or (db_path is not None and Path(db_path) != _store.db_path):
+        with _store_lock:
+            if _store is None or (db_path is not None and Path(db_path) != _store.db_path):
+                _store = SqliteStore(db_path)
+    return _store
+
+
+def get_store() -> Optional[SqliteStore]:
+    """SqliteStore nếu STORAGE_BACKEND = "sqlite", None nếu dùng file JSON."""
+    if backend_name() != BACKEND_SQLITE:
+        return None
+    return open_store()
+
+
+def migrate_from_json(db_path: Optional[Path] = None) -> Dict[str, int]:
+    """
+    Chuyển 1 lần dữ liệu JSON hiện có vào SQLite: hàng đợi post_ids (phần chưa xử lý),
+    kết quả all_results_*, groups.json, account_status.json, processed index, claim registry, engagement state.
+    Idempotent: chạy lại không nhân đôi dữ liệu. File JSON được giữ nguyên để có thể quay lại backend json.
+    """
+    from core import account_status, engagement_state, join_groups, post_claims, post_queue, processed_index, results_journal
+
+    store = open_store(db_path)
+    started = time.time()
+    summary = {
+        "queued_posts": post_queue.export_to_store(store),
+        "result_rows": results_journal.export_to_store(store),
+        "groups": join_groups.export_to_store(store),
+        "account_statuses": account_status.export_to_store(store),
+        "processed_posts": processed_index.export_to_store(store),
+        "post_claims": post_claims.export_to_store(store),
+        "engagement_states": engagement_state.export_to_store(store),
+    }
+    store.set_meta("migrated_from_json", {**summary, "migrated_at": time.time()})
+    print(f"📦 Đã migrate JSON -> SQLite ({store.db_path.name}) trong {time.time() - started:.1f}s: {summary}")
+    return summary
+
+
+def get_stats() -> Dict[str, Any]:
+    """Backend đang dùng + thống kê DB (nếu đang dùng sqlite)."""
+    store = get_store()
+    if store is None:
+        return {"backend": BACKEND_JSON, "db_path": str(DB_PATH), "db_exists": DB_PATH.exists()}
+    return store.get_stats()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        migrate_from_json()
+    else:
+        print("Cách dùng: python -m core.storage migrate")
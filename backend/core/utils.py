@@ -35,4 +35,9 @@ def clean_profile_list(raw):
         return []
 
     items = raw if isinstance(raw, list) else str(raw).split(",")
-    return [str(p).strip() for p in items if str(p).strip()]
\ No newline at end of file
+    return [str(p).strip() for p in items if str(p).strip()]
+
+
+def normalize_ids(ids):
+    """Id dạng chuỗi, bỏ rỗng + trùng, giữ thứ tự (O(n): hàng đợi có thể hàng chục nghìn post)."""
+    return list(dict.fromkeys(p for p in (str(x or "").strip() for x in ids) if p))
@@ -0,0 +1,517 @@
+import asyncio
+import functools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+# httpx là tuỳ chọn: có thì dùng AsyncClient (không tốn thread cho mỗi request),
+# không có thì chạy request qua session pooled (core.http_pool) trên 1 executor nhỏ dùng chung.
+try:
+    import httpx  # type: ignore
+except ImportError:
+    httpx = None
+
+try:
+    from core import http_pool
+    from core import rate_governor
+    from core import control as control_state
+    from core.pagination_checkpoint import PaginationCheckpoint
+    from core import engagement_state
+except ImportError:
+    from backend.core import http_pool
+    from backend.core import rate_governor
+    from backend.core import control as control_state
+    from backend.core.pagination_checkpoint import PaginationCheckpoint
+    from backend.core import engagement_state
+
+from single_get_reactions import (
+    build_request_payload as build_reactions_payload,
+    create_feedback_target_id,
+    parse_facebook_json_response,
+    process_reactors_response,
+    raise_on_graphql_errors,
+    reactions_page_summary,
+    refresh_payload_from_bad_response,
+)
+from single_get_comment import (
+    build_request_payload as build_comments_payload,
+    comments_page_summary,
+    extract_users_from_json,
+    parse_comments_page_info,
+)
+
+REACTIONS_FRIENDLY_NAME = "CometUFIReactionsDialogTabContentRefetchQuery"
+COMMENTS_FRIENDLY_NAME = "CommentListComponentsRootQuery"
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_BACKOFF_SECONDS = 30.0
+FALLBACK_WORKERS = 8  # số thread tối đa khi không có httpx (dùng chung cho mọi profile)
+
+_fallback_executor: Optional[ThreadPoolExecutor] = None
+_fallback_lock = threading.Lock()
+
+
+def _get_fallback_executor() -> ThreadPoolExecutor:
+    global _fallback_executor
+    with _fallback_lock:
+        if _fallback_executor is None:
+            _fallback_executor = ThreadPoolExecutor(max_workers=FALLBACK_WORKERS, thread_name_prefix="graphql-io")
+        return _fallback_executor
+
+
+class AsyncGraphQLClient:
+    """
+    Client GraphQL bất đồng bộ cho reactions/comments:
+    - 1 event loop phân trang nhiều post của nhiều profile cùng lúc
+    - Semaphore theo profile (giới hạn request đồng thời của mỗi tài khoản)
+    - Backoff khi gặp 429/5xx/1357004, refresh payload (single-flight theo profile) khi response lỗi
+    - Tôn trọng STOP/PAUSE qua control bus (không polling)
+    """
+
+    def __init__(self, requests_per_profile: int = 4, max_retries: int = 3, backoff_base: float = 1.0, timeout: float = 20):
+        self.requests_per_profile = max(1, int(requests_per_profile))
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = float(backoff_base)
+        self.timeout = timeout
+        self._profiles: Dict[str, Dict[str, Any]] = {}
+        self._clients: Dict[str, Any] = {}
+        self.stats: Dict[str, int] = {"requests_sent": 0, "retries": 0, "payload_refreshes": 0}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    def register_profile(self, profile_id: str, payload_dict: Dict[str, Any], cookies: str) -> None:
+        """Gắn payload + cookies cho profile (dùng chung cho mọi post của profile)."""
+        self._profiles[profile_id] = {
+            "payload": payload_dict,
+            "cookies": cookies,
+            "version": 0,
+            "semaphore": asyncio.Semaphore(self.requests_per_profile),
+            "refresh_lock": asyncio.Lock(),
+        }
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+
+    # ---------------- transport ----------------
+    def _get_httpx_client(self, profile_id: str):
+        client = self._clients.get(profile_id)
+        if client is None:
+            limits = httpx.Limits(max_connections=http_pool.POOL_MAXSIZE, max_keepalive_connections=http_pool.POOL_MAXSIZE)
+            client = httpx.AsyncClient(headers=http_pool.STATIC_GRAPHQL_HEADERS, timeout=self.timeout, limits=limits)
+            self._clients[profile_id] = client
+        return client
+
+    async def _send(self, profile_id: str, payload: str, headers: Dict[str, str]):
+        self.stats["requests_sent"] += 1
+        if httpx is not None:
+            client = self._get_httpx_client(profile_id)
+            http_pool.count_request(profile_id)
+            response = await client.post(http_pool.GRAPHQL_URL, content=payload, headers=headers)
+            # Cookie luôn truyền qua header theo profile -> không giữ Set-Cookie trong client
+            client.cookies.clear()
+            return response
+        loop = asyncio.get_running_loop()
+        call = functools.partial(http_pool.post_graphql, profile_id, payload, headers, self.timeout, governed=False)
+        return await loop.run_in_executor(_get_fallback_executor(), call)
+
+    async def _backoff(self, profile_id: str, attempt: int, reason: str, retry_after: Optional[str] = None) -> None:
+        delay = min(MAX_BACKOFF_SECONDS, self.backoff_base * (2 ** attempt))
+        try:
+            if retry_after:
+                delay = min(MAX_BACKOFF_SECONDS, max(delay, float(retry_after)))
+        except (TypeError, ValueError):
+            pass
+        self.stats["retries"] += 1
+        print(f"   ⏳ [{profile_id}] {reason} -> thử lại sau {delay:.1f}s (lần {attempt + 1}/{self.max_retries})")
+        await control_state.async_smart_sleep(delay, profile_id)
+
+    async def _refresh_payload(self, profile_id: str, response_text: str, seen_version: int, sent_at: float) -> bool:
+        """
+        Refresh payload 1 lần cho cả profile (single-flight): các coroutine khác gặp lỗi cùng lúc
+        sẽ chờ lock rồi dùng luôn payload mới thay vì mở thêm trình duyệt.
+        sent_at: thời điểm gửi request bị lỗi (stale_since của payload cache giữa các tiến trình).
+        """
+        profile = self._profiles[profile_id]
+        async with profile["refresh_lock"]:
+            if profile["version"] != seen_version:
+                return True
+            loop = asyncio.get_running_loop()
+            try:
+                refresh = functools.partial(refresh_payload_from_bad_response, profile_id, profile["cookies"], response_text, sent_at)
+                new_payload = await loop.run_in_executor(None, refresh)
+            except Exception as e:
+                print(f"⚠️ Lỗi khi cố gắng fix bằng headless: {e}")
+                new_payload = None
+            if not new_payload:
+                print("❌ Không thể tạo payload mới từ payload.txt/settings.json.")
+                return False
+            profile["payload"] = new_payload
+            profile["version"] += 1
+            self.stats["payload_refreshes"] += 1
+            return True
+
+    async def _checkpoint(self, profile_id: str) -> None:
+        """Check STOP/PAUSE trước mỗi request (PAUSE thì chờ trên control bus)."""
+        stop, paused, reason = control_state.check_flags(profile_id)
+        if stop:
+            raise RuntimeError(f"EMERGENCY_STOP ({reason})")
+        if paused:
+            print(f"⏸️ Đang tạm dừng ({reason}), chờ tiếp tục...")
+            await control_state.async_wait_if_paused(profile_id)
+
+    async def request_page(
+        self,
+        profile_id: str,
+        friendly_name: str,
+        build_payload: Callable[[Dict[str, Any]], Tuple[str, Dict[str, Any], Dict[str, Any]]],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Gửi 1 trang GraphQL (có retry/backoff/refresh payload).
+        Trả về response JSON hoặc None nếu không lấy được (caller dừng phân trang như bản đồng bộ).
+        """
+        profile = self._profiles[profile_id]
+        refreshed = False
+        for attempt in range(self.max_retries + 1):
+            await self._checkpoint(profile_id)
+            version = profile["version"]
+            payload, merged_payload, _variables = build_payload(profile["payload"])
+            headers = http_pool.graphql_headers(profile["cookies"], friendly_name, merged_payload.get("lsd", ""))
+
+            # Governor dùng chung với luồng sync / get_id / Graph API của cùng profile
+            await rate_governor.acquire_async(profile_id, "graphql")
+            connection_error = None
+            async with profile["semaphore"]:
+                try:
+                    sent_at = time.time()
+                    response = await self._send(profile_id, payload, headers)
+                except Exception as e:
+                    if (httpx is not None and isinstance(e, httpx.TransportError)) or isinstance(e, requests.RequestException):
+                        connection_error = e
+                    else:
+                        raise
+            # Backoff ngoài semaphore: đang chờ retry thì nhường slot cho request khác của profile
+            if connection_error is not None:
+                if attempt < self.max_retries:
+                    await self._backoff(profile_id, attempt, f"lỗi kết nối: {connection_error}")
+                    continue
+                print(f"❌ [{profile_id}] Lỗi kết nối: {connection_error}")
+                return None
+
+            status = response.status_code
+            if status == 429 and rate_governor.enabled():
+                rate_governor.report_throttle(profile_id, "graphql", "429")
+                # Cooldown do governor giữ: acquire_async ở vòng sau chờ, không backoff thêm ở đây
+                if attempt < self.max_retries:
+                    self.stats["retries"] += 1
+                    continue
+            elif status in RETRY_STATUSES and attempt < self.max_retries:
+                await self._backoff(profile_id, attempt, f"status {status}", response.headers.get("retry-after"))
+                continue
+            if status != 200:
+                print(f"❌ [{profile_id}] Lỗi: Status code {status}")
+                return None
+
+            text = response.text or ""
+            try:
+                response_json = parse_facebook_json_response(text)
+                raise_on_graphql_errors(response_json)
+                rate_governor.report_success(profile_id, "graphql")
+                return response_json
+            except (ValueError, json.JSONDecodeError) as e:
+                error_msg = str(e)
+                if "1357004" in error_msg:
+                    rate_governor.report_throttle(profile_id, "graphql", "1357004")
+                print(f"   ❌ [{profile_id}] {error_msg[:200]}")
+                if attempt >= self.max_retries:
+                    return None
+                # Lỗi payload/session -> refresh payload (1 lần cho cả profile) rồi thử lại
+                if not refreshed or profile["version"] != version:
+                    refreshed = True
+                    if not await self._refresh_payload(profile_id, text, version, sent_at):
+                        return None
+                if "1357004" in error_msg and not rate_governor.enabled():
+                    await self._backoff(profile_id, attempt, "Facebook Error 1357004")
+        return None
+
+    # ---------------- pagination ----------------
+    async def fetch_reactions(
+        self, fid: str, profile_id: str, max_pages: Optional[int] = None, first_page: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Bản async của get_all_users_by_fid: trả về [{"id","name"}, ...]. max_pages: budget trang (crawl scheduler),
+        first_page: JSON trang đầu đã tải lúc probe (bỏ qua nếu tiếp tục từ checkpoint).
+        """
+        feedback_target_id = create_feedback_target_id(fid)
+        all_users: List[Dict[str, Any]] = []
+        seen_ids = set()
+        duplicate_count = 0
+        cursor = None
+        page_number = 1
+        checkpoint = PaginationCheckpoint("reactions", fid)
+        resume = checkpoint.load()
+        if resume:
+            all_users = resume["items"]
+            seen_ids = {user.get("id") for user in all_users}
+            cursor = resume["cursor"]
+            page_number = resume["page_number"]
+            duplicate_count = int(resume["extra"].get("duplicate_count") or 0)
+        finished = False
+        start_page = page_number
+        try:
+            while True:
+                if max_pages and page_number - start_page >= max_pages:
+                    print(f"⏳ [{profile_id}] Hết budget {max_pages} trang reactions cho {fid}, phần còn lại để phiên sau")
+                    break
+                if first_page is not None and cursor is None:
+                    response_json, first_page = first_page, None
+                else:
+                    response_json = await self.request_page(
+                        profile_id,
+                        REACTIONS_FRIENDLY_NAME,
+                        lambda payload_dict: build_reactions_payload(feedback_target_id, payload_dict, cursor),
+                    )
+                if response_json is None:
+                    break
+                try:
+                    page_users, end_cursor, has_next_page, _last_cursor, duplicate_count = process_reactors_response(
+                        response_json, all_users, seen_ids, duplicate_count
+                    )
+                except Exception as e:
+                    print(f"⚠️ Lỗi khi trích xuất nodes: {e}")
+                    break
+                all_users.extend(page_users)
+                if not has_next_page or not end_cursor:
+                    finished = True
+                    break
+                cursor = end_cursor
+                page_number += 1
+                checkpoint.update(all_users, cursor, page_number, duplicate_count=duplicate_count)
+        finally:
+            # STOP / lỗi giữa chừng -> ghi nốt checkpoint; lấy hết trang -> xoá
+            checkpoint.close(finished)
+        print(f"✅ [{profile_id}] Reactions {fid}: {len(all_users)} users / {page_number} trang (trùng: {duplicate_count})")
+        return all_users
+
+    async def fetch_comments(
+        self, post_id: str, profile_id: str, max_pages: Optional[int] = None, first_page: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Bản async của get_all_comments_by_post_id: trả về [{"id","name","text",...}, ...].
+        max_pages: budget trang, first_page: JSON trang đầu đã tải lúc probe.
+        """
+        all_users: List[Dict[str, Any]] = []
+        seen_user_ids = set()
+        cursor = None
+        page_number = 1
+        checkpoint = PaginationCheckpoint("comments", post_id)
+        resume = checkpoint.load()
+        if resume:
+            all_users = resume["items"]
+            seen_user_ids = {f"{u.get('id')}_{u.get('text')}" if u.get("text") else u.get("id") for u in all_users}
+            cursor = resume["cursor"]
+            page_number = resume["page_number"]
+        finished = False
+        start_page = page_number
+        try:
+            while True:
+                if max_pages and page_number - start_page >= max_pages:
+                    print(f"⏳ [{profile_id}] Hết budget {max_pages} trang comments cho {post_id}, phần còn lại để phiên sau")
+                    break
+                if first_page is not None and cursor is None:
+                    response_json, first_page = first_page, None
+                else:
+                    response_json = await self.request_page(
+                        profile_id,
+                        COMMENTS_FRIENDLY_NAME,
+                        lambda payload_dict: build_comments_payload(post_id, payload_dict, cursor),
+                    )
+                if response_json is None:
+                    break
+                extract_users_from_json(response_json, all_users, seen_user_ids)
+                try:
+                    _edges_count, end_cursor, _start_cursor, has_next_page = parse_comments_page_info(response_json)
+                except Exception as e:
+                    print(f"⚠️ Lỗi khi trích xuất page_info: {e}")
+                    break
+                if not has_next_page or not end_cursor:
+                    finished = True
+                    break
+                cursor = end_cursor
+                page_number += 1
+                checkpoint.update(all_users, cursor, page_number)
+        finally:
+            checkpoint.close(finished)
+        print(f"✅ [{profile_id}] Comments {post_id}: {len(all_users)} users / {page_number} trang")
+        return all_users
+
+    async def fetch_reactions_delta(
+        self,
+        fid: str,
+        profile_id: str,
+        known_ids: set,
+        known_total: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        first_page: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int], bool]:
+        """Bản async của get_new_users_by_fid: (users mới, tổng reactions Facebook báo, complete)."""
+        feedback_target_id = create_feedback_target_id(fid)
+        new_users: List[Dict[str, Any]] = []
+        seen_ids = set(known_ids or [])
+        duplicate_count = 0
+        cursor = None
+        page_number = 0
+        total = None
+        stop_reason = None
+        complete = False
+        while True:
+            if max_pages and page_number >= max_pages:
+                stop_reason = "budget"
+                break
+            if first_page is not None and page_number == 0:
+                response_json, first_page = first_page, None
+            else:
+                response_json = await self.request_page(
+                    profile_id,
+                    REACTIONS_FRIENDLY_NAME,
+                    lambda payload_dict: build_reactions_payload(feedback_target_id, payload_dict, cursor),
+                )
+            page_number += 1
+            if response_json is None:
+                break
+            try:
+                reactors = response_json.get("data", {}).get("node", {}).get("reactors", {})
+                page_users, end_cursor, has_next_page, _last_cursor, duplicate_count = process_reactors_response(
+                    response_json, new_users, seen_ids, duplicate_count
+                )
+            except Exception as e:
+                print(f"⚠️ Lỗi khi trích xuất nodes: {e}")
+                break
+            new_users.extend(page_users)
+            if page_number == 1:
+                total = engagement_state.extract_total(reactors)
+                if known_total is not None and total == known_total:
+                    stop_reason = "total_unchanged"
+                    complete = True
+                    break
+            if reactors.get("edges") and not page_users:
+                stop_reason = "known_page"
+                complete = True
+                break
+            if not has_next_page or not end_cursor:
+                complete = True
+                break
+            cursor = end_cursor
+        engagement_state.record_pages(page_number, stop_reason if complete else (stop_reason or "error"))
+        print(f"✅ [{profile_id}] Delta reactions {fid}: +{len(new_users)} users / {page_number} trang (dừng: {stop_reason or ('hết trang' if complete else 'lỗi')})")
+        return new_users, total, complete
+
+    async def fetch_comments_delta(
+        self,
+        post_id: str,
+        profile_id: str,
+        known_keys: set,
+        known_total: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        first_page: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int], bool]:
+        """Bản async của get_new_comments_by_post_id: (comments mới, tổng comments Facebook báo, complete)."""
+        new_comments: List[Dict[str, Any]] = []
+        seen_user_ids = set(known_keys or [])
+        cursor = None
+        page_number = 0
+        total = None
+        stop_reason = None
+        complete = False
+        while True:
+            if max_pages and page_number >= max_pages:
+                stop_reason = "budget"
+                break
+            if first_page is not None and page_number == 0:
+                response_json, first_page = first_page, None
+            else:
+                response_json = await self.request_page(
+                    profile_id,
+                    COMMENTS_FRIENDLY_NAME,
+                    lambda payload_dict: build_comments_payload(post_id, payload_dict, cursor),
+                )
+            page_number += 1
+            if response_json is None:
+                break
+            before = len(new_comments)
+            extract_users_from_json(response_json, new_comments, seen_user_ids)
+            try:
+                edges_count, end_cursor, _start_cursor, has_next_page = parse_comments_page_info(response_json)
+            except Exception as e:
+                print(f"⚠️ Lỗi khi trích xuất page_info: {e}")
+                break
+            if page_number == 1:
+                node = (response_json.get("data") or {}).get("node") or {}
+                comments = (node.get("comment_rendering_instance_for_feed_location") or {}).get("comments") or {}
+                total = engagement_state.extract_total(comments)
+                if known_total is not None and total == known_total:
+                    stop_reason = "total_unchanged"
+                    complete = True
+                    break
+            if edges_count and len(new_comments) == before:
+                stop_reason = "known_page"
+                complete = True
+                break
+            if not has_next_page or not end_cursor:
+                complete = True
+                break
+            cursor = end_cursor
+        engagement_state.record_pages(page_number, stop_reason if complete else (stop_reason or "error"))
+        print(f"✅ [{profile_id}] Delta comments {post_id}: +{len(new_comments)} / {page_number} trang (dừng: {stop_reason or ('hết trang' if complete else 'lỗi')})")
+        return new_comments, total, complete
+
+    async def fetch_post(
+        self,
+        post_id: str,
+        profile_id: str,
+        max_pages: Optional[int] = None,
+        first_pages: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Reactions + comments của 1 post chạy song song trên cùng event loop (first_pages: trang đầu từ probe_post)."""
+        first_pages = first_pages or {}
+        reactions, comments = await asyncio.gather(
+            self.fetch_reactions(post_id, profile_id, max_pages, first_pages.get("reactions")),
+            self.fetch_comments(post_id, profile_id, max_pages, first_pages.get("comments")),
+        )
+        return reactions, comments
+
+    async def probe_post(self, post_id: str, profile_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Trang đầu reactions + comments (crawl scheduler): ({"reactions": summary|None, "comments": summary|None},
+        {"reactions": json|None, "comments": json|None}) - JSON trang đầu chuyển cho fetch_post để không tải lại.
+        """
+        feedback_target_id = create_feedback_target_id(post_id)
+        reactions_json, comments_json = await asyncio.gather(
+            self.request_page(
+                profile_id,
+                REACTIONS_FRIENDLY_NAME,
+                lambda payload_dict: build_reactions_payload(feedback_target_id, payload_dict, None),
+            ),
+            self.request_page(
+                profile_id,
+                COMMENTS_FRIENDLY_NAME,
+                lambda payload_dict: build_comments_payload(post_id, payload_dict, None),
+            ),
+        )
+        probe = {
+            "reactions": reactions_page_summary(reactions_json) if reactions_json is not None else None,
+            "comments": comments_page_summary(comments_json) if comments_json is not None else None,
+        }
+        return probe, {"reactions": reactions_json, "comments": comments_json}
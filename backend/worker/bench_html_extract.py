@@ -0,0 +1,161 @@
+"""
+Benchmark trích post_id / owning_profile / nội dung bài từ HTML đã lưu (fixtures):
+so sánh cách cũ (tải hết body + regex trên toàn chuỗi + đếm ngoặc từng ký tự)
+với html_stream (đọc theo chunk, dừng sớm khi đủ dữ liệu).
+
+Cách dùng (từ thư mục backend):
+    python worker/bench_html_extract.py                      # mọi *.html trong data/html_fixtures
+    python worker/bench_html_extract.py a.html b.html --repeat 5 --chunk 65536
+    python worker/bench_html_extract.py --group groups/*.html  # trang group (page_id)
+
+Fixture: lưu view-source của trang bài / group khi đã đăng nhập (Ctrl+S hoặc curl kèm cookie).
+Không commit fixture vào repo (chứa dữ liệu tài khoản).
+"""
+import argparse
+import codecs
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import html_stream  # noqa: E402
+
+DEFAULT_FIXTURES_DIR = Path(__file__).resolve().parent.parent / "data" / "html_fixtures"
+
+
+def _legacy_extract_post(html_content):
+    """Bản rút gọn logic cũ của get_post_id_from_html (chỉ phần xử lý, để đo thời gian)."""
+    post_id = None
+    for pattern, flags in (
+        (r'"post_id"\s*:\s*"(\d+)"', 0),
+        (r'"post_id"\s*:\s*(\d+)', 0),
+        (r'post_id["\']?\s*:\s*["\']?(\d+)', 0),
+        (r'["\']post_id["\']\s*:\s*["\']?(\d+)', re.IGNORECASE),
+    ):
+        match = re.search(pattern, html_content, flags)
+        if match:
+            post_id = match.group(1)
+            break
+
+    owning_profile = None
+    match = re.search(r'"owning_profile"\s*:\s*\{', html_content)
+    if match:
+        start_pos = match.end()
+        brace_count = 1
+        end_pos = start_pos
+        while end_pos < len(html_content) and brace_count > 0:
+            if html_content[end_pos] == '{':
+                brace_count += 1
+            elif html_content[end_pos] == '}':
+                brace_count -= 1
+            end_pos += 1
+        if brace_count == 0:
+            block = html_content[start_pos:end_pos - 1]
+            data = {}
+            for key in ("__typename", "name", "id"):
+                m = re.search(r'"%s"\s*:\s*"([^"]+)"' % key, block)
+                if m:
+                    data[key] = m.group(1)
+            owning_profile = data if len(data) >= 2 else None
+    else:
+        re.findall(r'<script[^>]*>(.*?)</script>', html_content, re.DOTALL)
+
+    story_match = re.search(r'data-ad-rendering-role="story_message"[^>]*>(.*?)</div></div></div>', html_content, re.DOTALL)
+    content_html = story_match.group(1) if story_match else html_content[:500_000]
+    return {"post_id": post_id, "owning_profile": owning_profile, "post_text": html_stream.html_to_text(content_html)}
+
+
+def _iter_chunks(raw: bytes, chunk_size: int, counter: dict):
+    """Giả lập response.iter_content + decode như html_stream.iter_response_text."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for i in range(0, len(raw), chunk_size):
+        chunk = raw[i:i + chunk_size]
+        counter["bytes"] += len(chunk)
+        yield decoder.decode(chunk)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def bench_file(path: Path, chunk_size: int, repeat: int, group: bool) -> dict:
+    raw = path.read_bytes()
+    legacy_ms = []
+    stream_ms = []
+    legacy = streamed = None
+    counter = {"bytes": 0}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        html_content = raw.decode("utf-8", errors="replace")
+        legacy = None if group else _legacy_extract_post(html_content)
+        legacy_ms.append((time.perf_counter() - started) * 1000)
+
+        counter = {"bytes": 0}
+        started = time.perf_counter()
+        chunks = _iter_chunks(raw, chunk_size, counter)
+        streamed = html_stream.extract_group_id(chunks) if group else html_stream.extract_post_details(chunks)
+        stream_ms.append((time.perf_counter() - started) * 1000)
+
+    same = None
+    if legacy is not None:
+        same = all(legacy[k] == streamed[k] for k in ("post_id", "owning_profile", "post_text"))
+    return {
+        "file": path.name,
+        "size": len(raw),
+        "bytes_read": counter["bytes"],
+        "early_exit": streamed["early_exit"],
+        "legacy_ms": min(legacy_ms),
+        "stream_ms": min(stream_ms),
+        "same_result": same,
+        "post_id": streamed.get("post_id") or streamed.get("page_id"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark html_stream trên HTML fixtures")
+    parser.add_argument("paths", nargs="*", help="file .html hoặc thư mục (mặc định data/html_fixtures)")
+    parser.add_argument("--chunk", type=int, default=html_stream.CHUNK_SIZE, help="kích thước chunk (byte)")
+    parser.add_argument("--repeat", type=int, default=3, help="số lần chạy mỗi file (lấy thời gian nhỏ nhất)")
+    parser.add_argument("--group", action="store_true", help="fixture là trang group (trích page_id)")
+    args = parser.parse_args(argv)
+
+    files = []
+    for p in (args.paths or [str(DEFAULT_FIXTURES_DIR)]):
+        path = Path(p)
+        if not path.exists():
+            print(f"⚠️ Không tìm thấy fixture: {path}")
+            print("   Lưu view-source trang bài / group vào data/html_fixtures hoặc truyền đường dẫn file .html")
+            parser.print_usage()
+            return 1
+        files.extend(sorted(path.glob("*.html")) if path.is_dir() else [path])
+    if not files:
+        print(f"⚠️ Không có fixture HTML nào (mặc định: {DEFAULT_FIXTURES_DIR})")
+        return 1
+
+    print(f"{'file':<32} {'size':>10} {'read':>10} {'read%':>6} {'exit':>5} {'cũ ms':>8} {'stream ms':>10} {'khớp':>5}")
+    total_size = total_read = 0
+    total_legacy = total_stream = 0.0
+    for path in files:
+        r = bench_file(path, args.chunk, max(args.repeat, 1), args.group)
+        total_size += r["size"]
+        total_read += r["bytes_read"]
+        total_legacy += r["legacy_ms"]
+        total_stream += r["stream_ms"]
+        pct = r["bytes_read"] * 100.0 / r["size"] if r["size"] else 0.0
+        same = "-" if r["same_result"] is None else ("✅" if r["same_result"] else "❌")
+        print(
+            f"{r['file'][:32]:<32} {r['size']:>10} {r['bytes_read']:>10} {pct:>5.1f}% "
+            f"{'có' if r['early_exit'] else 'không':>5} {r['legacy_ms']:>8.2f} {r['stream_ms']:>10.2f} {same:>5}"
+        )
+    n = len(files)
+    print(
+        f"\n📊 {n} URL: trung bình đọc {total_read / n / 1024:.1f} KB/URL (thay vì {total_size / n / 1024:.1f} KB), "
+        f"xử lý {total_stream / n:.2f} ms/URL (cách cũ {total_legacy / n:.2f} ms/URL)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,23 @@
+import asyncio
 import json
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 from datetime import datetime
-from single_get_reactions import get_all_users_by_fid
-from single_get_comment import get_all_comments_by_post_id
+from single_get_reactions import get_all_users_by_fid, get_new_users_by_fid, get_reactions_summary
+from single_get_comment import get_all_comments_by_post_id, get_new_comments_by_post_id, get_comments_summary
+from async_graphql import AsyncGraphQLClient
 from core import control as control_state
+from core import results_journal
+from core import post_queue
+from core import processed_index
+from core import post_claims
+from core import http_pool
+from core import pagination_checkpoint
+from core import engagement_state
+from core import crawl_scheduler
 from core.paths import get_data_dir
 
 def _import_get_payload_funcs():
@@ -35,6 +48,8 @@ OUTPUT_DIR = RESULTS_DIR  # Alias cho RESULTS_DIR để tương thích
 # File all_results kèm timestamp cho mỗi lần chạy (chỉ một file duy nhất)
 RUN_TS = datetime.now().strftime("%Y%m%d_%H%M%S")
 ALL_RESULTS_FILE = OUTPUT_DIR / f"all_results_{RUN_TS}.json"
+# Journal append-only (mỗi post 1 dòng), file legacy ALL_RESULTS_FILE được compact từ journal
+ALL_RESULTS_JOURNAL = results_journal.journal_path_for(ALL_RESULTS_FILE)
 # Bộ nhớ đệm kết quả để ghi dạng summary giống all_results_summary_selected
 ALL_RESULTS_DATA = {
     "total_files": 0,
@@ -56,14 +71,15 @@ def cleanup_old_result_files(max_days: int = 3) -> int:
         return 0
 
     # Pattern để parse timestamp từ tên file: all_results_YYYYMMDD_HHMMSS.json
-    pattern = re.compile(r'all_results_(\d{8})_(\d{6})\.json$')
+    # (kèm journal .jsonl và sidecar .meta.json của cùng lần chạy)
+    pattern = re.compile(r'all_results_(\d{8})_(\d{6})(\.json|\.jsonl|\.meta\.json)$')
 
     current_time = datetime.now()
     max_age = timedelta(days=max_days)
     deleted_count = 0
 
     # Duyệt qua tất cả file trong thư mục
-    for file_path in OUTPUT_DIR.glob("*.json"):
+    for file_path in OUTPUT_DIR.glob("all_results_*"):
         if not file_path.is_file():
             continue
 
@@ -71,7 +87,7 @@ def cleanup_old_result_files(max_days: int = 3) -> int:
         if not match:
             continue
 
-        date_str, time_str = match.groups()
+        date_str, time_str, _ext = match.groups()
         try:
             # Parse thành datetime
             file_datetime = datetime.strptime(f"{date_str} {time_str}", "%Y%m%d %H%M%S")
@@ -98,7 +114,10 @@ INFO_PROGRESS = {
     "current": 0,
     "total": 0,
     "current_file": "",
+    "posts_per_minute": 0.0,
 }
+# Lock cho ALL_RESULTS_DATA / INFO_PROGRESS khi xử lý nhiều post song song
+_results_lock = threading.Lock()
 
 # Tạo thư mục output nếu chưa có
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
@@ -106,6 +125,17 @@ OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 # ====== PROFILE ID ======
 # Profile ID mặc định, có thể thay đổi
 DEFAULT_PROFILE_ID = "031ca13d-e8fa-400c-a603-df57a2806788"
+# Post phân trang dở (còn checkpoint reactions/comments) được đưa lại cuối hàng đợi tối đa bấy nhiêu lần
+# (INFO_MAX_RESUME_ATTEMPTS, giá trị này dùng khi không đọc được settings)
+DEFAULT_MAX_RESUME_ATTEMPTS = 3
+
+
+def _max_resume_attempts():
+    try:
+        from core.settings import get_settings
+        return int(get_settings().info_max_resume_attempts)
+    except Exception:
+        return DEFAULT_MAX_RESUME_ATTEMPTS
 
 
 def filter_by_owner_id(items, owner_id):
@@ -156,7 +186,160 @@ def filter_by_owner_id(items, owner_id):
     return filtered
 
 
-def process_post_id(post_data, file_name, profile_id, payload_dict, cookies):
+def _filter_owner_items(items, owning_profile_id, label):
+    """Lọc bỏ reactions/comments của owner. Trả về (items_đã_lọc, count_before_filter)."""
+    count_before = len(items)
+    if owning_profile_id:
+        items = filter_by_owner_id(items, owning_profile_id)
+        filtered_count = count_before - len(items)
+        if filtered_count > 0:
+            print(f"🚫 Đã lọc bỏ {filtered_count} {label} từ owner (ID: {owning_profile_id})")
+    return items, count_before
+
+
+def _fetch_reactions(post_id, owning_profile_id, payload_dict, profile_id, cookies, max_pages=None, first_page=None):
+    """Lấy reactions + lọc owner. Trả về (reactions, count_before_filter)."""
+    print(f"\n🔵 Bắt đầu lấy REACTIONS cho post_id: {post_id}")
+    reactions = get_all_users_by_fid(post_id, payload_dict, profile_id, cookies, max_pages=max_pages, first_page=first_page)
+    return _filter_owner_items(reactions, owning_profile_id, "reactions")
+
+
+def _fetch_comments(post_id, owning_profile_id, payload_dict, profile_id, cookies, max_pages=None, first_page=None):
+    """Lấy comments + lọc owner. Trả về (comments, count_before_filter)."""
+    print(f"\n🟢 Bắt đầu lấy COMMENTS cho post_id: {post_id}")
+    comments = get_all_comments_by_post_id(post_id, payload_dict, profile_id, cookies, max_pages=max_pages, first_page=first_page)
+    return _filter_owner_items(comments, owning_profile_id, "comments")
+
+
+def _probe_post(post_id, profile_id, payload_dict, cookies):
+    """
+    Crawl scheduler: đọc trang đầu reactions + comments để biết tổng (2 request).
+    Trả về (probe, first_pages) - first_pages là response trang đầu, chuyển cho lúc crawl để không tải lại.
+    """
+    _check_stop_pause(profile_id)
+    reactions_summary, reactions_page = get_reactions_summary(post_id, payload_dict, profile_id, cookies)
+    comments_summary, comments_page = get_comments_summary(post_id, payload_dict, profile_id, cookies)
+    probe = {"reactions": reactions_summary, "comments": comments_summary, "ts": time.time()}
+    return probe, {"reactions": reactions_page, "comments": comments_page}
+
+
+def _parse_post_data(post_data):
+    """Trả về (post_id, flag, text, owning_profile, owning_profile_id) cho cả format cũ (string) và mới (object)."""
+    if isinstance(post_data, str):
+        # Format cũ: chỉ là string post_id
+        return post_data, None, None, None, None
+    # Format mới: object với id, flag, text, owning_profile
+    owning_profile = post_data.get("owning_profile")
+    owning_profile_id = owning_profile.get("id") if owning_profile else None
+    return post_data.get("id"), post_data.get("flag"), post_data.get("text"), owning_profile, owning_profile_id
+
+
+def _delta_state(post_data, post_id):
+    """
+    Engagement state nếu post này crawl kiểu delta (post_data có "recheck" hoặc bật INFO_DELTA_RECRAWL)
+    và đã từng crawl đủ 1 lần; None -> crawl đầy đủ như cũ. post_data có "full_recrawl" thì luôn crawl đủ.
+    """
+    if not isinstance(post_data, dict) or post_data.get("full_recrawl"):
+        return None
+    if not (post_data.get("recheck") or engagement_state.delta_by_default()):
+        return None
+    return engagement_state.load(post_id)
+
+
+def _apply_delta(result, state, reactions, comments, reactions_total, comments_total, owning_profile_id, complete=True):
+    """
+    Gộp phần mới vào engagement state, kết quả post chỉ chứa phần mới (đã lọc owner).
+    complete=False (1 trong 2 fetcher dừng vì lỗi / hết budget trang trước khi tới trang đã biết / hết trang): KHÔNG đụng state
+    (tổng trang 1 mà lưu lại thì lần recheck sau dừng ngay ở "total_unchanged" và mất luôn phần chưa tải),
+    post đánh dấu lỗi để không vào processed index và lần sau được crawl lại.
+    """
+    result["mode"] = "delta"
+    if not complete:
+        result["status"] = "error"
+        result["error"] = "Delta re-crawl dừng giữa chừng (lỗi request/payload hoặc hết budget trang), giữ nguyên engagement state"
+        print(f"❌ Delta post_id {result['post_id']}: {result['error']}")
+        return
+    engagement_state.merge_delta(state, reactions, comments, reactions_total, comments_total)
+    result["reactions"], result["reactions_count_before_filter"] = _filter_owner_items(reactions, owning_profile_id, "reactions")
+    result["reactions_count"] = len(result["reactions"])
+    result["comments"], result["comments_count_before_filter"] = _filter_owner_items(comments, owning_profile_id, "comments")
+    result["comments_count"] = len(result["comments"])
+    result["reactions_total"] = reactions_total
+    result["comments_total"] = comments_total
+    print(f"🔁 Delta post_id {result['post_id']}: +{result['reactions_count']} reactions, +{result['comments_count']} comments")
+
+
+def _delta_known(state, owning_profile_id):
+    """(id user đã react, key comment đã có) của state; owner luôn tính là đã biết (kết quả cũng lọc bỏ owner)."""
+    known_reactors, known_comments = engagement_state.known_keys(state)
+    if owning_profile_id:
+        known_reactors.add(owning_profile_id)
+    return known_reactors, known_comments
+
+
+def _fetch_delta(
+    result, state, post_id, owning_profile_id, payload_dict, profile_id, cookies,
+    parallel_fetch=False, max_pages=None, first_pages=None,
+):
+    """Delta re-crawl bản đồng bộ: chỉ lấy reactions/comments mới so với lần crawl trước."""
+    known_reactors, known_comments = _delta_known(state, owning_profile_id)
+    first_pages = first_pages or {}
+    reactions_args = (
+        post_id, payload_dict, profile_id, cookies, known_reactors, state.get("reactions_total"),
+        max_pages, first_pages.get("reactions"),
+    )
+    comments_args = (
+        post_id, payload_dict, profile_id, cookies, known_comments, state.get("comments_total"),
+        max_pages, first_pages.get("comments"),
+    )
+    if parallel_fetch:
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"delta-{post_id}") as executor:
+            reactions_future = executor.submit(get_new_users_by_fid, *reactions_args)
+            comments_future = executor.submit(get_new_comments_by_post_id, *comments_args)
+            reactions, reactions_total, reactions_complete = reactions_future.result()
+            comments, comments_total, comments_complete = comments_future.result()
+    else:
+        reactions, reactions_total, reactions_complete = get_new_users_by_fid(*reactions_args)
+        comments, comments_total, comments_complete = get_new_comments_by_post_id(*comments_args)
+    _apply_delta(result, state, reactions, comments, reactions_total, comments_total, owning_profile_id,
+                 complete=reactions_complete and comments_complete)
+
+
+def _save_engagement_state(result, post_data, profile_id):
+    """Sau 1 lần crawl đủ thành công (không còn checkpoint phân trang dở): lưu state để lần sau delta."""
+    post_id = result.get("post_id")
+    if result.get("status") != "success" or result.get("mode") == "delta" or not post_id:
+        return
+    if pagination_checkpoint.exists("reactions", post_id) or pagination_checkpoint.exists("comments", post_id):
+        return
+    post = {"id": post_id}
+    if isinstance(post_data, dict):
+        post.update({k: post_data.get(k) for k in ("flag", "text", "owning_profile") if post_data.get(k) is not None})
+    try:
+        engagement_state.save_full(post_id, profile_id, post, result.get("reactions"), result.get("comments"))
+    except Exception as e:
+        print(f"⚠️ Không lưu được engagement state của post {post_id}: {e}")
+
+
+def _new_post_result(post_id, flag, text, owning_profile, file_name, profile_id):
+    return {
+        "post_id": post_id,
+        "flag": flag,
+        "text": text,
+        "owning_profile": owning_profile,
+        "source_file": file_name,
+        "profile_id": profile_id,
+        "reactions": [],
+        "comments": [],
+        "reactions_count": 0,
+        "comments_count": 0,
+        "reactions_count_before_filter": 0,
+        "comments_count_before_filter": 0,
+        "status": "success"
+    }
+
+
+def process_post_id(post_data, file_name, profile_id, payload_dict, cookies, parallel_fetch=False, max_pages=None, first_pages=None):
     """
     Xử lý một post: lấy reactions và comments
     
@@ -168,25 +351,15 @@ def process_post_id(post_data, file_name, profile_id, payload_dict, cookies):
         profile_id (str): Profile ID
         payload_dict (dict): Payload dictionary đã được load sẵn
         cookies (str): Cookie string đã được load sẵn
+        parallel_fetch (bool): Lấy reactions và comments song song (2 luồng) thay vì lần lượt
+        max_pages (int, optional): Budget trang mỗi loại (crawl scheduler), hết budget thì phiên sau lấy tiếp
+        first_pages (dict, optional): {"reactions": response, "comments": response} trang đầu đã tải lúc probe
         
     Returns:
         dict: Kết quả với reactions và comments
     """
     # Xử lý cả format cũ (string) và format mới (object)
-    if isinstance(post_data, str):
-        # Format cũ: chỉ là string post_id
-        post_id = post_data
-        flag = None
-        text = None
-        owning_profile = None
-        owning_profile_id = None
-    else:
-        # Format mới: object với id, flag, text, owning_profile
-        post_id = post_data.get("id")
-        flag = post_data.get("flag")
-        text = post_data.get("text")
-        owning_profile = post_data.get("owning_profile")
-        owning_profile_id = owning_profile.get("id") if owning_profile else None
+    post_id, flag, text, owning_profile, owning_profile_id = _parse_post_data(post_data)
     
     if not post_id:
         print(f"⚠️ Không tìm thấy post_id trong post_data")
@@ -202,54 +375,45 @@ def process_post_id(post_data, file_name, profile_id, payload_dict, cookies):
     print(f"👤 Profile ID: {profile_id}")
     print("="*70)
     
-    result = {
-        "post_id": post_id,
-        "flag": flag,
-        "text": text,
-        "owning_profile": owning_profile,
-        "source_file": file_name,
-        "profile_id": profile_id,
-        "reactions": [],
-        "comments": [],
-        "reactions_count": 0,
-        "comments_count": 0,
-        "reactions_count_before_filter": 0,
-        "comments_count_before_filter": 0,
-        "status": "success"
-    }
+    result = _new_post_result(post_id, flag, text, owning_profile, file_name, profile_id)
+    delta_state = _delta_state(post_data, post_id)
     
     try:
-        # 1. Lấy reactions
-        print(f"\n🔵 Bắt đầu lấy REACTIONS cho post_id: {post_id}")
-        reactions = get_all_users_by_fid(post_id, payload_dict, profile_id, cookies)
-        result["reactions_count_before_filter"] = len(reactions)
-        
-        # Lọc bỏ reactions từ owner
-        if owning_profile_id:
-            reactions = filter_by_owner_id(reactions, owning_profile_id)
-            filtered_count = result["reactions_count_before_filter"] - len(reactions)
-            if filtered_count > 0:
-                print(f"🚫 Đã lọc bỏ {filtered_count} reactions từ owner (ID: {owning_profile_id})")
+        fetch_args = (post_id, owning_profile_id, payload_dict, profile_id, cookies)
+        if delta_state:
+            # Xem lại post đã crawl: chỉ lấy phần engagement mới
+            _fetch_delta(result, delta_state, *fetch_args, parallel_fetch=parallel_fetch, max_pages=max_pages, first_pages=first_pages)
+            return result
+        first_pages = first_pages or {}
+        if parallel_fetch:
+            # 1 + 2. Lấy reactions và comments song song
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"post-{post_id}") as executor:
+                reactions_future = executor.submit(
+                    _fetch_reactions, *fetch_args, max_pages=max_pages, first_page=first_pages.get("reactions")
+                )
+                comments_future = executor.submit(
+                    _fetch_comments, *fetch_args, max_pages=max_pages, first_page=first_pages.get("comments")
+                )
+                reactions, result["reactions_count_before_filter"] = reactions_future.result()
+                comments, result["comments_count_before_filter"] = comments_future.result()
+        else:
+            # 1. Lấy reactions
+            reactions, result["reactions_count_before_filter"] = _fetch_reactions(
+                *fetch_args, max_pages=max_pages, first_page=first_pages.get("reactions")
+            )
+            # 2. Lấy comments
+            comments, result["comments_count_before_filter"] = _fetch_comments(
+                *fetch_args, max_pages=max_pages, first_page=first_pages.get("comments")
+            )
         
         result["reactions"] = reactions
         result["reactions_count"] = len(reactions)
         print(f"✅ Đã lấy được {result['reactions_count']} reactions (sau khi lọc)")
         
-        # 2. Lấy comments
-        print(f"\n🟢 Bắt đầu lấy COMMENTS cho post_id: {post_id}")
-        comments = get_all_comments_by_post_id(post_id, payload_dict, profile_id, cookies)
-        result["comments_count_before_filter"] = len(comments)
-        
-        # Lọc bỏ comments từ owner
-        if owning_profile_id:
-            comments = filter_by_owner_id(comments, owning_profile_id)
-            filtered_count = result["comments_count_before_filter"] - len(comments)
-            if filtered_count > 0:
-                print(f"🚫 Đã lọc bỏ {filtered_count} comments từ owner (ID: {owning_profile_id})")
-        
         result["comments"] = comments
         result["comments_count"] = len(comments)
         print(f"✅ Đã lấy được {result['comments_count']} comments (sau khi lọc)")
+        _save_engagement_state(result, post_data, profile_id)
         
     except RuntimeError as e:
         # Re-raise RuntimeError (EMERGENCY_STOP) để caller có thể dừng hoàn toàn
@@ -273,41 +437,48 @@ def process_post_id(post_data, file_name, profile_id, payload_dict, cookies):
 
 def append_to_all_results(file_name: str, result: dict):
     """
-    Append FULL result vào cấu trúc summary (results_by_file) và ghi ra all_results_<timestamp>.json NGAY LẬP TỨC.
+    Append FULL result vào cấu trúc summary (results_by_file) trong bộ nhớ và
+    append 1 dòng vào journal all_results_<timestamp>.jsonl NGAY LẬP TỨC.
+    File legacy all_results_<timestamp>.json được compact từ journal (cuối lần chạy / khi API đọc).
     """
     try:
-        # Bổ sung list cho file nếu chưa có
-        results_by_file = ALL_RESULTS_DATA.get("results_by_file", {})
-        file_list = results_by_file.get(file_name)
-        if file_list is None:
-            file_list = []
-            results_by_file[file_name] = file_list
-        file_list.append(result)
-        ALL_RESULTS_DATA["results_by_file"] = results_by_file
-
-        # Cập nhật counters
-        ALL_RESULTS_DATA["total_posts_processed"] = sum(len(v) for v in results_by_file.values())
-        ALL_RESULTS_DATA["total_reactions"] += int(result.get("reactions_count", 0) or 0)
-        ALL_RESULTS_DATA["total_comments"] += int(result.get("comments_count", 0) or 0)
-        ALL_RESULTS_DATA["total_files"] = len(results_by_file.keys())
-
-        # Cleanup file cũ quá 3 ngày trước khi ghi file mới
-        cleanup_old_result_files(3)
-
-        # Ghi file NGAY LẬP TỨC và flush để đảm bảo dữ liệu được ghi ngay
-        with ALL_RESULTS_FILE.open("w", encoding="utf-8") as f:
-            json.dump(ALL_RESULTS_DATA, f, ensure_ascii=False, indent=2)
-            f.flush()  # Đảm bảo dữ liệu được ghi ngay vào disk
-            os.fsync(f.fileno())  # Force write to disk (nếu hệ thống hỗ trợ)
-        
+        # Lock vì có thể nhiều post được xử lý song song (INFO_POST_CONCURRENCY > 1)
+        with _results_lock:
+            # Bổ sung list cho file nếu chưa có
+            results_by_file = ALL_RESULTS_DATA.get("results_by_file", {})
+            file_list = results_by_file.get(file_name)
+            if file_list is None:
+                file_list = []
+                results_by_file[file_name] = file_list
+            file_list.append(result)
+            ALL_RESULTS_DATA["results_by_file"] = results_by_file
+
+            # Cập nhật counters
+            ALL_RESULTS_DATA["total_posts_processed"] += 1
+            ALL_RESULTS_DATA["total_reactions"] += int(result.get("reactions_count", 0) or 0)
+            ALL_RESULTS_DATA["total_comments"] += int(result.get("comments_count", 0) or 0)
+            ALL_RESULTS_DATA["total_files"] = len(results_by_file.keys())
+
+        # Chỉ append 1 dòng + cập nhật sidecar counters (không ghi lại toàn bộ file)
+        results_journal.append_result(ALL_RESULTS_FILE, file_name, result)
+
         post_id = result.get("post_id", "N/A")
-        print(f"💾 Đã lưu post_id {post_id} vào {ALL_RESULTS_FILE}")
+        print(f"💾 Đã lưu post_id {post_id} vào {ALL_RESULTS_JOURNAL}")
     except Exception as e:
-        print(f"⚠️ Lỗi khi lưu vào {ALL_RESULTS_FILE}: {e}")
+        print(f"⚠️ Lỗi khi lưu vào {ALL_RESULTS_JOURNAL}: {e}")
         import traceback
         traceback.print_exc()
 
 
+def compact_all_results():
+    """Materialize all_results_<timestamp>.json (shape legacy) từ journal của lần chạy hiện tại."""
+    try:
+        if results_journal.compact(ALL_RESULTS_FILE):
+            print(f"🗜️ Đã compact journal vào {ALL_RESULTS_FILE}")
+    except Exception as e:
+        print(f"⚠️ Lỗi khi compact {ALL_RESULTS_JOURNAL}: {e}")
+
+
 def _check_stop_pause(profile_id: str | None = None):
     """Tôn trọng nút dừng / pause (global hoặc theo profile)."""
     stop, paused, reason = control_state.check_flags(profile_id)
@@ -338,96 +509,475 @@ def extract_profile_id_from_filename(file_name):
     return None
 
 
-def process_post_ids_file(file_path):
+def _load_info_tuning():
     """
-    Xử lý một file JSON chứa danh sách post_ids
-    
-    Args:
-        file_path (str | Path): Đường dẫn đến file JSON
-        
-    Returns:
-        list: Danh sách kết quả của tất cả post_ids trong file
+    Đọc cấu hình song song cho việc lấy thông tin từ settings.json:
+    (INFO_POST_CONCURRENCY, INFO_PARALLEL_FETCH, INFO_POSTS_PER_MINUTE)
     """
-    # Chuyển đổi thành Path nếu là string
-    file_path = Path(file_path) if not isinstance(file_path, Path) else file_path
-    file_name = file_path.name
-    
-    # Tự động tách profile_id từ tên file
-    profile_id = extract_profile_id_from_filename(file_name)
-    
-    if not profile_id:
-        print(f"⚠️ Không thể tách profile_id từ tên file: {file_name}")
-        print(f"   Sử dụng profile_id mặc định: {DEFAULT_PROFILE_ID}")
-        profile_id = DEFAULT_PROFILE_ID
-    else:
-        print(f"✅ Đã tách profile_id từ tên file: {profile_id}")
-    
-    print("\n" + "="*70)
-    print(f"📂 Đang xử lý file: {file_name}")
-    print(f"👤 Profile ID: {profile_id}")
-    print("="*70)
-    
     try:
-        with file_path.open("r", encoding="utf-8") as f:
-            post_ids = json.load(f)
+        from core.settings import reload_settings
+        cfg = reload_settings()
+        return max(1, int(cfg.info_post_concurrency)), bool(cfg.info_parallel_fetch), max(0, int(cfg.info_posts_per_minute))
+    except Exception as e:
+        print(f"⚠️ Không đọc được cấu hình song song, dùng mặc định: {e}")
+        return 1, False, 0
+
+
+class _OrderedOffsetCommitter:
+    """
+    Commit offset hàng đợi theo đúng thứ tự: chỉ tiến tới post liên tiếp lớn nhất đã xong,
+    để khi xử lý song song mà bị crash/stop thì không bỏ sót post đang chạy dở.
+    """
+
+    def __init__(self, queue_key, generation, offsets):
+        self.queue_key = queue_key
+        self.generation = generation
+        self.offsets = offsets
+        self._done = set()
+        self._next_idx = 0
+        self._lock = threading.Lock()
+
+    def mark_done(self, idx) -> bool:
+        with self._lock:
+            self._done.add(idx)
+            advanced_to = None
+            while self._next_idx in self._done:
+                self._done.discard(self._next_idx)
+                advanced_to = self.offsets[self._next_idx]
+                self._next_idx += 1
+            if advanced_to is None:
+                # Còn post trước đó đang chạy, sẽ commit khi nó xong
+                return True
+            return post_queue.commit_offset(self.queue_key, advanced_to, self.generation)
+
+
+class _PostRateBudget:
+    """Giới hạn số post bắt đầu mỗi phút cho 1 profile (0 = không giới hạn). Chờ bằng smart_sleep nên vẫn STOP/PAUSE được."""
+
+    def __init__(self, posts_per_minute):
+        self.interval = 60.0 / posts_per_minute if posts_per_minute and posts_per_minute > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, profile_id):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_seconds = max(0.0, self._next_at - now)
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait_seconds > 0:
+            control_state.smart_sleep(wait_seconds, profile_id)
+
+    async def async_acquire(self, profile_id):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_seconds = max(0.0, self._next_at - now)
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait_seconds > 0:
+            await control_state.async_smart_sleep(wait_seconds, profile_id)
+
+
+class _QueueRun:
+    """
+    Trạng thái xử lý hàng đợi post_ids của 1 profile: payload/cookies, commit offset theo thứ tự,
+    tiến trình, tốc độ. Dùng chung cho engine thread (process_post_ids_file) và engine asyncio.
+    """
+
+    def __init__(self, file_path):
+        file_path = Path(file_path) if not isinstance(file_path, Path) else file_path
+        self.file_path = file_path
+        self.queue_key = file_path.name.split(".", 1)[0]
+        # Giữ tên <profile_id>.json trong kết quả (source_file / results_by_file) như trước
+        self.file_name = f"{self.queue_key}.json"
+        self.profile_id = None
+        self.pending = []
+        self.payload_dict = None
+        self.cookies = None
+        self.results = []
+        self.committer = None
+        self.processed = 0
+        self.recently_processed = set()
+        self.claimed_elsewhere = set()
+        self.skipped = 0
+        # Số post đã đưa lại cuối hàng đợi (phân trang dở / scheduler hoãn)
+        self.requeued = 0
+        self.scheduler = None
+        self.probes = {}
+        # idx -> (thời điểm probe, trang đầu reactions/comments) chờ chuyển cho lúc crawl post
+        self.first_pages = {}
+        self.started_at = time.monotonic()
+
+    def open(self) -> bool:
+        """
+        Đọc phần chưa xử lý + load payload/cookies. Raise ValueError nếu hàng đợi trống,
+        trả về False nếu không lấy được payload/cookies.
+        """
+        # Tự động tách profile_id từ tên file
+        profile_id = extract_profile_id_from_filename(self.file_name)
         
-        if not isinstance(post_ids, list):
-            print(f"⚠️ File {file_name} không chứa mảng post_ids")
-            return []
+        if not profile_id:
+            print(f"⚠️ Không thể tách profile_id từ tên file: {self.file_name}")
+            print(f"   Sử dụng profile_id mặc định: {DEFAULT_PROFILE_ID}")
+            profile_id = DEFAULT_PROFILE_ID
+        else:
+            print(f"✅ Đã tách profile_id từ tên file: {profile_id}")
+        self.profile_id = profile_id
+        
+        print("\n" + "="*70)
+        print(f"📂 Đang xử lý file: {self.file_name}")
+        print(f"👤 Profile ID: {profile_id}")
+        print("="*70)
+        
+        # Chỉ đọc phần chưa xử lý (sau offset đã commit)
+        pending, generation = post_queue.read_pending(self.queue_key)
         
         # Kiểm tra nếu file trống hoặc không có dữ liệu
-        if len(post_ids) == 0:
-            print(f"⚠️ File {file_name} không có dữ liệu bài viết (file trống)")
-            raise ValueError(f"File {file_name} không có dữ liệu bài viết")
+        if len(pending) == 0:
+            print(f"⚠️ File {self.file_name} không có dữ liệu bài viết (file trống)")
+            raise ValueError(f"File {self.file_name} không có dữ liệu bài viết")
         
-        print(f"📋 Tìm thấy {len(post_ids)} post(s) trong file")
+        print(f"📋 Tìm thấy {len(pending)} post(s) trong file")
         
         # Load payload và cookies một lần cho tất cả posts
         print(f"\n🔄 Đang lấy payload và cookies từ profile_id: {profile_id}")
         # Khi bắt đầu xử lý, đảm bảo profile không bị STOP trong runtime_control
         control_state.resume_profile(profile_id)
 
-        payload_dict = get_payload_by_profile_id(profile_id)
-        if not payload_dict:
+        self.payload_dict = get_payload_by_profile_id(profile_id)
+        if not self.payload_dict:
             print(f"❌ Không thể lấy payload từ profile_id: {profile_id}")
-            return []
+            return False
         
-        cookies = get_cookies_by_profile_id(profile_id)
-        if not cookies:
+        self.cookies = get_cookies_by_profile_id(profile_id)
+        if not self.cookies:
             print(f"❌ Không thể lấy cookies từ profile_id: {profile_id}")
-            return []
-        
-        print(f"✅ Đã load payload và cookies thành công (sẽ dùng chung cho tất cả {len(post_ids)} posts)")
+            return False
         
-        results = []
-        idx = 0
-        while idx < len(post_ids):
+        print(f"✅ Đã load payload và cookies thành công (sẽ dùng chung cho tất cả {len(pending)} posts)")
+        self.pending = pending
+        # Post đã crawl trong TTL (processed index) -> bỏ qua, không tốn request/budget
+        # (trừ post được xếp lại để recheck delta: chủ ý crawl lại dù còn trong TTL)
+        self.recently_processed = processed_index.filter_processed(
+            _parse_post_data(post_data)[0] for post_data, _ in pending
+            if not (isinstance(post_data, dict) and post_data.get("recheck"))
+        )
+        if self.recently_processed:
+            print(f"⏭️ {len(self.recently_processed)} post đã crawl gần đây, sẽ bỏ qua")
+        # Claim registry: post đã thuộc profile khác (nhiều profile cùng gặp 1 bài) -> không crawl trùng
+        self.claimed_elsewhere = post_claims.claimed_elsewhere(
+            [
+                post_id for post_id in (_parse_post_data(post_data)[0] for post_data, _ in pending)
+                if post_id and post_id not in self.recently_processed
+            ],
+            profile_id,
+        )
+        if self.claimed_elsewhere:
+            print(f"👥 {len(self.claimed_elsewhere)} post đã được profile khác claim, sẽ bỏ qua")
+        self.committer = _OrderedOffsetCommitter(self.queue_key, generation, [end_offset for _, end_offset in pending])
+        self.started_at = time.monotonic()
+        return True
+
+    def _requeue(self, idx, record) -> bool:
+        """
+        Ghi ngay bản requeue của post vào cuối hàng đợi, TRƯỚC khi commit offset qua post
+        (ghi lúc finish() thì crash/STOP giữa chừng là mất post). False nếu không ghi được.
+        """
+        if not post_queue.requeue_post(self.queue_key, record, self.pending[idx][1], self.committer.generation):
+            return False
+        with _results_lock:
+            self.requeued += 1
+        return True
+
+    def drop_from_progress(self, count=1):
+        """Post không crawl ở lượt này (bỏ qua / hoãn / để phiên sau) -> bớt khỏi tổng tiến trình để thanh tiến trình về được 100%."""
+        with _results_lock:
+            INFO_PROGRESS["total"] = max(INFO_PROGRESS.get("total", 0) - count, INFO_PROGRESS.get("current", 0))
+
+    def skip_processed(self, idx, post_id) -> bool:
+        """Post đã crawl gần đây / thuộc profile khác -> commit offset qua luôn, trả về True (caller bỏ qua post)."""
+        if post_id in self.recently_processed:
+            print(f"⏭️ Bỏ qua post_id {post_id} (đã crawl gần đây)")
+            self.skipped += 1
+        elif post_id in self.claimed_elsewhere:
+            print(f"👥 Bỏ qua post_id {post_id} (profile khác đã claim)")
+        else:
+            return False
+        self.committer.mark_done(idx)
+        self.drop_from_progress()
+        return True
+
+    def _defer_incomplete(self, idx, post_id, result) -> bool:
+        """
+        Reactions/comments của post dừng giữa chừng (còn checkpoint phân trang) -> chưa lưu kết quả từng phần,
+        đưa post lại cuối hàng đợi để lượt sau tiếp tục từ cursor cuối.
+        Quá INFO_MAX_RESUME_ATTEMPTS lần: đánh dấu result là "partial" (kèm pages_fetched), xoá checkpoint, trả về False.
+        Trả về False nếu không hoãn, "requeued" nếu đã ghi bản requeue, "kept" nếu không ghi được
+        (không được commit offset qua post).
+        """
+        kinds = [kind for kind in ("reactions", "comments") if pagination_checkpoint.exists(kind, post_id)]
+        if not kinds:
+            return False
+        post_data = self.pending[idx][0] if idx < len(self.pending) else post_id
+        post_data = dict(post_data) if isinstance(post_data, dict) else {"id": post_id}
+        attempts = int(post_data.get("resume_attempts") or 0) + 1
+        max_attempts = _max_resume_attempts()
+        if attempts > max_attempts:
+            print(f"⚠️ Post_id {post_id} vẫn chưa lấy hết sau {max_attempts} lần tiếp tục, lưu kết quả từng phần")
+            if result.get("status") != "error":
+                result["status"] = "partial"
+                result["pages_fetched"] = {kind: pagination_checkpoint.pages_fetched(kind, post_id) for kind in kinds}
+            for kind in kinds:
+                pagination_checkpoint.clear(kind, post_id)
+            return False
+        post_data["resume_attempts"] = attempts
+        if not self._requeue(idx, post_data):
+            # Không commit offset: lượt sau post được đọc lại từ hàng đợi và tiếp tục từ checkpoint
+            print(f"⚠️ Không đưa lại được post_id {post_id} vào hàng đợi, giữ nguyên offset")
+            return "kept"
+        print(f"♻️ Post_id {post_id} mới lấy được một phần, sẽ tiếp tục từ checkpoint ở lượt sau (lần {attempts}/{max_attempts})")
+        return "requeued"
+
+    def schedule_candidates(self, start):
+        """
+        Crawl scheduler: các post trong cửa sổ bắt đầu từ pending[start] cần xếp hạng [{"idx","post_data","post_id","probe"}]
+        (bỏ post không có id / đã crawl gần đây / profile khác claim - vòng lặp engine tự bỏ qua như cũ).
+        Trả về (entries, end): cửa sổ gồm pending[start:end].
+        """
+        entries = []
+        for idx in range(start, len(self.pending)):
+            if len(entries) >= self.scheduler.window:
+                return entries, idx
+            post_data = self.pending[idx][0]
+            post_id = _parse_post_data(post_data)[0]
+            if not post_id or post_id in self.recently_processed or post_id in self.claimed_elsewhere:
+                continue
+            probe = crawl_scheduler.cached_probe(post_data)
+            if probe is not None:
+                self.scheduler.record_probe(cached=True)
+            entries.append({"idx": idx, "post_data": post_data, "post_id": post_id, "probe": probe})
+        return entries, len(self.pending)
+
+    def apply_schedule(self, entries, start, end):
+        """
+        Xếp hạng các post đã probe của cửa sổ pending[start:end], hoãn post không vừa budget phiên.
+        Trả về ([(idx, (post_data, end_offset))] theo thứ tự engine xử lý, end).
+        """
+        scheduled, deferred = self.scheduler.plan(entries)
+        for entry in entries:
+            self.probes[entry["idx"]] = entry["probe"]
+        for entry in deferred:
+            self.defer(entry["idx"], entry["post_id"], log=False)
+        ranked = {entry["idx"] for entry in entries}
+        ordered = [(idx, self.pending[idx]) for idx in range(start, end) if idx not in ranked]
+        ordered += [(entry["idx"], self.pending[entry["idx"]]) for entry in scheduled]
+        print(
+            f"🗓️ Scheduler {self.file_name} [{start + 1}-{end}/{len(self.pending)}]: "
+            f"crawl {len(scheduled)} post theo thứ tự ưu tiên, hoãn {len(deferred)}"
+        )
+        return ordered, end
+
+    def leave_rest(self, start):
+        """Hết budget request của phiên: pending[start:] chưa xếp hạng để nguyên trong hàng đợi cho phiên sau."""
+        left = len(self.pending) - start
+        if left > 0:
+            print(f"⏳ Hết budget request của phiên, {left} post còn lại trong {self.file_name} để phiên sau")
+            self.drop_from_progress(left)
+
+    def scheduled_items(self, concurrency):
+        """
+        Bản engine thread: lần lượt xếp hạng từng cửa sổ INFO_SCHEDULER_WINDOW post cho tới hết hàng đợi
+        hoặc hết budget request của phiên. Generator (idx, (post_data, end_offset)); STOP lúc probe thì raise.
+        """
+        start = 0
+        while start < len(self.pending) and not self.scheduler.exhausted():
+            ordered, start = self.schedule(concurrency, start)
+            yield from ordered
+        self.leave_rest(start)
+
+    async def scheduled_items_async(self, client):
+        """Bản engine asyncio của scheduled_items (probe qua client)."""
+        start = 0
+        while start < len(self.pending) and not self.scheduler.exhausted():
+            ordered, start = await self.schedule_async(client, start)
+            for item in ordered:
+                yield item
+        self.leave_rest(start)
+
+    def schedule(self, concurrency, start=0):
+        """Bản engine thread: probe song song (concurrency luồng) cửa sổ bắt đầu từ start rồi apply_schedule."""
+        entries, end = self.schedule_candidates(start)
+
+        def _probe(entry):
             try:
-                _check_stop_pause(profile_id)
+                entry["probe"], first_pages = _probe_post(entry["post_id"], self.profile_id, self.payload_dict, self.cookies)
+                self._keep_first_pages(entry["idx"], first_pages)
+                self.scheduler.record_probe(cached=False)
             except RuntimeError as stp:
-                print(f"🛑 Dừng xử lý file {file_name} do stop/pause: {stp}")
-                break
+                if "EMERGENCY_STOP" in str(stp):
+                    raise
+                print(f"⚠️ Không probe được post_id {entry['post_id']}: {stp}")
+            except Exception as e:
+                print(f"⚠️ Không probe được post_id {entry['post_id']}: {e}")
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"probe-{self.queue_key[:8]}") as executor:
+            for future in [executor.submit(_probe, entry) for entry in entries if entry["probe"] is None]:
+                future.result()
+        return self.apply_schedule(entries, start, end)
+
+    async def schedule_async(self, client, start=0):
+        """Bản engine asyncio: probe qua client.probe_post (cùng giới hạn request/profile của client)."""
+        entries, end = self.schedule_candidates(start)
+
+        async def _probe(entry):
+            try:
+                probe, first_pages = await client.probe_post(entry["post_id"], self.profile_id)
+                entry["probe"] = {**probe, "ts": time.time()}
+                self._keep_first_pages(entry["idx"], first_pages)
+                self.scheduler.record_probe(cached=False)
+            except RuntimeError as stp:
+                if "EMERGENCY_STOP" in str(stp):
+                    raise
+                print(f"⚠️ Không probe được post_id {entry['post_id']}: {stp}")
+            except Exception as e:
+                print(f"⚠️ Không probe được post_id {entry['post_id']}: {e}")
+
+        await asyncio.gather(*[_probe(entry) for entry in entries if entry["probe"] is None])
+        return self.apply_schedule(entries, start, end)
+
+    def _keep_first_pages(self, idx, first_pages):
+        with _results_lock:
+            self.first_pages[idx] = (time.monotonic(), first_pages)
+
+    def take_first_pages(self, idx):
+        """Trang đầu đã tải lúc probe của post (dùng 1 lần), None nếu không có / quá FIRST_PAGE_MAX_AGE_SECONDS."""
+        with _results_lock:
+            probed_at, first_pages = self.first_pages.pop(idx, (0.0, None))
+        if first_pages is None or time.monotonic() - probed_at > crawl_scheduler.FIRST_PAGE_MAX_AGE_SECONDS:
+            return None
+        return first_pages
+
+    def defer(self, idx, post_id, log=True):
+        """Hoãn post sang phiên sau: đưa lại cuối hàng đợi (kèm probe) và commit offset qua post."""
+        self.take_first_pages(idx)
+        self.drop_from_progress()
+        post_data = self.pending[idx][0] if idx < len(self.pending) else post_id
+        record = crawl_scheduler.CrawlScheduler.deferred_record(post_data, post_id, self.probes.get(idx))
+        if not self._requeue(idx, record):
+            # Không commit offset: post vẫn nằm trong phần chưa xử lý cho phiên sau
+            print(f"⚠️ Không hoãn được post_id {post_id} vào hàng đợi, giữ nguyên offset")
+            return
+        if log:
+            print(f"⏳ Hết budget request của phiên, hoãn post_id {post_id} sang phiên sau")
+        self.committer.mark_done(idx)
 
-            post_data = post_ids[idx]
-            # Xử lý cả format cũ (string) và format mới (object)
-            if isinstance(post_data, str):
-                post_id = post_data
+    def record(self, idx, post_id, result):
+        """Lưu kết quả 1 post (journal), cập nhật tiến trình và commit offset."""
+        deferred = self._defer_incomplete(idx, post_id, result) if result else False
+        # Xử lý kết quả thành công
+        if result and not deferred:
+            # Append full result vào journal all_results_<timestamp>.jsonl
+            append_to_all_results(self.file_name, result)
+            # Đánh dấu đã crawl (cả id Graph API gốc nếu producer có ghi source_id)
+            post_data = self.pending[idx][0] if idx < len(self.pending) else None
+            source_id = post_data.get("source_id") if isinstance(post_data, dict) else None
+            if result.get("status") == "error":
+                # Không đánh dấu processed: post lỗi phải còn được crawl lại (bởi profile này hoặc profile khác)
+                print(f"⚠️ Post_id {post_id} lỗi: {result.get('error')}")
+            elif result.get("status") == "partial":
+                # Kết quả bị cắt: không đánh dấu processed để lần sau gặp lại post thì crawl lại đầy đủ
+                print(f"⚠️ Post_id {post_id} chỉ lấy được một phần ({result.get('pages_fetched')} trang)")
             else:
-                post_id = post_data.get("id")
-            
-            if not post_id:
-                print(f"⚠️ [{idx+1}/{len(post_ids)}] Bỏ qua item không có post_id: {post_data}")
-                idx += 1
-                continue
-            
+                processed_index.mark_processed([result.get("post_id") or post_id, source_id])
+                print(f"✅ Đã xử lý thành công post_id {post_id}")
+        elif not deferred:
+            # Nếu không có result (lỗi) thì vẫn cập nhật tiến trình
+            print(f"⚠️ Post_id {post_id} xử lý không thành công (lỗi hoặc không có dữ liệu)")
+        if not deferred and (not result or result.get("status") == "error"):
+            # Crawl lỗi: trả claim để profile khác (đã bỏ qua post vì claimed_elsewhere) claim lại được,
+            # không thì post bị mất tới khi claim hết hạn (POST_CLAIM_TTL_HOURS)
+            post_claims.release([post_id], self.profile_id)
+
+        # Cập nhật tiến trình + tốc độ (post/phút)
+        with _results_lock:
+            if result and not deferred:
+                self.results.append(result)
+            INFO_PROGRESS["current"] += 1
+            self.processed += 1
+            elapsed = time.monotonic() - self.started_at
+            INFO_PROGRESS["posts_per_minute"] = round(self.processed * 60.0 / elapsed, 2) if elapsed > 0 else 0.0
+
+        # LUÔN commit offset qua post đã xử lý (dù thành công hay lỗi)
+        # để tránh hàng đợi bị kẹt với các post lỗi (chỉ ghi file offset, không ghi lại hàng đợi);
+        # riêng post hoãn mà chưa ghi được bản requeue thì giữ offset để lượt sau đọc lại
+        if deferred == "kept":
+            return
+        if self.committer.mark_done(idx):
+            print(f"🗑️ Đã đánh dấu xử lý xong post_id {post_id} trong {self.file_name}")
+        else:
+            print(f"⚠️ Không thể commit offset cho post_id {post_id} trong {self.file_name}")
+
+    def finish(self, finished):
+        elapsed = time.monotonic() - self.started_at
+        if self.requeued:
+            print(f"♻️ Đã đưa lại {self.requeued} post (phân trang dở / hoãn) vào hàng đợi {self.file_name}")
+        if self.scheduler is not None:
+            stats = self.scheduler.finish()
+            print(
+                f"🗓️ Scheduler {self.file_name}: {stats['requests_used']}/{stats['session_budget'] or '∞'} request, "
+                f"crawl {stats['scheduled']} post, hoãn {stats['deferred']} post"
+            )
+        if self.skipped:
+            processed_index.record_saved("info_queue", self.skipped)
+        if self.processed:
+            print(f"📈 {self.file_name}: {self.processed} post trong {elapsed:.1f}s (~{self.processed * 60.0 / max(elapsed, 1e-6):.1f} post/phút)")
+            pool_stats = http_pool.get_pool_stats()
+            print(f"🔌 HTTP pool: {pool_stats['requests_sent']} request / {pool_stats['connections_opened']} kết nối (~{pool_stats['requests_per_connection']} request/kết nối)")
+
+        # Hết lượt -> thu gọn log một lần (bỏ phần đã xử lý)
+        if finished:
+            post_queue.compact_queue(self.queue_key)
+
+
+def process_post_ids_file(file_path):
+    """
+    Xử lý hàng đợi post_ids của một profile (data/post_ids/<profile_id>.jsonl,
+    file <profile_id>.json cũ sẽ được tự động chuyển sang hàng đợi)
+    
+    Args:
+        file_path (str | Path): Đường dẫn đến file hàng đợi (.jsonl) hoặc file JSON cũ
+        
+    Returns:
+        list: Danh sách kết quả của tất cả post_ids trong file
+    """
+    run = _QueueRun(file_path)
+    file_name = run.file_name
+    
+    try:
+        if not run.open():
+            return []
+        profile_id = run.profile_id
+        pending = run.pending
+        
+        concurrency, parallel_fetch, posts_per_minute = _load_info_tuning()
+        print(f"⚙️ Song song: {concurrency} post/lần | reactions+comments song song: {parallel_fetch} | giới hạn: {posts_per_minute or '∞'} post/phút")
+
+        budget = _PostRateBudget(posts_per_minute)
+
+        def _run_post(idx, post_data, post_id):
             print(f"\n{'='*70}")
-            print(f"📌 [{idx+1}/{len(post_ids)}] Xử lý Post ID: {post_id}")
+            print(f"📌 [{idx+1}/{len(pending)}] Xử lý Post ID: {post_id}")
             print(f"{'='*70}")
             
             try:
-                result = process_post_id(post_data, file_name, profile_id, payload_dict, cookies)
+                result = process_post_id(
+                    post_data, file_name, profile_id, run.payload_dict, run.cookies,
+                    parallel_fetch=parallel_fetch, max_pages=max_pages, first_pages=run.take_first_pages(idx),
+                )
             except RuntimeError as stp:
-                # Nếu là EMERGENCY_STOP thì dừng ngay
+                # Nếu là EMERGENCY_STOP thì dừng ngay (KHÔNG commit offset -> lần sau xử lý lại post này)
                 if "EMERGENCY_STOP" in str(stp):
                     print(f"🛑 Dừng xử lý file {file_name} do stop: {stp}")
                     raise  # Re-raise để caller có thể catch và break
@@ -435,34 +985,76 @@ def process_post_ids_file(file_path):
                 print(f"❌ Lỗi RuntimeError khi xử lý post_id {post_id}: {stp}")
                 result = None
             
-            # Xử lý kết quả thành công
-            if result:
-                results.append(result)
-                
-                # Append full result vào all_results_<timestamp>.json (summary-style)
-                append_to_all_results(file_name, result)
-
-                # Cập nhật tiến trình
-                INFO_PROGRESS["current"] += 1
-                print(f"✅ Đã xử lý thành công post_id {post_id}")
-            else:
-                # Nếu không có result (lỗi) thì vẫn cập nhật tiến trình
-                print(f"⚠️ Post_id {post_id} xử lý không thành công (lỗi hoặc không có dữ liệu)")
-                INFO_PROGRESS["current"] += 1
+            run.record(idx, post_id, result)
 
-            # LUÔN XÓA post_id đã xử lý khỏi file nguồn (dù thành công hay lỗi)
-            # để tránh file bị kẹt với các post lỗi
-            post_ids.pop(idx)
-            try:
-                with file_path.open("w", encoding="utf-8") as f:
-                    json.dump(post_ids, f, ensure_ascii=False, indent=2)
-                print(f"🗑️ Đã xóa post_id {post_id} khỏi {file_name}")
-            except Exception as e:
-                print(f"⚠️ Không thể ghi lại file {file_name} sau khi xóa post_id: {e}")
-            # không tăng idx vì đã pop, danh sách đã dịch sang trái
-            continue
+        finished = True
+        stop_error = None
+        max_pages = None
+        items = iter(enumerate(pending))
+        if crawl_scheduler.enabled():
+            run.scheduler = crawl_scheduler.CrawlScheduler(profile_id)
+            max_pages = run.scheduler.max_pages
+            items = run.scheduled_items(concurrency)
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"info-{run.queue_key[:8]}") as executor:
+            in_flight = {}
+            while True:
+                # Nạp thêm post cho tới khi đủ số luồng song song
+                while finished and stop_error is None and len(in_flight) < concurrency:
+                    try:
+                        idx, (post_data, _end_offset) = next(items)
+                    except StopIteration:
+                        break
+                    except RuntimeError as stp:
+                        # Scheduler probe cửa sổ kế tiếp gặp STOP
+                        if "EMERGENCY_STOP" not in str(stp):
+                            raise
+                        print(f"🛑 Dừng xử lý file {file_name} do stop khi probe: {stp}")
+                        stop_error = stp
+                        break
+                    post_id = _parse_post_data(post_data)[0]
+                    
+                    if not post_id:
+                        print(f"⚠️ [{idx+1}/{len(pending)}] Bỏ qua item không có post_id: {post_data}")
+                        run.committer.mark_done(idx)
+                        run.drop_from_progress()
+                        continue
+                    if run.skip_processed(idx, post_id):
+                        continue
+                    if run.scheduler is not None and run.scheduler.exhausted():
+                        run.defer(idx, post_id)
+                        continue
+
+                    try:
+                        _check_stop_pause(profile_id)
+                        budget.acquire(profile_id)
+                    except RuntimeError as stp:
+                        print(f"🛑 Dừng xử lý file {file_name} do stop/pause: {stp}")
+                        finished = False
+                        break
+
+                    in_flight[executor.submit(_run_post, idx, post_data, post_id)] = idx
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.pop(future, None)
+                    try:
+                        future.result()
+                    except RuntimeError as stp:
+                        if "EMERGENCY_STOP" in str(stp):
+                            stop_error = stp
+                        else:
+                            print(f"❌ Lỗi khi xử lý post: {stp}")
+                    except Exception as e:
+                        print(f"❌ Lỗi khi xử lý post: {e}")
+
+        run.finish(finished and stop_error is None)
+        if stop_error is not None:
+            raise stop_error
         
-        return results
+        return run.results
         
     except ValueError as e:
         # Re-raise ValueError để caller có thể catch và xử lý
@@ -483,6 +1075,191 @@ def process_post_ids_file(file_path):
         return []
 
 
+async def process_post_id_async(client, post_data, file_name, profile_id, max_pages=None, first_pages=None):
+    """
+    Bản asyncio của process_post_id: reactions + comments phân trang trên event loop
+    qua AsyncGraphQLClient (payload/cookies đã register theo profile). first_pages: JSON trang đầu từ probe.
+    """
+    post_id, flag, text, owning_profile, owning_profile_id = _parse_post_data(post_data)
+    if not post_id:
+        print(f"⚠️ Không tìm thấy post_id trong post_data")
+        return None
+    
+    print(f"📌 [{profile_id}] Xử lý Post ID: {post_id} (file: {file_name})")
+    result = _new_post_result(post_id, flag, text, owning_profile, file_name, profile_id)
+    delta_state = _delta_state(post_data, post_id)
+    
+    try:
+        if delta_state:
+            known_reactors, known_comments = _delta_known(delta_state, owning_profile_id)
+            (reactions, reactions_total, reactions_complete), (comments, comments_total, comments_complete) = await asyncio.gather(
+                client.fetch_reactions_delta(
+                    post_id, profile_id, known_reactors, delta_state.get("reactions_total"),
+                    max_pages, (first_pages or {}).get("reactions"),
+                ),
+                client.fetch_comments_delta(
+                    post_id, profile_id, known_comments, delta_state.get("comments_total"),
+                    max_pages, (first_pages or {}).get("comments"),
+                ),
+            )
+            _apply_delta(result, delta_state, reactions, comments, reactions_total, comments_total, owning_profile_id,
+                         complete=reactions_complete and comments_complete)
+            return result
+        reactions, comments = await client.fetch_post(post_id, profile_id, max_pages, first_pages)
+        result["reactions"], result["reactions_count_before_filter"] = _filter_owner_items(reactions, owning_profile_id, "reactions")
+        result["reactions_count"] = len(result["reactions"])
+        result["comments"], result["comments_count_before_filter"] = _filter_owner_items(comments, owning_profile_id, "comments")
+        result["comments_count"] = len(result["comments"])
+        print(f"✅ [{profile_id}] {post_id}: {result['reactions_count']} reactions, {result['comments_count']} comments (sau khi lọc)")
+        _save_engagement_state(result, post_data, profile_id)
+    except RuntimeError as e:
+        # Re-raise RuntimeError (EMERGENCY_STOP) để caller có thể dừng hoàn toàn
+        if "EMERGENCY_STOP" in str(e):
+            raise
+        print(f"❌ Lỗi khi xử lý post_id {post_id}: {e}")
+        result["status"] = "error"
+        result["error"] = str(e)
+    except Exception as e:
+        print(f"❌ Lỗi khi xử lý post_id {post_id}: {e}")
+        import traceback
+        traceback.print_exc()
+        result["status"] = "error"
+        result["error"] = str(e)
+    
+    return result
+
+
+def _load_async_tuning():
+    """(INFO_ASYNC_GRAPHQL, INFO_ASYNC_REQUESTS_PER_PROFILE) từ settings.json."""
+    try:
+        from core.settings import reload_settings
+        cfg = reload_settings()
+        return bool(cfg.info_async_graphql), max(1, int(cfg.info_async_requests_per_profile))
+    except Exception as e:
+        print(f"⚠️ Không đọc được cấu hình async, dùng engine thread: {e}")
+        return False, 4
+
+
+async def _drive_queue_async(client, run, concurrency, budget):
+    """Chạy hàng đợi của 1 profile trên event loop: tối đa `concurrency` post cùng lúc."""
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    tasks = []
+    finished = True
+    max_pages = None
+    if crawl_scheduler.enabled():
+        run.scheduler = crawl_scheduler.CrawlScheduler(run.profile_id)
+        max_pages = run.scheduler.max_pages
+
+    async def _items():
+        if run.scheduler is None:
+            for item in enumerate(run.pending):
+                yield item
+            return
+        async for item in run.scheduled_items_async(client):
+            yield item
+
+    async def _run_post(idx, post_data, post_id):
+        try:
+            result = await process_post_id_async(
+                client, post_data, run.file_name, run.profile_id, max_pages, run.take_first_pages(idx)
+            )
+            # Ghi journal/offset (có fsync) trên thread phụ để không chặn event loop
+            await loop.run_in_executor(None, run.record, idx, post_id, result)
+        finally:
+            slots.release()
+
+    stop_error = None
+    try:
+        async for idx, (post_data, _end_offset) in _items():
+            if run.skip_processed(idx, _parse_post_data(post_data)[0]):
+                continue
+            if run.scheduler is not None and run.scheduler.exhausted():
+                run.defer(idx, _parse_post_data(post_data)[0])
+                continue
+            await slots.acquire()
+            try:
+                await control_state.async_wait_if_paused(run.profile_id)
+                await budget.async_acquire(run.profile_id)
+            except RuntimeError as stp:
+                print(f"🛑 Dừng xử lý file {run.file_name} do stop/pause: {stp}")
+                slots.release()
+                finished = False
+                break
+
+            post_id = _parse_post_data(post_data)[0]
+            if not post_id:
+                print(f"⚠️ [{idx+1}/{len(run.pending)}] Bỏ qua item không có post_id: {post_data}")
+                run.committer.mark_done(idx)
+                run.drop_from_progress()
+                slots.release()
+                continue
+            tasks.append(asyncio.ensure_future(_run_post(idx, post_data, post_id)))
+    except RuntimeError as stp:
+        # Scheduler probe cửa sổ kế tiếp gặp STOP: chờ các post đang chạy rồi dừng
+        if "EMERGENCY_STOP" not in str(stp):
+            raise
+        print(f"🛑 Dừng xử lý file {run.file_name} do stop khi probe: {stp}")
+        stop_error = stp
+
+    for outcome in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(outcome, RuntimeError) and "EMERGENCY_STOP" in str(outcome):
+            stop_error = stop_error or outcome
+        elif isinstance(outcome, BaseException):
+            print(f"❌ Lỗi khi xử lý post: {outcome}")
+
+    run.finish(finished and stop_error is None)
+    if stop_error is not None:
+        raise stop_error
+
+
+async def _process_queues_async(file_paths, requests_per_profile):
+    concurrency, _parallel_fetch, posts_per_minute = _load_info_tuning()
+    print(f"⚙️ Engine asyncio: {len(file_paths)} profile | {concurrency} post/lần/profile | {requests_per_profile} request đồng thời/profile | giới hạn: {posts_per_minute or '∞'} post/phút")
+
+    all_results = {}
+    runs = []
+    async with AsyncGraphQLClient(requests_per_profile=requests_per_profile) as client:
+        for file_path in file_paths:
+            run = _QueueRun(file_path)
+            all_results[run.file_name] = []
+            try:
+                if not run.open():
+                    continue
+            except ValueError as e:
+                # Nếu file trống thì bỏ qua và tiếp tục với file khác
+                if "không có dữ liệu bài viết" in str(e):
+                    print(f"⚠️ {e}")
+                    continue
+                raise
+            client.register_profile(run.profile_id, run.payload_dict, run.cookies)
+            runs.append(run)
+
+        INFO_PROGRESS["current_file"] = ", ".join(run.file_name for run in runs)
+        outcomes = await asyncio.gather(
+            *(_drive_queue_async(client, run, concurrency, _PostRateBudget(posts_per_minute)) for run in runs),
+            return_exceptions=True,
+        )
+        for run, outcome in zip(runs, outcomes):
+            all_results[run.file_name] = run.results
+            if isinstance(outcome, RuntimeError) and "EMERGENCY_STOP" in str(outcome):
+                print(f"🛑 Dừng xử lý file {run.file_name} do stop: {outcome}")
+            elif isinstance(outcome, BaseException):
+                print(f"❌ Lỗi khi xử lý file {run.file_name}: {outcome}")
+
+        stats = client.stats
+        print(f"🔌 GraphQL async: {stats['requests_sent']} request | {stats['retries']} lần retry | {stats['payload_refreshes']} lần refresh payload")
+    return all_results
+
+
+def process_post_ids_files_async(file_paths, requests_per_profile=4):
+    """
+    Xử lý hàng đợi của nhiều profile cùng lúc trên 1 event loop (không cần 1 thread / post).
+    Trả về {file_name: [results]} giống vòng lặp process_post_ids_file.
+    """
+    return asyncio.run(_process_queues_async(list(file_paths), requests_per_profile))
+
+
 def get_all_info_from_post_ids_dir():
     """
     Xử lý tất cả các file JSON trong thư mục data/post_ids/
@@ -503,7 +1280,7 @@ def get_all_info_from_post_ids_dir():
         INFO_PROGRESS["is_running"] = False
         return
     
-    json_files = list(post_ids_path.glob("*.json"))
+    json_files = [post_queue.queue_path(pid) for pid in post_queue.list_queue_profiles()]
     
     if not json_files:
         print(f"⚠️ Không tìm thấy file JSON nào trong {POST_IDS_DIR}")
@@ -512,50 +1289,64 @@ def get_all_info_from_post_ids_dir():
     
     print(f"📁 Tìm thấy {len(json_files)} file(s) JSON")
     
-    # Tính tổng số bài trước khi bắt đầu
+    # Tính tổng số bài trước khi bắt đầu (chỉ phần chưa xử lý trong hàng đợi)
     total_posts = 0
     for file_path in json_files:
         try:
-            with file_path.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    total_posts += len(data)
+            total_posts += post_queue.pending_count(file_path.name.split(".", 1)[0])
         except Exception:
             pass
     
+    # Cleanup file cũ quá 3 ngày (một lần mỗi lượt chạy, không phải mỗi post)
+    cleanup_old_result_files(3)
+
     # Khởi tạo tiến trình
     INFO_PROGRESS = {
         "is_running": True,
         "current": 0,
         "total": total_posts,
         "current_file": "",
+        "posts_per_minute": 0.0,
     }
     
     all_results = {}
     has_data = False
     
     # Xử lý từng file (mỗi file sẽ tự động extract profile_id từ tên file)
-    for file_path in json_files:
+    async_enabled, requests_per_profile = _load_async_tuning()
+    if async_enabled:
+        # Engine asyncio: tất cả profile chạy song song trên 1 event loop
         try:
             _check_stop_pause(None)
+            all_results = process_post_ids_files_async(json_files, requests_per_profile)
+            has_data = any(all_results.values())
         except RuntimeError as stp:
-            print(f"🛑 Dừng toàn bộ do stop/pause: {stp}")
-            break
-        file_name = file_path.name
-        INFO_PROGRESS["current_file"] = file_name
-        try:
-            results = process_post_ids_file(str(file_path))
-            all_results[file_name] = results
-            if results:
-                has_data = True
-        except ValueError as e:
-            # Nếu file trống thì bỏ qua và tiếp tục với file khác
-            if "không có dữ liệu bài viết" in str(e):
-                print(f"⚠️ {e}")
-                all_results[file_name] = []
-                continue
-            raise
+            print(f"🛑 Dừng do stop/pause: {stp}")
+    else:
+        for file_path in json_files:
+            try:
+                _check_stop_pause(None)
+            except RuntimeError as stp:
+                print(f"🛑 Dừng toàn bộ do stop/pause: {stp}")
+                break
+            file_name = f"{file_path.name.split('.', 1)[0]}.json"
+            INFO_PROGRESS["current_file"] = file_name
+            try:
+                results = process_post_ids_file(str(file_path))
+                all_results[file_name] = results
+                if results:
+                    has_data = True
+            except ValueError as e:
+                # Nếu file trống thì bỏ qua và tiếp tục với file khác
+                if "không có dữ liệu bài viết" in str(e):
+                    print(f"⚠️ {e}")
+                    all_results[file_name] = []
+                    continue
+                raise
     
+    # Materialize file legacy all_results_<timestamp>.json từ journal
+    compact_all_results()
+
     # Kiểm tra nếu không có file nào có dữ liệu
     if not has_data:
         INFO_PROGRESS["is_running"] = False
@@ -606,9 +1397,10 @@ def get_info_for_profile_ids(profile_ids):
 
     # Lọc file theo profile_id
     json_files = []
+    available = set(post_queue.list_queue_profiles())
     for pid in target_ids:
-        candidate = post_ids_path / f"{pid}.json"
-        if candidate.exists():
+        candidate = post_queue.queue_path(pid)
+        if pid in available:
             json_files.append(candidate)
         else:
             print(f"⚠️ Bỏ qua: không tìm thấy file post_ids cho profile_id={pid} ({candidate})")
@@ -620,48 +1412,62 @@ def get_info_for_profile_ids(profile_ids):
 
     print(f"📁 Tìm thấy {len(json_files)} file(s) JSON theo danh sách profile đã chọn.")
 
-    # Tính tổng số bài trước khi bắt đầu
+    # Tính tổng số bài trước khi bắt đầu (chỉ phần chưa xử lý trong hàng đợi)
     total_posts = 0
     for file_path in json_files:
         try:
-            with file_path.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, list):
-                    total_posts += len(data)
+            total_posts += post_queue.pending_count(file_path.name.split(".", 1)[0])
         except Exception:
             pass
 
+    # Cleanup file cũ quá 3 ngày (một lần mỗi lượt chạy, không phải mỗi post)
+    cleanup_old_result_files(3)
+
     # Khởi tạo tiến trình
     INFO_PROGRESS = {
         "is_running": True,
         "current": 0,
         "total": total_posts,
         "current_file": "",
+        "posts_per_minute": 0.0,
     }
 
     all_results = {}
     has_data = False
-    for file_path in json_files:
+    async_enabled, requests_per_profile = _load_async_tuning()
+    if async_enabled:
+        # Engine asyncio: tất cả profile chạy song song trên 1 event loop
         try:
             _check_stop_pause(None)
+            all_results = process_post_ids_files_async(json_files, requests_per_profile)
+            has_data = any(all_results.values())
         except RuntimeError as stp:
             print(f"🛑 Dừng do stop/pause: {stp}")
-            break
-        file_name = file_path.name
-        INFO_PROGRESS["current_file"] = file_name
-        try:
-            results = process_post_ids_file(str(file_path))
-            all_results[file_name] = results
-            if results:
-                has_data = True
-        except ValueError as e:
-            # Nếu file trống thì bỏ qua và tiếp tục với file khác
-            if "không có dữ liệu bài viết" in str(e):
-                print(f"⚠️ {e}")
-                all_results[file_name] = []
-                continue
-            raise
+    else:
+        for file_path in json_files:
+            try:
+                _check_stop_pause(None)
+            except RuntimeError as stp:
+                print(f"🛑 Dừng do stop/pause: {stp}")
+                break
+            file_name = f"{file_path.name.split('.', 1)[0]}.json"
+            INFO_PROGRESS["current_file"] = file_name
+            try:
+                results = process_post_ids_file(str(file_path))
+                all_results[file_name] = results
+                if results:
+                    has_data = True
+            except ValueError as e:
+                # Nếu file trống thì bỏ qua và tiếp tục với file khác
+                if "không có dữ liệu bài viết" in str(e):
+                    print(f"⚠️ {e}")
+                    all_results[file_name] = []
+                    continue
+                raise
     
+    # Materialize file legacy all_results_<timestamp>.json từ journal
+    compact_all_results()
+
     # Kiểm tra nếu không có file nào có dữ liệu
     if not has_data:
         INFO_PROGRESS["is_running"] = False
@@ -4,6 +4,23 @@ import re
 import codecs
 from urllib.parse import urlencode, urlparse, parse_qs
 
+try:
+    import html_stream
+except ImportError:
+    from worker import html_stream
+
+try:
+    from core import post_details_cache
+except Exception:
+    # Chạy trực tiếp trong worker/ khi backend chưa có trong sys.path -> không cache
+    post_details_cache = None
+
+try:
+    from core import rate_governor
+except Exception:
+    # Chạy trực tiếp trong worker/ -> không điều tốc
+    rate_governor = None
+
 # ====== LƯU Ý ======
 # Cookies và payload được lấy từ cookies.json và payload.txt thông qua profile_id
 # cookies.json có cấu trúc: {"profile_id": {"cookie": "...", "access_token": "..."}}
@@ -67,6 +84,16 @@ def get_post_id(video_url, profile_id, cookies=None):
     return post_id, owning_profile, post_text
 
 
+def _report_html_status(profile_id, status_code):
+    """Báo kết quả tải HTML cho rate_governor (429 -> giảm tốc, 200 -> tăng dần)."""
+    if rate_governor is None:
+        return
+    if status_code == 429:
+        rate_governor.report_throttle(profile_id, "html", "429")
+    elif status_code == 200:
+        rate_governor.report_success(profile_id, "html")
+
+
 def get_post_id_from_html(url, profile_id, cookies=None):
     """
     Lấy post_id và owning_profile từ HTML source của trang (view-source)
@@ -88,7 +115,7 @@ def get_post_id_from_html(url, profile_id, cookies=None):
         cookies = get_cookies_by_profile_id(profile_id)
         if not cookies:
             print(f"❌ Không thể lấy cookies từ profile_id: {profile_id}")
-            return None, None
+            return None, None, None
     
     try:
         # Tạo session để quản lý cookies tốt hơn (như trình duyệt)
@@ -121,178 +148,39 @@ def get_post_id_from_html(url, profile_id, cookies=None):
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36"
         }
         
-        # Lấy HTML source trực tiếp (view-source) với cookies
+        # Đọc HTML theo chunk (stream), dừng ngay khi đã đủ post_id + owning_profile + nội dung bài
         print(f"🌐 Lấy HTML source (view-source) trực tiếp từ: {url}")
-        response = session.get(url, headers=get_headers)
-        
-        print(f"📊 Status Code: {response.status_code}")
-        print(f"📄 Response Length: {len(response.text)} characters")
-        
-        if response.status_code != 200:
-            print(f"❌ Status code không phải 200: {response.status_code}")
-            return None, None
-        
-        html_content = response.text
-        print(f"✅ Đã lấy HTML content ({len(html_content)} ký tự)")
-        
-        # Debug: Tìm các pattern có thể có trong HTML
-        # Facebook có thể escape hoặc encode khác
-        print(f"\n🔍 Đang tìm kiếm patterns...")
-        
-        # Thử tìm post_id với nhiều pattern khác nhau
-        post_id = None
-        
-        # Pattern 1: "post_id":"123456789" (chuẩn)
-        match = re.search(r'"post_id"\s*:\s*"(\d+)"', html_content)
-        if match:
-            post_id = match.group(1)
-            print(f"✅ Tìm thấy post_id (pattern 1): {post_id}")
+        if rate_governor is not None and not rate_governor.acquire(profile_id, "html"):
+            print(f"🛑 Đã nhận yêu cầu dừng trong lúc chờ rate governor, bỏ qua: {url}")
+            return None, None, None
+        with session.get(url, headers=get_headers, stream=True) as response:
+            print(f"📊 Status Code: {response.status_code}")
+            _report_html_status(profile_id, response.status_code)
+
+            if response.status_code != 200:
+                print(f"❌ Status code không phải 200: {response.status_code}")
+                return None, None, None
+
+            details = html_stream.extract_post_details(html_stream.iter_response_text(response))
+            bytes_read = getattr(response, "_bytes_read", 0)
+
+        stop_note = "dừng sớm" if details["early_exit"] else "đọc hết trang"
+        print(f"✅ Đã đọc {bytes_read} bytes HTML ({stop_note}, {details['elapsed_ms']} ms xử lý)")
+
+        post_id = details["post_id"]
+        if post_id:
+            print(f"✅ Tìm thấy post_id: {post_id}")
         else:
-            # Pattern 2: "post_id":123456789 (không có quotes)
-            match = re.search(r'"post_id"\s*:\s*(\d+)', html_content)
-            if match:
-                post_id = match.group(1)
-                print(f"✅ Tìm thấy post_id (pattern 2): {post_id}")
-            else:
-                # Pattern 3: post_id":"123456789" (có thể escape)
-                match = re.search(r'post_id["\']?\s*:\s*["\']?(\d+)', html_content)
-                if match:
-                    post_id = match.group(1)
-                    print(f"✅ Tìm thấy post_id (pattern 3): {post_id}")
-                else:
-                    # Pattern 4: Tìm trong JSON structure
-                    # Có thể là JSON được embed trong HTML
-                    json_matches = re.findall(r'["\']post_id["\']\s*:\s*["\']?(\d+)', html_content, re.IGNORECASE)
-                    if json_matches:
-                        post_id = json_matches[0]
-                        print(f"✅ Tìm thấy post_id (pattern 4 - JSON): {post_id}")
-                    else:
-                        print(f"⚠️ Không tìm thấy post_id với bất kỳ pattern nào")
-                        # Debug: Tìm một số pattern khác để xem HTML có gì
-                        if '"post_id"' in html_content:
-                            print(f"   🔍 Tìm thấy chuỗi 'post_id' trong HTML nhưng không match pattern")
-                            # Tìm context xung quanh
-                            idx = html_content.find('"post_id"')
-                            if idx != -1:
-                                context = html_content[max(0, idx-50):min(len(html_content), idx+100)]
-                                print(f"   📋 Context: {context[:150]}...")
-                        else:
-                            print(f"   🔍 Không tìm thấy chuỗi 'post_id' trong HTML")
-        
-        # ===== TÌM OWNING_PROFILE ĐẦU TIÊN TRONG HTML =====
-        # Pattern: "owning_profile":{"__typename":"User","name":"...","id":"..."}
-        # Có thể có các field khác như "short_name" giữa các field
-        owning_profile = None
-        
-        # Tìm owning_profile với nhiều pattern khác nhau
-        
-        # Pattern 1: "owning_profile":{ (chuẩn)
-        pattern = r'"owning_profile"\s*:\s*\{'
-        match = re.search(pattern, html_content)
-        
-        if match:
-            print(f"✅ Tìm thấy 'owning_profile':{{ tại vị trí {match.start()}")
-            start_pos = match.end()
-            
-            # Tìm closing brace tương ứng (balanced braces)
-            brace_count = 1
-            end_pos = start_pos
-            while end_pos < len(html_content) and brace_count > 0:
-                if html_content[end_pos] == '{':
-                    brace_count += 1
-                elif html_content[end_pos] == '}':
-                    brace_count -= 1
-                end_pos += 1
-            
-            if brace_count == 0:
-                # Lấy nội dung bên trong braces
-                block_content = html_content[start_pos:end_pos-1]
-                print(f"   📋 Block content length: {len(block_content)} characters")
-                
-                # Tìm các field trong block này
-                owning_profile_data = {}
-                
-                # Tìm __typename
-                typename_match = re.search(r'"__typename"\s*:\s*"([^"]+)"', block_content)
-                if typename_match:
-                    owning_profile_data["__typename"] = typename_match.group(1)
-                    print(f"   ✅ Tìm thấy __typename: {typename_match.group(1)}")
-                
-                # Tìm name
-                name_match = re.search(r'"name"\s*:\s*"([^"]+)"', block_content)
-                if name_match:
-                    owning_profile_data["name"] = name_match.group(1)
-                    print(f"   ✅ Tìm thấy name: {name_match.group(1)[:50]}...")
-                
-                # Tìm id
-                id_match = re.search(r'"id"\s*:\s*"([^"]+)"', block_content)
-                if id_match:
-                    owning_profile_data["id"] = id_match.group(1)
-                    print(f"   ✅ Tìm thấy id: {id_match.group(1)}")
-                
-                # Chỉ lấy nếu có đủ ít nhất 2 trong 3 fields (__typename, name, id)
-                if len(owning_profile_data) >= 2:
-                    owning_profile = owning_profile_data
-                    print(f"✅ Đã extract owning_profile thành công")
-                else:
-                    print(f"⚠️ Không đủ fields trong owning_profile (chỉ có {len(owning_profile_data)} fields)")
-            else:
-                print(f"⚠️ Không tìm thấy closing brace tương ứng (brace_count: {brace_count})")
+            print(f"⚠️ Không tìm thấy post_id với bất kỳ pattern nào")
+
+        owning_profile = details["owning_profile"]
+        if owning_profile:
+            print(f"✅ Đã extract owning_profile thành công")
+        elif details["owning_profile_found"]:
+            print(f"⚠️ Không đủ fields trong owning_profile")
         else:
             print(f"⚠️ Không tìm thấy pattern 'owning_profile':{{")
-            # Debug: Kiểm tra xem có chuỗi owning_profile không
-            if '"owning_profile"' in html_content or "'owning_profile'" in html_content:
-                print(f"   🔍 Tìm thấy chuỗi 'owning_profile' trong HTML nhưng không match pattern")
-                # Tìm context xung quanh
-                idx = html_content.find('owning_profile')
-                if idx != -1:
-                    context = html_content[max(0, idx-50):min(len(html_content), idx+200)]
-                    print(f"   📋 Context: {context[:200]}...")
-            else:
-                print(f"   🔍 Không tìm thấy chuỗi 'owning_profile' trong HTML")
-                # Có thể HTML được minify, thử tìm trong JSON blocks
-                # Facebook thường embed JSON trong script tags
-                script_tags = re.findall(r'<script[^>]*>(.*?)</script>', html_content, re.DOTALL)
-                print(f"   🔍 Tìm thấy {len(script_tags)} script tags, đang tìm trong đó...")
-                for i, script_content in enumerate(script_tags[:5]):  # Chỉ check 5 script đầu tiên
-                    if 'owning_profile' in script_content:
-                        print(f"   ✅ Tìm thấy 'owning_profile' trong script tag #{i+1}")
-                        # Tìm trong script này
-                        match = re.search(r'"owning_profile"\s*:\s*\{', script_content)
-                        if match:
-                            print(f"      ✅ Match pattern trong script tag!")
-                            # Extract từ script content
-                            start_pos = match.end()
-                            brace_count = 1
-                            end_pos = start_pos
-                            while end_pos < len(script_content) and brace_count > 0:
-                                if script_content[end_pos] == '{':
-                                    brace_count += 1
-                                elif script_content[end_pos] == '}':
-                                    brace_count -= 1
-                                end_pos += 1
-                            
-                            if brace_count == 0:
-                                block_content = script_content[start_pos:end_pos-1]
-                                owning_profile_data = {}
-                                
-                                typename_match = re.search(r'"__typename"\s*:\s*"([^"]+)"', block_content)
-                                if typename_match:
-                                    owning_profile_data["__typename"] = typename_match.group(1)
-                                
-                                name_match = re.search(r'"name"\s*:\s*"([^"]+)"', block_content)
-                                if name_match:
-                                    owning_profile_data["name"] = name_match.group(1)
-                                
-                                id_match = re.search(r'"id"\s*:\s*"([^"]+)"', block_content)
-                                if id_match:
-                                    owning_profile_data["id"] = id_match.group(1)
-                                
-                                if len(owning_profile_data) >= 2:
-                                    owning_profile = owning_profile_data
-                                    print(f"      ✅ Đã extract owning_profile từ script tag!")
-                                    break
-        
+
         # Decode Unicode escape sequences trong owning_profile name nếu có
         if owning_profile and "name" in owning_profile:
             name = owning_profile['name']
@@ -307,44 +195,13 @@ def get_post_id_from_html(url, profile_id, cookies=None):
                     except:
                         pass
 
-        # ===== LẤY NỘI DUNG BÀI POST =====
-        post_text = None
-
-        # Ưu tiên lấy nội dung trong block story_message (nội dung bài post)
-        content_html = None
-
-        story_match = re.search(
-            r'data-ad-rendering-role="story_message"[^>]*>(.*?)</div></div></div>',
-            html_content,
-            re.DOTALL,
-        )
-        if story_match:
-            content_html = story_match.group(1)
-            print("✅ Tìm thấy block story_message để trích nội dung bài post")
-        else:
-            # Fallback: dùng một phần đầu HTML
-            content_html = html_content[:500_000]
+        # ===== NỘI DUNG BÀI POST =====
+        # Ưu tiên block story_message, không có thì fallback 500KB đầu HTML (như trước)
+        post_text = details["post_text"]
+        if not details["story_message_found"]:
             print("⚠️ Không tìm thấy block story_message, dùng fallback (500KB đầu HTML)")
 
-        # Thay <img ... alt="..."> bằng chính alt (để giữ emoji/text)
-        def _img_alt_to_text(m):
-            alt_text = m.group(1) or ""
-            return f" {alt_text} "
-
-        content_html = re.sub(
-            r'<img[^>]*alt="([^"]*)"[^>]*>',
-            _img_alt_to_text,
-            content_html,
-            flags=re.IGNORECASE,
-        )
-
-        # Bỏ toàn bộ tag HTML còn lại
-        text_raw = re.sub(r"<[^>]*>", " ", content_html)
-        # Chuẩn hóa khoảng trắng
-        text_clean = re.sub(r"\s+", " ", text_raw).strip()
-
-        if text_clean:
-            post_text = text_clean
+        if post_text:
             preview = post_text[:400] + "..." if len(post_text) > 400 else post_text
             print(f"✅ Post text (preview): {preview}")
         else:
@@ -356,7 +213,7 @@ def get_post_id_from_html(url, profile_id, cookies=None):
         print(f"❌ Lỗi khi lấy HTML source: {e}")
         import traceback
         traceback.print_exc()
-        return None, None
+        return None, None, None
 
 
 def get_page_id_from_html(url, profile_id, cookies=None):
@@ -419,73 +276,31 @@ def get_page_id_from_html(url, profile_id, cookies=None):
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36"
         }
         
-        # Lấy HTML source trực tiếp (view-source) với cookies
+        # Đọc HTML theo chunk (stream), dừng ngay khi gặp pattern group đặc hiệu nhất
         print(f"🌐 Lấy HTML source (view-source) trực tiếp từ: {url}")
-        response = session.get(url, headers=get_headers)
-        
-        if response.status_code != 200:
+        if rate_governor is not None and not rate_governor.acquire(profile_id, "html"):
             return None
+        with session.get(url, headers=get_headers, stream=True) as response:
+            _report_html_status(profile_id, response.status_code)
+            if response.status_code != 200:
+                return None
 
-        # ✅ Nếu Facebook redirect sang URL có /groups/<id> thì ưu tiên lấy luôn từ response.url
-        try:
-            m_final = re.search(r"/groups/(\d+)", str(getattr(response, "url", "") or ""))
-            if m_final:
-                return m_final.group(1)
-        except Exception:
-            pass
-        
-        html_content = response.text
-        
-        # ===== ƯU TIÊN LẤY "GROUP ID" (tránh nhặt nhầm page_id khác trong HTML) =====
-        # 1) Các pattern rất đặc hiệu cho group
-        group_specific_patterns = [
-            # page_id_type = group (ưu tiên)
-            r'"page_id"\s*:\s*"(\d+)"\s*,\s*"page_id_type"\s*:\s*"group"',
-            r'"page_id_type"\s*:\s*"group"\s*,\s*"page_id"\s*:\s*"(\d+)"',
-            # groupID/group_id
-            r'"groupID"\s*:\s*"(\d+)"',
-            r'"group_id"\s*:\s*"(\d+)"',
-        ]
-        for pat in group_specific_patterns:
-            m = re.search(pat, html_content, flags=re.IGNORECASE)
-            if m:
-                return m.group(1)
-
-        # 2) Nếu HTML có /groups/<id> thì ưu tiên ID xuất hiện nhiều nhất (tránh dính 1 ID cố định ở header)
-        try:
-            group_ids = re.findall(r"/groups/(\d+)", html_content, flags=re.IGNORECASE)
-            if group_ids:
-                # chọn ID phổ biến nhất
-                freq: dict[str, int] = {}
-                for gid in group_ids:
-                    freq[gid] = freq.get(gid, 0) + 1
-                group_ids_sorted = sorted(freq.items(), key=lambda x: x[1], reverse=True)
-                return group_ids_sorted[0][0]
-        except Exception:
-            pass
+            # ✅ Nếu Facebook redirect sang URL có /groups/<id> thì ưu tiên lấy luôn từ response.url
+            try:
+                m_final = re.search(r"/groups/(\d+)", str(getattr(response, "url", "") or ""))
+                if m_final:
+                    return m_final.group(1)
+            except Exception:
+                pass
 
-        # 3) Fallback cuối: tìm page_id nhưng chọn cái có tần suất cao nhất (đỡ nhặt "cái đầu tiên")
-        try:
-            candidates: list[str] = []
-            for pat in [
-                r'"page_id"\s*:\s*"(\d+)"',
-                r'page_id["\']\s*:\s*["\'](\d+)',
-                r'page_id=(\d+)',
-                r'data-page-id="(\d+)"',
-                r'"pageID"\s*:\s*"(\d+)"',
-            ]:
-                candidates.extend(re.findall(pat, html_content, flags=re.IGNORECASE) or [])
-            if candidates:
-                freq2: dict[str, int] = {}
-                for cid in candidates:
-                    freq2[cid] = freq2.get(cid, 0) + 1
-                cand_sorted = sorted(freq2.items(), key=lambda x: x[1], reverse=True)
-                return cand_sorted[0][0]
-        except Exception:
-            pass
+            # Thứ tự ưu tiên như trước:
+            # 1) pattern đặc hiệu cho group (page_id_type = group, groupID/group_id)
+            # 2) /groups/<id> xuất hiện nhiều nhất (tránh dính 1 ID cố định ở header)
+            # 3) page_id có tần suất cao nhất
+            details = html_stream.extract_group_id(html_stream.iter_response_text(response))
+            print(f"📊 Đã đọc {getattr(response, '_bytes_read', 0)} bytes HTML ({'dừng sớm' if details['early_exit'] else 'đọc hết trang'})")
+            return details["page_id"]
 
-        return None
-            
     except Exception:
         return None
 
@@ -511,6 +326,13 @@ def get_id_from_url(url, profile_id):
             "url_type": str ("group" hoặc "post")
         }
     """
+    # URL bài đã resolve gần đây (profile này hoặc profile khác) -> dùng cache, không tải lại HTML
+    if post_details_cache is not None and "group" not in url.lower():
+        cached = post_details_cache.get_by_url(url)
+        if cached:
+            print(f"♻️ post_id {cached['post_id']} lấy từ cache (không tải HTML)")
+            return {"page_id": None, "url_type": "post", **cached}
+
     get_cookies_by_profile_id = _import_get_cookies_by_profile_id()
     
     # Load cookies một lần duy nhất
@@ -551,6 +373,9 @@ def get_id_from_url(url, profile_id):
         result["post_id"] = post_id
         result["owning_profile"] = owning_profile
         result["post_text"] = post_text
+
+        if post_id and post_details_cache is not None:
+            post_details_cache.put(url, post_id, owning_profile, post_text)
         
         # In kết quả cuối cùng
         if post_id:
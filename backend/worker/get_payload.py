@@ -39,6 +39,26 @@ except ImportError:
         SETTINGS_JSON_FILE = config_dir / "settings.json"
         PAYLOAD_TXT_FILE = config_dir / "payload.txt"
 
+# Cache payload theo profile (TTL + refresh single-flight), None nếu không import được core
+try:
+    from core import payload_cache
+except ImportError:
+    payload_cache = None
+
+# Cấu hình profile parse sẵn trong bộ nhớ (invalidate theo mtime, ghi write-through)
+try:
+    from core.profile_config import get_repository as get_profile_config_repository
+except ImportError:
+    get_profile_config_repository = None
+
+FB_DTSG_PATTERNS = [
+    r'"name":"fb_dtsg","value":"([^"]+)"',
+    r'"token":"([^"]+)","type":"fb_dtsg"',
+    r'"fb_dtsg"\s*:\s*"([^"]+)"',
+    r'name="fb_dtsg"\s+value="([^"]+)"',
+    r'DTSGInitData.*?"token":"([^"]+)"'
+]
+
 
 def _normalize_cookie(cookie: str | None) -> str | None:
     if cookie is None:
@@ -55,6 +75,11 @@ def _read_settings_profile_config(profile_id: str) -> dict | None:
     Đọc PROFILE_IDS[profile_id] từ backend/config/settings.json.
     Trả về dict config hoặc None nếu không có.
     """
+    if get_profile_config_repository is not None:
+        try:
+            return get_profile_config_repository().get(profile_id)
+        except Exception:
+            return None
     try:
         if not SETTINGS_JSON_FILE.exists():
             return None
@@ -69,6 +94,32 @@ def _read_settings_profile_config(profile_id: str) -> dict | None:
         return None
 
 
+def _update_settings_profile_config(profile_id: str, values: dict) -> None:
+    """
+    Ghi values vào PROFILE_IDS[profile_id] trong settings.json.
+    Có repository: đưa vào hàng đợi của settings writer (gom với profile khác, flush nền), không chờ ghi xong.
+    """
+    if get_profile_config_repository is not None:
+        get_profile_config_repository().update(profile_id, values, wait=False)
+        return
+    if SETTINGS_JSON_FILE.exists():
+        with SETTINGS_JSON_FILE.open("r", encoding="utf-8") as sf:
+            sdata = json.load(sf)
+    else:
+        sdata = {}
+    profiles = sdata.get("PROFILE_IDS") or {}
+    if not isinstance(profiles, dict):
+        profiles = {}
+    profile_cfg = profiles.get(profile_id) or {}
+    if not isinstance(profile_cfg, dict):
+        profile_cfg = {}
+    profile_cfg.update(values)
+    profiles[profile_id] = profile_cfg
+    sdata["PROFILE_IDS"] = profiles
+    with SETTINGS_JSON_FILE.open("w", encoding="utf-8") as sf:
+        json.dump(sdata, sf, ensure_ascii=False, indent=2)
+
+
 def get_cookies_by_profile_id(profile_id):
     """
     Lấy cookies theo profile_id.
@@ -240,6 +291,57 @@ def get_spin_t(html):
         return None
 
 
+def _payload_cache_ttl() -> int | None:
+    """PAYLOAD_CACHE_TTL_SECONDS trong settings.json (None -> mặc định của payload_cache)."""
+    try:
+        if get_profile_config_repository is not None:
+            ttl = int(get_profile_config_repository().get_setting("PAYLOAD_CACHE_TTL_SECONDS") or 0)
+        else:
+            with SETTINGS_JSON_FILE.open("r", encoding="utf-8") as f:
+                raw = json.load(f)
+            ttl = int(raw.get("PAYLOAD_CACHE_TTL_SECONDS") or 0)
+        return ttl if ttl > 0 else None
+    except Exception:
+        return None
+
+
+def fetch_payload_values_http(cookie, timeout: int = 15):
+    """
+    Refresh nhẹ (không mở trình duyệt): GET facebook.com bằng cookie rồi regex
+    fb_dtsg / lsd / __spin_r / __spin_t từ HTML. Trả về dict hoặc None nếu không có fb_dtsg.
+    """
+    try:
+        response = requests.get("https://www.facebook.com/", headers=get_base_headers(cookie), timeout=timeout)
+        html = response.text or ""
+    except Exception as e:
+        print(f"⚠️ HTTP refresh payload lỗi: {e}")
+        return None
+
+    fb_dtsg = None
+    for pattern in FB_DTSG_PATTERNS:
+        m = re.search(pattern, html)
+        if m:
+            fb_dtsg = m.group(1)
+            break
+    if not fb_dtsg:
+        print(f"⚠️ HTTP refresh: không tìm thấy fb_dtsg trong HTML (status {response.status_code}, {len(html)} ký tự)")
+        return None
+
+    c_user = get_c_user(cookie)
+    print(f"✅ HTTP refresh: lấy được fb_dtsg {fb_dtsg[:30]}... (không cần headless)")
+    return {
+        "c_user": c_user,
+        "av": c_user,
+        "__user": c_user,
+        "fb_dtsg": fb_dtsg,
+        "jazoest": get_jazoest(fb_dtsg),
+        "lsd": get_lsd(html),
+        "spin_r": get_spin_r(html),
+        "spin_t": get_spin_t(html),
+        "_source": "http",
+    }
+
+
 def get_fb_dtsg(cookie, profile_id: str | None = None, return_page_source: bool = False):
     """
     Lấy fb_dtsg từ Facebook.com sử dụng Playwright
@@ -401,18 +503,56 @@ def capture_graphql_post_payloads(cookie_str, timeout=8):
 
 
 
+def _fill_derived_values(values, cookie):
+    """Bổ sung c_user/av/__user từ cookie và jazoest tính từ fb_dtsg nếu cache thiếu."""
+    values = dict(values)
+    c_user = values.get("c_user") or get_c_user(cookie)
+    values.setdefault("c_user", c_user)
+    values.setdefault("av", c_user)
+    values.setdefault("__user", c_user)
+    if values.get("fb_dtsg") and not values.get("jazoest"):
+        values["jazoest"] = get_jazoest(values["fb_dtsg"])
+    return values
+
+
 def get_all_payload_values(cookie, profile_id: str | None = None):
     """
     Lấy tất cả các giá trị payload từ Facebook.com
     
+    Có profile_id thì ưu tiên payload cache còn hạn (data/payload_cache.json);
+    hết hạn thì refresh single-flight: HTTP trước, headless sau.
+    
     Args:
         cookie (str): Cookie string để sử dụng
     
     Returns:
         dict: Dictionary chứa c_user, av, __user, fb_dtsg, jazoest, lsd, spin_r, spin_t hoặc None nếu lỗi
     """
-    # CHỈ DÙNG HEADLESS SELENIUM: không còn fallback bằng requests.get
+    if profile_id and payload_cache is not None:
+        cached = payload_cache.get(profile_id)
+        if cached:
+            print(f"ℹ️ Dùng payload cache cho profile_id={profile_id}")
+            return _fill_derived_values(cached, cookie)
+        values = payload_cache.refresh(
+            profile_id,
+            lambda: _collect_payload_values(cookie, profile_id),
+            ttl_seconds=_payload_cache_ttl(),
+        )
+        return _fill_derived_values(values, cookie) if values else None
+    values = _collect_payload_values(cookie, profile_id)
+    if values:
+        values.pop("_source", None)
+    return values
+
+
+def _collect_payload_values(cookie, profile_id: str | None = None):
+    """Lấy payload values thật (không qua cache): HTTP -> fb_dtsg trong settings.json -> headless capture."""
     try:
+        # Refresh nhẹ bằng HTTP trước khi mở trình duyệt
+        http_values = fetch_payload_values_http(cookie)
+        if http_values:
+            return http_values
+
         # Lấy c_user từ cookie (từ cookie string)
         c_user = get_c_user(cookie)
         if c_user:
@@ -449,22 +589,7 @@ def get_all_payload_values(cookie, profile_id: str | None = None):
                 # Persist fb_dtsg into settings.json for this profile_id if provided
                 if profile_id:
                     try:
-                        if SETTINGS_JSON_FILE.exists():
-                            with SETTINGS_JSON_FILE.open("r", encoding="utf-8") as sf:
-                                sdata = json.load(sf)
-                        else:
-                            sdata = {}
-                        profiles = sdata.get("PROFILE_IDS") or {}
-                        if not isinstance(profiles, dict):
-                            profiles = {}
-                        profile_cfg = profiles.get(profile_id) or {}
-                        if not isinstance(profile_cfg, dict):
-                            profile_cfg = {}
-                        profile_cfg["fb_dtsg"] = fb_dtsg
-                        profiles[profile_id] = profile_cfg
-                        sdata["PROFILE_IDS"] = profiles
-                        with SETTINGS_JSON_FILE.open("w", encoding="utf-8") as sf:
-                            json.dump(sdata, sf, ensure_ascii=False, indent=2)
+                        _update_settings_profile_config(profile_id, {"fb_dtsg": fb_dtsg})
                         print(f"✅ Đã ghi fb_dtsg vào {SETTINGS_JSON_FILE} cho profile_id={profile_id}")
                     except Exception as e:
                         print(f"⚠️ Không thể ghi fb_dtsg vào settings.json: {e}")
@@ -498,7 +623,8 @@ def get_all_payload_values(cookie, profile_id: str | None = None):
             "jazoest": jazoest,
             "lsd": lsd,
             "spin_r": spin_r,
-            "spin_t": spin_t
+            "spin_t": spin_t,
+            "_source": "headless" if payload else "settings",
         }
         return result
     except Exception as e:
@@ -585,7 +711,11 @@ def capture_graphql_post_payload(cookie, timeout: int = 8):
 
         try:
             page.goto("https://www.facebook.com", timeout=60000)
-            time.sleep(timeout)  # Wait for requests to be made
+            # Chờ tối đa `timeout` giây, dừng ngay khi đã bắt được POST /api/graphql/
+            # (wait_for_timeout để Playwright vẫn xử lý event request trong lúc chờ)
+            deadline = time.time() + timeout
+            while not payload_found and time.time() < deadline:
+                page.wait_for_timeout(250)
         except Exception as e:
             print(f"❌ Lỗi khi navigate: {e}")
         finally:
@@ -759,15 +889,48 @@ def update_payload_file(payload_values):
         return False
 
 
-def ensure_payload_from_bad_response(profile_id: str | None, cookie: str | None, response_text: str | None = None, timeout: int = 8):
+def ensure_payload_from_bad_response(
+    profile_id: str | None,
+    cookie: str | None,
+    response_text: str | None = None,
+    timeout: int = 8,
+    stale_since: float | None = None,
+):
     """
     Khi gặp response không phải JSON (ví dụ trả về 'for (;;);{...error...}'), cố gắng:
       - Lấy fb_dtsg, lsd từ `response_text` nếu có
-      - Nếu không, khởi động headless capture (`capture_graphql_post_payload`) để bắt postData
-      - Ghi các giá trị tìm được vào `settings.json` trong PROFILE_IDS[profile_id]
-    Trả về dict với các giá trị tìm được hoặc None nếu thất bại.
+      - Nếu không, refresh bằng HTTP, cuối cùng mới khởi động headless capture (`capture_graphql_post_payload`)
+      - Ghi các giá trị tìm được vào `settings.json` trong PROFILE_IDS[profile_id] và payload cache
+    Single-flight theo profile: nhiều worker gọi cùng lúc thì chỉ 1 worker refresh, các worker khác dùng lại kết quả.
+    - stale_since: thời điểm gửi request bị lỗi (None = lúc gọi hàm); worker khác đã refresh sau thời điểm đó
+      thì dùng lại kết quả, không capture lại
+    Trả về dict với các giá trị tìm được ({"fb_dtsg": None, "lsd": None} nếu không tìm được) hoặc None nếu lỗi.
     """
+    if profile_id and payload_cache is not None:
+        recovered = {}
+
+        def _refresher():
+            # Không tìm được giá trị nào -> None để cache không ghi đè entry bằng dict rỗng
+            recovered["values"] = values = _recover_payload_values(profile_id, cookie, response_text, timeout)
+            return values if values and (values.get("fb_dtsg") or values.get("lsd")) else None
+
+        values = payload_cache.refresh(
+            profile_id,
+            _refresher,
+            stale_since=stale_since,
+            ttl_seconds=_payload_cache_ttl(),
+        )
+        return _fill_derived_values(values, cookie or "") if values else recovered.get("values")
+    values = _recover_payload_values(profile_id, cookie, response_text, timeout)
+    if values:
+        values.pop("_source", None)
+    return values
+
+
+def _recover_payload_values(profile_id: str | None, cookie: str | None, response_text: str | None = None, timeout: int = 8):
+    """Phần xử lý thật của ensure_payload_from_bad_response (không qua cache)."""
     try:
+        source = "response"
         fb_dtsg = None
         lsd = None
 
@@ -823,8 +986,18 @@ def ensure_payload_from_bad_response(profile_id: str | None, cookie: str | None,
                     lsd = m.group(1)
                     break
 
+        # Refresh nhẹ bằng HTTP trước khi mở trình duyệt
+        http_values = None
+        if (not fb_dtsg or not lsd) and cookie:
+            http_values = fetch_payload_values_http(cookie)
+            if http_values:
+                source = "http"
+                fb_dtsg = fb_dtsg or http_values.get("fb_dtsg")
+                lsd = lsd or http_values.get("lsd")
+
         # If still not found, attempt headless capture to parse graphql postData
         if not fb_dtsg or not lsd:
+            source = "headless"
             try:
                 parsed = capture_graphql_post_payload(cookie, timeout=timeout)
                 if isinstance(parsed, dict):
@@ -838,30 +1011,23 @@ def ensure_payload_from_bad_response(profile_id: str | None, cookie: str | None,
         # Persist into settings.json if profile_id provided and we found anything
         if profile_id and (fb_dtsg or lsd):
             try:
-                if SETTINGS_JSON_FILE.exists():
-                    with SETTINGS_JSON_FILE.open("r", encoding="utf-8") as sf:
-                        sdata = json.load(sf)
-                else:
-                    sdata = {}
-                profiles = sdata.get("PROFILE_IDS") or {}
-                if not isinstance(profiles, dict):
-                    profiles = {}
-                profile_cfg = profiles.get(profile_id) or {}
-                if not isinstance(profile_cfg, dict):
-                    profile_cfg = {}
+                values = {}
                 if fb_dtsg:
-                    profile_cfg["fb_dtsg"] = fb_dtsg
+                    values["fb_dtsg"] = fb_dtsg
                 if lsd:
-                    profile_cfg["lsd"] = lsd
-                profiles[profile_id] = profile_cfg
-                sdata["PROFILE_IDS"] = profiles
-                with SETTINGS_JSON_FILE.open("w", encoding="utf-8") as sf:
-                    json.dump(sdata, sf, ensure_ascii=False, indent=2)
+                    values["lsd"] = lsd
+                _update_settings_profile_config(profile_id, values)
                 print(f"✅ Đã ghi payload values vào {SETTINGS_JSON_FILE} cho profile_id={profile_id}")
             except Exception as e:
                 print(f"⚠️ Không thể ghi vào settings.json: {e}")
 
-        result = {"fb_dtsg": fb_dtsg, "lsd": lsd}
+        if not fb_dtsg and not lsd:
+            return {"fb_dtsg": None, "lsd": None}
+        result = {"fb_dtsg": fb_dtsg, "lsd": lsd, "jazoest": get_jazoest(fb_dtsg), "_source": source}
+        if http_values:
+            for key in ("spin_r", "spin_t"):
+                if http_values.get(key):
+                    result[key] = http_values[key]
         return result
     except Exception as e:
         print(f"❌ ensure_payload_from_bad_response failed: {e}")
@@ -1,8 +1,9 @@
 import requests
 import json
 import sys
-import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
 from urllib.parse import urlparse, parse_qs
@@ -18,6 +19,21 @@ if __name__ == "__main__" or not any("core" in str(p) for p in sys.path):
         if backend_path not in sys.path:
             sys.path.insert(0, backend_path)
 
+from core import file_lock
+from core import post_queue
+from core import processed_index
+from core import post_claims
+from core import rate_governor
+from core.settings import get_settings
+
+# Graph API rate limit (code 4 = app, 17 = user): số lần chờ + thử lại 1 trang khi quét có budget token
+RATE_LIMIT_CODES = (4, 17)
+MAX_RATE_LIMIT_RETRIES = 3
+
+# Thống kê làm giàu (enrich) theo group của lần quét gần nhất: post lấy thẳng từ Graph API vs fallback HTML
+_ENRICH_STATS = {}
+_enrich_stats_lock = threading.Lock()
+
 # ====== LƯU Ý ======
 # Lấy access_token từ cookies.json thông qua profile_id
 # Sử dụng get_payload.get_access_token_by_profile_id(profile_id) để lấy access_token
@@ -47,6 +63,22 @@ def get_cookies_by_profile_id(profile_id):
     Returns:
         str: Cookie string hoặc None nếu không tìm thấy
     """
+    # Đọc từ repository cấu hình profile (cache trong bộ nhớ, không parse lại settings.json mỗi lần)
+    try:
+        from core.profile_config import get_repository
+    except ImportError:
+        get_repository = None
+    if get_repository is not None:
+        try:
+            cookie_data = get_repository().get_value(profile_id, "cookie")
+        except Exception as e:
+            print(f"❌ Lỗi khi đọc cookies từ settings.json: {e}")
+            return None
+        if cookie_data:
+            return cookie_data
+        print(f"⚠️ Không tìm thấy cookies cho profile_id: {profile_id}")
+        return None
+
     try:
         # Sử dụng get_settings_path() từ core.paths để đảm bảo đúng đường dẫn khi chạy exe
         from core.paths import get_settings_path
@@ -141,95 +173,6 @@ def convert_to_vietnam_datetime(dt_string):
         return None
 
 
-def _acquire_post_ids_lock(lock_file: Path, timeout_seconds: float = 10.0, poll: float = 0.1):
-    """
-    Lock file đơn giản (cross-platform): tạo file .lock bằng O_EXCL để chống ghi đè khi nhiều process cùng ghi.
-    """
-    start = time.time()
-    while True:
-        try:
-            fd = os.open(str(lock_file), os.O_CREAT | os.O_EXCL | os.O_RDWR)
-            return fd
-        except FileExistsError:
-            # timeout_seconds <= 0 => chờ vô hạn
-            if timeout_seconds and timeout_seconds > 0 and (time.time() - start >= timeout_seconds):
-                return None
-            time.sleep(poll)
-        except Exception:
-            return None
-
-
-def _release_post_ids_lock(fd, lock_file: Path) -> None:
-    """Release lock file"""
-    try:
-        if fd is not None:
-            try:
-                os.close(fd)
-            except Exception:
-                pass
-        try:
-            if lock_file.exists():
-                lock_file.unlink()
-        except Exception:
-            pass
-    except Exception:
-        pass
-
-
-def _save_post_ids_file_safe(post_ids_file: Path, data: list, max_retries: int = 3):
-    """
-    Lưu file post_ids JSON an toàn với lock để tránh conflict khi nhiều luồng cùng ghi.
-    Sử dụng atomic write: temp file rồi replace.
-    """
-    lock_file = post_ids_file.parent / f"{post_ids_file.name}.lock"
-    
-    for attempt in range(max_retries):
-        fd = _acquire_post_ids_lock(lock_file, timeout_seconds=10.0)
-        if fd is None:
-            if attempt < max_retries - 1:
-                print(f"⚠️ Không lấy được lock, retry {attempt + 1}/{max_retries}...")
-                time.sleep(0.5)
-                continue
-            else:
-                print(f"⚠️ Không lấy được lock sau {max_retries} lần thử, bỏ qua lưu file")
-                return
-        
-        try:
-            # Đọc lại file hiện có trong lock để đảm bảo có dữ liệu mới nhất
-            existing_data = []
-            if post_ids_file.exists():
-                try:
-                    with open(post_ids_file, 'r', encoding='utf-8') as f:
-                        existing_data = json.load(f)
-                except Exception:
-                    existing_data = []
-            
-            # Merge với dữ liệu mới (tránh trùng)
-            existing_ids = {item.get('id') for item in existing_data if item.get('id')}
-            new_items = [item for item in data if item.get('id') not in existing_ids]
-            merged_data = existing_data + new_items
-            
-            # Atomic write: temp file rồi replace
-            tmp_file = post_ids_file.parent / f"{post_ids_file.name}.tmp"
-            with open(tmp_file, 'w', encoding='utf-8') as f:
-                json.dump(merged_data, f, ensure_ascii=False, indent=2)
-                f.flush()
-                os.fsync(f.fileno())  # Force write to disk
-            
-            # Replace atomically
-            os.replace(str(tmp_file), str(post_ids_file))
-            return
-            
-        except Exception as e:
-            print(f"⚠️ Lỗi khi lưu file: {e}")
-            import traceback
-            traceback.print_exc()
-        finally:
-            _release_post_ids_lock(fd, lock_file)
-    
-    print(f"❌ Không thể lưu file sau {max_retries} lần thử")
-
-
 def parse_vietnam_datetime(date_str, is_end_of_day=False):
     """
     Parse ngày tháng năm theo múi giờ Việt Nam (UTC+7) và chuyển sang UTC
@@ -340,7 +283,7 @@ def parse_vietnam_datetime(date_str, is_end_of_day=False):
         return None, None
 
 
-def get_posts_from_page(page_id, profile_id, start_date=None, end_date=None, limit=None):
+def get_posts_from_page(page_id, profile_id, start_date=None, end_date=None, limit=None, stop_event=None, budget=None, incremental=None):
     """
     Lấy danh sách posts từ page/group qua Graph API với điều kiện lọc theo thời gian
     
@@ -350,6 +293,11 @@ def get_posts_from_page(page_id, profile_id, start_date=None, end_date=None, lim
         start_date (str, required): Ngày bắt đầu theo múi giờ Việt Nam (format: "2025-12-14" hoặc "14/12/2025")
         end_date (str, required): Ngày kết thúc theo múi giờ Việt Nam (format: "2025-12-14" hoặc "14/12/2025")
         limit (int, optional): Giới hạn số lượng posts (None = không giới hạn)
+        stop_event (threading.Event, optional): Set để dừng ngay giữa chừng (giữa các trang / các post)
+        budget (core.group_scan.TokenBudget, optional): Budget request theo access token (quét nhiều group song song);
+            có budget thì gặp code 4/17 sẽ chờ hết thời gian khoá rồi thử lại trang đó thay vì dừng
+        incremental (bool, optional): Chỉ lấy bài mới hơn watermark của group (groups.json) và dừng phân trang
+            khi gặp bài đã biết; None = theo GROUP_SCAN_INCREMENTAL, False = quét lại toàn bộ khoảng ngày
         
     Returns:
         list: Danh sách posts phù hợp điều kiện thời gian [{"id": "...", "updated_time": "..."}, ...]
@@ -399,14 +347,42 @@ def get_posts_from_page(page_id, profile_id, start_date=None, end_date=None, lim
     
     # Parameters cho request (sử dụng Unix timestamp)
     # Sử dụng feed.limit(1000) để lấy nhiều posts mỗi trang (tối đa 1000)
+    # GROUP_SCAN_GRAPH_FIELDS: lấy luôn tác giả + nội dung từ Graph API (khỏi tải HTML từng bài bằng get_id_from_url)
+    settings = get_settings()
+    graph_fields = settings.group_scan_graph_fields
+
+    # Quét tăng dần: group có watermark (bài mới nhất đã đưa vào hàng đợi lần trước) thì since = watermark,
+    # chỉ áp dụng khi khoảng ngày lần này nằm trong phần lần trước đã quét (covered_since <= start <= watermark <= end)
+    if incremental is None:
+        incremental = settings.group_scan_incremental
+    watermark = None
+    if incremental:
+        try:
+            from core.join_groups import get_group_watermark
+            watermark = get_group_watermark(profile_id, page_id)
+        except Exception as e:
+            print(f"⚠️ Không đọc được watermark của group {page_id}: {e}")
+        if watermark and not (
+            int(watermark.get("covered_since") or 0) <= int(start_timestamp)
+            <= int(watermark.get("timestamp") or 0) <= int(end_timestamp)
+        ):
+            watermark = None
+    since_timestamp = start_timestamp
+    # Các bài cùng giây với watermark đã đưa vào hàng đợi (since tính cả giây đó nên phải so thêm theo id)
+    watermark_ids = set()
+    if watermark:
+        watermark_ids = {str(i) for i in (watermark.get("post_ids") or [watermark.get("post_id")]) if i}
+        since_timestamp = str(int(watermark["timestamp"]))
+        print(f"   🔖 Watermark: {watermark.get('created_time')} (post {watermark.get('post_id')}) -> chỉ lấy bài mới hơn")
+    feed_fields = "id,created_time,message,from{id,name}" if graph_fields else "id,created_time"
     params = {
         "access_token": access_token,
-        "fields": "feed.limit(1000){id,created_time}",
+        "fields": f"feed.limit(1000){{{feed_fields}}}",
         "format": "json",
         "method": "get",
         "pretty": "0",
         "suppress_http_code": "1",
-        "since": start_timestamp,  # Unix timestamp (UTC)
+        "since": since_timestamp,  # Unix timestamp (UTC), = watermark nếu quét tăng dần
         "until": end_timestamp,     # Unix timestamp (UTC)
         "debug": "all",
         "origin_graph_explorer": "1",
@@ -443,7 +419,25 @@ def get_posts_from_page(page_id, profile_id, start_date=None, end_date=None, lim
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36"
         }
     
+    # Pipeline: trang N được làm giàu + ghi hàng đợi ở luồng riêng trong lúc tải trang N+1
+    enrich_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"pipeline-{str(page_id)[:8]}")
+    enrich_futures = []
+    rate_limit_retries = 0
+    # completed: phân trang kết thúc bình thường (hết trang / đủ limit / gặp bài đã biết) -> được tiến watermark
+    completed = False
+    limit_reached = False
+
     while True:
+        if stop_event is not None and stop_event.is_set():
+            print(f"🛑 Đã nhận yêu cầu dừng, ngừng phân trang page_id: {page_id}")
+            break
+        if budget is not None and not budget.acquire(access_token, stop_event):
+            print(f"🛑 Đã nhận yêu cầu dừng trong lúc chờ budget token, ngừng phân trang page_id: {page_id}")
+            break
+        # Có TokenBudget (quét group song song) thì budget lo rate limit theo token, không qua governor nữa
+        if budget is None and not rate_governor.acquire(profile_id, "graph_api", stop_event):
+            print(f"🛑 Đã nhận yêu cầu dừng trong lúc chờ rate governor, ngừng phân trang page_id: {page_id}")
+            break
         try:
             # Gửi request
             if next_url:
@@ -458,6 +452,8 @@ def get_posts_from_page(page_id, profile_id, start_date=None, end_date=None, lim
             page_count += 1
             print(f"\n📄 Trang {page_count}: {url[:100]}...")
             
+            if response.status_code == 429 and budget is None:
+                rate_governor.report_throttle(profile_id, "graph_api", "429")
             if response.status_code != 200:
                 print(f"❌ Lỗi: Status code {response.status_code}")
                 print(f"Response: {response.text[:500]}")
@@ -490,8 +486,25 @@ def get_posts_from_page(page_id, profile_id, start_date=None, end_date=None, lim
                     print(f"   ⚠️ Application request limit reached")
                 elif error_code == 17:
                     print(f"   ⚠️ User request limit reached")
+
+                if error_code in RATE_LIMIT_CODES and budget is None:
+                    rate_governor.report_throttle(profile_id, "graph_api", f"graph_{error_code}")
+
+                # Rate limit: khoá token theo backoff, budget.acquire ở vòng sau sẽ chờ rồi thử lại đúng trang này
+                if budget is not None and error_code in RATE_LIMIT_CODES and rate_limit_retries < MAX_RATE_LIMIT_RETRIES:
+                    rate_limit_retries += 1
+                    page_count -= 1
+                    backoff = budget.on_rate_limited(access_token, error_code)
+                    print(f"   ⏳ Token bị rate limit, chờ {backoff:.0f}s rồi thử lại (lần {rate_limit_retries}/{MAX_RATE_LIMIT_RETRIES})")
+                    continue
                 
                 break
+
+            if budget is not None:
+                budget.on_success(access_token)
+            else:
+                rate_governor.report_success(profile_id, "graph_api")
+            rate_limit_retries = 0
             
             # Lấy feed data
             feed_data = data.get("feed", {})
@@ -499,12 +512,14 @@ def get_posts_from_page(page_id, profile_id, start_date=None, end_date=None, lim
             
             if not posts:
                 print(f"   ℹ️ Không có posts nào trong trang này")
+                completed = True
                 break
             
             print(f"   📋 Tìm thấy {len(posts)} posts trong trang này")
             
             # Lọc posts theo điều kiện thời gian
-            matched_count = 0
+            page_posts = []
+            known_count = 0
             for post in posts:
                 post_id = post.get("id")
                 created_time_str = post.get("created_time")
@@ -520,21 +535,51 @@ def get_posts_from_page(page_id, profile_id, start_date=None, end_date=None, lim
                 # Kiểm tra điều kiện thời gian: start_time <= created_time <= end_time
                 # Đảm bảo created_time nằm trong khoảng [start_dt, end_dt]
                 if start_dt <= created_dt <= end_dt:
+                    # Bài đã đưa vào hàng đợi ở lần quét trước (cũ hơn watermark, hoặc cùng giây và đã có id)
+                    if watermark and (
+                        int(created_dt.timestamp()) < int(watermark["timestamp"])
+                        or (int(created_dt.timestamp()) == int(watermark["timestamp"]) and post_id in watermark_ids)
+                    ):
+                        known_count += 1
+                        continue
+
                     # Chuyển đổi sang ngày tháng năm theo múi giờ Việt Nam
                     created_time_vn = convert_to_vietnam_datetime(created_time_str)
                     
-                    all_posts.append({
+                    post_item = {
                         "id": post_id,
                         "created_time": created_time_vn if created_time_vn else created_time_str
-                    })
-                    matched_count += 1
+                    }
+                    if graph_fields:
+                        post_item["message"] = post.get("message")
+                        post_item["from"] = post.get("from")
+                    page_posts.append((post_item, (created_dt, created_time_str, post_id)))
             
-            print(f"   ✅ Có {matched_count} posts phù hợp điều kiện trong trang này")
+            print(f"   ✅ Có {len(page_posts)} posts phù hợp điều kiện trong trang này")
+
+            if limit:
+                page_posts = page_posts[:max(limit - len(all_posts), 0)]
+            all_posts.extend(post_item for post_item, _ in page_posts)
+            if page_posts:
+                # Giữ (created_dt, created_time, id) của các bài gửi đi làm giàu: watermark chỉ tiến theo bài đã vào hàng đợi
+                enrich_futures.append((
+                    enrich_executor.submit(
+                        _enrich_and_queue, page_id, profile_id, [post_item for post_item, _ in page_posts], stop_event, settings
+                    ),
+                    [key for _, key in page_posts],
+                ))
             
             # Kiểm tra limit
             if limit and len(all_posts) >= limit:
                 print(f"   ⏹️ Đã đạt giới hạn {limit} posts")
-                all_posts = all_posts[:limit]
+                completed = True
+                limit_reached = True
+                break
+
+            # Feed trả bài mới trước: gặp bài đã biết thì các trang sau đều là bài cũ hơn watermark
+            if known_count:
+                print(f"   🔖 Gặp {known_count} bài đã quét lần trước -> dừng phân trang")
+                completed = True
                 break
             
             # Kiểm tra pagination
@@ -543,6 +588,7 @@ def get_posts_from_page(page_id, profile_id, start_date=None, end_date=None, lim
                 next_url = paging["next"]
             else:
                 print(f"   ℹ️ Không còn trang tiếp theo")
+                completed = True
                 break
                 
         except requests.exceptions.Timeout as e:
@@ -566,110 +612,288 @@ def get_posts_from_page(page_id, profile_id, start_date=None, end_date=None, lim
     
     print(f"\n✅ Hoàn thành! Tổng cộng lấy được {len(all_posts)} posts phù hợp điều kiện")
 
-    # Tự động gọi get_id.py cho từng post_id và lưu kết quả
-    if all_posts:
-        print(f"\n🔍 Bắt đầu lấy chi tiết cho {len(all_posts)} posts...")
-
-        # Import function từ get_id.py
-        try:
-            from get_id import get_id_from_url
-            print("✅ Đã import get_id_from_url thành công")
-        except ImportError as e:
-            print(f"❌ Không thể import get_id_from_url từ get_id.py: {e}")
-            return all_posts
+    # Chờ phần làm giàu của các trang (đã chạy song song với phân trang) rồi gộp thống kê
+    stats = {"candidates": 0, "from_graph": 0, "html_fallback": 0, "html_failed": 0, "skipped_after_resolve": 0}
+    saved_count = 0
+    scanned = []  # (created_dt, created_time gốc, post_id) các bài đã gửi đi làm giàu
+    not_queued = []  # ... các bài làm giàu lỗi / chưa ghi được vào hàng đợi
+    try:
+        for future, page_keys in enrich_futures:
+            scanned.extend(page_keys)
+            try:
+                page_stats, page_saved, failed_ids = future.result()
+            except Exception as e:
+                print(f"❌ Lỗi khi làm giàu posts của page_id {page_id}: {e}")
+                not_queued.extend(page_keys)
+                continue
+            for key in stats:
+                stats[key] += page_stats.get(key, 0)
+            saved_count += page_saved
+            not_queued.extend(key for key in page_keys if key[2] in failed_ids)
+    finally:
+        enrich_executor.shutdown(wait=True)
+
+    if enrich_futures:
+        _record_enrich_stats(page_id, stats)
+    if saved_count:
+        processed_index.record_saved("page_scan", saved_count)
+        print(f"\n⏭️ Bỏ qua {saved_count} posts đã crawl gần đây (processed index)")
+
+    # Tiến watermark khi lượt quét không bị dừng giữa chừng (dừng / lỗi thì lần sau quét lại phần còn thiếu)
+    if completed and not (stop_event is not None and stop_event.is_set()):
+        _advance_watermark(profile_id, page_id, watermark, watermark_ids, scanned, not_queued, limit_reached, start_timestamp)
 
-        # Tạo thư mục lưu trữ nếu chưa có (dùng get_data_dir để đúng cả khi chạy .exe)
-        try:
-            from core.paths import get_data_dir
-            post_ids_dir = get_data_dir() / "post_ids"
-        except ImportError:
-            # Fallback nếu không import được core.paths
-            current_file = Path(__file__).resolve()
-            backend_dir = current_file.parent.parent
-            post_ids_dir = backend_dir / "data" / "post_ids"
-        post_ids_dir.mkdir(parents=True, exist_ok=True)
+    return all_posts
 
-        # File để lưu kết quả cho profile này
-        post_ids_file = post_ids_dir / f"{profile_id}.json"
-        print(f"📁 Sẽ lưu vào file: {post_ids_file}")
 
-        # Load dữ liệu hiện có (nếu file đã tồn tại)
-        existing_data = []
-        if post_ids_file.exists():
-            try:
-                with open(post_ids_file, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                print(f"📂 Đã load {len(existing_data)} posts hiện có từ {post_ids_file}")
-            except Exception as e:
-                print(f"⚠️ Không thể đọc file hiện có: {e}")
+def _advance_watermark(profile_id, page_id, watermark, watermark_ids, scanned, not_queued, limit_reached, start_timestamp):
+    """
+    Tiến watermark của group theo các bài đã vào hàng đợi (scanned trừ not_queued):
+    - Bài làm giàu lỗi không được nằm dưới watermark: watermark dừng ở bài đã vào hàng đợi mới nhất CŨ HƠN bài lỗi cũ nhất
+    - Dừng vì đủ limit: chưa quét tới start / watermark cũ -> chỉ phủ được [bài cũ nhất đã lấy, watermark]
+    - Lưu id mọi bài cùng giây với watermark (lần sau lọc cùng giây theo id, không bỏ sót bài cùng giây)
+    """
+    def seconds(key):
+        return int(key[0].timestamp())
+
+    queued = [key for key in scanned if key not in not_queued]
+    if not_queued:
+        oldest_failed = min(seconds(key) for key in not_queued)
+        queued = [key for key in queued if seconds(key) < oldest_failed]
+    if not queued:
+        return
+    newest = max(queued, key=lambda key: (key[0], key[2]))
+    newest_ids = {key[2] for key in queued if seconds(key) == seconds(newest)}
+    if watermark and int(watermark["timestamp"]) == seconds(newest):
+        newest_ids |= watermark_ids
+    if limit_reached:
+        covered_since = min(seconds(key) for key in scanned)
+    else:
+        covered_since = int(watermark["covered_since"]) if watermark else int(start_timestamp)
+    try:
+        from core.join_groups import update_group_watermark
+        update_group_watermark(profile_id, page_id, {
+            "timestamp": seconds(newest),
+            "created_time": newest[1],
+            "post_id": newest[2],
+            "post_ids": sorted(newest_ids),
+            "covered_since": covered_since,
+            "updated_at": int(time.time()),
+        })
+    except Exception as e:
+        print(f"⚠️ Không ghi được watermark của group {page_id}: {e}")
 
-        # Dictionary để track posts đã xử lý
-        existing_post_ids = {item.get('id') for item in existing_data if item.get('id')}
 
-        processed_count = 0
-        new_posts = []
+def _enrich_and_queue(page_id, profile_id, posts, stop_event=None, settings=None):
+    """
+    Lấy chi tiết (tác giả, nội dung, post_id thật) cho 1 trang posts của group rồi append vào hàng đợi post_ids.
+    Chạy ở luồng pipeline của get_posts_from_page (song song với việc tải trang tiếp theo).
 
-        for post in all_posts:
-            post_id = post.get('id')
-            if not post_id:
-                continue
+    Returns:
+        tuple: (stats làm giàu của trang, số post bỏ qua nhờ processed index,
+            set id (Graph API) các post không lấy được chi tiết -> chưa vào hàng đợi)
+    """
+    stats = {"candidates": 0, "from_graph": 0, "html_fallback": 0, "html_failed": 0, "skipped_after_resolve": 0}
+    saved_count = 0
+    settings = settings or get_settings()
+    print(f"\n🔍 Bắt đầu lấy chi tiết cho {len(posts)} posts (page_id {page_id})...")
 
-            # Bỏ qua nếu đã xử lý rồi
-            if post_id in existing_post_ids:
-                print(f"⏭️ Bỏ qua post_id {post_id} (đã xử lý)")
-                continue
+    # Import function từ get_id.py
+    try:
+        from get_id import get_id_from_url
+    except ImportError as e:
+        print(f"❌ Không thể import get_id_from_url từ get_id.py: {e}")
+        return stats, saved_count, {post.get('id') for post in posts}
 
-            # Tạo URL từ post_id
-            # Format: https://www.facebook.com/{page_id}/posts/{post_id_split}
-            if '_' in post_id:
-                page_part, post_part = post_id.split('_', 1)
-                post_url = f"https://www.facebook.com/{page_part}/posts/{post_part}"
-            else:
-                # Fallback: dùng URL generic
-                post_url = f"https://www.facebook.com/{post_id}"
+    # Hàng đợi post_ids cho profile này (data/post_ids/{profile_id}.jsonl)
+    post_ids_file = post_queue.queue_path(profile_id)
 
-            print(f"🔍 Đang xử lý post_id: {post_id}")
-            print(f"   URL: {post_url}")
+    # Load các post đang chờ xử lý để tránh trùng
+    existing_data = post_queue.pending_posts(profile_id)
 
-            try:
-                # Gọi get_id_from_url
-                print(f"   🔍 Gọi get_id_from_url với URL: {post_url}")
-                result = get_id_from_url(post_url, profile_id)
-                print(f"   📋 Kết quả từ get_id_from_url: {result}")
+    # Set để track posts đã xử lý
+    existing_post_ids = {
+        (item if isinstance(item, str) else item.get('id'))
+        for item in existing_data
+    }
 
-                if result and result.get('post_id'):
-                    # Tạo object theo định dạng yêu cầu
-                    post_data = {
-                        "id": result['post_id'],
-                        "flag": "vàng",  # Mặc định là "vàng" theo yêu cầu
-                        "text": result.get('post_text', ''),
-                        "owning_profile": result.get('owning_profile')
-                    }
+    # Post đã crawl gần đây (processed index, theo TTL): tra 1 lần cho cả trang, khỏi gọi get_id_from_url
+    candidate_ids = []
+    for post in posts:
+        pid = str(post.get('id') or '')
+        candidate_ids.append(pid)
+        if '_' in pid:
+            candidate_ids.append(pid.split('_', 1)[1])
+    recently_processed = processed_index.filter_processed(candidate_ids)
+
+    # Claim registry: claim id Graph API của các post mới cho profile này (như FBController.save_post_id_from_details);
+    # post profile khác đã claim thì profile này không resolve/crawl lại
+    owners = post_claims.claim(
+        [
+            str(post.get('id'))
+            for post in posts
+            if post.get('id') and post.get('id') not in existing_post_ids
+            and post.get('id') not in recently_processed
+            and str(post.get('id')).split('_', 1)[-1] not in recently_processed
+        ],
+        profile_id,
+    )
+    claimed_elsewhere = {pid for pid, owner in owners.items() if owner != profile_id}
+    if claimed_elsewhere:
+        print(f"👥 {len(claimed_elsewhere)} posts đã được profile khác claim, sẽ bỏ qua")
+
+    # 1) Lọc các post không cần xử lý (đang chờ trong hàng đợi / crawl gần đây / profile khác đã claim)
+    to_enrich = []
+    for post in posts:
+        post_id = post.get('id')
+        if not post_id:
+            continue
+
+        # Bỏ qua nếu đã xử lý rồi
+        if post_id in existing_post_ids:
+            print(f"⏭️ Bỏ qua post_id {post_id} (đã xử lý)")
+            continue
+
+        if post_id in recently_processed or post_id.split('_', 1)[-1] in recently_processed:
+            print(f"⏭️ Bỏ qua post_id {post_id} (đã crawl gần đây)")
+            saved_count += 1
+            continue
+
+        if post_id in claimed_elsewhere:
+            print(f"⏭️ Bỏ qua post_id {post_id} (profile khác đã claim)")
+            continue
+
+        to_enrich.append(post)
+
+    stats["candidates"] = len(to_enrich)
+    new_posts = []
+    failed_ids = set()
+
+    def _accept(source_id, result):
+        """Kiểm tra id đã resolve (processed index / claim) rồi tạo post_data cho hàng đợi."""
+        nonlocal saved_count
+        resolved_id = str(result['post_id'])
+        if processed_index.is_processed(resolved_id):
+            print(f"   ⏭️ post_id {resolved_id} đã crawl gần đây -> bỏ qua")
+            saved_count += 1
+            stats["skipped_after_resolve"] += 1
+            post_claims.release([source_id], profile_id)
+            return
+        # Claim cả id thật (profile khác có thể gặp bài qua URL share thay vì id Graph API)
+        owner = post_claims.claim([resolved_id], profile_id).get(resolved_id, profile_id)
+        if owner != profile_id:
+            print(f"   👥 post_id {resolved_id} đã được profile {owner} claim -> bỏ qua")
+            stats["skipped_after_resolve"] += 1
+            post_claims.release([source_id], profile_id)
+            return
+        # Tạo object theo định dạng yêu cầu
+        # source_id: id Graph API của bài (để consumer đánh dấu cả 2 id vào processed index)
+        new_posts.append({
+            "id": resolved_id,
+            "flag": "vàng",  # Mặc định là "vàng" theo yêu cầu
+            "text": result.get('post_text', ''),
+            "owning_profile": result.get('owning_profile'),
+            "source_id": source_id
+        })
+
+    # 2) Post đã có tác giả từ Graph API -> dùng luôn, không tải HTML
+    html_posts = []
+    for post in to_enrich:
+        author = post.get('from')
+        if isinstance(author, dict) and author.get('id'):
+            stats["from_graph"] += 1
+            _accept(post['id'], {
+                "post_id": post['id'].split('_', 1)[-1],
+                "post_text": post.get('message') or '',
+                "owning_profile": {"name": author.get('name'), "id": author.get('id')},
+            })
+        else:
+            html_posts.append(post)
 
-                    new_posts.append(post_data)
-                    processed_count += 1
-                    print(f"   ✅ Đã xử lý thành công - tạo post_data: {post_data}")
+    # 3) Fallback: get_id_from_url (tải HTML) cho phần còn lại, chạy song song có giới hạn
+    def _enrich_from_html(post_id):
+        if stop_event is not None and stop_event.is_set():
+            return None
+        # Tạo URL từ post_id
+        # Format: https://www.facebook.com/{page_id}/posts/{post_id_split}
+        if '_' in post_id:
+            page_part, post_part = post_id.split('_', 1)
+            post_url = f"https://www.facebook.com/{page_part}/posts/{post_part}"
+        else:
+            # Fallback: dùng URL generic
+            post_url = f"https://www.facebook.com/{post_id}"
+        print(f"🔍 Đang xử lý post_id: {post_id} | URL: {post_url}")
+        try:
+            return get_id_from_url(post_url, profile_id)
+        except Exception as e:
+            import traceback
+            print(f"   ❌ Lỗi khi xử lý post_id {post_id}: {e}")
+            print(f"   🔍 Traceback: {traceback.format_exc()}")
+            return None
 
+    if html_posts:
+        workers = max(1, min(settings.group_scan_enrich_workers, len(html_posts)))
+        print(f"🌐 {len(html_posts)} posts cần lấy chi tiết từ HTML ({workers} luồng)")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"enrich-{str(page_id)[:8]}") as executor:
+            html_ids = [post['id'] for post in html_posts]
+            for post_id, result in zip(html_ids, executor.map(_enrich_from_html, html_ids)):
+                if stop_event is not None and stop_event.is_set() and result is None:
+                    post_claims.release([post_id], profile_id)
+                    failed_ids.add(post_id)
+                    continue
+                stats["html_fallback"] += 1
+                if result and result.get('post_id'):
+                    _accept(post_id, result)
                 else:
+                    stats["html_failed"] += 1
+                    failed_ids.add(post_id)
                     print(f"   ❌ Không thể lấy thông tin cho post_id: {post_id} - result: {result}")
+                    # Trả claim để profile khác thử lại
+                    post_claims.release([post_id], profile_id)
 
-            except Exception as e:
-                import traceback
-                print(f"   ❌ Lỗi khi xử lý post_id {post_id}: {e}")
-                print(f"   🔍 Traceback: {traceback.format_exc()}")
-
-        # Gộp dữ liệu mới với dữ liệu hiện có
-        all_post_data = existing_data + new_posts
-
-        # Lưu file JSON với lock để tránh conflict khi nhiều luồng cùng ghi
-        if new_posts:
-            _save_post_ids_file_safe(post_ids_file, all_post_data)
-            print(f"\n💾 Đã lưu {len(new_posts)} posts mới vào: {post_ids_file}")
-            print(f"   Tổng cộng: {len(all_post_data)} posts")
-        else:
-            print(f"\n📋 Không có posts mới để lưu")
+    # Append vào hàng đợi (có lock, không ghi lại toàn bộ file)
+    if new_posts:
+        try:
+            added = post_queue.append_posts(profile_id, new_posts)
+        except file_lock.FileLockTimeout:
+            # Chưa ghi được: trả claim để lượt quét sau (hoặc profile khác) lấy lại các post này
+            post_claims.release([i for p in new_posts for i in (p.get("id"), p.get("source_id")) if i], profile_id)
+            raise
+        print(f"\n💾 Đã lưu {added} posts mới vào: {post_ids_file}")
+        print(f"   Tổng cộng: {len(existing_data) + added} posts")
+    else:
+        print(f"\n📋 Không có posts mới để lưu (page_id {page_id})")
+
+    return stats, saved_count, failed_ids
 
-    return all_posts
+
+def _record_enrich_stats(page_id, stats):
+    """Lưu + in tỉ lệ làm giàu của 1 group: lấy thẳng từ Graph API vs phải fallback tải HTML."""
+    candidates = stats["candidates"]
+    entry = {
+        **stats,
+        "graph_rate": round(stats["from_graph"] / candidates, 3) if candidates else 0.0,
+        "fallback_rate": round(stats["html_fallback"] / candidates, 3) if candidates else 0.0,
+        "updated_at": time.time(),
+    }
+    with _enrich_stats_lock:
+        _ENRICH_STATS[str(page_id)] = entry
+    if candidates:
+        print(
+            f"📊 Group {page_id}: {stats['from_graph']}/{candidates} posts lấy từ Graph API ({entry['graph_rate']:.0%}), "
+            f"{stats['html_fallback']} fallback HTML ({entry['fallback_rate']:.0%}, lỗi {stats['html_failed']})"
+        )
+
+
+def get_enrich_stats():
+    """Thống kê làm giàu theo group (lần quét gần nhất của mỗi group) + tổng."""
+    with _enrich_stats_lock:
+        groups = {gid: dict(entry) for gid, entry in _ENRICH_STATS.items()}
+    totals = {key: sum(g[key] for g in groups.values()) for key in ("candidates", "from_graph", "html_fallback", "html_failed")}
+    candidates = totals["candidates"]
+    totals["graph_rate"] = round(totals["from_graph"] / candidates, 3) if candidates else 0.0
+    totals["fallback_rate"] = round(totals["html_fallback"] / candidates, 3) if candidates else 0.0
+    return {"groups": groups, "totals": totals}
 
 
 def get_post_ids_from_page(page_id, profile_id, start_date=None, end_date=None, limit=None):
@@ -691,8 +915,6 @@ def get_post_ids_from_page(page_id, profile_id, start_date=None, end_date=None,
 
 
 if __name__ == "__main__":
-    import os
-    
     # Ví dụ sử dụng
     profile_id = "b77da63d-af55-43c2-ab7f-364250b20e30"
     page_id = "445142479459290"
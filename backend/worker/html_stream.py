@@ -0,0 +1,317 @@
+import codecs
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+# Trích post_id / owning_profile / nội dung bài / group_id từ HTML facebook.com theo kiểu streaming:
+# - Trước đây get_id tải hết body (vài MB) rồi chạy 4 lần re.search, vòng lặp Python đếm ngoặc
+#   từng ký tự cho owning_profile và re.findall <script> fallback trên toàn bộ chuỗi
+# - Ở đây HTML được đưa vào theo chunk, các pattern (compile sẵn) chỉ quét phần mới của cửa sổ trượt
+#   (+ một đoạn chồng lấn _OVERLAP để không lỡ match nằm giữa 2 chunk), phần đã quét xong bị bỏ khỏi bộ nhớ
+# - Đủ post_id (pattern ưu tiên nhất) + owning_profile + block story_message thì dừng đọc, caller đóng kết nối
+# Kết quả giữ đúng thứ tự ưu tiên của code cũ (pattern 1 ở bất kỳ đâu thắng pattern 2 xuất hiện sớm hơn).
+CHUNK_SIZE = 64 * 1024
+_OVERLAP = 512
+_TEXT_FALLBACK_CHARS = 500_000  # giống code cũ: không có story_message thì lấy nội dung từ 500KB đầu
+
+_POST_ID_PATTERNS = [
+    re.compile(r'"post_id"\s*:\s*"(\d+)"'),
+    re.compile(r'"post_id"\s*:\s*(\d+)'),
+    re.compile(r'post_id["\']?\s*:\s*["\']?(\d+)'),
+    re.compile(r'["\']post_id["\']\s*:\s*["\']?(\d+)', re.IGNORECASE),
+]
+_OWNING_PROFILE_START = re.compile(r'"owning_profile"\s*:\s*\{')
+_BRACES = re.compile(r'[{}]')
+_OWNING_FIELDS = [
+    ("__typename", re.compile(r'"__typename"\s*:\s*"([^"]+)"')),
+    ("name", re.compile(r'"name"\s*:\s*"([^"]+)"')),
+    ("id", re.compile(r'"id"\s*:\s*"([^"]+)"')),
+]
+_STORY_START = re.compile(r'data-ad-rendering-role="story_message"[^>]*>')
+_STORY_END = re.compile(r'</div></div></div>')
+_IMG_ALT = re.compile(r'<img[^>]*alt="([^"]*)"[^>]*>', re.IGNORECASE)
+_TAGS = re.compile(r"<[^>]*>")
+_SPACES = re.compile(r"\s+")
+
+_GROUP_PATTERNS = [
+    re.compile(r'"page_id"\s*:\s*"(\d+)"\s*,\s*"page_id_type"\s*:\s*"group"', re.IGNORECASE),
+    re.compile(r'"page_id_type"\s*:\s*"group"\s*,\s*"page_id"\s*:\s*"(\d+)"', re.IGNORECASE),
+    re.compile(r'"groupID"\s*:\s*"(\d+)"', re.IGNORECASE),
+    re.compile(r'"group_id"\s*:\s*"(\d+)"', re.IGNORECASE),
+]
+_GROUP_URL = re.compile(r"/groups/(\d+)", re.IGNORECASE)
+_PAGE_ID_PATTERNS = [
+    re.compile(r'"page_id"\s*:\s*"(\d+)"', re.IGNORECASE),
+    re.compile(r'page_id["\']\s*:\s*["\'](\d+)', re.IGNORECASE),
+    re.compile(r'page_id=(\d+)', re.IGNORECASE),
+    re.compile(r'data-page-id="(\d+)"', re.IGNORECASE),
+    re.compile(r'"pageID"\s*:\s*"(\d+)"', re.IGNORECASE),
+]
+
+
+class _Scanner:
+    """
+    Quét 1 pattern trên cửa sổ trượt, nhớ vị trí (tuyệt đối) đã quét tới.
+    Match chạm cuối cửa sổ khi chưa hết dữ liệu thì để lần sau (có thể còn thiếu ký tự).
+    find_all=False: dừng ở match đầu tiên; True: gom mọi match (group 1).
+    """
+
+    def __init__(self, pattern, find_all: bool = False, start: int = 0):
+        self.pattern = pattern
+        self.find_all = find_all
+        self.pos = start
+        self.match = None  # (abs_start, abs_end, group1) của match đầu tiên
+        self.values: List[str] = []
+
+    @property
+    def active(self) -> bool:
+        return self.find_all or self.match is None
+
+    def scan(self, window: str, base: int, final: bool) -> None:
+        if not self.active:
+            return
+        safe_end = base + len(window) - (0 if final else _OVERLAP)
+        last_end = self.pos
+        for m in self.pattern.finditer(window, max(self.pos - base, 0)):
+            start, end = base + m.start(), base + m.end()
+            if not final and (start >= safe_end or m.end() >= len(window)):
+                self.pos = start
+                return
+            value = m.group(1) if m.groups() else m.group(0)
+            if not self.find_all:
+                self.match = (start, end, value)
+                self.pos = end
+                return
+            self.values.append(value)
+            last_end = end
+        self.pos = max(safe_end, last_end)
+
+
+class _StreamExtractor:
+    """Cửa sổ trượt dùng chung: feed() nhận text, tự bỏ phần mà không scanner nào cần nữa."""
+
+    def __init__(self):
+        self.window = ""
+        self.base = 0  # vị trí tuyệt đối của window[0]
+        self.chars_read = 0
+        self.final = False
+
+    def _keep_from(self) -> int:
+        return self.base + len(self.window)
+
+    def feed(self, text: str) -> None:
+        self.window += text
+        self.chars_read += len(text)
+        self._process()
+        keep = min(self._keep_from(), self.base + len(self.window))
+        if keep > self.base:
+            self.window = self.window[keep - self.base:]
+            self.base = keep
+
+    def close(self) -> None:
+        self.final = True
+        self._process()
+
+    def _process(self) -> None:
+        raise NotImplementedError
+
+    @property
+    def done(self) -> bool:
+        return False
+
+
+class PostHtmlExtractor(_StreamExtractor):
+    """post_id + owning_profile + post_text từ HTML trang bài viết."""
+
+    def __init__(self):
+        super().__init__()
+        self.post_id_scanners = [_Scanner(p) for p in _POST_ID_PATTERNS]
+        self.owning_scanner = _Scanner(_OWNING_PROFILE_START)
+        self.owning_depth = 1
+        self.owning_pos = None  # vị trí đang đếm ngoặc (tuyệt đối)
+        self.owning_block = None
+        self.owning_profile = None
+        self.story_scanner = _Scanner(_STORY_START)
+        self.story_end_scanner = None
+        self.story_html = None
+        self.prefix: List[str] = []
+        self.prefix_chars = 0
+
+    def feed(self, text: str) -> None:
+        if self.prefix_chars < _TEXT_FALLBACK_CHARS:
+            piece = text[:_TEXT_FALLBACK_CHARS - self.prefix_chars]
+            self.prefix.append(piece)
+            self.prefix_chars += len(piece)
+        super().feed(text)
+
+    def _keep_from(self) -> int:
+        positions = [s.pos for s in self.post_id_scanners if s.active and not self.post_id_found]
+        # Block đang đọc dở (đã thấy điểm bắt đầu, chưa thấy điểm kết thúc) phải giữ nguyên từ đầu block
+        if self.owning_scanner.active:
+            positions.append(self.owning_scanner.pos)
+        elif self.owning_block is None:
+            positions.append(self.owning_scanner.match[1])
+        if self.story_scanner.active:
+            positions.append(self.story_scanner.pos)
+        elif self.story_html is None:
+            positions.append(self.story_scanner.match[1])
+        return min(positions) if positions else self.base + len(self.window)
+
+    @property
+    def post_id_found(self) -> bool:
+        return self.post_id_scanners[0].match is not None
+
+    @property
+    def owning_resolved(self) -> bool:
+        return self.owning_block is not None
+
+    @property
+    def done(self) -> bool:
+        return self.post_id_found and self.owning_resolved and self.story_html is not None
+
+    def _process(self) -> None:
+        window, base, final = self.window, self.base, self.final
+        if not self.post_id_found:
+            for scanner in self.post_id_scanners:
+                scanner.scan(window, base, final)
+
+        # owning_profile: match đầu tiên rồi đếm ngoặc cân bằng (chỉ quét ký tự { } bằng regex)
+        if self.owning_block is None:
+            self.owning_scanner.scan(window, base, final)
+            if self.owning_scanner.match is not None:
+                if self.owning_pos is None:
+                    self.owning_pos = self.owning_scanner.match[1]
+                for m in _BRACES.finditer(window, self.owning_pos - base):
+                    self.owning_depth += 1 if m.group(0) == "{" else -1
+                    if self.owning_depth == 0:
+                        self.owning_block = window[self.owning_scanner.match[1] - base:m.start()]
+                        self.owning_profile = _parse_owning_profile(self.owning_block)
+                        break
+                else:
+                    self.owning_pos = base + len(window)
+
+        # Nội dung bài: block story_message đầu tiên tới </div></div></div>
+        if self.story_html is None:
+            self.story_scanner.scan(window, base, final)
+            if self.story_scanner.match is not None:
+                if self.story_end_scanner is None:
+                    self.story_end_scanner = _Scanner(_STORY_END, start=self.story_scanner.match[1])
+                self.story_end_scanner.scan(window, base, final)
+                if self.story_end_scanner.match is not None:
+                    self.story_html = window[self.story_scanner.match[1] - base:self.story_end_scanner.match[0] - base]
+
+    def result(self) -> Dict[str, Any]:
+        post_id = None
+        for scanner in self.post_id_scanners:
+            if scanner.match is not None:
+                post_id = scanner.match[2]
+                break
+        content_html = self.story_html if self.story_html is not None else "".join(self.prefix)
+        return {
+            "post_id": post_id,
+            "owning_profile": self.owning_profile,
+            "post_text": html_to_text(content_html),
+            "story_message_found": self.story_html is not None,
+            "owning_profile_found": self.owning_scanner.match is not None,
+        }
+
+
+class GroupHtmlExtractor(_StreamExtractor):
+    """group_id (page_id) từ HTML trang group: dừng sớm khi gặp pattern đặc hiệu nhất."""
+
+    def __init__(self):
+        super().__init__()
+        self.group_scanners = [_Scanner(p) for p in _GROUP_PATTERNS]
+        # Fallback cần tần suất trên toàn trang nên vẫn quét hết nếu không có pattern đặc hiệu
+        self.url_scanner = _Scanner(_GROUP_URL, find_all=True)
+        self.page_id_scanners = [_Scanner(p, find_all=True) for p in _PAGE_ID_PATTERNS]
+
+    @property
+    def done(self) -> bool:
+        return self.group_scanners[0].match is not None
+
+    def _all_scanners(self):
+        return [*self.group_scanners, self.url_scanner, *self.page_id_scanners]
+
+    def _keep_from(self) -> int:
+        positions = [s.pos for s in self._all_scanners() if s.active]
+        return min(positions) if positions else self.base + len(self.window)
+
+    def _process(self) -> None:
+        for scanner in self._all_scanners():
+            scanner.scan(self.window, self.base, self.final)
+
+    def result(self) -> Optional[str]:
+        for scanner in self.group_scanners:
+            if scanner.match is not None:
+                return scanner.match[2]
+        for values in ([*self.url_scanner.values], [v for s in self.page_id_scanners for v in s.values]):
+            if values:
+                freq: Dict[str, int] = {}
+                for value in values:
+                    freq[value] = freq.get(value, 0) + 1
+                return sorted(freq.items(), key=lambda x: x[1], reverse=True)[0][0]
+        return None
+
+
+def _parse_owning_profile(block: str) -> Optional[Dict[str, str]]:
+    """Lấy __typename / name / id trong block owning_profile (cần ít nhất 2 field như code cũ)."""
+    data = {}
+    for key, pattern in _OWNING_FIELDS:
+        m = pattern.search(block)
+        if m:
+            data[key] = m.group(1)
+    return data if len(data) >= 2 else None
+
+
+def html_to_text(content_html: str) -> Optional[str]:
+    """<img alt> -> alt (giữ emoji), bỏ tag, chuẩn hoá khoảng trắng."""
+    if not content_html:
+        return None
+    text = _IMG_ALT.sub(lambda m: f" {m.group(1) or ''} ", content_html)
+    text = _SPACES.sub(" ", _TAGS.sub(" ", text)).strip()
+    return text or None
+
+
+def iter_response_text(response, chunk_size: int = CHUNK_SIZE) -> Iterable[str]:
+    """Decode body (đã giải nén gzip) theo chunk; đếm byte vào response._bytes_read để log/benchmark."""
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    response._bytes_read = 0
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if not chunk:
+            continue
+        response._bytes_read += len(chunk)
+        yield decoder.decode(chunk)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def run_extractor(extractor: _StreamExtractor, chunks: Iterable[str]) -> Dict[str, Any]:
+    """Đưa chunk vào extractor tới khi đủ dữ liệu (early exit) hoặc hết body. Trả về thống kê đọc."""
+    started = time.perf_counter()
+    early_exit = False
+    for text in chunks:
+        extractor.feed(text)
+        if extractor.done:
+            early_exit = True
+            break
+    else:
+        extractor.close()
+    return {
+        "chars_read": extractor.chars_read,
+        "early_exit": early_exit,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def extract_post_details(chunks: Iterable[str]) -> Dict[str, Any]:
+    extractor = PostHtmlExtractor()
+    stats = run_extractor(extractor, chunks)
+    return {**extractor.result(), **stats}
+
+
+def extract_group_id(chunks: Iterable[str]) -> Dict[str, Any]:
+    extractor = GroupHtmlExtractor()
+    stats = run_extractor(extractor, chunks)
+    return {"page_id": extractor.result(), **stats}
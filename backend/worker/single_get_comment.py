@@ -1,11 +1,31 @@
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 import json
 import base64
+import time
 from urllib.parse import urlencode
 from datetime import datetime, timezone, timedelta
 
+# Session HTTP pooled theo profile (keep-alive, retry chung, header tĩnh tính sẵn)
+try:
+    from core.http_pool import graphql_headers, post_graphql
+except ImportError:
+    from backend.core.http_pool import graphql_headers, post_graphql
+
+# Checkpoint cursor + kết quả từng phần theo post (tiếp tục phân trang sau crash / STOP / lỗi)
+try:
+    from core.pagination_checkpoint import PaginationCheckpoint
+    from core.page_prefetch import PagePrefetcher
+    from core import engagement_state
+except ImportError:
+    from backend.core.pagination_checkpoint import PaginationCheckpoint
+    from backend.core.page_prefetch import PagePrefetcher
+    from backend.core import engagement_state
+
+# Nhánh fix payload (headless capture) + kiểm tra mảng errors dùng chung với reactions
+try:
+    from single_get_reactions import raise_on_graphql_errors, refresh_payload_from_bad_response
+except ImportError:
+    from worker.single_get_reactions import raise_on_graphql_errors, refresh_payload_from_bad_response
+
 # Import control state để check stop/pause
 try:
     from backend.core.control import check_flags, wait_if_paused
@@ -117,9 +137,14 @@ def extract_users_from_json(data, users_list, seen_ids, max_words=10):
 # ================================
 #   GỬI REQUEST GRAPHQL VỚI CURSOR
 # ================================
-def send_request(post_id, payload_dict, profile_id, cookies, commentsAfterCursor=None):
-    """Gửi request GraphQL để lấy comments với post_id và commentsAfterCursor (nếu có)"""
+def build_request_payload(post_id, payload_dict, commentsAfterCursor=None):
+    """
+    Tạo body form-urlencoded cho request comments (không gửi).
+    Dùng chung cho send_request (đồng bộ) và async_graphql (bất đồng bộ).
     
+    Returns:
+        tuple: (payload_str, payload_dict_đã_merge, variables)
+    """
     # Tạo feedback ID từ post_id
     feedback_id = create_feedback_id(post_id)
     
@@ -139,15 +164,6 @@ def send_request(post_id, payload_dict, profile_id, cookies, commentsAfterCursor
         "__relay_internal__pv__IsWorkUserrelayprovider": False
     }
     
-    # Thêm commentsAfterCursor nếu có
-    if commentsAfterCursor:
-        print(f"   🔄 Sử dụng commentsAfterCursor: {commentsAfterCursor[:50]}...")
-    else:
-        print(f"   🔄 Không có commentsAfterCursor (trang đầu tiên)")
-    
-    # Debug: In ra variables để kiểm tra
-    print(f"   📋 Variables: {json.dumps(variables, ensure_ascii=True)}")
-    
     # Sử dụng payload được truyền vào và thêm variables, doc_id, fb_api_req_friendly_name, __crn
     payload_dict = payload_dict.copy()
     payload_dict["variables"] = json.dumps(variables, ensure_ascii=False)
@@ -156,49 +172,47 @@ def send_request(post_id, payload_dict, profile_id, cookies, commentsAfterCursor
     payload_dict["__crn"] = "comet.fbweb.CometSinglePostDialogRoute"  # Route riêng cho comments
 
     # Chuyển dictionary thành form-urlencoded string
-    payload = urlencode(payload_dict)
+    return urlencode(payload_dict), payload_dict, variables
+
+
+def parse_comments_page_info(response_json):
+    """
+    Lấy thông tin phân trang từ response comments.
+    Cấu trúc: data.node.comment_rendering_instance_for_feed_location.comments
+    
+    Returns:
+        tuple: (edges_count, end_cursor, start_cursor, has_next_page)
+    """
+    node = (response_json.get("data") or {}).get("node") or {}
+    comment_rendering = node.get("comment_rendering_instance_for_feed_location") or {}
+    comments = comment_rendering.get("comments") or {}
+    edges = comments.get("edges") or []
+    page_info = comments.get("page_info") or {}
+    return len(edges), page_info.get("end_cursor"), page_info.get("start_cursor"), page_info.get("has_next_page", False)
+
+
+def send_request(post_id, payload_dict, profile_id, cookies, commentsAfterCursor=None):
+    """Gửi request GraphQL để lấy comments với post_id và commentsAfterCursor (nếu có)"""
+    
+    # Thêm commentsAfterCursor nếu có
+    if commentsAfterCursor:
+        print(f"   🔄 Sử dụng commentsAfterCursor: {commentsAfterCursor[:50]}...")
+    else:
+        print(f"   🔄 Không có commentsAfterCursor (trang đầu tiên)")
+    
+    payload, payload_dict, variables = build_request_payload(post_id, payload_dict, commentsAfterCursor)
+    
+    # Debug: In ra variables để kiểm tra
+    print(f"   📋 Variables: {json.dumps(variables, ensure_ascii=True)}")
     
     # Debug: In ra payload để kiểm tra (chỉ 500 ký tự đầu)
     print(f"   🔍 Payload preview: {payload[:500]}...")
 
     # Tạo headers với cookies
-    headers = {
-        "accept": "*/*",
-        "accept-encoding": "gzip, deflate",
-        "accept-language": "en,vi;q=0.9,en-US;q=0.8",
-        "content-type": "application/x-www-form-urlencoded",
-        "cookie": cookies,
-        "origin": "https://www.facebook.com",
-        "priority": "u=1, i",
-        "referer": "https://www.facebook.com/photo/?fbid=965661036626847&set=a.777896542069965",
-        "sec-ch-ua": '"Google Chrome";v="143", "Chromium";v="143", "Not A(Brand";v="24"',
-        "sec-ch-ua-mobile": "?0",
-        "sec-ch-ua-platform": '"Windows"',
-        "sec-fetch-dest": "empty",
-        "sec-fetch-mode": "cors",
-        "sec-fetch-site": "same-origin",
-        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36",
-        "x-asbd-id": "359341",
-        "x-fb-friendly-name": "CommentListComponentsRootQuery",
-        "x-fb-lsd": payload_dict.get("lsd", "")
-    }
+    headers = graphql_headers(cookies, "CommentListComponentsRootQuery", payload_dict.get("lsd", ""))
 
-    url = "https://www.facebook.com/api/graphql/"
-    
-    # Session với retry để hạn chế timeout/connection reset
-    session = requests.Session()
-    retry_cfg = Retry(
-        total=2,
-        backoff_factor=0.5,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["POST"],
-    )
-    adapter = HTTPAdapter(max_retries=retry_cfg)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    
-    # Gửi payload dưới dạng form-urlencoded với headers
-    response = session.post(url, data=payload, headers=headers, timeout=20)
+    # Gửi payload qua session dùng chung của profile (giữ kết nối keep-alive giữa các trang/post)
+    response = post_graphql(profile_id, payload, headers, timeout=20)
     
     return response
 
@@ -206,7 +220,7 @@ def send_request(post_id, payload_dict, profile_id, cookies, commentsAfterCursor
 # ================================
 #   HÀM HOÀN CHỈNH: LẤY TẤT CẢ COMMENTS TỪ POST_ID
 # ================================
-def get_all_comments_by_post_id(post_id, payload_dict, profile_id, cookies):
+def get_all_comments_by_post_id(post_id, payload_dict, profile_id, cookies, max_pages=None, first_page=None):
     """
     Hàm hoàn chỉnh để lấy tất cả comments từ post_id
     
@@ -215,6 +229,10 @@ def get_all_comments_by_post_id(post_id, payload_dict, profile_id, cookies):
         payload_dict (dict): Dictionary chứa payload parameters
         profile_id (str): Profile ID
         cookies (str): Cookie string để sử dụng trong request
+        max_pages (int, optional): Budget số trang cho lần gọi này (crawl scheduler). Hết budget thì dừng,
+            checkpoint giữ cursor để phiên sau lấy tiếp. None = không giới hạn
+        first_page (Response, optional): Response trang đầu đã tải sẵn (crawl scheduler probe),
+            dùng thay cho request trang 1 nếu không tiếp tục từ checkpoint
         
     Returns:
         list: Danh sách comments với format [{"id": "...", "text": "...", "author": {...}}, ...]
@@ -233,131 +251,164 @@ def get_all_comments_by_post_id(post_id, payload_dict, profile_id, cookies):
     cursors_info = {}  # Lưu thông tin cursors
     commentsAfterCursor = None  # Cursor để pagination
     page_number = 1
+
+    # Checkpoint cursor + comments mỗi N trang: lần chạy trước dừng giữa chừng thì tiếp tục từ cursor cuối
+    checkpoint = PaginationCheckpoint("comments", post_id)
+    resume = checkpoint.load()
+    if resume:
+        all_users = resume["items"]
+        seen_user_ids = {f"{u.get('id')}_{u.get('text')}" if u.get("text") else u.get("id") for u in all_users}
+        commentsAfterCursor = resume["cursor"]
+        page_number = resume["page_number"]
+    finished = False  # True khi đã lấy hết trang -> xoá checkpoint
+    start_page = page_number
+    # Gửi trước trang sau (thread nền) trong lúc xử lý trang hiện tại
+    prefetcher = PagePrefetcher(lambda next_cursor: send_request(post_id, payload_dict, profile_id, cookies, next_cursor), profile_id)
+    if commentsAfterCursor is None:
+        prefetcher.preload(None, first_page)
     
-    while True:
-        # Check stop/pause trước mỗi request
-        try:
-            stop, paused, reason = check_flags(profile_id)
-            if stop:
-                print(f"🛑 Dừng lấy comments do stop: {reason}")
-                raise RuntimeError(f"EMERGENCY_STOP ({reason})")
-            if paused:
-                print(f"⏸️ Đang tạm dừng ({reason}), chờ tiếp tục...")
-                wait_if_paused(profile_id, sleep_seconds=0.5)
-                continue  # Tiếp tục check sau khi resume
-        except RuntimeError:
-            raise  # Re-raise RuntimeError để caller có thể catch
-        except Exception as e:
-            print(f"⚠️ Lỗi khi check stop/pause: {e}")
-            # Tiếp tục nếu có lỗi check
+    try:
+        while True:
+            if max_pages and page_number - start_page >= max_pages:
+                print(f"⏳ Đã dùng hết budget {max_pages} trang comments cho post này, phần còn lại để phiên sau")
+                break
+            # Check stop/pause trước mỗi request
+            try:
+                stop, paused, reason = check_flags(profile_id)
+                if stop:
+                    print(f"🛑 Dừng lấy comments do stop: {reason}")
+                    raise RuntimeError(f"EMERGENCY_STOP ({reason})")
+                if paused:
+                    print(f"⏸️ Đang tạm dừng ({reason}), chờ tiếp tục...")
+                    # Bỏ trang đang prefetch: tiếp tục thì tải lại, không dùng response từ trước lúc tạm dừng
+                    prefetcher.close()
+                    wait_if_paused(profile_id, sleep_seconds=0.5)
+                    continue  # Tiếp tục check sau khi resume
+            except RuntimeError:
+                raise  # Re-raise RuntimeError để caller có thể catch
+            except Exception as e:
+                print(f"⚠️ Lỗi khi check stop/pause: {e}")
+                # Tiếp tục nếu có lỗi check
         
-        print(f"\n📄 Trang {page_number} - Đang gửi request...")
-        if commentsAfterCursor:
-            print(f"   CommentsAfterCursor: {commentsAfterCursor[:50]}...")
+            print(f"\n📄 Trang {page_number} - Đang gửi request...")
+            if commentsAfterCursor:
+                print(f"   CommentsAfterCursor: {commentsAfterCursor[:50]}...")
         
-        # Gửi request với post_id, payload, profile_id, cookies và commentsAfterCursor
-        response = send_request(post_id, payload_dict, profile_id, cookies, commentsAfterCursor)
+            # Gửi request với post_id, payload, profile_id, cookies và commentsAfterCursor (hoặc lấy response đã prefetch)
+            response = prefetcher.fetch(commentsAfterCursor)
         
-        print(f"   STATUS: {response.status_code}")
+            print(f"   STATUS: {response.status_code}")
         
-        if response.status_code != 200:
-            print(f"❌ Lỗi: Status code {response.status_code}")
-            print(f"   📋 Response text (500 ký tự đầu):")
-            print(f"   {response.text[:500]}")
+            if response.status_code != 200:
+                print(f"❌ Lỗi: Status code {response.status_code}")
+                print(f"   📋 Response text (500 ký tự đầu):")
+                print(f"   {response.text[:500]}")
             
-            # Thử parse JSON để xem có error message không
-            try:
-                error_json = response.json()
-                if "errors" in error_json:
-                    print(f"   ❌ Errors từ response: {json.dumps(error_json.get('errors'), indent=2, ensure_ascii=True)}")
-                else:
-                    print(f"   📋 Response JSON: {json.dumps(error_json, indent=2, ensure_ascii=False)[:1000]}")
-            except:
-                pass
+                # Thử parse JSON để xem có error message không
+                try:
+                    error_json = response.json()
+                    if "errors" in error_json:
+                        print(f"   ❌ Errors từ response: {json.dumps(error_json.get('errors'), indent=2, ensure_ascii=True)}")
+                    else:
+                        print(f"   📋 Response JSON: {json.dumps(error_json, indent=2, ensure_ascii=False)[:1000]}")
+                except:
+                    pass
             
-            # Lưu response để debug
-            with open("error_response_comment.txt", "w", encoding="utf-8") as f:
-                f.write(f"Status Code: {response.status_code}\n")
-                f.write(f"Headers: {dict(response.headers)}\n")
-                f.write(f"\nResponse Text:\n{response.text}")
-            print(f"   💾 Đã lưu response vào error_response_comment.txt")
-            break
+                # Lưu response để debug
+                with open("error_response_comment.txt", "w", encoding="utf-8") as f:
+                    f.write(f"Status Code: {response.status_code}\n")
+                    f.write(f"Headers: {dict(response.headers)}\n")
+                    f.write(f"\nResponse Text:\n{response.text}")
+                print(f"   💾 Đã lưu response vào error_response_comment.txt")
+                break
         
-        # Parse response thành JSON
-        try:
-            response_json = response.json()
+            # Parse response thành JSON
+            try:
+                response_json = response.json()
             
-            # Lưu response vào list để lưu tất cả vào một file sau
-            all_responses.append(response_json)
+                # Đã biết cursor trang sau -> gửi trước trong lúc extract users trang này (trừ khi hết budget trang)
+                _edges_count, next_cursor, _start_cursor, next_page = parse_comments_page_info(response_json)
+                if next_page and not (max_pages and page_number + 1 - start_page >= max_pages):
+                    prefetcher.prefetch(next_cursor)
             
-            # Extract users từ response JSON
-            extract_users_from_json(response_json, all_users, seen_user_ids)
+                # Lưu response vào list để lưu tất cả vào một file sau
+                all_responses.append(response_json)
             
-            # Debug: Kiểm tra cấu trúc response
-            if "data" not in response_json:
-                print(f"   ⚠️ Response không có 'data': {list(response_json.keys())}")
-            if "errors" in response_json:
-                print(f"   ❌ Response có errors: {response_json.get('errors')}")
+                # Extract users từ response JSON
+                extract_users_from_json(response_json, all_users, seen_user_ids)
             
-            # Trích xuất page_info từ response
-            try:
-                # Cấu trúc response: data.node.comment_rendering_instance_for_feed_location.comments
-                node = response_json.get("data", {}).get("node", {})
-                comment_rendering = node.get("comment_rendering_instance_for_feed_location", {})
-                comments = comment_rendering.get("comments", {})
-                edges = comments.get("edges", [])
-                page_info = comments.get("page_info", {})
-                end_cursor = page_info.get("end_cursor")
-                start_cursor = page_info.get("start_cursor")
-                has_next_page = page_info.get("has_next_page", False)
+                # Debug: Kiểm tra cấu trúc response
+                if "data" not in response_json:
+                    print(f"   ⚠️ Response không có 'data': {list(response_json.keys())}")
+                if "errors" in response_json:
+                    print(f"   ❌ Response có errors: {response_json.get('errors')}")
+            
+                # Trích xuất page_info từ response
+                try:
+                    # Cấu trúc response: data.node.comment_rendering_instance_for_feed_location.comments
+                    node = response_json.get("data", {}).get("node", {})
+                    comment_rendering = node.get("comment_rendering_instance_for_feed_location", {})
+                    comments = comment_rendering.get("comments", {})
+                    edges = comments.get("edges", [])
+                    page_info = comments.get("page_info", {})
+                    end_cursor = page_info.get("end_cursor")
+                    start_cursor = page_info.get("start_cursor")
+                    has_next_page = page_info.get("has_next_page", False)
                 
-                print(f"   🔍 Debug: Số edges trong response: {len(edges)}")
-                print(f"   🔗 End cursor: {end_cursor if end_cursor else 'None'}")
-                print(f"   🔗 Start cursor: {start_cursor if start_cursor else 'None'}")
-                print(f"   📄 Has next page: {has_next_page}")
+                    print(f"   🔍 Debug: Số edges trong response: {len(edges)}")
+                    print(f"   🔗 End cursor: {end_cursor if end_cursor else 'None'}")
+                    print(f"   🔗 Start cursor: {start_cursor if start_cursor else 'None'}")
+                    print(f"   📄 Has next page: {has_next_page}")
                 
-                # Lưu cursors vào dict (lưu của trang cuối cùng)
-                cursors_info = {
-                    "end_cursor": end_cursor,
-                    "start_cursor": start_cursor,
-                    "has_next_page": has_next_page,
-                    "edges_count": len(edges),
-                    "page_number": page_number
-                }
+                    # Lưu cursors vào dict (lưu của trang cuối cùng)
+                    cursors_info = {
+                        "end_cursor": end_cursor,
+                        "start_cursor": start_cursor,
+                        "has_next_page": has_next_page,
+                        "edges_count": len(edges),
+                        "page_number": page_number
+                    }
                 
-                if len(edges) == 0:
-                    print(f"   ⚠️ Không có edges trong response!")
-                    print(f"   🔍 Debug: Comments keys: {list(comments.keys()) if comments else 'None'}")
+                    if len(edges) == 0:
+                        print(f"   ⚠️ Không có edges trong response!")
+                        print(f"   🔍 Debug: Comments keys: {list(comments.keys()) if comments else 'None'}")
                 
-                # Kiểm tra có trang tiếp theo không
-                if not has_next_page:
-                    print(f"\n✅ Đã lấy hết tất cả comments! (has_next_page = False)")
-                    break
+                    # Kiểm tra có trang tiếp theo không
+                    if not has_next_page:
+                        print(f"\n✅ Đã lấy hết tất cả comments! (has_next_page = False)")
+                        finished = True
+                        break
                 
-                if not end_cursor:
-                    print(f"\n⚠️ Không có end_cursor để tiếp tục, dừng lại")
-                    break
+                    if not end_cursor:
+                        print(f"\n⚠️ Không có end_cursor để tiếp tục, dừng lại")
+                        finished = True
+                        break
                 
-                # Cập nhật commentsAfterCursor cho lần lặp tiếp theo
-                commentsAfterCursor = end_cursor
-                page_number += 1
-                print(f"   ➡️ CommentsAfterCursor đã được cập nhật: {commentsAfterCursor[:50]}...")
+                    # Cập nhật commentsAfterCursor cho lần lặp tiếp theo
+                    commentsAfterCursor = end_cursor
+                    page_number += 1
+                    checkpoint.update(all_users, commentsAfterCursor, page_number)
+                    print(f"   ➡️ CommentsAfterCursor đã được cập nhật: {commentsAfterCursor[:50]}...")
                 
-            except Exception as e:
-                print(f"⚠️ Lỗi khi trích xuất page_info: {e}")
-                import traceback
-                traceback.print_exc()
-                break
+                except Exception as e:
+                    print(f"⚠️ Lỗi khi trích xuất page_info: {e}")
+                    import traceback
+                    traceback.print_exc()
+                    break
                 
-        except json.JSONDecodeError as e:
-            print(f"❌ Lỗi: Response không phải JSON hợp lệ")
-            print(f"   Chi tiết: {e}")
-            # Lưu response để debug
-            with open("response_debug.txt", "w", encoding="utf-8") as f:
-                f.write(response.text)
-            print(f"   Đã lưu response vào response_debug.txt")
-            break
-    
+            except json.JSONDecodeError as e:
+                print(f"❌ Lỗi: Response không phải JSON hợp lệ")
+                print(f"   Chi tiết: {e}")
+                # Lưu response để debug
+                with open("response_debug.txt", "w", encoding="utf-8") as f:
+                    f.write(response.text)
+                print(f"   Đã lưu response vào response_debug.txt")
+                break
+    finally:
+        # STOP / lỗi giữa chừng -> bỏ request prefetch, ghi nốt checkpoint; lấy hết trang -> xoá
+        prefetcher.close()
+        checkpoint.close(finished)
+
     # Hiển thị kết quả
     print(f"\n" + "="*50)
     print(f"✅ Hoàn thành!")
@@ -383,6 +434,139 @@ def get_all_comments_by_post_id(post_id, payload_dict, profile_id, cookies):
     return all_users
 
 
+# ================================
+#   DELTA: CHỈ LẤY COMMENTS MỚI SO VỚI LẦN CRAWL TRƯỚC
+# ================================
+def get_new_comments_by_post_id(post_id, payload_dict, profile_id, cookies, known_keys, known_total=None, max_pages=None, first_page=None):
+    """
+    Delta re-crawl comments: phân trang như get_all_comments_by_post_id nhưng dừng sớm khi
+    trang đầu báo tổng comments bằng known_total, hoặc gặp 1 trang không có comment nào mới.
+    
+    Args:
+        post_id (str): Facebook ID của post
+        payload_dict (dict): Dictionary chứa payload parameters
+        profile_id (str): Profile ID
+        cookies (str): Cookie string để sử dụng trong request
+        known_keys (set): Key các comment đã có (engagement_state.comment_key: user id + nội dung)
+        known_total (int, optional): Tổng comments Facebook báo ở lần trước
+        max_pages (int, optional): Budget số trang (crawl scheduler); hết budget trước trang đã biết
+            thì complete = False. None = không giới hạn
+        first_page (Response, optional): Response trang đầu đã tải sẵn (crawl scheduler probe)
+        
+    Returns:
+        tuple: (new_comments, total, complete) - new_comments chỉ gồm comment chưa có trong known_keys,
+            total là tổng comments Facebook báo ở trang đầu (None nếu không có),
+            complete = False nếu dừng vì lỗi / hết budget (chưa tới trang đã biết / hết trang) -> caller không được lưu total
+    """
+    seen_user_ids = set(known_keys or [])
+    new_comments = []
+    commentsAfterCursor = None
+    page_number = 0
+    total = None
+    stop_reason = None
+    complete = False
+    refreshed = False
+    print(f"🔁 Delta comments post {post_id}: đã biết {len(seen_user_ids)} comments (tổng lần trước: {known_total})")
+    
+    while True:
+        stop, paused, reason = check_flags(profile_id)
+        if stop:
+            print(f"🛑 Dừng lấy comments do stop: {reason}")
+            raise RuntimeError(f"EMERGENCY_STOP ({reason})")
+        if paused:
+            wait_if_paused(profile_id, sleep_seconds=0.5)
+            continue
+        
+        if max_pages and page_number >= max_pages:
+            stop_reason = "budget"
+            break
+        if first_page is not None and page_number == 0:
+            response, first_page, sent_at = first_page, None, None
+        else:
+            sent_at = time.time()
+            response = send_request(post_id, payload_dict, profile_id, cookies, commentsAfterCursor)
+        page_number += 1
+        if response.status_code != 200:
+            print(f"❌ Lỗi: Status code {response.status_code}")
+            break
+        try:
+            response_json = response.json()
+            raise_on_graphql_errors(response_json)
+        except json.JSONDecodeError as e:
+            print(f"❌ Trang {page_number} không phải JSON hợp lệ: {e}")
+            break
+        except ValueError as e:
+            # Lỗi payload/session (1357004, errors): refresh payload 1 lần rồi gửi lại trang này
+            print(f"❌ {e}")
+            if refreshed:
+                break
+            refreshed = True
+            new_payload = refresh_payload_from_bad_response(profile_id, cookies, response.text or "", sent_at)
+            if not new_payload:
+                break
+            payload_dict = new_payload
+            page_number -= 1
+            continue
+        try:
+            before = len(new_comments)
+            extract_users_from_json(response_json, new_comments, seen_user_ids)
+            edges_count, end_cursor, _start_cursor, has_next_page = parse_comments_page_info(response_json)
+        except Exception as e:
+            print(f"❌ Lỗi khi đọc trang {page_number}: {e}")
+            break
+        
+        if page_number == 1:
+            node = (response_json.get("data") or {}).get("node") or {}
+            comments = (node.get("comment_rendering_instance_for_feed_location") or {}).get("comments") or {}
+            total = engagement_state.extract_total(comments)
+            if known_total is not None and total == known_total:
+                stop_reason = "total_unchanged"
+                complete = True
+                break
+        if edges_count and len(new_comments) == before:
+            stop_reason = "known_page"
+            complete = True
+            break
+        if not has_next_page or not end_cursor:
+            complete = True
+            break
+        commentsAfterCursor = end_cursor
+    
+    engagement_state.record_pages(page_number, stop_reason if complete else (stop_reason or "error"))
+    print(f"✅ Delta comments post {post_id}: +{len(new_comments)} comments mới / {page_number} trang (dừng: {stop_reason or ('hết trang' if complete else 'lỗi')})")
+    return new_comments, total, complete
+
+
+# ================================
+#   PROBE: TỔNG COMMENTS TỪ TRANG ĐẦU (CHO CRAWL SCHEDULER)
+# ================================
+def comments_page_summary(response_json):
+    """{"total", "edges", "has_next_page"} của 1 trang comments (total = None nếu Facebook không trả)."""
+    node = (response_json.get("data") or {}).get("node") or {}
+    comments = (node.get("comment_rendering_instance_for_feed_location") or {}).get("comments") or {}
+    page_info = comments.get("page_info") or {}
+    return {
+        "total": engagement_state.extract_total(comments),
+        "edges": len(comments.get("edges") or []),
+        "has_next_page": bool(page_info.get("has_next_page")),
+    }
+
+
+def get_comments_summary(post_id, payload_dict, profile_id, cookies):
+    """
+    Gửi 1 request trang đầu comments, trả về (comments_page_summary, response) hoặc (None, None) nếu lỗi.
+    response được chuyển cho get_all_comments_by_post_id / get_new_comments_by_post_id (first_page).
+    """
+    response = send_request(post_id, payload_dict, profile_id, cookies)
+    if response.status_code != 200:
+        return None, None
+    try:
+        return comments_page_summary(response.json()), response
+    except Exception as e:
+        print(f"⚠️ Không đọc được trang đầu comments của {post_id}: {e}")
+        return None, None
+
+
 # ================================
 #   HÀM ĐƠN GIẢN: LẤY COMMENTS TỪ CURSOR
 # ================================
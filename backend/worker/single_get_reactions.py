@@ -1,13 +1,17 @@
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 import json
 import base64
 from urllib.parse import urlencode
 import os
+import time
 from datetime import datetime
 from pathlib import Path
 
+# Session HTTP pooled theo profile (keep-alive, retry chung, header tĩnh tính sẵn)
+try:
+    from core.http_pool import graphql_headers, post_graphql
+except ImportError:
+    from backend.core.http_pool import graphql_headers, post_graphql
+
 
 def parse_facebook_json_response(response_text):
     """
@@ -53,6 +57,16 @@ def parse_facebook_json_response(response_text):
     
     return response_json
 
+# Checkpoint cursor + kết quả từng phần theo post (tiếp tục phân trang sau crash / STOP / lỗi)
+try:
+    from core.pagination_checkpoint import PaginationCheckpoint
+    from core.page_prefetch import PagePrefetcher
+    from core import engagement_state
+except ImportError:
+    from backend.core.pagination_checkpoint import PaginationCheckpoint
+    from backend.core.page_prefetch import PagePrefetcher
+    from backend.core import engagement_state
+
 # Import control state để check stop/pause
 try:
     from backend.core.control import check_flags, wait_if_paused
@@ -72,6 +86,52 @@ except ImportError:
 # Sử dụng get_payload.get_payload_by_profile_id(profile_id) để lấy payload
 # Sử dụng get_payload.get_cookies_by_profile_id(profile_id) để lấy cookie
 
+# ====== FIX PAYLOAD KHI FACEBOOK BÁO LỖI (1357004 / errors) ======
+def _import_payload_refresh_funcs():
+    """Import lazy (get_payload kéo theo playwright) với các đường dẫn import giống get_all_info."""
+    try:
+        from get_payload import ensure_payload_from_bad_response, get_payload_by_profile_id, update_payload_file  # type: ignore
+    except ImportError:
+        try:
+            from worker.get_payload import ensure_payload_from_bad_response, get_payload_by_profile_id, update_payload_file  # type: ignore
+        except ImportError:
+            from backend.worker.get_payload import ensure_payload_from_bad_response, get_payload_by_profile_id, update_payload_file  # type: ignore
+    return ensure_payload_from_bad_response, get_payload_by_profile_id, update_payload_file
+
+
+def refresh_payload_from_bad_response(profile_id, cookies, response_text, sent_at=None):
+    """
+    Nhánh fix lỗi payload (1357004 / errors): headless capture lấy giá trị động -> cập nhật payload.txt
+    -> dựng lại payload_dict. Trả về payload_dict mới hoặc None. Dùng chung cho client async và delta re-crawl.
+    sent_at: thời điểm gửi request bị lỗi; worker khác refresh sau thời điểm đó thì dùng lại payload của nó.
+    """
+    ensure_payload_from_bad_response, get_payload_by_profile_id, update_payload_file = _import_payload_refresh_funcs()
+    print("ℹ️ Thực hiện headless capture để lấy các giá trị động và cập nhật settings.json/payload.txt...")
+    payload_values = ensure_payload_from_bad_response(
+        profile_id, cookies, response_text=response_text, timeout=8, stale_since=sent_at
+    )
+    if not payload_values or not (payload_values.get("fb_dtsg") or payload_values.get("lsd")):
+        print("❌ Headless capture không trả về giá trị nào.")
+        return None
+    try:
+        if update_payload_file(payload_values):
+            print("✅ Đã cập nhật backend/config/payload.txt từ headless capture")
+    except Exception as e_up:
+        print(f"⚠️ Lỗi khi cập nhật payload.txt: {e_up}")
+    return get_payload_by_profile_id(profile_id) or None
+
+
+def raise_on_graphql_errors(response_json):
+    """Response có mảng errors -> ValueError (giống bản đồng bộ)."""
+    errors = response_json.get("errors")
+    if errors and isinstance(errors, list):
+        error = errors[0] if isinstance(errors[0], dict) else {}
+        error_msg = f"Facebook API Error: {error.get('message', 'Unknown error')}"
+        if error.get("code"):
+            error_msg += f" (Code: {error.get('code')})"
+        raise ValueError(error_msg)
+
+
 # ====== TẠO FEEDBACK TARGET ID TỪ FID ======
 def create_feedback_target_id(fid):
     """Chuyển đổi fid thành feedbackTargetID bằng base64"""
@@ -83,9 +143,14 @@ def create_feedback_target_id(fid):
 # ================================
 #   GỬI REQUEST GRAPHQL VỚI CURSOR
 # ================================
-def send_request(feedback_target_id, payload_dict, profile_id, cookies, cursor=None):
-    """Gửi request GraphQL với feedbackTargetID và cursor (nếu có)"""
+def build_request_payload(feedback_target_id, payload_dict, cursor=None):
+    """
+    Tạo body form-urlencoded cho request reactions (không gửi).
+    Dùng chung cho send_request (đồng bộ) và async_graphql (bất đồng bộ).
     
+    Returns:
+        tuple: (payload_str, payload_dict_đã_merge, variables)
+    """
     # Payload dưới dạng dictionary (từ điển)
     variables = {
         "count": 100,
@@ -98,12 +163,6 @@ def send_request(feedback_target_id, payload_dict, profile_id, cookies, cursor=N
     # Thêm cursor nếu có
     if cursor:
         variables["cursor"] = cursor
-        print(f"   🔄 Sử dụng cursor: {cursor[:50]}...")
-    else:
-        print(f"   🔄 Không có cursor (trang đầu tiên)")
-    
-    # Debug: In ra variables để kiểm tra
-    print(f"   📋 Variables: {json.dumps(variables, ensure_ascii=True)}")
     
     # Sử dụng payload được truyền vào và thêm variables, doc_id, fb_api_req_friendly_name
     payload_dict = payload_dict.copy()
@@ -119,7 +178,21 @@ def send_request(feedback_target_id, payload_dict, profile_id, cookies, cursor=N
     payload_dict["fb_api_req_friendly_name"] = "CometUFIReactionsDialogTabContentRefetchQuery"
 
     # Chuyển dictionary thành form-urlencoded string
-    payload = urlencode(payload_dict)
+    return urlencode(payload_dict), payload_dict, variables
+
+
+def send_request(feedback_target_id, payload_dict, profile_id, cookies, cursor=None):
+    """Gửi request GraphQL với feedbackTargetID và cursor (nếu có)"""
+    
+    if cursor:
+        print(f"   🔄 Sử dụng cursor: {cursor[:50]}...")
+    else:
+        print(f"   🔄 Không có cursor (trang đầu tiên)")
+    
+    payload, payload_dict, variables = build_request_payload(feedback_target_id, payload_dict, cursor)
+    
+    # Debug: In ra variables để kiểm tra
+    print(f"   📋 Variables: {json.dumps(variables, ensure_ascii=True)}")
 
     # Tạo headers với cookies
     # Lấy lsd từ payload_dict (quan trọng để tránh lỗi 1357004)
@@ -127,26 +200,7 @@ def send_request(feedback_target_id, payload_dict, profile_id, cookies, cursor=N
     if not lsd_value:
         print(f"   ⚠️ WARNING: lsd không có trong payload_dict! Keys: {list(payload_dict.keys())}")
     
-    headers = {
-        "accept": "*/*",
-        "accept-encoding": "gzip, deflate",
-        "accept-language": "en,vi;q=0.9,en-US;q=0.8",
-        "content-type": "application/x-www-form-urlencoded",
-        "cookie": cookies,
-        "origin": "https://www.facebook.com",
-        "priority": "u=1, i",
-        "referer": "https://www.facebook.com/photo/?fbid=965661036626847&set=a.777896542069965",
-        "sec-ch-ua": '"Google Chrome";v="143", "Chromium";v="143", "Not A(Brand";v="24"',
-        "sec-ch-ua-mobile": "?0",
-        "sec-ch-ua-platform": '"Windows"',
-        "sec-fetch-dest": "empty",
-        "sec-fetch-mode": "cors",
-        "sec-fetch-site": "same-origin",
-        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36",
-        "x-asbd-id": "359341",
-        "x-fb-friendly-name": "CometUFIReactionsDialogTabContentRefetchQuery",
-        "x-fb-lsd": lsd_value
-    }
+    headers = graphql_headers(cookies, "CometUFIReactionsDialogTabContentRefetchQuery", lsd_value)
     
     # Debug: Kiểm tra cookies và headers quan trọng
     if not cookies or len(cookies.strip()) < 50:
@@ -154,26 +208,19 @@ def send_request(feedback_target_id, payload_dict, profile_id, cookies, cursor=N
     if not lsd_value:
         print(f"   ⚠️ WARNING: x-fb-lsd rỗng - có thể gây lỗi 1357004!")
 
-    url = "https://www.facebook.com/api/graphql/"
-    
-    # Chuẩn bị session với retry để giảm timeout/connection reset
-    session = requests.Session()
-    retry_cfg = Retry(
-        total=2,
-        backoff_factor=0.5,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["POST"],
-    )
-    adapter = HTTPAdapter(max_retries=retry_cfg)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    
-    # Gửi payload dưới dạng form-urlencoded với headers
-    response = session.post(url, data=payload, headers=headers, timeout=20)
+    # Gửi payload qua session dùng chung của profile (giữ kết nối keep-alive giữa các trang/post)
+    response = post_graphql(profile_id, payload, headers, timeout=20)
     
     return response
 
 
+def reactions_next_cursor(response_json):
+    """end_cursor của trang reactors nếu còn trang sau (đọc page_info, không duyệt edges), không thì None."""
+    reactors = ((response_json.get("data") or {}).get("node") or {}).get("reactors") or {}
+    page_info = reactors.get("page_info") or {}
+    return page_info.get("end_cursor") if page_info.get("has_next_page") else None
+
+
 def process_reactors_response(response_json, all_users, seen_ids, duplicate_count):
     """
     Xử lý response_json từ Facebook API để trích xuất users từ reactors.
@@ -250,7 +297,7 @@ def process_reactors_response(response_json, all_users, seen_ids, duplicate_coun
 # ================================
 #   HÀM HOÀN CHỈNH: LẤY TẤT CẢ USERS TỪ FID
 # ================================
-def get_all_users_by_fid(fid, payload_dict, profile_id, cookies):
+def get_all_users_by_fid(fid, payload_dict, profile_id, cookies, max_pages=None, first_page=None):
     """
     Hàm hoàn chỉnh để lấy tất cả users (id và name) từ FID
     
@@ -259,6 +306,10 @@ def get_all_users_by_fid(fid, payload_dict, profile_id, cookies):
         payload_dict (dict): Dictionary chứa payload parameters
         profile_id (str): Profile ID
         cookies (str): Cookie string để sử dụng trong request
+        max_pages (int, optional): Budget số trang cho lần gọi này (crawl scheduler). Hết budget thì dừng,
+            checkpoint giữ cursor để phiên sau lấy tiếp. None = không giới hạn
+        first_page (Response, optional): Response trang đầu đã tải sẵn (crawl scheduler probe),
+            dùng thay cho request trang 1 nếu không tiếp tục từ checkpoint
         
     Returns:
         list: Danh sách users với format [{"id": "...", "name": "..."}, ...]
@@ -276,335 +327,209 @@ def get_all_users_by_fid(fid, payload_dict, profile_id, cookies):
     cursor = None
     page_number = 1
     duplicate_count = 0  # Đếm số user trùng đã bỏ qua
+
+    # Checkpoint cursor + users mỗi N trang: lần chạy trước dừng giữa chừng thì tiếp tục từ cursor cuối
+    checkpoint = PaginationCheckpoint("reactions", fid)
+    resume = checkpoint.load()
+    if resume:
+        all_users = resume["items"]
+        seen_ids = {user.get("id") for user in all_users}
+        cursor = resume["cursor"]
+        page_number = resume["page_number"]
+        duplicate_count = int(resume["extra"].get("duplicate_count") or 0)
+    finished = False  # True khi đã lấy hết trang -> xoá checkpoint
+    start_page = page_number
+    payload_refreshed = False  # đã refresh payload cho trang hiện tại (mỗi trang lỗi chỉ refresh + gửi lại 1 lần)
+    # Gửi trước trang sau (thread nền) trong lúc xử lý trang hiện tại
+    prefetcher = PagePrefetcher(lambda next_cursor: send_request(feedback_target_id, payload_dict, profile_id, cookies, next_cursor), profile_id)
+    if cursor is None:
+        prefetcher.preload(None, first_page)
     
-    while True:
-        # Check stop/pause trước mỗi request
-        try:
-            stop, paused, reason = check_flags(profile_id)
-            if stop:
-                print(f"🛑 Dừng lấy reactions do stop: {reason}")
-                raise RuntimeError(f"EMERGENCY_STOP ({reason})")
-            if paused:
-                print(f"⏸️ Đang tạm dừng ({reason}), chờ tiếp tục...")
-                wait_if_paused(profile_id, sleep_seconds=0.5)
-                continue  # Tiếp tục check sau khi resume
-        except RuntimeError:
-            raise  # Re-raise RuntimeError để caller có thể catch
-        except Exception as e:
-            print(f"⚠️ Lỗi khi check stop/pause: {e}")
-            # Tiếp tục nếu có lỗi check
+    try:
+        while True:
+            if max_pages and page_number - start_page >= max_pages:
+                print(f"⏳ Đã dùng hết budget {max_pages} trang reactions cho post này, phần còn lại để phiên sau")
+                break
+            # Check stop/pause trước mỗi request
+            try:
+                stop, paused, reason = check_flags(profile_id)
+                if stop:
+                    print(f"🛑 Dừng lấy reactions do stop: {reason}")
+                    raise RuntimeError(f"EMERGENCY_STOP ({reason})")
+                if paused:
+                    print(f"⏸️ Đang tạm dừng ({reason}), chờ tiếp tục...")
+                    # Bỏ trang đang prefetch: tiếp tục thì tải lại, không dùng response từ trước lúc tạm dừng
+                    prefetcher.close()
+                    wait_if_paused(profile_id, sleep_seconds=0.5)
+                    continue  # Tiếp tục check sau khi resume
+            except RuntimeError:
+                raise  # Re-raise RuntimeError để caller có thể catch
+            except Exception as e:
+                print(f"⚠️ Lỗi khi check stop/pause: {e}")
+                # Tiếp tục nếu có lỗi check
         
-        print(f"\n📄 Trang {page_number} - Đang gửi request...")
-        if cursor:
-            print(f"   Cursor: {cursor[:50]}...")
+            print(f"\n📄 Trang {page_number} - Đang gửi request...")
+            if cursor:
+                print(f"   Cursor: {cursor[:50]}...")
         
-        # Gửi request với feedbackTargetID, payload, profile_id, cookies và cursor
-        response = send_request(feedback_target_id, payload_dict, profile_id, cookies, cursor)
+            # Gửi request với feedbackTargetID, payload, profile_id, cookies và cursor (hoặc lấy response đã prefetch)
+            response = prefetcher.fetch(cursor)
         
-        print(f"   STATUS: {response.status_code}")
+            print(f"   STATUS: {response.status_code}")
 
-        # Decode response text for inspection (no file saving)
-        saved_text = ""
-        content_encoding = (response.headers.get("content-encoding") or "").lower()
-        if "br" in content_encoding:
-            try:
-                import brotli
-                saved_text = brotli.decompress(response.content).decode("utf-8", errors="replace")
-            except Exception as e:
-                print(f"   ⚠️ Brotli decompress failed: {e}")
+            # Decode response text for inspection (no file saving)
+            saved_text = ""
+            content_encoding = (response.headers.get("content-encoding") or "").lower()
+            if "br" in content_encoding:
                 try:
-                    saved_text = (response.content or b"").decode("utf-8", errors="replace")
-                except Exception:
-                    saved_text = ""
-        else:
-            # rely on requests to handle gzip/deflate; fall back to manual decode
-            try:
-                saved_text = response.text or ""
-            except Exception:
+                    import brotli
+                    saved_text = brotli.decompress(response.content).decode("utf-8", errors="replace")
+                except Exception as e:
+                    print(f"   ⚠️ Brotli decompress failed: {e}")
+                    try:
+                        saved_text = (response.content or b"").decode("utf-8", errors="replace")
+                    except Exception:
+                        saved_text = ""
+            else:
+                # rely on requests to handle gzip/deflate; fall back to manual decode
                 try:
-                    saved_text = (response.content or b"").decode("utf-8", errors="replace")
+                    saved_text = response.text or ""
                 except Exception:
-                    saved_text = ""
+                    try:
+                        saved_text = (response.content or b"").decode("utf-8", errors="replace")
+                    except Exception:
+                        saved_text = ""
 
-        if response.status_code != 200:
-            print(f"❌ Lỗi: Status code {response.status_code}")
-            print(f"   Response preview: {saved_text[:500] if saved_text else 'Empty response'}")
-            break
+            if response.status_code != 200:
+                print(f"❌ Lỗi: Status code {response.status_code}")
+                print(f"   Response preview: {saved_text[:500] if saved_text else 'Empty response'}")
+                break
         
-        # Debug: Kiểm tra content-type
-        content_type = response.headers.get("content-type", "").lower()
-        print(f"   Content-Type: {content_type}")
+            # Debug: Kiểm tra content-type
+            content_type = response.headers.get("content-type", "").lower()
+            print(f"   Content-Type: {content_type}")
         
-        # Debug: In preview của response để kiểm tra
-        if saved_text:
-            preview = saved_text[:200].replace("\n", "\\n")
-            print(f"   Response preview (200 chars): {preview}")
-        else:
-            print(f"   ⚠️ Response text rỗng!")
+            # Debug: In preview của response để kiểm tra
+            if saved_text:
+                preview = saved_text[:200].replace("\n", "\\n")
+                print(f"   Response preview (200 chars): {preview}")
+            else:
+                print(f"   ⚠️ Response text rỗng!")
         
-        # Parse response thành JSON
-        try:
-            response_json = parse_facebook_json_response(saved_text)
+            # Parse response thành JSON
+            try:
+                response_json = parse_facebook_json_response(saved_text)
             
-            # Kiểm tra và parse lỗi Facebook API (format errors array)
-            if "errors" in response_json:
-                errors = response_json.get("errors", [])
-                if errors and isinstance(errors, list) and len(errors) > 0:
-                    error = errors[0]
-                    error_code = error.get("code")
-                    error_message = error.get("message", "Unknown error")
-                    error_type = error.get("error_type", "")
+                # Kiểm tra và parse lỗi Facebook API (format errors array)
+                if "errors" in response_json:
+                    errors = response_json.get("errors", [])
+                    if errors and isinstance(errors, list) and len(errors) > 0:
+                        error = errors[0]
+                        error_code = error.get("code")
+                        error_message = error.get("message", "Unknown error")
+                        error_type = error.get("error_type", "")
                     
-                    # Tạo thông báo lỗi chi tiết
-                    error_msg = f"Facebook API Error: {error_message}"
-                    if error_code:
-                        error_msg += f" (Code: {error_code})"
-                    if error_type:
-                        error_msg += f" (Type: {error_type})"
+                        # Tạo thông báo lỗi chi tiết
+                        error_msg = f"Facebook API Error: {error_message}"
+                        if error_code:
+                            error_msg += f" (Code: {error_code})"
+                        if error_type:
+                            error_msg += f" (Type: {error_type})"
                     
-                    print(f"   ❌ Response có errors: {errors}")
-                    raise ValueError(error_msg)
+                        print(f"   ❌ Response có errors: {errors}")
+                        raise ValueError(error_msg)
             
-            # Debug: Kiểm tra cấu trúc response
-            if "data" not in response_json:
-                print(f"   ⚠️ Response không có 'data': {list(response_json.keys())}")
+                # Debug: Kiểm tra cấu trúc response
+                if "data" not in response_json:
+                    print(f"   ⚠️ Response không có 'data': {list(response_json.keys())}")
             
-            # Trích xuất id và name từ mỗi node
-            try:
-                page_users, end_cursor, has_next_page, last_cursor, duplicate_count = process_reactors_response(
-                    response_json, all_users, seen_ids, duplicate_count
-                )
+                # Đã biết cursor trang sau -> gửi trước trong lúc xử lý edges trang này (trừ khi hết budget trang)
+                if not (max_pages and page_number + 1 - start_page >= max_pages):
+                    prefetcher.prefetch(reactions_next_cursor(response_json))
+            
+                # Trích xuất id và name từ mỗi node
+                try:
+                    page_users, end_cursor, has_next_page, last_cursor, duplicate_count = process_reactors_response(
+                        response_json, all_users, seen_ids, duplicate_count
+                    )
                 
-                all_users.extend(page_users)
+                    all_users.extend(page_users)
                 
-                # Sử dụng end_cursor từ page_info (theo yêu cầu)
-                next_cursor = end_cursor
+                    # Sử dụng end_cursor từ page_info (theo yêu cầu)
+                    next_cursor = end_cursor
                 
-                print(f"   ✅ Lấy được {len(page_users)} users mới (Tổng: {len(all_users)}, Trùng: {duplicate_count})")
-                print(f"   🔗 End cursor (page_info): {end_cursor[:50] if end_cursor else 'None'}...")
-                print(f"   🔗 Last cursor (edge): {last_cursor[:50] if last_cursor else 'None'}...")
-                print(f"   🔗 Next cursor sẽ dùng: {next_cursor[:50] if next_cursor else 'None'}...")
-                print(f"   📄 Has next page: {has_next_page}")
+                    print(f"   ✅ Lấy được {len(page_users)} users mới (Tổng: {len(all_users)}, Trùng: {duplicate_count})")
+                    print(f"   🔗 End cursor (page_info): {end_cursor[:50] if end_cursor else 'None'}...")
+                    print(f"   🔗 Last cursor (edge): {last_cursor[:50] if last_cursor else 'None'}...")
+                    print(f"   🔗 Next cursor sẽ dùng: {next_cursor[:50] if next_cursor else 'None'}...")
+                    print(f"   📄 Has next page: {has_next_page}")
                 
-                # Kiểm tra có trang tiếp theo không
-                if not has_next_page:
-                    print(f"\n✅ Đã lấy hết tất cả users! (has_next_page = False)")
-                    break
-                
-                if not next_cursor:
-                    print(f"\n⚠️ Không có cursor để tiếp tục, dừng lại")
-                    break
+                    # Kiểm tra có trang tiếp theo không
+                    if not has_next_page:
+                        print(f"\n✅ Đã lấy hết tất cả users! (has_next_page = False)")
+                        finished = True
+                        break
                 
-                # Cập nhật cursor cho lần lặp tiếp theo
-                cursor = next_cursor
-                page_number += 1
-                print(f"   ➡️ Cursor đã được cập nhật: {cursor[:50]}...")
+                    if not next_cursor:
+                        print(f"\n⚠️ Không có cursor để tiếp tục, dừng lại")
+                        finished = True
+                        break
                 
-            except Exception as e:
-                print(f"⚠️ Lỗi khi trích xuất nodes: {e}")
-                break
+                    # Cập nhật cursor cho lần lặp tiếp theo
+                    cursor = next_cursor
+                    page_number += 1
+                    checkpoint.update(all_users, cursor, page_number, duplicate_count=duplicate_count)
+                    payload_refreshed = False
+                    print(f"   ➡️ Cursor đã được cập nhật: {cursor[:50]}...")
                 
-        except ValueError as e:
-            # Facebook API error (1357004, etc.) - đã được parse và xử lý trong parse_facebook_json_response
-            error_msg = str(e)
-            if "1357004" in error_msg:
-                print(f"   ❌ Facebook Error 1357004")
-                print(f"   💡 Có thể do: Session hết hạn, cookies không hợp lệ, hoặc cần refresh browser")
-            else:
-                print(f"   ❌ {error_msg}")
-            # Attempt to extract dynamic payload values (fb_dtsg, lsd, __spin_r, __spin_t)
-            try:
-                from get_payload import ensure_payload_from_bad_response, get_payload_by_profile_id, update_payload_file
-                print("ℹ️ Thực hiện headless capture để lấy các giá trị động và cập nhật settings.json/payload.txt...")
-                payload_values = ensure_payload_from_bad_response(profile_id, cookies, response_text=saved_text, timeout=8)
-                if not payload_values:
-                    print("❌ Headless capture không trả về giá trị nào, dừng.")
+                except Exception as e:
+                    print(f"⚠️ Lỗi khi trích xuất nodes: {e}")
                     break
-
-                # Update payload.txt with discovered dynamic values
-                try:
-                    updated = update_payload_file(payload_values)
-                    if updated:
-                        print("✅ Đã cập nhật backend/config/payload.txt từ headless capture")
+                
+            except (ValueError, json.JSONDecodeError) as e:
+                # Lỗi Facebook API (1357004, errors array) hoặc response không phải JSON
+                error_msg = str(e)
+                if isinstance(e, json.JSONDecodeError):
+                    print(f"❌ Lỗi: Response không phải JSON hợp lệ")
+                    print(f"   Chi tiết: {e}")
+                    print(f"   Content-Type: {content_type}")
+                    print(f"   Response length: {len(saved_text) if saved_text else 0} chars")
+                    if saved_text:
+                        # In ra 500 ký tự đầu để debug
+                        preview = saved_text[:500].replace("\n", "\\n")
+                        print(f"   Response preview: {preview}")
+                        # Kiểm tra xem có phải HTML không
+                        if saved_text.strip().startswith("<!DOCTYPE") or saved_text.strip().startswith("<html"):
+                            print(f"   ⚠️ Response có vẻ là HTML (có thể là trang lỗi của Facebook)")
                     else:
-                        print("⚠️ Không thể cập nhật backend/config/payload.txt từ headless capture")
-                except Exception as e_up:
-                    print(f"⚠️ Lỗi khi cập nhật payload.txt: {e_up}")
-
-                # Rebuild payload_dict from updated payload.txt / settings.json and retry once
-                payload_dict = get_payload_by_profile_id(profile_id)
-                if payload_dict:
-                    print("ℹ️ Thử gửi lại request sau khi cập nhật payload...")
-                    response = send_request(feedback_target_id, payload_dict, profile_id, cookies, cursor)
-                    try:
-                        # Lấy response text để parse
-                        retry_saved_text = response.text or ""
-                        if not retry_saved_text and response.content:
-                            retry_saved_text = response.content.decode("utf-8", errors="replace")
-                        response_json = parse_facebook_json_response(retry_saved_text)
-                        print("✅ Retry thành công, response JSON hợp lệ.")
-                        
-                        # Kiểm tra errors array
-                        if "errors" in response_json:
-                            errors = response_json.get("errors", [])
-                            if errors and isinstance(errors, list) and len(errors) > 0:
-                                error = errors[0]
-                                error_code = error.get("code")
-                                error_message = error.get("message", "Unknown error")
-                                print(f"   ❌ Response có errors: {errors}")
-                                raise ValueError(f"Facebook API Error: {error_message} (Code: {error_code})")
-                        
-                        # Xử lý response_json ngay tại đây
-                        if "data" not in response_json:
-                            print(f"   ⚠️ Response không có 'data': {list(response_json.keys())}")
-                            break
-                        
-                        # Trích xuất users từ response
-                        try:
-                            page_users, end_cursor, has_next_page, last_cursor, duplicate_count = process_reactors_response(
-                                response_json, all_users, seen_ids, duplicate_count
-                            )
-                            
-                            all_users.extend(page_users)
-                            next_cursor = end_cursor
-                            
-                            print(f"   ✅ Lấy được {len(page_users)} users mới (Tổng: {len(all_users)}, Trùng: {duplicate_count})")
-                            print(f"   🔗 End cursor: {end_cursor[:50] if end_cursor else 'None'}...")
-                            print(f"   📄 Has next page: {has_next_page}")
-                            
-                            if not has_next_page:
-                                print(f"\n✅ Đã lấy hết tất cả users! (has_next_page = False)")
-                                break
-                            
-                            if not next_cursor:
-                                print(f"\n⚠️ Không có cursor để tiếp tục, dừng lại")
-                                break
-                            
-                            cursor = next_cursor
-                            page_number += 1
-                            print(f"   ➡️ Cursor đã được cập nhật: {cursor[:50]}...")
-                            continue  # Tiếp tục vòng lặp với cursor mới
-                            
-                        except Exception as e_extract:
-                            print(f"⚠️ Lỗi khi trích xuất nodes từ retry response: {e_extract}")
-                            break
-                            
-                    except ValueError as e2:
-                        print(f"❌ Retry vẫn có lỗi Facebook API: {e2}")
-                        break
-                    except Exception as e2:
-                        print(f"❌ Retry vẫn không trả về JSON hợp lệ: {e2}")
-                        break
+                        print(f"   ⚠️ Response rỗng!")
+                elif "1357004" in error_msg:
+                    print(f"   ❌ Facebook Error 1357004")
+                    print(f"   💡 Có thể do: Session hết hạn, cookies không hợp lệ, hoặc cần refresh browser")
                 else:
-                    print("❌ Không thể tạo payload mới từ payload.txt/settings.json, dừng.")
-                    break
-            except Exception as ee:
-                print(f"⚠️ Lỗi khi cố gắng fix bằng headless: {ee}")
-                break
-        except json.JSONDecodeError as e:
-            print(f"❌ Lỗi: Response không phải JSON hợp lệ")
-            print(f"   Chi tiết: {e}")
-            print(f"   Content-Type: {content_type}")
-            print(f"   Response length: {len(saved_text) if saved_text else 0} chars")
-            if saved_text:
-                # In ra 500 ký tự đầu để debug
-                preview = saved_text[:500].replace("\n", "\\n")
-                print(f"   Response preview: {preview}")
-                # Kiểm tra xem có phải HTML không
-                if saved_text.strip().startswith("<!DOCTYPE") or saved_text.strip().startswith("<html"):
-                    print(f"   ⚠️ Response có vẻ là HTML (có thể là trang lỗi của Facebook)")
-                elif len(saved_text.strip()) == 0:
-                    print(f"   ⚠️ Response rỗng!")
-            # Attempt to extract dynamic payload values (fb_dtsg, lsd, __spin_r, __spin_t)
-            try:
-                from get_payload import ensure_payload_from_bad_response, get_payload_by_profile_id, update_payload_file
-                print("ℹ️ Thực hiện headless capture để lấy các giá trị động và cập nhật settings.json/payload.txt...")
-                payload_values = ensure_payload_from_bad_response(profile_id, cookies, response_text=saved_text, timeout=8)
-                if not payload_values:
-                    print("❌ Headless capture không trả về giá trị nào, dừng.")
+                    print(f"   ❌ {error_msg}")
+                # Refresh payload (headless capture) 1 lần rồi gửi lại đúng trang này; lần gửi lại vẫn lỗi thì dừng
+                if payload_refreshed:
+                    print(f"❌ Gửi lại sau khi cập nhật payload vẫn lỗi, dừng.")
                     break
-
-                # Update payload.txt with discovered dynamic values
+                payload_refreshed = True
                 try:
-                    updated = update_payload_file(payload_values)
-                    if updated:
-                        print("✅ Đã cập nhật backend/config/payload.txt từ headless capture")
-                    else:
-                        print("⚠️ Không thể cập nhật backend/config/payload.txt từ headless capture")
-                except Exception as e_up:
-                    print(f"⚠️ Lỗi khi cập nhật payload.txt: {e_up}")
-
-                # Rebuild payload_dict from updated payload.txt / settings.json and retry once
-                payload_dict = get_payload_by_profile_id(profile_id)
-                if payload_dict:
-                    print("ℹ️ Thử gửi lại request sau khi cập nhật payload...")
-                    response = send_request(feedback_target_id, payload_dict, profile_id, cookies, cursor)
-                    try:
-                        # Lấy response text để parse
-                        retry_saved_text = response.text or ""
-                        if not retry_saved_text and response.content:
-                            retry_saved_text = response.content.decode("utf-8", errors="replace")
-                        response_json = parse_facebook_json_response(retry_saved_text)
-                        print("✅ Retry thành công, response JSON hợp lệ.")
-                        
-                        # Kiểm tra errors array
-                        if "errors" in response_json:
-                            errors = response_json.get("errors", [])
-                            if errors and isinstance(errors, list) and len(errors) > 0:
-                                error = errors[0]
-                                error_code = error.get("code")
-                                error_message = error.get("message", "Unknown error")
-                                print(f"   ❌ Response có errors: {errors}")
-                                raise ValueError(f"Facebook API Error: {error_message} (Code: {error_code})")
-                        
-                        # Xử lý response_json ngay tại đây
-                        if "data" not in response_json:
-                            print(f"   ⚠️ Response không có 'data': {list(response_json.keys())}")
-                            break
-                        
-                        # Trích xuất users từ response
-                        try:
-                            page_users, end_cursor, has_next_page, last_cursor, duplicate_count = process_reactors_response(
-                                response_json, all_users, seen_ids, duplicate_count
-                            )
-                            
-                            all_users.extend(page_users)
-                            next_cursor = end_cursor
-                            
-                            print(f"   ✅ Lấy được {len(page_users)} users mới (Tổng: {len(all_users)}, Trùng: {duplicate_count})")
-                            print(f"   🔗 End cursor: {end_cursor[:50] if end_cursor else 'None'}...")
-                            print(f"   📄 Has next page: {has_next_page}")
-                            
-                            if not has_next_page:
-                                print(f"\n✅ Đã lấy hết tất cả users! (has_next_page = False)")
-                                break
-                            
-                            if not next_cursor:
-                                print(f"\n⚠️ Không có cursor để tiếp tục, dừng lại")
-                                break
-                            
-                            cursor = next_cursor
-                            page_number += 1
-                            print(f"   ➡️ Cursor đã được cập nhật: {cursor[:50]}...")
-                            continue  # Tiếp tục vòng lặp với cursor mới
-                            
-                        except Exception as e_extract:
-                            print(f"⚠️ Lỗi khi trích xuất nodes từ retry response: {e_extract}")
-                            break
-                            
-                    except ValueError as e2:
-                        print(f"❌ Retry vẫn có lỗi Facebook API: {e2}")
-                        break
-                    except Exception as e2:
-                        print(f"❌ Retry vẫn không trả về JSON hợp lệ: {e2}")
-                        break
-                else:
+                    new_payload = refresh_payload_from_bad_response(profile_id, cookies, saved_text, prefetcher.last_sent_at)
+                except Exception as ee:
+                    print(f"⚠️ Lỗi khi cố gắng fix bằng headless: {ee}")
+                    break
+                if not new_payload:
                     print("❌ Không thể tạo payload mới từ payload.txt/settings.json, dừng.")
                     break
-            except Exception as ee:
-                print(f"⚠️ Lỗi khi cố gắng fix bằng headless: {ee}")
-                break
-    
+                # send_request của prefetcher đọc payload_dict qua closure -> lần gửi lại dùng payload mới
+                payload_dict = new_payload
+                print("ℹ️ Thử gửi lại request sau khi cập nhật payload...")
+                continue
+    finally:
+        # STOP / lỗi giữa chừng -> bỏ request prefetch, ghi nốt checkpoint; lấy hết trang -> xoá
+        prefetcher.close()
+        checkpoint.close(finished)
+
     # Hiển thị kết quả
     print(f"\n" + "="*50)
     print(f"✅ Hoàn thành!")
@@ -713,6 +638,141 @@ def get_users_by_cursor(fid, payload_dict, profile_id, cookies, cursor=None):
         return {"users": [], "end_cursor": None, "has_next_page": False}
 
 
+# ================================
+#   DELTA: CHỈ LẤY USERS MỚI SO VỚI LẦN CRAWL TRƯỚC
+# ================================
+def get_new_users_by_fid(fid, payload_dict, profile_id, cookies, known_ids, known_total=None, max_pages=None, first_page=None):
+    """
+    Delta re-crawl reactions: phân trang như get_all_users_by_fid nhưng dừng sớm khi
+    trang đầu báo tổng reactions bằng known_total, hoặc gặp 1 trang toàn user đã có trong known_ids.
+    
+    Args:
+        fid (str): Facebook ID của post/photo
+        payload_dict (dict): Dictionary chứa payload parameters
+        profile_id (str): Profile ID
+        cookies (str): Cookie string để sử dụng trong request
+        known_ids (set): ID các user đã react ở lần crawl trước
+        known_total (int, optional): Tổng reactions Facebook báo ở lần trước
+        max_pages (int, optional): Budget số trang (crawl scheduler); hết budget trước trang đã biết
+            thì complete = False. None = không giới hạn
+        first_page (Response, optional): Response trang đầu đã tải sẵn (crawl scheduler probe)
+        
+    Returns:
+        tuple: (new_users, total, complete) - new_users chỉ gồm user chưa có trong known_ids,
+            total là tổng reactions Facebook báo ở trang đầu (None nếu không có),
+            complete = False nếu dừng vì lỗi / hết budget (chưa tới trang đã biết / hết trang) -> caller không được lưu total
+    """
+    feedback_target_id = create_feedback_target_id(fid)
+    seen_ids = set(known_ids or [])
+    new_users = []
+    duplicate_count = 0
+    cursor = None
+    page_number = 0
+    total = None
+    stop_reason = None
+    complete = False
+    refreshed = False
+    print(f"🔁 Delta reactions FID {fid}: đã biết {len(seen_ids)} users (tổng lần trước: {known_total})")
+    
+    while True:
+        stop, paused, reason = check_flags(profile_id)
+        if stop:
+            print(f"🛑 Dừng lấy reactions do stop: {reason}")
+            raise RuntimeError(f"EMERGENCY_STOP ({reason})")
+        if paused:
+            wait_if_paused(profile_id, sleep_seconds=0.5)
+            continue
+        
+        if max_pages and page_number >= max_pages:
+            stop_reason = "budget"
+            break
+        if first_page is not None and page_number == 0:
+            response, first_page, sent_at = first_page, None, None
+        else:
+            sent_at = time.time()
+            response = send_request(feedback_target_id, payload_dict, profile_id, cookies, cursor)
+        page_number += 1
+        if response.status_code != 200:
+            print(f"❌ Lỗi: Status code {response.status_code}")
+            break
+        try:
+            response_json = parse_facebook_json_response(response.text or "")
+            raise_on_graphql_errors(response_json)
+        except json.JSONDecodeError as e:
+            print(f"❌ Trang {page_number} không phải JSON hợp lệ: {e}")
+            break
+        except ValueError as e:
+            # Lỗi payload/session (1357004, errors): refresh payload 1 lần như bản crawl đầy đủ rồi gửi lại trang này
+            print(f"❌ {e}")
+            if refreshed:
+                break
+            refreshed = True
+            new_payload = refresh_payload_from_bad_response(profile_id, cookies, response.text or "", sent_at)
+            if not new_payload:
+                break
+            payload_dict = new_payload
+            page_number -= 1
+            continue
+        try:
+            reactors = response_json.get("data", {}).get("node", {}).get("reactors", {})
+            edges_count = len(reactors.get("edges") or [])
+            page_users, end_cursor, has_next_page, _last_cursor, duplicate_count = process_reactors_response(
+                response_json, new_users, seen_ids, duplicate_count
+            )
+        except Exception as e:
+            print(f"❌ Lỗi khi đọc trang {page_number}: {e}")
+            break
+        new_users.extend(page_users)
+        
+        if page_number == 1:
+            total = engagement_state.extract_total(reactors)
+            if known_total is not None and total == known_total:
+                stop_reason = "total_unchanged"
+                complete = True
+                break
+        if edges_count and not page_users:
+            stop_reason = "known_page"
+            complete = True
+            break
+        if not has_next_page or not end_cursor:
+            complete = True
+            break
+        cursor = end_cursor
+    
+    engagement_state.record_pages(page_number, stop_reason if complete else (stop_reason or "error"))
+    print(f"✅ Delta reactions FID {fid}: +{len(new_users)} users mới / {page_number} trang (dừng: {stop_reason or ('hết trang' if complete else 'lỗi')})")
+    return new_users, total, complete
+
+
+# ================================
+#   PROBE: TỔNG REACTIONS TỪ TRANG ĐẦU (CHO CRAWL SCHEDULER)
+# ================================
+def reactions_page_summary(response_json):
+    """{"total", "edges", "has_next_page"} của 1 trang reactors (total = None nếu Facebook không trả)."""
+    reactors = (response_json.get("data") or {}).get("node", {}).get("reactors") or {}
+    page_info = reactors.get("page_info") or {}
+    return {
+        "total": engagement_state.extract_total(reactors),
+        "edges": len(reactors.get("edges") or []),
+        "has_next_page": bool(page_info.get("has_next_page")),
+    }
+
+
+def get_reactions_summary(fid, payload_dict, profile_id, cookies):
+    """
+    Gửi 1 request trang đầu reactions, trả về (reactions_page_summary, response) hoặc (None, None) nếu lỗi.
+    response được chuyển cho get_all_users_by_fid / get_new_users_by_fid (first_page) để không tải lại trang 1.
+    """
+    response = send_request(create_feedback_target_id(fid), payload_dict, profile_id, cookies)
+    if response.status_code != 200:
+        return None, None
+    try:
+        return reactions_page_summary(parse_facebook_json_response(response.text or "")), response
+    except Exception as e:
+        print(f"⚠️ Không đọc được trang đầu reactions của {fid}: {e}")
+        return None, None
+
+
 # ================================
 #   HÀM GỌI CŨ (giữ lại để tương thích)
 # ================================